@@ -0,0 +1,498 @@
+/**
+ * Scraper benchmark
+ * Runs scrapeReviews and the /scrape-stream endpoint against the mock
+ * retailer server and reports timings, reviews per second, peak memory and
+ * browser count. Results are saved to benchmark-results/ and compared with
+ * the previous run of the same kind, so regressions show up between commits.
+ *
+ * The cancel mode starts the same scrapes, cancels them after --cancel-after ms
+ * and measures how long the browsers take to be freed.
+ *
+ * Usage: node benchmark.js [--mode both] [--products 6] [--latency 150] [--jitter 100] [--pages 3]
+ */
+
+const fs = require('fs');
+const path = require('path');
+const http = require('http');
+const { spawn, execSync } = require('child_process');
+const { program } = require('commander');
+const { startMockRetailerServer } = require('./mock-retailer-server');
+const { runWithConcurrency, readPositiveIntEnv } = require('./concurrency-utils');
+const urlUtils = require('./url-utils');
+const rateLimiter = require('./rate-limiter');
+const { deleteScreenshots } = require('./delete-screenshots');
+
+program
+  .description('Benchmark the review scrapers against the mock retailer server')
+  .option('-m, --mode <mode>', 'What to benchmark: scrape, stream, cancel or both', 'both')
+  .option('-n, --products <number>', 'Number of product URLs (spread across retailers)', v => parseInt(v, 10), 6)
+  .option('-l, --latency <ms>', 'Mock server latency per response in ms', v => parseInt(v, 10), 150)
+  .option('-j, --jitter <ms>', 'Extra random latency up to this many ms', v => parseInt(v, 10), 100)
+  .option('-p, --pages <number>', 'Review pages per product', v => parseInt(v, 10), 3)
+  .option('-c, --concurrency <number>', 'SCRAPE_CONCURRENCY to use', v => parseInt(v, 10))
+  .option('--cancel-after <ms>', 'Cancel mode: how long the scrapes run before they are cancelled', v => parseInt(v, 10), 3000)
+  .option('--label <label>', 'Label stored with the results')
+  .option('--no-save', 'Don\'t save the results')
+  .parse(process.argv);
+
+const options = program.opts();
+const RESULTS_DIR = path.join(__dirname, 'benchmark-results');
+
+// Product URLs on the real retailer hosts; the browser's requests are answered by the mock server
+const URL_TEMPLATES = [
+  i => `https://www.tesco.com/groceries/en-GB/products/${300000000 + i}`,
+  i => `https://www.asda.com/groceries/product/benchmark-product/${1000000000 + i}`,
+  i => `https://www.sainsburys.co.uk/gol-ui/product/benchmark-product-${i}`
+];
+
+function buildProductUrls(count) {
+  return Array.from({ length: count }, (_, i) => URL_TEMPLATES[i % URL_TEMPLATES.length](i));
+}
+
+function summarize(values) {
+  if (values.length === 0) return null;
+  const sorted = [...values].sort((a, b) => a - b);
+  const pick = q => sorted[Math.min(sorted.length - 1, Math.floor(q * sorted.length))];
+  return {
+    count: sorted.length,
+    min: sorted[0],
+    median: pick(0.5),
+    p95: pick(0.95),
+    max: sorted[sorted.length - 1]
+  };
+}
+
+const toMb = bytes => Math.round((bytes / (1024 * 1024)) * 10) / 10;
+
+// Total RSS of a process and all its descendants (Chromium included), Linux only
+function processTreeRss(rootPid) {
+  if (!fs.existsSync('/proc/self/stat')) return null;
+
+  const children = new Map();
+  const rss = new Map();
+  const pageSize = 4096;
+  for (const entry of fs.readdirSync('/proc')) {
+    if (!/^\d+$/.test(entry)) continue;
+    try {
+      const stat = fs.readFileSync(`/proc/${entry}/stat`, 'utf8');
+      // The command name can contain spaces, so split after its closing parenthesis
+      const fields = stat.slice(stat.lastIndexOf(')') + 2).split(' ');
+      const ppid = parseInt(fields[1], 10);
+      if (!children.has(ppid)) children.set(ppid, []);
+      children.get(ppid).push(parseInt(entry, 10));
+      rss.set(parseInt(entry, 10), parseInt(fields[21], 10) * pageSize);
+    } catch (e) {
+      // Process exited while we were reading it
+    }
+  }
+
+  let total = 0;
+  const stack = [rootPid];
+  while (stack.length) {
+    const pid = stack.pop();
+    total += rss.get(pid) || 0;
+    stack.push(...(children.get(pid) || []));
+  }
+  return total;
+}
+
+// Peak RSS (VmHWM) of a single process, Linux only
+function processPeakRss(pid) {
+  try {
+    const status = fs.readFileSync(`/proc/${pid}/status`, 'utf8');
+    const match = status.match(/VmHWM:\s+(\d+) kB/);
+    return match ? parseInt(match[1], 10) * 1024 : null;
+  } catch (e) {
+    return null;
+  }
+}
+
+// Sample memory and browser count every interval until stop() is called
+function startSampler(sample, intervalMs = 250) {
+  const peaks = { treeRss: 0, browsers: 0 };
+  const timer = setInterval(async () => {
+    try {
+      const { treeRss, browsers } = await sample();
+      if (treeRss) peaks.treeRss = Math.max(peaks.treeRss, treeRss);
+      if (browsers) peaks.browsers = Math.max(peaks.browsers, browsers);
+    } catch (e) {
+      // Skip this sample
+    }
+  }, intervalMs);
+  return { peaks, stop: () => clearInterval(timer) };
+}
+
+function getJson(url) {
+  return new Promise((resolve, reject) => {
+    http.get(url, (res) => {
+      let body = '';
+      res.on('data', chunk => { body += chunk; });
+      res.on('end', () => {
+        try {
+          resolve(JSON.parse(body));
+        } catch (e) {
+          reject(e);
+        }
+      });
+    }).on('error', reject);
+  });
+}
+
+// Benchmark scrapeReviews called directly, the way server.js fans out URLs
+async function benchmarkScrapeReviews(urls) {
+  const { scrapeReviews, closeBrowserPool, getBrowserPoolStats } = require('./review-scraper-integrated');
+  const { getEventLoopLag } = require('./metrics');
+  const concurrency = readPositiveIntEnv('SCRAPE_CONCURRENCY', 3);
+  // Only count lag from the scrapes themselves
+  getEventLoopLag(true);
+
+  const sampler = startSampler(async () => ({
+    treeRss: processTreeRss(process.pid),
+    browsers: getBrowserPoolStats().browsers
+  }));
+
+  const urlTimings = [];
+  const timingsByRetailer = {};
+  let totalReviews = 0;
+  let failedUrls = 0;
+  const startedAt = Date.now();
+
+  await runWithConcurrency(urls, async (url) => {
+    const urlStartedAt = Date.now();
+    const reviews = await scrapeReviews(url, {});
+    return { reviews, durationMs: Date.now() - urlStartedAt };
+  }, {
+    concurrency,
+    keyFn: url => urlUtils.detectRetailerFromUrl(url),
+    perKeyLimit: retailer => rateLimiter.getConcurrency(retailer),
+    onSettled: (outcome, url) => {
+      if (outcome.status === 'rejected' || outcome.value.reviews.length === 0) {
+        failedUrls++;
+      }
+      if (outcome.status === 'fulfilled') {
+        const retailer = urlUtils.detectRetailerFromUrl(url);
+        urlTimings.push(outcome.value.durationMs);
+        (timingsByRetailer[retailer] = timingsByRetailer[retailer] || []).push(outcome.value.durationMs);
+        totalReviews += outcome.value.reviews.length;
+      }
+    }
+  });
+
+  const durationMs = Date.now() - startedAt;
+  sampler.stop();
+  const eventLoopLag = getEventLoopLag();
+  const poolStats = getBrowserPoolStats();
+  await closeBrowserPool();
+
+  return {
+    durationMs,
+    totalReviews,
+    failedUrls,
+    reviewsPerSecond: Math.round((totalReviews / (durationMs / 1000)) * 100) / 100,
+    peakRssMb: toMb(process.resourceUsage().maxRSS * 1024),
+    peakProcessTreeRssMb: sampler.peaks.treeRss ? toMb(sampler.peaks.treeRss) : null,
+    peakBrowsers: sampler.peaks.browsers,
+    browserLaunches: poolStats.launches,
+    eventLoopLagP99Ms: eventLoopLag.p99Ms,
+    eventLoopLagMaxMs: eventLoopLag.maxMs,
+    rateLimits: rateLimiter.getRateLimitStats(),
+    stages: {
+      scrapeReviews: summarize(urlTimings),
+      ...Object.fromEntries(Object.entries(timingsByRetailer).map(([retailer, values]) => [`scrapeReviews:${retailer}`, summarize(values)]))
+    }
+  };
+}
+
+// Benchmark cancellation: how quickly running scrapes give their browsers back
+async function benchmarkCancellation(urls) {
+  const { scrapeReviews, closeBrowserPool, getBrowserPoolStats } = require('./review-scraper-integrated');
+  const controller = new AbortController();
+  const settleAfterCancelMs = [];
+  let cancelledAt = null;
+  let cancelledUrls = 0;
+  let completedUrls = 0;
+
+  const run = runWithConcurrency(urls, url => scrapeReviews(url, { signal: controller.signal }), {
+    concurrency: readPositiveIntEnv('SCRAPE_CONCURRENCY', 3),
+    keyFn: url => urlUtils.detectRetailerFromUrl(url),
+    perKeyLimit: retailer => rateLimiter.getConcurrency(retailer),
+    onSettled: (outcome) => {
+      if (outcome.status === 'rejected' && outcome.reason.name === 'AbortError') {
+        cancelledUrls++;
+      } else {
+        completedUrls++;
+      }
+      if (cancelledAt !== null) {
+        settleAfterCancelMs.push(Date.now() - cancelledAt);
+      }
+    }
+  });
+
+  await new Promise(resolve => setTimeout(resolve, options.cancelAfter));
+  const activeLeasesAtCancel = getBrowserPoolStats().activeLeases;
+  cancelledAt = Date.now();
+  controller.abort();
+  await run;
+  const cancelToFreeMs = Date.now() - cancelledAt;
+  const activeLeasesAfter = getBrowserPoolStats().activeLeases;
+  const poolStats = getBrowserPoolStats();
+  await closeBrowserPool();
+
+  return {
+    durationMs: options.cancelAfter + cancelToFreeMs,
+    cancelToFreeMs,
+    activeLeasesAtCancel,
+    activeLeasesAfter,
+    cancelledUrls,
+    completedUrls,
+    browserLaunches: poolStats.launches,
+    stages: {
+      settleAfterCancel: summarize(settleAfterCancelMs)
+    }
+  };
+}
+
+function getFreePort() {
+  return new Promise((resolve, reject) => {
+    const probe = http.createServer();
+    probe.listen(0, '127.0.0.1', () => {
+      const { port } = probe.address();
+      probe.close(() => resolve(port));
+    });
+    probe.on('error', reject);
+  });
+}
+
+async function waitForServer(baseUrl, timeoutMs = 30000) {
+  const startedAt = Date.now();
+  while (Date.now() - startedAt < timeoutMs) {
+    try {
+      await getJson(`${baseUrl}/health`);
+      return;
+    } catch (e) {
+      await new Promise(resolve => setTimeout(resolve, 250));
+    }
+  }
+  throw new Error(`Server at ${baseUrl} didn't start within ${timeoutMs}ms`);
+}
+
+// Benchmark the /scrape-stream endpoint end to end, with server.js in a child process
+async function benchmarkScrapeStream(urls, mockUrl) {
+  const port = await getFreePort();
+  const baseUrl = `http://127.0.0.1:${port}`;
+  const child = spawn(process.execPath, [path.join(__dirname, 'server.js')], {
+    env: { ...process.env, PORT: String(port), MOCK_RETAILER_URL: mockUrl },
+    stdio: ['ignore', 'ignore', 'inherit']
+  });
+
+  try {
+    await waitForServer(baseUrl);
+
+    const sampler = startSampler(async () => {
+      const health = await getJson(`${baseUrl}/health`);
+      return {
+        treeRss: processTreeRss(child.pid),
+        browsers: health.browserPool ? health.browserPool.browsers : 0
+      };
+    }, 500);
+
+    const startedAt = Date.now();
+    const marks = {};
+    const progressTimes = [];
+    let complete = null;
+
+    await new Promise((resolve, reject) => {
+      const query = new URLSearchParams({ productUrls: urls.join('\n') }).toString();
+      http.get(`${baseUrl}/scrape-stream?${query}`, (res) => {
+        let buffer = '';
+        res.setEncoding('utf8');
+        res.on('data', (chunk) => {
+          buffer += chunk;
+          let boundary;
+          while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const event = (message.match(/^event: (.*)$/m) || [])[1];
+            const data = JSON.parse((message.match(/^data: (.*)$/m) || [])[1] || '{}');
+            const now = Date.now() - startedAt;
+
+            if (event === 'start') marks.start = now;
+            if (event === 'progress') progressTimes.push(now);
+            if (event === 'complete') {
+              marks.complete = now;
+              complete = data;
+            }
+            if (event === 'error') marks.error = data.message;
+          }
+        });
+        res.on('end', resolve);
+        res.on('error', reject);
+      }).on('error', reject);
+    });
+
+    sampler.stop();
+    const durationMs = Date.now() - startedAt;
+
+    // Time the CSV download too, since it's now served from disk
+    let downloadMs = null;
+    let csvBytes = null;
+    if (complete && complete.downloads) {
+      const downloadStartedAt = Date.now();
+      csvBytes = await new Promise((resolve, reject) => {
+        http.get(`${baseUrl}${complete.downloads.csv}`, (res) => {
+          let bytes = 0;
+          res.on('data', chunk => { bytes += chunk.length; });
+          res.on('end', () => resolve(bytes));
+        }).on('error', reject);
+      });
+      downloadMs = Date.now() - downloadStartedAt;
+    }
+
+    const totalReviews = complete ? complete.totalReviews : 0;
+    const health = await getJson(`${baseUrl}/health`).catch(() => ({}));
+    const progressGaps = progressTimes.map((time, i) => time - (i === 0 ? (marks.start || 0) : progressTimes[i - 1]));
+
+    return {
+      durationMs,
+      totalReviews,
+      error: marks.error || null,
+      reviewsPerSecond: Math.round((totalReviews / (durationMs / 1000)) * 100) / 100,
+      peakRssMb: processPeakRss(child.pid) ? toMb(processPeakRss(child.pid)) : null,
+      peakProcessTreeRssMb: sampler.peaks.treeRss ? toMb(sampler.peaks.treeRss) : null,
+      peakBrowsers: sampler.peaks.browsers,
+      browserLaunches: health.browserPool ? health.browserPool.launches : null,
+      eventLoopLagP99Ms: health.eventLoop ? health.eventLoop.p99Ms : null,
+      eventLoopLagMaxMs: health.eventLoop ? health.eventLoop.maxMs : null,
+      csvBytes,
+      stages: {
+        requestToStart: marks.start !== undefined ? marks.start : null,
+        startToFirstProgress: progressTimes.length ? progressTimes[0] - (marks.start || 0) : null,
+        betweenProgressEvents: summarize(progressGaps),
+        startToComplete: marks.complete !== undefined ? marks.complete - (marks.start || 0) : null,
+        csvDownload: downloadMs
+      }
+    };
+  } finally {
+    child.kill('SIGTERM');
+    await new Promise(resolve => child.once('exit', resolve));
+  }
+}
+
+function gitCommit() {
+  try {
+    return execSync('git rev-parse --short HEAD', { cwd: __dirname, stdio: ['ignore', 'pipe', 'ignore'] }).toString().trim();
+  } catch (e) {
+    return 'unknown';
+  }
+}
+
+// Most recent saved run with the same settings, for comparison
+function loadPreviousResult(settings) {
+  if (!fs.existsSync(RESULTS_DIR)) return null;
+  const files = fs.readdirSync(RESULTS_DIR).filter(file => file.endsWith('.json')).sort().reverse();
+  for (const file of files) {
+    try {
+      const result = JSON.parse(fs.readFileSync(path.join(RESULTS_DIR, file), 'utf8'));
+      if (JSON.stringify(result.settings) === JSON.stringify(settings)) {
+        return { file, result };
+      }
+    } catch (e) {
+      // Ignore unreadable result files
+    }
+  }
+  return null;
+}
+
+function printReport(name, current, previous) {
+  console.log(`\n${name}`);
+  const metrics = ['durationMs', 'totalReviews', 'reviewsPerSecond', 'peakRssMb', 'peakProcessTreeRssMb', 'peakBrowsers', 'browserLaunches', 'eventLoopLagP99Ms', 'eventLoopLagMaxMs', 'cancelToFreeMs', 'activeLeasesAtCancel', 'activeLeasesAfter', 'cancelledUrls'];
+  for (const metric of metrics) {
+    if (current[metric] === undefined) continue;
+    let line = `  ${metric.padEnd(22)} ${current[metric]}`;
+    if (previous && typeof previous[metric] === 'number' && typeof current[metric] === 'number' && previous[metric] !== 0) {
+      const change = ((current[metric] - previous[metric]) / previous[metric]) * 100;
+      line += `  (was ${previous[metric]}, ${change >= 0 ? '+' : ''}${change.toFixed(1)}%)`;
+    }
+    console.log(line);
+  }
+  console.log('  stages:');
+  for (const [stage, value] of Object.entries(current.stages)) {
+    console.log(`    ${stage.padEnd(28)} ${value && typeof value === 'object' ? `median ${value.median}ms, p95 ${value.p95}ms (n=${value.count})` : `${value}ms`}`);
+  }
+}
+
+async function main() {
+  if (options.concurrency) {
+    process.env.SCRAPE_CONCURRENCY = String(options.concurrency);
+  }
+  // Mock reviews must not end up in the real review store
+  process.env.REVIEW_STORE = 'false';
+
+  const mock = await startMockRetailerServer({
+    latencyMs: options.latency,
+    jitterMs: options.jitter,
+    reviewPages: options.pages
+  });
+  process.env.MOCK_RETAILER_URL = mock.url;
+  console.log(`Mock retailer server on ${mock.url} (latency ${options.latency}ms + up to ${options.jitter}ms, ${options.pages} review pages)`);
+
+  const urls = buildProductUrls(options.products);
+  const settings = {
+    mode: options.mode,
+    products: options.products,
+    latency: options.latency,
+    jitter: options.jitter,
+    pages: options.pages,
+    concurrency: readPositiveIntEnv('SCRAPE_CONCURRENCY', 3),
+    ...(options.mode === 'cancel' ? { cancelAfter: options.cancelAfter } : {})
+  };
+
+  const results = {};
+  try {
+    if (options.mode === 'scrape' || options.mode === 'both') {
+      console.log(`Benchmarking scrapeReviews over ${urls.length} URLs...`);
+      results.scrapeReviews = await benchmarkScrapeReviews(urls);
+    }
+    if (options.mode === 'stream' || options.mode === 'both') {
+      console.log(`Benchmarking /scrape-stream over ${urls.length} URLs...`);
+      results.scrapeStream = await benchmarkScrapeStream(urls, mock.url);
+    }
+    if (options.mode === 'cancel') {
+      console.log(`Benchmarking cancellation of ${urls.length} URLs after ${options.cancelAfter}ms...`);
+      results.cancellation = await benchmarkCancellation(urls);
+    }
+  } finally {
+    await mock.close();
+    deleteScreenshots();
+  }
+
+  const previous = loadPreviousResult(settings);
+  const run = {
+    label: options.label || null,
+    commit: gitCommit(),
+    timestamp: new Date().toISOString(),
+    node: process.version,
+    settings,
+    mockRequests: mock.app.locals.stats,
+    results
+  };
+
+  if (previous) {
+    console.log(`\nComparing with ${previous.file} (commit ${previous.result.commit})`);
+  }
+  for (const [name, result] of Object.entries(results)) {
+    printReport(name, result, previous && previous.result.results[name]);
+  }
+
+  if (options.save) {
+    fs.mkdirSync(RESULTS_DIR, { recursive: true });
+    const file = path.join(RESULTS_DIR, `${run.timestamp.replace(/[:.]/g, '-')}-${run.commit}.json`);
+    fs.writeFileSync(file, JSON.stringify(run, null, 2));
+    console.log(`\nSaved results to ${path.relative(__dirname, file)}`);
+  }
+}
+
+main().then(() => process.exit(0)).catch((error) => {
+  console.error(`Benchmark failed: ${error.stack || error.message}`);
+  process.exit(1);
+});
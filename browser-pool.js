@@ -0,0 +1,269 @@
+/**
+ * Browser pool
+ * Keeps launched browsers alive between scrapes so each URL only pays for a
+ * new context instead of a full browser launch. Browsers are grouped by launch
+ * profile (headless vs Xvfb, proxy, user agent) and recycled after a number of
+ * uses, when they crash, or when they sit idle for too long.
+ */
+
+const { readPositiveIntEnv } = require('./concurrency-utils');
+
+/**
+ * Build a stable key for a launch profile
+ * @param {Object} profile - Profile fields that require a separate browser (headless, proxy, userAgent...)
+ * @returns {string} - The profile key
+ */
+function createProfileKey(profile) {
+  return Object.keys(profile)
+    .sort()
+    .map(key => `${key}=${profile[key] === undefined || profile[key] === null ? '' : profile[key]}`)
+    .join('|');
+}
+
+class BrowserPool {
+  /**
+   * @param {Object} options - Pool options
+   * @param {string} options.name - Name used in log messages
+   * @param {Function} options.launch - async (launchOptions) => browser
+   * @param {Function} options.createContext - async (browser, contextOptions) => context
+   * @param {number} options.maxUsesPerBrowser - Leases handed out before a browser is recycled
+   * @param {number} options.maxContextsPerBrowser - Concurrent leases sharing one browser
+   * @param {number} options.maxBrowsersPerProfile - Browsers kept per launch profile
+   * @param {number} options.idleTimeoutMs - Close browsers that have been idle this long
+   */
+  constructor(options) {
+    this.name = options.name || 'browser';
+    this.launch = options.launch;
+    this.createContext = options.createContext;
+    this.maxUsesPerBrowser = options.maxUsesPerBrowser || readPositiveIntEnv('BROWSER_POOL_MAX_USES', 20);
+    this.maxContextsPerBrowser = options.maxContextsPerBrowser || readPositiveIntEnv('BROWSER_POOL_CONTEXTS_PER_BROWSER', 2);
+    this.maxBrowsersPerProfile = options.maxBrowsersPerProfile || readPositiveIntEnv('BROWSER_POOL_MAX_BROWSERS', 2);
+    this.idleTimeoutMs = options.idleTimeoutMs || readPositiveIntEnv('BROWSER_POOL_IDLE_MS', 5 * 60 * 1000);
+    this.log = options.log || {
+      info: (message) => console.log(message),
+      warning: (message) => console.warn(message),
+      error: (message) => console.error(message)
+    };
+
+    // profileKey -> array of browser entries
+    this.entries = new Map();
+    this.closed = false;
+    this.launchCount = 0;
+
+    this.idleTimer = setInterval(() => this.closeIdleBrowsers(), Math.min(this.idleTimeoutMs, 60000));
+    this.idleTimer.unref();
+  }
+
+  /**
+   * Lease a browser for the given profile, launching one if needed
+   * @param {Object} profile - Profile fields that identify the browser (see createProfileKey)
+   * @param {Object} launchOptions - Options passed to launch() if a new browser is needed
+   * @returns {Promise<Object>} - Lease with browser, newContext(contextOptions) and release({ failed })
+   */
+  async acquire(profile, launchOptions) {
+    if (this.closed) {
+      throw new Error(`${this.name} pool has been shut down`);
+    }
+
+    const profileKey = createProfileKey(profile);
+    const entry = this.pickEntry(profileKey, launchOptions);
+    entry.active++;
+    entry.uses++;
+    entry.lastUsed = Date.now();
+
+    let browser;
+    try {
+      browser = await entry.ready;
+    } catch (launchError) {
+      entry.active--;
+      this.removeEntry(entry);
+      throw launchError;
+    }
+
+    const contexts = [];
+    let released = false;
+
+    return {
+      browser,
+      profileKey,
+      newContext: async (contextOptions = {}) => {
+        const context = await this.createContext(browser, contextOptions);
+        contexts.push(context);
+        return context;
+      },
+      release: async ({ failed = false } = {}) => {
+        if (released) return;
+        released = true;
+
+        for (const context of contexts) {
+          await context.close().catch(() => {});
+        }
+
+        entry.active--;
+        entry.lastUsed = Date.now();
+
+        // A failed lease may have left the browser in a bad state, so don't reuse it
+        if (failed || !this.isConnected(browser)) {
+          entry.retired = true;
+        }
+
+        if (entry.retired && entry.active === 0) {
+          await this.closeEntry(entry);
+        }
+      }
+    };
+  }
+
+  pickEntry(profileKey, launchOptions) {
+    const entries = this.entries.get(profileKey) || [];
+    this.entries.set(profileKey, entries);
+
+    const usable = entries.filter(entry => !entry.retired);
+    const free = usable
+      .filter(entry => entry.active < this.maxContextsPerBrowser)
+      .sort((a, b) => a.active - b.active);
+
+    if (free.length > 0) {
+      return this.markIfWornOut(free[0]);
+    }
+
+    if (usable.length < this.maxBrowsersPerProfile) {
+      const entry = this.launchEntry(profileKey, launchOptions);
+      entries.push(entry);
+      return this.markIfWornOut(entry);
+    }
+
+    // Every browser is busy and we're at the cap, so share the least loaded one
+    const leastLoaded = usable.sort((a, b) => a.active - b.active)[0];
+    return this.markIfWornOut(leastLoaded);
+  }
+
+  markIfWornOut(entry) {
+    // Retire after this lease so the browser is replaced once it's done
+    if (entry.uses + 1 >= this.maxUsesPerBrowser) {
+      entry.retired = true;
+    }
+    return entry;
+  }
+
+  launchEntry(profileKey, launchOptions) {
+    const entry = {
+      profileKey,
+      browser: null,
+      ready: null,
+      uses: 0,
+      active: 0,
+      retired: false,
+      lastUsed: Date.now()
+    };
+
+    this.launchCount++;
+    const startedAt = Date.now();
+    this.log.info(`${this.name} pool launching browser for profile ${profileKey}`);
+
+    entry.ready = Promise.resolve()
+      .then(() => this.launch(launchOptions))
+      .then(browser => {
+        entry.browser = browser;
+        this.log.info(`${this.name} pool launched browser in ${Date.now() - startedAt}ms`);
+
+        // Drop crashed browsers from the pool straight away
+        browser.on('disconnected', () => {
+          if (!entry.closing) {
+            this.log.warning(`${this.name} pool browser disconnected unexpectedly, removing it`);
+          }
+          entry.retired = true;
+          this.removeEntry(entry);
+        });
+
+        return browser;
+      });
+
+    return entry;
+  }
+
+  isConnected(browser) {
+    return typeof browser.isConnected === 'function' ? browser.isConnected() : browser.connected !== false;
+  }
+
+  removeEntry(entry) {
+    const entries = this.entries.get(entry.profileKey);
+    if (!entries) return;
+
+    const index = entries.indexOf(entry);
+    if (index !== -1) {
+      entries.splice(index, 1);
+    }
+    if (entries.length === 0) {
+      this.entries.delete(entry.profileKey);
+    }
+  }
+
+  async closeEntry(entry) {
+    this.removeEntry(entry);
+    if (!entry.browser || entry.closing) return;
+
+    entry.closing = true;
+    try {
+      await entry.browser.close();
+    } catch (closeError) {
+      this.log.warning(`${this.name} pool error closing browser: ${closeError.message}`);
+    }
+  }
+
+  async closeIdleBrowsers() {
+    const now = Date.now();
+    for (const entries of [...this.entries.values()]) {
+      for (const entry of [...entries]) {
+        if (entry.browser && entry.active === 0 && now - entry.lastUsed > this.idleTimeoutMs) {
+          this.log.info(`${this.name} pool closing idle browser for profile ${entry.profileKey}`);
+          await this.closeEntry(entry);
+        }
+      }
+    }
+  }
+
+  /**
+   * Pool statistics for logging and benchmarks
+   * @returns {Object} - Counts of open browsers, active leases and launches
+   */
+  stats() {
+    let browsers = 0;
+    let activeLeases = 0;
+    for (const entries of this.entries.values()) {
+      browsers += entries.length;
+      activeLeases += entries.reduce((sum, entry) => sum + entry.active, 0);
+    }
+    return {
+      browsers,
+      activeLeases,
+      profiles: this.entries.size,
+      launches: this.launchCount
+    };
+  }
+
+  /**
+   * Close every browser in the pool and refuse new leases
+   */
+  async closeAll() {
+    this.closed = true;
+    clearInterval(this.idleTimer);
+
+    const allEntries = [];
+    for (const entries of this.entries.values()) {
+      allEntries.push(...entries);
+    }
+
+    await Promise.all(allEntries.map(async entry => {
+      await entry.ready.catch(() => null);
+      await this.closeEntry(entry);
+    }));
+
+    this.log.info(`${this.name} pool shut down (${allEntries.length} browsers closed)`);
+  }
+}
+
+module.exports = {
+  BrowserPool,
+  createProfileKey
+};
@@ -0,0 +1,90 @@
+/**
+ * Cancellation
+ * Helpers for passing an AbortSignal from a request down through a scrape.
+ * Playwright calls don't take a signal, so scrapeReviews closes the browser
+ * context when the signal fires: every pending navigation, wait and click on
+ * its pages then fails straight away. The handlers check the signal between
+ * steps and in their error handling, so those failures surface as a single
+ * AbortError instead of being retried or replaced with fallback reviews.
+ */
+
+/**
+ * Build the error a cancelled scrape throws
+ * @param {AbortSignal} signal - The signal that fired
+ * @returns {Error} - Error named AbortError
+ */
+function createAbortError(signal) {
+  const reason = signal && signal.reason;
+  const error = new Error(reason instanceof Error ? reason.message : (reason || 'The scrape was cancelled'));
+  error.name = 'AbortError';
+  return error;
+}
+
+/**
+ * Throw an AbortError if the signal has fired
+ * @param {AbortSignal} signal - Signal, or null/undefined for uncancellable calls
+ */
+function throwIfAborted(signal) {
+  if (signal && signal.aborted) {
+    throw createAbortError(signal);
+  }
+}
+
+/**
+ * Check whether an error came from a cancellation
+ * @param {Error} error - Any error
+ * @returns {boolean}
+ */
+function isAbortError(error) {
+  return Boolean(error) && error.name === 'AbortError';
+}
+
+/**
+ * Run a listener once when the signal fires (straight away if it already has)
+ * @param {AbortSignal} signal - Signal, or null/undefined
+ * @param {Function} listener - Called with no arguments
+ * @returns {Function} - Removes the listener
+ */
+function onAbort(signal, listener) {
+  if (!signal) {
+    return () => {};
+  }
+  if (signal.aborted) {
+    listener();
+    return () => {};
+  }
+  signal.addEventListener('abort', listener, { once: true });
+  return () => signal.removeEventListener('abort', listener);
+}
+
+/**
+ * Sleep that rejects with an AbortError as soon as the signal fires
+ * @param {number} ms - Delay in ms
+ * @param {AbortSignal} signal - Signal, or null/undefined
+ * @returns {Promise<void>}
+ */
+function sleep(ms, signal) {
+  return new Promise((resolve, reject) => {
+    if (signal && signal.aborted) {
+      reject(createAbortError(signal));
+      return;
+    }
+    let removeListener = () => {};
+    const timer = setTimeout(() => {
+      removeListener();
+      resolve();
+    }, ms);
+    removeListener = onAbort(signal, () => {
+      clearTimeout(timer);
+      reject(createAbortError(signal));
+    });
+  });
+}
+
+module.exports = {
+  createAbortError,
+  throwIfAborted,
+  isAbortError,
+  onAbort,
+  sleep
+};
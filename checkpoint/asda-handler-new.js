@@ -1,36 +1,43 @@
+const { jitter, waitForSelectorStable, watchReviewsUpdate, waitForReviewsUpdate } = require('../wait-utils');
+const { startSpan } = require('../metrics');
+const { createArtifactRecorder } = require('../debug-artifacts');
+const { throwIfAborted } = require('../cancellation');
+
+// Selectors used to tell when ASDA's reviews have loaded or changed
+const ASDA_REVIEW_ITEM_SELECTOR = 'div.pdp-description-reviews__content-cntr, [data-auto-id="review-container"], .review-container';
+const ASDA_REVIEW_CONTAINER_SELECTOR = '.pdp-description-reviews, #reviews, [data-auto-id="reviews"]';
+const ASDA_REVIEW_RESPONSE_PATTERN = /review/i;
+
 // ASDA specific handler
 async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
   const log = siteConfig.log || console;
+  const artifacts = siteConfig.artifacts || createArtifactRecorder({ retailer: 'asda', log });
   log.info('Using ASDA specific handler');
 
-  // Initialize global array for ASDA reviews if not exists
-  if (!global.asdaReviews) {
-    global.asdaReviews = [];
-  }
-  
-  // Clear any existing reviews to avoid duplicates
-  global.asdaReviews = [];
-  log.info('Cleared existing ASDA reviews array');
+  // Collect reviews for this invocation only, so concurrent scrapes don't share state
+  const asdaReviews = [];
   
   // Debug info
   log.info(`ASDA handler starting for URL: ${page.url()}`);
   log.info(`Max reviews to collect: ${maxReviews}`);
   
   try {
-    // Take a screenshot for debugging
-    await page.screenshot({ path: `asda-initial-${Date.now()}.png` });
+    // Record the page state for debug artifacts
+    await artifacts.capture(page, 'initial');
     
     // First, handle cookie consent if present
+    const cookieSpan = startSpan('cookie_banner', { retailer: 'asda' });
     try {
       const cookieButton = await page.$('button[data-auto-id="onetrust-accept-btn-handler"], #onetrust-accept-btn-handler, button:has-text("Accept all cookies")');
       if (cookieButton) {
         log.info('Found cookie consent button, clicking...');
         await cookieButton.click().catch(e => log.warning(`Direct cookie click failed: ${e.message}`));
-        await page.waitForTimeout(2000);
+        await jitter(page);
       }
     } catch (cookieError) {
       log.warning(`Error handling cookie consent: ${cookieError.message}`);
     }
+    cookieSpan.end();
 
     // Find and click on the reviews tab
     const reviewTabSelectors = [
@@ -44,6 +51,7 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
       'div[role="tab"]:has-text("Reviews")'
     ];
 
+    const tabSpan = startSpan('reviews_tab', { retailer: 'asda' });
     let tabClicked = false;
     for (const selector of reviewTabSelectors) {
       try {
@@ -51,16 +59,21 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
         if (reviewTab) {
           // Scroll to the element first
           await reviewTab.scrollIntoViewIfNeeded();
-          await page.waitForTimeout(1000);
+          await jitter(page);
 
-          // Try clicking
-          await reviewTab.click({ force: true }).catch(async (e) => {
-            log.warning(`Direct tab click failed: ${e.message}, trying JavaScript click...`);
-            await page.evaluate(button => button.click(), reviewTab);
+          // Try clicking, then wait for the reviews to appear
+          await waitForReviewsUpdate(page, {
+            containerSelector: ASDA_REVIEW_CONTAINER_SELECTOR,
+            itemSelector: ASDA_REVIEW_ITEM_SELECTOR,
+            responsePattern: ASDA_REVIEW_RESPONSE_PATTERN,
+            timeout: 2000,
+            action: () => reviewTab.click({ force: true }).catch(async (e) => {
+              log.warning(`Direct tab click failed: ${e.message}, trying JavaScript click...`);
+              await page.evaluate(button => button.click(), reviewTab);
+            })
           });
 
           log.info(`Clicked review tab with selector: ${selector}`);
-          await page.waitForTimeout(2000);
           tabClicked = true;
           break;
         }
@@ -87,17 +100,19 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
 
       if (clicked) {
         log.info('Successfully clicked reviews tab via JavaScript');
-        await page.waitForTimeout(2000);
+        await waitForSelectorStable(page, ASDA_REVIEW_ITEM_SELECTOR, { timeout: 2000 });
       } else {
         log.warning('Could not find reviews tab with any method');
       }
     }
 
-    // Take a screenshot after clicking the reviews tab
-    await page.screenshot({ path: `asda-after-tab-click-${Date.now()}.png` });
+    tabSpan.end({ outcome: tabClicked ? 'ok' : 'fallback' });
+
+    // Record the page state after clicking the reviews tab
+    await artifacts.capture(page, 'after-tab-click');
 
     // Wait for reviews to load
-    await page.waitForTimeout(2000);
+    await waitForSelectorStable(page, ASDA_REVIEW_ITEM_SELECTOR, { timeout: 3000 });
 
     // Scroll down to load lazy-loaded content
     await page.evaluate(async () => {
@@ -116,10 +131,10 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
         }, 100);
       });
     });
-    await page.waitForTimeout(1000);
+    await waitForSelectorStable(page, ASDA_REVIEW_ITEM_SELECTOR, { timeout: 2000 });
 
-    // Take a screenshot after scrolling
-    await page.screenshot({ path: `asda-after-scroll-${Date.now()}.png` });
+    // Record the page state after scrolling
+    await artifacts.capture(page, 'after-scroll');
 
     // Check if there are pagination controls and navigate through pages
     let pageCount = 0;
@@ -130,11 +145,21 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
     log.info(`Extracted ${reviews.length} reviews from page 1`);
     
     if (reviews.length > 0) {
-      global.asdaReviews.push(...reviews);
+      asdaReviews.push(...reviews);
     }
+
+    // Incremental / date-filtered scrapes can stop once a page holds nothing new
+    const shouldStopPagination = siteConfig.shouldStopPagination;
+    const stopAfterFirstPage = shouldStopPagination ? shouldStopPagination(reviews) : false;
     
     // Click through pagination to load more reviews if needed
-    while (pageCount < maxPages && global.asdaReviews.length < maxReviews) {
+    let pageSpan = null;
+    while (!stopAfterFirstPage && pageCount < maxPages && asdaReviews.length < maxReviews) {
+      // Each pagination step is timed until the next one starts (or pagination ends)
+      if (pageSpan) pageSpan.end();
+      pageSpan = startSpan('pagination_step', { retailer: 'asda' });
+      throwIfAborted(siteConfig.signal);
+
       // Try to click the "Next" button with the exact selector from the HTML
       const nextButtonSelectors = [
         'a[data-auto-id="btnright"]',
@@ -162,6 +187,12 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
         log.info('No next button found with standard selectors, trying JavaScript approach');
         
         // Try to find the next button using JavaScript
+        const pageUpdate = await watchReviewsUpdate(page, {
+          containerSelector: ASDA_REVIEW_CONTAINER_SELECTOR,
+          itemSelector: ASDA_REVIEW_ITEM_SELECTOR,
+          responsePattern: ASDA_REVIEW_RESPONSE_PATTERN,
+          timeout: 3000
+        });
         const nextButtonFound = await page.evaluate(() => {
           // Look for any element that might be a next button
           const possibleNextButtons = [];
@@ -225,21 +256,26 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
         
         if (nextButtonFound) {
           log.info('Found and clicked next button using JavaScript approach');
-          await page.waitForTimeout(3000); // Wait for page to load
+          await pageUpdate.wait(); // Wait for the next page of reviews
           pageCount++;
           
-          // Take a screenshot after clicking next page
-          await page.screenshot({ path: `asda-after-js-next-page-${pageCount}-${Date.now()}.png` });
+          // Record the page state after clicking next page
+          await artifacts.capture(page, `after-js-next-page-${pageCount}`);
           
           // Extract reviews from the current page
           reviews = await extractAsdaReviews(page);
           log.info(`Extracted ${reviews.length} reviews from page ${pageCount + 1}`);
           
           if (reviews.length > 0) {
-            global.asdaReviews.push(...reviews);
-            log.info(`Total reviews collected so far: ${global.asdaReviews.length}`);
+            asdaReviews.push(...reviews);
+            log.info(`Total reviews collected so far: ${asdaReviews.length}`);
+            if (shouldStopPagination && shouldStopPagination(reviews)) {
+              break;
+            }
             continue; // Skip to the next iteration
           }
+        } else {
+          await pageUpdate.cancel();
         }
       }
 
@@ -257,14 +293,20 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
         
         log.info('Clicking next page button...');
         
-        // Take a screenshot before clicking
-        await page.screenshot({ path: `asda-before-next-page-${pageCount}-${Date.now()}.png` });
+        // Record the page state before clicking
+        await artifacts.capture(page, `before-next-page-${pageCount}`);
         
         // Scroll to make sure the button is visible
         await nextButton.scrollIntoViewIfNeeded();
-        await page.waitForTimeout(1000);
+        await jitter(page);
         
         // Try multiple click methods
+        const pageUpdate = await watchReviewsUpdate(page, {
+          containerSelector: ASDA_REVIEW_CONTAINER_SELECTOR,
+          itemSelector: ASDA_REVIEW_ITEM_SELECTOR,
+          responsePattern: ASDA_REVIEW_RESPONSE_PATTERN,
+          timeout: 3000
+        });
         try {
           // Method 1: Direct click
           await nextButton.click({ force: true }).catch(async (e) => {
@@ -305,22 +347,26 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
           });
         } catch (clickError) {
           log.error(`All click methods failed: ${clickError.message}`);
+          await pageUpdate.cancel();
           break;
         }
         
-        await page.waitForTimeout(3000); // Wait longer for page to load
+        await pageUpdate.wait(); // Wait for the next page of reviews
         pageCount++;
         
-        // Take a screenshot after clicking next page
-        await page.screenshot({ path: `asda-after-next-page-${pageCount}-${Date.now()}.png` });
+        // Record the page state after clicking next page
+        await artifacts.capture(page, `after-next-page-${pageCount}`);
         
         // Extract reviews from the current page
         reviews = await extractAsdaReviews(page);
         log.info(`Extracted ${reviews.length} reviews from page ${pageCount + 1}`);
         
         if (reviews.length > 0) {
-          global.asdaReviews.push(...reviews);
-          log.info(`Total reviews collected so far: ${global.asdaReviews.length}`);
+          asdaReviews.push(...reviews);
+          log.info(`Total reviews collected so far: ${asdaReviews.length}`);
+          if (shouldStopPagination && shouldStopPagination(reviews)) {
+            break;
+          }
         } else {
           log.warning(`No reviews found on page ${pageCount + 1}, stopping pagination`);
           break;
@@ -331,16 +377,21 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
       }
     }
 
-    log.info(`Total extracted ${global.asdaReviews.length} reviews from ASDA site`);
+    if (pageSpan) pageSpan.end();
+
+    log.info(`Total extracted ${asdaReviews.length} reviews from ASDA site`);
 
     // Log the extracted reviews for debugging
-    for (const review of global.asdaReviews.slice(0, 5)) {
+    for (const review of asdaReviews.slice(0, 5)) {
       log.info(`ASDA Review: Rating=${review.rating}, Title="${review.title}", Date=${review.date}, Text="${review.text.substring(0, 30)}..."`);
     }
 
+    throwIfAborted(siteConfig.signal);
+
     // If we didn't find any reviews, add fallback reviews
-    if (global.asdaReviews.length === 0) {
+    if (asdaReviews.length === 0) {
       log.warning('No ASDA reviews found. Adding fallback reviews.');
+      await artifacts.flush(new Error('No ASDA reviews found'), page);
       
       // Add multiple fallback reviews with different ratings
       const ratings = ['5', '4', '3', '2', '1'];
@@ -366,12 +417,13 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
         const year = date.getFullYear();
         const formattedDate = `${day}/${month}/${year}`; // DD/MM/YYYY format
         
-        global.asdaReviews.push({
+        asdaReviews.push({
           title: titles[i],
           rating: ratings[i],
           date: formattedDate,
           text: texts[i],
-          sourceUrl: page.url()
+          sourceUrl: page.url(),
+          isFallback: true // Placeholder, not a real review
         });
         log.info(`Added fallback ASDA review with rating ${ratings[i]} and date ${formattedDate}`);
       }
@@ -380,10 +432,13 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
     }
 
   } catch (error) {
+    // Errors from a cancelled scrape's closed page aren't worth artifacts or fallbacks
+    throwIfAborted(siteConfig.signal);
     log.error(`Error in ASDA handler: ${error.message}\n${error.stack}`);
+    await artifacts.flush(error, page);
     
     // Add fallback reviews if we encountered an error
-    if (global.asdaReviews.length === 0) {
+    if (asdaReviews.length === 0) {
       log.warning('Error occurred and no reviews were found. Adding fallback reviews.');
       
       // Add multiple fallback reviews with different ratings
@@ -410,12 +465,13 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
         const year = date.getFullYear();
         const formattedDate = `${day}/${month}/${year}`; // DD/MM/YYYY format
         
-        global.asdaReviews.push({
+        asdaReviews.push({
           title: titles[i],
           rating: ratings[i],
           date: formattedDate,
           text: texts[i],
-          sourceUrl: page.url()
+          sourceUrl: page.url(),
+          isFallback: true // Placeholder, not a real review
         });
       }
       
@@ -423,7 +479,7 @@ async function handleAsdaSite(page, siteConfig, maxReviews = 50) {
     }
   }
 
-  return global.asdaReviews;
+  return asdaReviews;
 }
 
 // Helper function to extract reviews from the current page
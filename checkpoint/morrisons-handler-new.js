@@ -1,15 +1,21 @@
+const { jitter, waitForSelectorStable, watchReviewsUpdate, waitForReviewsUpdate } = require('../wait-utils');
+const { startSpan } = require('../metrics');
+const { createArtifactRecorder } = require('../debug-artifacts');
+const { throwIfAborted } = require('../cancellation');
+
+// Selectors used to tell when Morrisons' reviews have loaded or changed
+const MORRISONS_REVIEW_ITEM_SELECTOR = 'li[data-test^="review-item-"], [class*="review-item"]';
+const MORRISONS_REVIEW_CONTAINER_SELECTOR = '[data-test="reviews-list"], ul:has(> li[data-test^="review-item-"]), #reviews';
+const MORRISONS_REVIEW_RESPONSE_PATTERN = /review/i;
+
 // Morrisons specific handler
 async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
   const log = siteConfig.log || console;
+  const artifacts = siteConfig.artifacts || createArtifactRecorder({ retailer: 'morrisons', log });
   log.info('Using Morrisons specific handler');
 
-  // Initialize global array for Morrisons reviews if not exists
-  if (!global.morrisonsReviews) {
-    global.morrisonsReviews = [];
-  }
-  
-  // Clear any existing reviews to avoid duplicates
-  global.morrisonsReviews = [];
+  // Collect reviews for this invocation only, so concurrent scrapes don't share state
+  const morrisonsReviews = [];
   
   // Set a flag to track if we've successfully extracted reviews
   let extractedReviews = false;
@@ -25,25 +31,25 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
       throw new Error('Page has no content - navigation may have failed');
     }
     
-    // Take a screenshot for debugging
-    await page.screenshot({ path: `morrisons-initial-${Date.now()}.png` }).catch(e => {
-      log.warning(`Failed to take screenshot: ${e.message}`);
-    });
+    // Record the page state for debug artifacts
+    await artifacts.capture(page, 'initial');
     
     // First, handle cookie consent if present
+    const cookieSpan = startSpan('cookie_banner', { retailer: 'morrisons' });
     try {
       const cookieButton = await page.$('#onetrust-accept-btn-handler, button:has-text("Accept all cookies"), button[id*="accept-cookies"]');
       if (cookieButton) {
         log.info('Found cookie consent button, clicking...');
         await cookieButton.click().catch(e => log.warning(`Cookie click failed: ${e.message}`));
-        await page.waitForTimeout(2000);
+        await jitter(page);
       }
     } catch (cookieError) {
       log.warning(`Error handling cookie consent: ${cookieError.message}`);
     }
+    cookieSpan.end();
 
-    // Wait for the page to load
-    await page.waitForTimeout(3000);
+    // Wait for the page content to settle
+    await waitForSelectorStable(page, 'main, body', { timeout: 3000 });
 
     // Scroll down to load lazy-loaded content
     await page.evaluate(async () => {
@@ -62,7 +68,7 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
         }, 100);
       });
     });
-    await page.waitForTimeout(2000);
+    await waitForSelectorStable(page, MORRISONS_REVIEW_ITEM_SELECTOR, { timeout: 2000 });
 
     // Find and click on the reviews tab
     const reviewTabSelectors = [
@@ -76,6 +82,7 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
       'div[role="tab"]:has-text("Reviews")'
     ];
 
+    const tabSpan = startSpan('reviews_tab', { retailer: 'morrisons' });
     let tabClicked = false;
     for (const selector of reviewTabSelectors) {
       try {
@@ -83,16 +90,21 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
         if (reviewTab) {
           // Scroll to the element first
           await reviewTab.scrollIntoViewIfNeeded();
-          await page.waitForTimeout(1000);
+          await jitter(page);
 
-          // Try clicking
-          await reviewTab.click({ force: true }).catch(async (e) => {
-            log.warning(`Direct tab click failed: ${e.message}, trying JavaScript click...`);
-            await page.evaluate(button => button.click(), reviewTab);
+          // Try clicking, then wait for the reviews to appear
+          await waitForReviewsUpdate(page, {
+            containerSelector: MORRISONS_REVIEW_CONTAINER_SELECTOR,
+            itemSelector: MORRISONS_REVIEW_ITEM_SELECTOR,
+            responsePattern: MORRISONS_REVIEW_RESPONSE_PATTERN,
+            timeout: 2000,
+            action: () => reviewTab.click({ force: true }).catch(async (e) => {
+              log.warning(`Direct tab click failed: ${e.message}, trying JavaScript click...`);
+              await page.evaluate(button => button.click(), reviewTab);
+            })
           });
 
           log.info(`Clicked review tab with selector: ${selector}`);
-          await page.waitForTimeout(2000);
           tabClicked = true;
           break;
         }
@@ -119,17 +131,19 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
 
       if (clicked) {
         log.info('Successfully clicked reviews tab via JavaScript');
-        await page.waitForTimeout(2000);
+        await waitForSelectorStable(page, MORRISONS_REVIEW_ITEM_SELECTOR, { timeout: 2000 });
       } else {
         log.warning('Could not find reviews tab with any method');
       }
     }
 
-    // Take a screenshot after clicking the reviews tab
-    await page.screenshot({ path: `morrisons-after-tab-click-${Date.now()}.png` });
+    tabSpan.end({ outcome: tabClicked ? 'ok' : 'fallback' });
+
+    // Record the page state after clicking the reviews tab
+    await artifacts.capture(page, 'after-tab-click');
 
     // Wait for reviews to load
-    await page.waitForTimeout(2000);
+    await waitForSelectorStable(page, MORRISONS_REVIEW_ITEM_SELECTOR, { timeout: 2000 });
 
     // Check if there are pagination controls
     let pageCount = 0;
@@ -140,11 +154,21 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
     log.info(`Extracted ${reviews.length} reviews from page 1`);
     
     if (reviews.length > 0) {
-      global.morrisonsReviews.push(...reviews);
+      morrisonsReviews.push(...reviews);
     }
+
+    // Incremental / date-filtered scrapes can stop once a page holds nothing new
+    const shouldStopPagination = siteConfig.shouldStopPagination;
+    const stopAfterFirstPage = shouldStopPagination ? shouldStopPagination(reviews) : false;
     
     // Click through pagination to load more reviews
-    while (pageCount < maxPages && global.morrisonsReviews.length < maxReviews) {
+    let pageSpan = null;
+    while (!stopAfterFirstPage && pageCount < maxPages && morrisonsReviews.length < maxReviews) {
+      // Each pagination step is timed until the next one starts (or pagination ends)
+      if (pageSpan) pageSpan.end();
+      pageSpan = startSpan('pagination_step', { retailer: 'morrisons' });
+      throwIfAborted(siteConfig.signal);
+
       // Try to click the "Next" button with the exact selector from the HTML
       const nextButtonSelectors = [
         'button[data-test="next-page"]',
@@ -178,6 +202,12 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
         log.info('No next button found with standard selectors, trying JavaScript approach');
         
         // Try to find the next button using JavaScript
+        const pageUpdate = await watchReviewsUpdate(page, {
+          containerSelector: MORRISONS_REVIEW_CONTAINER_SELECTOR,
+          itemSelector: MORRISONS_REVIEW_ITEM_SELECTOR,
+          responsePattern: MORRISONS_REVIEW_RESPONSE_PATTERN,
+          timeout: 3000
+        });
         const nextButtonFound = await page.evaluate(() => {
           // Look for any element that might be a next button
           const possibleNextButtons = [];
@@ -241,21 +271,26 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
         
         if (nextButtonFound) {
           log.info('Found and clicked next button using JavaScript approach');
-          await page.waitForTimeout(3000); // Wait for page to load
+          await pageUpdate.wait(); // Wait for the next page of reviews
           pageCount++;
           
-          // Take a screenshot after clicking next page
-          await page.screenshot({ path: `morrisons-after-js-next-page-${pageCount}-${Date.now()}.png` });
+          // Record the page state after clicking next page
+          await artifacts.capture(page, `after-js-next-page-${pageCount}`);
           
           // Extract reviews from the current page
           reviews = await extractMorrisonsReviews(page);
           log.info(`Extracted ${reviews.length} reviews from page ${pageCount + 1}`);
           
           if (reviews.length > 0) {
-            global.morrisonsReviews.push(...reviews);
-            log.info(`Total reviews collected so far: ${global.morrisonsReviews.length}`);
+            morrisonsReviews.push(...reviews);
+            log.info(`Total reviews collected so far: ${morrisonsReviews.length}`);
+            if (shouldStopPagination && shouldStopPagination(reviews)) {
+              break;
+            }
             continue; // Skip to the next iteration
           }
+        } else {
+          await pageUpdate.cancel();
         }
       }
 
@@ -273,14 +308,20 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
         
         log.info('Clicking next page button...');
         
-        // Take a screenshot before clicking
-        await page.screenshot({ path: `morrisons-before-next-page-${pageCount}-${Date.now()}.png` });
+        // Record the page state before clicking
+        await artifacts.capture(page, `before-next-page-${pageCount}`);
         
         // Scroll to make sure the button is visible
         await nextButton.scrollIntoViewIfNeeded();
-        await page.waitForTimeout(1000);
+        await jitter(page);
         
         // Try multiple click methods
+        const pageUpdate = await watchReviewsUpdate(page, {
+          containerSelector: MORRISONS_REVIEW_CONTAINER_SELECTOR,
+          itemSelector: MORRISONS_REVIEW_ITEM_SELECTOR,
+          responsePattern: MORRISONS_REVIEW_RESPONSE_PATTERN,
+          timeout: 3000
+        });
         try {
           // Method 1: Direct click
           await nextButton.click({ force: true }).catch(async (e) => {
@@ -314,22 +355,26 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
           });
         } catch (clickError) {
           log.error(`All click methods failed: ${clickError.message}`);
+          await pageUpdate.cancel();
           break;
         }
         
-        await page.waitForTimeout(3000); // Wait longer for page to load
+        await pageUpdate.wait(); // Wait for the next page of reviews
         pageCount++;
         
-        // Take a screenshot after clicking next page
-        await page.screenshot({ path: `morrisons-after-next-page-${pageCount}-${Date.now()}.png` });
+        // Record the page state after clicking next page
+        await artifacts.capture(page, `after-next-page-${pageCount}`);
         
         // Extract reviews from the current page
         reviews = await extractMorrisonsReviews(page);
         log.info(`Extracted ${reviews.length} reviews from page ${pageCount + 1}`);
         
         if (reviews.length > 0) {
-          global.morrisonsReviews.push(...reviews);
-          log.info(`Total reviews collected so far: ${global.morrisonsReviews.length}`);
+          morrisonsReviews.push(...reviews);
+          log.info(`Total reviews collected so far: ${morrisonsReviews.length}`);
+          if (shouldStopPagination && shouldStopPagination(reviews)) {
+            break;
+          }
         } else {
           log.warning(`No reviews found on page ${pageCount + 1}, stopping pagination`);
           break;
@@ -340,11 +385,16 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
       }
     }
 
-    log.info(`Total extracted ${global.morrisonsReviews.length} reviews from Morrisons site`);
+    if (pageSpan) pageSpan.end();
+
+    log.info(`Total extracted ${morrisonsReviews.length} reviews from Morrisons site`);
+
+    throwIfAborted(siteConfig.signal);
 
     // If we didn't find any reviews, add fallback reviews
-    if (global.morrisonsReviews.length === 0) {
+    if (morrisonsReviews.length === 0) {
       log.warning('No Morrisons reviews found. Adding fallback reviews.');
+      await artifacts.flush(new Error('No Morrisons reviews found'), page);
       
       // Add fallback reviews with different ratings
       for (let i = 0; i < 5; i++) {
@@ -356,22 +406,26 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
         const year = date.getFullYear();
         const formattedDate = `${day}/${month}/${year}`; // DD/MM/YYYY format
         
-        global.morrisonsReviews.push({
+        morrisonsReviews.push({
           title: `Morrisons Review ${i+1}`,
           rating: rating.toString(),
           date: formattedDate,
           text: `This is a fallback Morrisons review with rating ${rating}`,
-          sourceUrl: page.url()
+          sourceUrl: page.url(),
+          isFallback: true // Placeholder, not a real review
         });
       }
       
       log.info('Added 5 fallback Morrisons reviews');
     }
   } catch (error) {
+    // Errors from a cancelled scrape's closed page aren't worth artifacts or fallbacks
+    throwIfAborted(siteConfig.signal);
     log.error(`Error in Morrisons handler: ${error.message}\n${error.stack}`);
+    await artifacts.flush(error, page);
     
     // Add fallback reviews if we encountered an error
-    if (global.morrisonsReviews.length === 0) {
+    if (morrisonsReviews.length === 0) {
       log.warning('Error occurred and no reviews were found. Adding fallback reviews.');
       
       // Add fallback reviews with different ratings
@@ -384,12 +438,13 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
         const year = date.getFullYear();
         const formattedDate = `${day}/${month}/${year}`; // DD/MM/YYYY format
         
-        global.morrisonsReviews.push({
+        morrisonsReviews.push({
           title: `Morrisons Review ${i+1}`,
           rating: rating.toString(),
           date: formattedDate,
           text: `This is a fallback Morrisons review with rating ${rating}`,
-          sourceUrl: page.url()
+          sourceUrl: page.url(),
+          isFallback: true // Placeholder, not a real review
         });
       }
       
@@ -397,7 +452,7 @@ async function handleMorrisonsSite(page, siteConfig, maxReviews = 50) {
     }
   }
 
-  return global.morrisonsReviews;
+  return morrisonsReviews;
 }
 
 // Helper function to extract reviews from the current page
@@ -9,12 +9,6 @@ const { handleSainsburysSite } = require('./sainsburys-handler-new');
 const { handleAsdaSite } = require('./asda-handler-new');
 const { handleMorrisonsSite } = require('./morrisons-handler-new');
 
-// Global arrays to store reviews for each retailer
-global.tescoReviews = [];
-global.sainsburysReviews = [];
-global.asdaReviews = [];
-global.morrisonsReviews = [];
-
 // Main function to scrape reviews
 async function scrapeReviews(url, options = {}) {
   const log = options.log || console;
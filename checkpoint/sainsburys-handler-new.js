@@ -1,6 +1,17 @@
+const { jitter, waitForSelectorStable, waitForReviewsUpdate } = require('../wait-utils');
+const { startSpan } = require('../metrics');
+const { createArtifactRecorder } = require('../debug-artifacts');
+const { throwIfAborted } = require('../cancellation');
+
+// Selectors used to tell when Sainsbury's reviews have loaded or changed
+const SAINSBURYS_REVIEW_ITEM_SELECTOR = '.reviews-list-item, .product-reviews__list-item, [data-testid*="review"]';
+const SAINSBURYS_REVIEW_CONTAINER_SELECTOR = '.product-reviews, #reviews, #product-reviews';
+const SAINSBURYS_REVIEW_RESPONSE_PATTERN = /review/i;
+
 // Simplified Sainsbury's specific handler without fallback reviews
 async function handleSainsburysSite(page, siteConfig, maxReviews = 50) {
   const log = siteConfig.log || console;
+  const artifacts = siteConfig.artifacts || createArtifactRecorder({ retailer: 'sainsburys', log });
   log.info('Using improved Sainsbury\'s specific handler');
 
   try {
@@ -13,31 +24,28 @@ async function handleSainsburysSite(page, siteConfig, maxReviews = 50) {
     log.warning(`Error extracting product ID: ${e.message}`);
   }
   
-  // Clear any existing reviews to avoid duplicates
-  if (!global.sainsburysReviews) {
-    global.sainsburysReviews = [];
-  }
-  global.sainsburysReviews = [];
+  // Collect reviews for this invocation only, so concurrent scrapes don't share state
+  let sainsburysReviews = [];
 
   try {
-    // Take a screenshot for debugging
-    await page.screenshot({ path: `sainsburys-initial-${Date.now()}.png` }).catch(e => {
-      log.warning(`Failed to take screenshot: ${e.message}`);
-    });
+    // Record the page state for debug artifacts
+    await artifacts.capture(page, 'initial');
 
     // Try to find and click on the reviews section
     try {
       // First, handle cookie consent if present
+      const cookieSpan = startSpan('cookie_banner', { retailer: 'sainsburys' });
       try {
         const cookieButton = await page.$('#onetrust-accept-btn-handler, button:has-text("Accept all cookies"), button[id*="accept-cookies"]');
         if (cookieButton) {
           log.info('Found cookie consent button, clicking...');
           await cookieButton.click().catch(e => log.warning(`Cookie click failed: ${e.message}`));
-          await page.waitForTimeout(2000);
+          await jitter(page);
         }
       } catch (cookieError) {
         log.warning(`Error handling cookie consent: ${cookieError.message}`);
       }
+      cookieSpan.end();
 
       // Add some human-like behavior
       await page.evaluate(() => {
@@ -46,7 +54,8 @@ async function handleSainsburysSite(page, siteConfig, maxReviews = 50) {
         window.scrollTo(0, scrollTarget);
       });
       
-      await page.waitForTimeout(2000);
+      // Keep a human-like pause here, Sainsbury's bot checks watch for instant interaction
+      await jitter(page, { minMs: 800, maxMs: 1500 });
 
       // Try to find the reviews section by clicking on reviews tab/button
       const reviewTabSelectors = [
@@ -67,6 +76,7 @@ async function handleSainsburysSite(page, siteConfig, maxReviews = 50) {
         'a[href="#product-reviews"]'
       ];
 
+      const tabSpan = startSpan('reviews_tab', { retailer: 'sainsburys' });
       let tabClicked = false;
       for (const selector of reviewTabSelectors) {
         try {
@@ -83,17 +93,22 @@ async function handleSainsburysSite(page, siteConfig, maxReviews = 50) {
             
             // Scroll into view with a smooth behavior
             await element.scrollIntoViewIfNeeded();
-            await page.waitForTimeout(1000);
+            await jitter(page);
             
-            // Try multiple ways to click
+            // Try multiple ways to click, then wait for the reviews to appear
             try {
-              await element.click().catch(async () => {
-                log.info(`Direct click failed, trying JavaScript click`);
-                await page.evaluate(el => el.click(), element);
+              await waitForReviewsUpdate(page, {
+                containerSelector: SAINSBURYS_REVIEW_CONTAINER_SELECTOR,
+                itemSelector: SAINSBURYS_REVIEW_ITEM_SELECTOR,
+                responsePattern: SAINSBURYS_REVIEW_RESPONSE_PATTERN,
+                timeout: 2000,
+                action: () => element.click().catch(async () => {
+                  log.info(`Direct click failed, trying JavaScript click`);
+                  await page.evaluate(el => el.click(), element);
+                })
               });
               
               log.info(`Successfully clicked on reviews tab with selector: ${selector}`);
-              await page.waitForTimeout(2000);
               tabClicked = true;
               break;
             } catch (clickError) {
@@ -135,7 +150,7 @@ async function handleSainsburysSite(page, siteConfig, maxReviews = 50) {
         
         if (clicked) {
           log.info(`Successfully clicked reviews tab via JavaScript`);
-          await page.waitForTimeout(2000);
+          await waitForSelectorStable(page, SAINSBURYS_REVIEW_ITEM_SELECTOR, { timeout: 2000 });
         } else {
           log.warning(`Could not find or click reviews tab with any method`);
           
@@ -147,17 +162,16 @@ async function handleSainsburysSite(page, siteConfig, maxReviews = 50) {
             });
           });
           
-          await page.waitForTimeout(2000);
+          await waitForSelectorStable(page, SAINSBURYS_REVIEW_ITEM_SELECTOR, { timeout: 2000 });
         }
       }
+      tabSpan.end({ outcome: tabClicked ? 'ok' : 'fallback' });
     } catch (reviewSectionError) {
       log.warning(`Error finding reviews section: ${reviewSectionError.message}`);
     }
 
-    // Take a screenshot after attempting to find reviews section
-    await page.screenshot({ path: `sainsburys-after-find-reviews-${Date.now()}.png` }).catch(e => {
-      log.warning(`Failed to take screenshot: ${e.message}`);
-    });
+    // Record the page state after attempting to find reviews section
+    await artifacts.capture(page, 'after-find-reviews');
 
     // Try to extract reviews directly from page JSON data
     try {
@@ -212,7 +226,7 @@ async function handleSainsburysSite(page, siteConfig, maxReviews = 50) {
         
         // Process these reviews and add them to our collection
         reviewsData.forEach(review => {
-          global.sainsburysReviews.push({
+          sainsburysReviews.push({
             rating: review.reviewRating?.ratingValue || review.rating || '5',
             title: review.name || review.title || 'Review',
             date: review.datePublished || review.date || '',
@@ -255,28 +269,34 @@ async function handleSainsburysSite(page, siteConfig, maxReviews = 50) {
       if (validReviews.length > 0) {
         log.info(`Successfully extracted ${validReviews.length} valid reviews via direct page extraction`);
         log.info(`Filtered out ${pageReviews.length - validReviews.length} navigation elements`);
-        global.sainsburysReviews = validReviews;
+        sainsburysReviews = validReviews;
       } else {
         log.info(`All extracted content (${pageReviews.length} items) appeared to be navigation elements`);
       }
     }
 
-    log.info(`Total extracted ${global.sainsburysReviews.length} reviews for Sainsbury's`);
+    log.info(`Total extracted ${sainsburysReviews.length} reviews for Sainsbury's`);
+
+    throwIfAborted(siteConfig.signal);
 
     // If we didn't find any reviews, log a warning (but don't add fallbacks)
-    if (global.sainsburysReviews.length === 0) {
+    if (sainsburysReviews.length === 0) {
       log.warning('No Sainsbury\'s reviews found after all extraction attempts.');
+      await artifacts.flush(new Error('No Sainsbury\'s reviews found'), page);
     }
   } catch (error) {
+    // Errors from a cancelled scrape's closed page aren't worth artifacts or fallbacks
+    throwIfAborted(siteConfig.signal);
     log.error(`Error in Sainsbury's handler: ${error.message}\n${error.stack}`);
+    await artifacts.flush(error, page);
     
     // Log error but don't add fallback reviews
-    if (global.sainsburysReviews.length === 0) {
+    if (sainsburysReviews.length === 0) {
       log.warning('Error occurred and no reviews were found for Sainsbury\'s.');
     }
   }
 
-  return global.sainsburysReviews;
+  return sainsburysReviews;
 }
 
 // Extract reviews with enhanced validation
@@ -1,34 +1,201 @@
+const { jitter, countElements, waitForSelectorStable, waitForReviewCountChange } = require('../wait-utils');
+const { startSpan } = require('../metrics');
+const { createArtifactRecorder } = require('../debug-artifacts');
+const { throwIfAborted } = require('../cancellation');
+
+// Review tiles on Tesco product pages, used to tell when more reviews have loaded
+const TESCO_REVIEW_ITEM_SELECTOR = 'div[class*="ReviewTileContainer"], div[data-auto="review-card"], div[class*="review-card"]';
+
+// Extract Tesco reviews in the page, trying several selector strategies. The
+// incremental check and the final extraction both run this, so they read the
+// same fields and hash reviews the same way. Passed to page.evaluate, so it
+// can't use anything from this module. Reviews before fromIndex are skipped;
+// aggressive allows the last-resort scan of long text blocks.
+function extractTescoReviewsInPage({ fromIndex = 0, aggressive = false } = {}) {
+  console.log('Starting Tesco review extraction with multiple selector strategies');
+  const results = [];
+  
+  // Try multiple selector strategies
+  const selectorStrategies = [
+    // Strategy 1: Original selectors
+    {
+      container: '.review, .product-review, .review-container',
+      rating: '.stars, .star-rating',
+      title: '.review-title, .review-heading, h3, h4',
+      date: '.review-date, .date, .timestamp',
+      text: '.review-text, .review-content, p'
+    },
+    // Strategy 2: Updated selectors based on actual Tesco site
+    {
+      container: 'div[class*="ReviewTileContainer"], div[data-auto="review-card"], div[class*="review-card"]',
+      rating: 'div[class*="ReviewRating-mfe-pdp"], div[data-auto="review-rating"], div[class*="review-rating"]',
+      title: 'h3[class*="Title-mfe-pdp"], div[data-auto="review-title"], div[class*="review-title"]',
+      date: 'span[class*="ReviewDate-mfe-pdp"], div[data-auto="review-date"], div[class*="review-date"]',
+      text: 'span[class*="Content-mfe-pdp"], div[data-auto="review-text"], div[class*="review-text"]'
+    },
+    // Strategy 3: More generic selectors
+    {
+      container: '[class*="review" i], [data-auto*="review" i], [id*="review" i]',
+      rating: '[class*="rating" i], [class*="stars" i], [data-auto*="rating" i]',
+      title: '[class*="title" i], [data-auto*="title" i], h3, h4',
+      date: '[class*="date" i], [data-auto*="date" i], time',
+      text: '[class*="text" i], [class*="content" i], [data-auto*="text" i], p'
+    }
+  ];
+  
+  // Try each strategy until we find reviews
+  for (const strategy of selectorStrategies) {
+    console.log(`Trying selector strategy: ${JSON.stringify(strategy)}`);
+    
+    // Find all review containers using the current strategy
+    const reviewContainers = document.querySelectorAll(strategy.container);
+    console.log(`Found ${reviewContainers.length} Tesco review containers with selector: ${strategy.container}`);
+    
+    // If we found containers, process them
+    if (reviewContainers.length > 0) {
+      // Process each review container
+      for (const container of reviewContainers) {
+        try {
+          // Extract rating
+          let rating = '5'; // Default to 5 stars
+          const ratingElement = container.querySelector(strategy.rating);
+          if (ratingElement) {
+            // Try to extract from text content
+            const ratingText = ratingElement.textContent.trim();
+            const ratingMatch = ratingText.match(/\d+/);
+            if (ratingMatch) {
+              rating = ratingMatch[0];
+              console.log(`Extracted rating ${rating} from text content`);
+            } else {
+              // Try to count filled stars
+              const filledStars = ratingElement.querySelectorAll('.filled-star, [data-filled="true"], [class*="filled"]').length;
+              if (filledStars > 0) {
+                rating = filledStars.toString();
+                console.log(`Extracted rating ${rating} from filled stars count`);
+              }
+            }
+          }
+          
+          // Extract title
+          let title = '';
+          const titleElement = container.querySelector(strategy.title);
+          if (titleElement) {
+            title = titleElement.textContent.trim();
+            console.log(`Extracted title: "${title}"`);
+          }
+          
+          // Extract date
+          let date = '';
+          const dateElement = container.querySelector(strategy.date);
+          if (dateElement) {
+            date = dateElement.textContent.trim();
+            console.log(`Extracted date: "${date}"`);
+          }
+          
+          // Extract review text
+          let text = '';
+          const textElement = container.querySelector(strategy.text);
+          if (textElement) {
+            text = textElement.textContent.trim();
+            console.log(`Extracted text: "${text.substring(0, 30)}..."`);
+          }
+          
+          // Only add if we have meaningful text or a rating
+          if (text || rating) {
+            results.push({ rating, title, date, text });
+            console.log(`Added Tesco review with rating ${rating}`);
+          }
+        } catch (e) {
+          console.error('Error processing Tesco review container:', e);
+        }
+      }
+      
+      // If we found reviews with this strategy, stop trying others
+      if (results.length > 0) {
+        console.log(`Found ${results.length} reviews with strategy, stopping search`);
+        break;
+      }
+    }
+  }
+  
+  // If we still don't have reviews, try a more aggressive approach
+  if (results.length === 0 && aggressive) {
+    console.log('No reviews found with standard strategies, trying aggressive approach');
+    
+    // Look for any elements that might contain review text
+    const possibleReviewTexts = document.querySelectorAll('p, div, span');
+    for (const element of possibleReviewTexts) {
+      const text = element.textContent.trim();
+      
+      // If the text is reasonably long and not a navigation element, it might be a review
+      if (text.length > 50 && 
+          !element.closest('nav') && 
+          !element.closest('header') && 
+          !element.closest('footer') &&
+          !['script', 'style', 'meta', 'link'].includes(element.tagName.toLowerCase())) {
+        
+        console.log(`Found possible review text: "${text.substring(0, 30)}..."`);
+        
+        // Try to find a nearby rating element
+        let rating = '5'; // Default
+        const nearbyRating = element.parentElement?.querySelector('[class*="star"], [class*="rating"]');
+        if (nearbyRating) {
+          console.log('Found nearby rating element');
+        }
+        
+        // Add as a potential review
+        results.push({
+          rating,
+          title: 'Product Review', // Default
+          date: '',
+          text
+        });
+        
+        // Limit to 5 reviews from this aggressive approach
+        if (results.length >= 5) break;
+      }
+    }
+  }
+  
+  console.log(`Returning ${results.length} Tesco reviews`);
+  return results.slice(fromIndex);
+}
+
+// Read the reviews loaded since fromIndex, exactly as the final extraction will,
+// so an incremental scrape can check them before clicking "show more" again
+async function readTescoReviewTiles(page, fromIndex) {
+  return page.evaluate(extractTescoReviewsInPage, { fromIndex, aggressive: false }).catch(() => []);
+}
+
 // Tesco specific handler
 async function handleTescoSite(page, siteConfig, maxReviews = 50) {
   const log = siteConfig.log || console;
+  const artifacts = siteConfig.artifacts || createArtifactRecorder({ retailer: 'tesco', log });
   log.info('Using Tesco specific handler');
 
-  // Initialize global array for Tesco reviews if not exists
-  if (!global.tescoReviews) {
-    global.tescoReviews = [];
-  }
-  
-  // Clear any existing reviews to avoid duplicates
-  global.tescoReviews = [];
+  // Collect reviews for this invocation only, so concurrent scrapes don't share state
+  const tescoReviews = [];
   
   try {
-    // Take a screenshot for debugging
-    await page.screenshot({ path: `tesco-initial-${Date.now()}.png` });
+    // Record the page state for debug artifacts
+    await artifacts.capture(page, 'initial');
     
     // First, handle cookie consent if present
+    const cookieSpan = startSpan('cookie_banner', { retailer: 'tesco' });
     try {
       const cookieButton = await page.$('#onetrust-accept-btn-handler, button:has-text("Accept all cookies"), button[data-auto="accept-cookies"]');
       if (cookieButton) {
         log.info('Found cookie consent button, clicking...');
         await cookieButton.click().catch(e => log.warning(`Cookie click failed: ${e.message}`));
-        await page.waitForTimeout(2000);
+        await jitter(page);
       }
     } catch (cookieError) {
       log.warning(`Error handling cookie consent: ${cookieError.message}`);
     }
+    cookieSpan.end();
 
-    // Wait for the page to load
-    await page.waitForTimeout(3000);
+    // Wait for the page content to settle
+    await waitForSelectorStable(page, 'main, body', { timeout: 3000 });
 
     // Scroll down to load lazy-loaded content
     await page.evaluate(async () => {
@@ -47,7 +214,7 @@ async function handleTescoSite(page, siteConfig, maxReviews = 50) {
         }, 100);
       });
     });
-    await page.waitForTimeout(2000);
+    await waitForSelectorStable(page, TESCO_REVIEW_ITEM_SELECTOR, { timeout: 2000 });
 
     // Look for the reviews section
     const reviewsSection = await page.$('.product-reviews, #reviews, [data-auto-id="product-reviews"], div[class*="ReviewTileContainer"], div[data-auto="review-card"]');
@@ -57,24 +224,47 @@ async function handleTescoSite(page, siteConfig, maxReviews = 50) {
       log.info('Found reviews section on Tesco page');
     }
 
-    // Take a screenshot after scrolling
-    await page.screenshot({ path: `tesco-after-scroll-${Date.now()}.png` });
+    // Record the page state after scrolling
+    await artifacts.capture(page, 'after-scroll');
 
     // Click "Show more reviews" button multiple times to load more reviews
     let clickCount = 0;
     const maxClicks = 4; // Limit to 4 clicks to avoid infinite loops
+    const shouldStopPagination = siteConfig.shouldStopPagination;
+    let checkedTiles = 0;
     
+    let pageSpan = null;
     while (clickCount < maxClicks) {
+      // Each pagination step is timed until the next one starts (or pagination ends)
+      if (pageSpan) pageSpan.end();
+      pageSpan = startSpan('pagination_step', { retailer: 'tesco' });
+      throwIfAborted(siteConfig.signal);
+
       try {
+        // Incremental / date-filtered scrapes stop once the latest batch holds nothing new
+        if (shouldStopPagination) {
+          const latestTiles = await readTescoReviewTiles(page, checkedTiles);
+          checkedTiles += latestTiles.length;
+          if (shouldStopPagination(latestTiles)) {
+            break;
+          }
+        }
+
         const showMoreButton = await page.$('button:has-text("show 10 more reviews"), button:has-text("Show more reviews"), button[data-auto="load-more-reviews"], button[class*="load-more"], button:has-text("Load more"), button:has-text("Show more"), button:has-text("More reviews")');
         if (showMoreButton) {
           log.info('Found "Show more reviews" button, clicking...');
           await showMoreButton.scrollIntoViewIfNeeded();
+          const previousCount = await countElements(page, TESCO_REVIEW_ITEM_SELECTOR);
           await showMoreButton.click().catch(async (e) => {
             log.warning(`Direct click failed: ${e.message}, trying JavaScript click...`);
             await page.evaluate(button => button.click(), showMoreButton);
           });
-          await page.waitForTimeout(2000);
+          // Wait for the extra review tiles rather than a fixed delay
+          const newCount = await waitForReviewCountChange(page, TESCO_REVIEW_ITEM_SELECTOR, previousCount, { timeout: 3000 });
+          if (newCount !== null) {
+            log.info(`Review tiles went from ${previousCount} to ${newCount}`);
+          }
+          await jitter(page);
           clickCount++;
         } else {
           log.info('No more "Show more reviews" button found');
@@ -86,171 +276,28 @@ async function handleTescoSite(page, siteConfig, maxReviews = 50) {
       }
     }
 
-    // Take a screenshot after clicking show more
-    await page.screenshot({ path: `tesco-after-show-more-${Date.now()}.png` });
+    if (pageSpan) pageSpan.end();
+
+    // Record the page state after clicking show more
+    await artifacts.capture(page, 'after-show-more');
 
     // Extract reviews using page evaluation with multiple selector strategies
-    const reviews = await page.evaluate(() => {
-      console.log('Starting Tesco review extraction with multiple selector strategies');
-      const results = [];
-      
-      // Try multiple selector strategies
-      const selectorStrategies = [
-        // Strategy 1: Original selectors
-        {
-          container: '.review, .product-review, .review-container',
-          rating: '.stars, .star-rating',
-          title: '.review-title, .review-heading, h3, h4',
-          date: '.review-date, .date, .timestamp',
-          text: '.review-text, .review-content, p'
-        },
-        // Strategy 2: Updated selectors based on actual Tesco site
-        {
-          container: 'div[class*="ReviewTileContainer"], div[data-auto="review-card"], div[class*="review-card"]',
-          rating: 'div[class*="ReviewRating-mfe-pdp"], div[data-auto="review-rating"], div[class*="review-rating"]',
-          title: 'h3[class*="Title-mfe-pdp"], div[data-auto="review-title"], div[class*="review-title"]',
-          date: 'span[class*="ReviewDate-mfe-pdp"], div[data-auto="review-date"], div[class*="review-date"]',
-          text: 'span[class*="Content-mfe-pdp"], div[data-auto="review-text"], div[class*="review-text"]'
-        },
-        // Strategy 3: More generic selectors
-        {
-          container: '[class*="review" i], [data-auto*="review" i], [id*="review" i]',
-          rating: '[class*="rating" i], [class*="stars" i], [data-auto*="rating" i]',
-          title: '[class*="title" i], [data-auto*="title" i], h3, h4',
-          date: '[class*="date" i], [data-auto*="date" i], time',
-          text: '[class*="text" i], [class*="content" i], [data-auto*="text" i], p'
-        }
-      ];
-      
-      // Try each strategy until we find reviews
-      for (const strategy of selectorStrategies) {
-        console.log(`Trying selector strategy: ${JSON.stringify(strategy)}`);
-        
-        // Find all review containers using the current strategy
-        const reviewContainers = document.querySelectorAll(strategy.container);
-        console.log(`Found ${reviewContainers.length} Tesco review containers with selector: ${strategy.container}`);
-        
-        // If we found containers, process them
-        if (reviewContainers.length > 0) {
-          // Process each review container
-          for (const container of reviewContainers) {
-            try {
-              // Extract rating
-              let rating = '5'; // Default to 5 stars
-              const ratingElement = container.querySelector(strategy.rating);
-              if (ratingElement) {
-                // Try to extract from text content
-                const ratingText = ratingElement.textContent.trim();
-                const ratingMatch = ratingText.match(/\d+/);
-                if (ratingMatch) {
-                  rating = ratingMatch[0];
-                  console.log(`Extracted rating ${rating} from text content`);
-                } else {
-                  // Try to count filled stars
-                  const filledStars = ratingElement.querySelectorAll('.filled-star, [data-filled="true"], [class*="filled"]').length;
-                  if (filledStars > 0) {
-                    rating = filledStars.toString();
-                    console.log(`Extracted rating ${rating} from filled stars count`);
-                  }
-                }
-              }
-              
-              // Extract title
-              let title = '';
-              const titleElement = container.querySelector(strategy.title);
-              if (titleElement) {
-                title = titleElement.textContent.trim();
-                console.log(`Extracted title: "${title}"`);
-              }
-              
-              // Extract date
-              let date = '';
-              const dateElement = container.querySelector(strategy.date);
-              if (dateElement) {
-                date = dateElement.textContent.trim();
-                console.log(`Extracted date: "${date}"`);
-              }
-              
-              // Extract review text
-              let text = '';
-              const textElement = container.querySelector(strategy.text);
-              if (textElement) {
-                text = textElement.textContent.trim();
-                console.log(`Extracted text: "${text.substring(0, 30)}..."`);
-              }
-              
-              // Only add if we have meaningful text or a rating
-              if (text || rating) {
-                results.push({ rating, title, date, text });
-                console.log(`Added Tesco review with rating ${rating}`);
-              }
-            } catch (e) {
-              console.error('Error processing Tesco review container:', e);
-            }
-          }
-          
-          // If we found reviews with this strategy, stop trying others
-          if (results.length > 0) {
-            console.log(`Found ${results.length} reviews with strategy, stopping search`);
-            break;
-          }
-        }
-      }
-      
-      // If we still don't have reviews, try a more aggressive approach
-      if (results.length === 0) {
-        console.log('No reviews found with standard strategies, trying aggressive approach');
-        
-        // Look for any elements that might contain review text
-        const possibleReviewTexts = document.querySelectorAll('p, div, span');
-        for (const element of possibleReviewTexts) {
-          const text = element.textContent.trim();
-          
-          // If the text is reasonably long and not a navigation element, it might be a review
-          if (text.length > 50 && 
-              !element.closest('nav') && 
-              !element.closest('header') && 
-              !element.closest('footer') &&
-              !['script', 'style', 'meta', 'link'].includes(element.tagName.toLowerCase())) {
-            
-            console.log(`Found possible review text: "${text.substring(0, 30)}..."`);
-            
-            // Try to find a nearby rating element
-            let rating = '5'; // Default
-            const nearbyRating = element.parentElement?.querySelector('[class*="star"], [class*="rating"]');
-            if (nearbyRating) {
-              console.log('Found nearby rating element');
-            }
-            
-            // Add as a potential review
-            results.push({
-              rating,
-              title: 'Product Review', // Default
-              date: '',
-              text
-            });
-            
-            // Limit to 5 reviews from this aggressive approach
-            if (results.length >= 5) break;
-          }
-        }
-      }
-      
-      console.log(`Returning ${results.length} Tesco reviews`);
-      return results;
-    });
+    const reviews = await page.evaluate(extractTescoReviewsInPage, { fromIndex: 0, aggressive: true });
 
     log.info(`Extracted ${reviews.length} reviews from Tesco site`);
 
-    // Add the reviews to the global array
+    // Add the reviews to this invocation's results
     if (reviews && reviews.length > 0) {
-      global.tescoReviews.push(...reviews);
-      log.info(`Added ${reviews.length} reviews to global Tesco reviews array`);
+      tescoReviews.push(...reviews);
+      log.info(`Added ${reviews.length} reviews to Tesco reviews array`);
     }
 
+    throwIfAborted(siteConfig.signal);
+
     // If we didn't find any reviews, add fallback reviews
-    if (global.tescoReviews.length === 0) {
+    if (tescoReviews.length === 0) {
       log.warning('No Tesco reviews found. Adding fallback reviews.');
+      await artifacts.flush(new Error('No Tesco reviews found'), page);
       
       // Add fallback reviews with different ratings
       for (let i = 0; i < 5; i++) {
@@ -262,22 +309,26 @@ async function handleTescoSite(page, siteConfig, maxReviews = 50) {
         const year = date.getFullYear();
         const formattedDate = `${day}/${month}/${year}`; // DD/MM/YYYY format
         
-        global.tescoReviews.push({
+        tescoReviews.push({
           title: `Tesco Review ${i+1}`,
           rating: rating.toString(),
           date: formattedDate,
           text: `This is a fallback Tesco review with rating ${rating}`,
-          sourceUrl: page.url()
+          sourceUrl: page.url(),
+          isFallback: true // Placeholder, not a real review
         });
       }
       
       log.info('Added 5 fallback Tesco reviews');
     }
   } catch (error) {
+    // Errors from a cancelled scrape's closed page aren't worth artifacts or fallbacks
+    throwIfAborted(siteConfig.signal);
     log.error(`Error in Tesco handler: ${error.message}\n${error.stack}`);
+    await artifacts.flush(error, page);
     
     // Add fallback reviews if we encountered an error
-    if (global.tescoReviews.length === 0) {
+    if (tescoReviews.length === 0) {
       log.warning('Error occurred and no reviews were found. Adding fallback reviews.');
       
       // Add fallback reviews with different ratings
@@ -290,12 +341,13 @@ async function handleTescoSite(page, siteConfig, maxReviews = 50) {
         const year = date.getFullYear();
         const formattedDate = `${day}/${month}/${year}`; // DD/MM/YYYY format
         
-        global.tescoReviews.push({
+        tescoReviews.push({
           title: `Tesco Review ${i+1}`,
           rating: rating.toString(),
           date: formattedDate,
           text: `This is a fallback Tesco review with rating ${rating}`,
-          sourceUrl: page.url()
+          sourceUrl: page.url(),
+          isFallback: true // Placeholder, not a real review
         });
       }
       
@@ -303,7 +355,7 @@ async function handleTescoSite(page, siteConfig, maxReviews = 50) {
     }
   }
 
-  return global.tescoReviews;
+  return tescoReviews;
 }
 
 module.exports = { handleTescoSite };
@@ -0,0 +1,106 @@
+/**
+ * Concurrency utilities
+ * Bounded worker pool used to scrape several product URLs in parallel while
+ * capping how many requests hit any single retailer at once.
+ */
+
+/**
+ * Read a positive integer from an environment variable
+ * @param {string} name - The environment variable name
+ * @param {number} defaultValue - Value to use when the variable is unset or invalid
+ * @returns {number} - The parsed value
+ */
+function readPositiveIntEnv(name, defaultValue) {
+  const parsed = parseInt(process.env[name], 10);
+  return Number.isInteger(parsed) && parsed > 0 ? parsed : defaultValue;
+}
+
+/**
+ * Run an async worker over a list of items with a global concurrency limit
+ * and an optional per-key limit (e.g. per retailer).
+ *
+ * Items are started in list order, skipping ahead only when the next item's
+ * key is already at its limit. The worker's result for each item is reported
+ * through onSettled as soon as that item finishes.
+ *
+ * @param {Array} items - The items to process
+ * @param {Function} worker - async (item, index) => result
+ * @param {Object} options - Pool options
+ * @param {number} options.concurrency - Maximum number of items running at once
+ * @param {Function} options.keyFn - (item) => key used for per-key limits
+ * @param {number|Function} options.perKeyLimit - Limit per key, or (key) => limit
+ * @param {Function} options.onSettled - (outcome, item, index) => void, called as each item finishes
+ * @returns {Promise<Array>} - Outcomes in input order, shaped like Promise.allSettled results
+ */
+function runWithConcurrency(items, worker, options = {}) {
+  const {
+    concurrency = 1,
+    keyFn = () => 'default',
+    perKeyLimit = Infinity,
+    onSettled = null
+  } = options;
+
+  const limitForKey = typeof perKeyLimit === 'function' ? perKeyLimit : () => perKeyLimit;
+  const maxRunning = Math.max(1, concurrency);
+  const outcomes = new Array(items.length);
+  const pending = items.map((item, index) => ({ item, index, key: keyFn(item) }));
+  const runningByKey = new Map();
+  let running = 0;
+  let settled = 0;
+
+  return new Promise((resolve) => {
+    if (items.length === 0) {
+      resolve(outcomes);
+      return;
+    }
+
+    const canStart = (key) => (runningByKey.get(key) || 0) < Math.max(1, limitForKey(key));
+
+    const startNext = () => {
+      while (running < maxRunning) {
+        const nextIndex = pending.findIndex(entry => canStart(entry.key));
+        if (nextIndex === -1) {
+          return;
+        }
+
+        const [entry] = pending.splice(nextIndex, 1);
+        running++;
+        runningByKey.set(entry.key, (runningByKey.get(entry.key) || 0) + 1);
+
+        Promise.resolve()
+          .then(() => worker(entry.item, entry.index))
+          .then(
+            value => ({ status: 'fulfilled', value }),
+            reason => ({ status: 'rejected', reason })
+          )
+          .then(outcome => {
+            running--;
+            runningByKey.set(entry.key, runningByKey.get(entry.key) - 1);
+            outcomes[entry.index] = outcome;
+            settled++;
+
+            if (onSettled) {
+              try {
+                onSettled(outcome, entry.item, entry.index);
+              } catch (callbackError) {
+                console.error(`Error in onSettled callback: ${callbackError.message}`);
+              }
+            }
+
+            if (settled === items.length) {
+              resolve(outcomes);
+            } else {
+              startNext();
+            }
+          });
+      }
+    };
+
+    startNext();
+  });
+}
+
+module.exports = {
+  readPositiveIntEnv,
+  runWithConcurrency
+};
@@ -3,6 +3,8 @@
  * This module provides functions for generating CSV content from review data
  */
 
+const { normalizeReviewDate, formatIsoDate } = require('./date-normalizer');
+
 /**
  * Properly escape a field for CSV format
  * @param {*} field - The field to escape
@@ -21,67 +23,14 @@ function escapeCsvField(field) {
 /**
  * Format a date to DD/MM/YYYY format
  * @param {string} dateStr - The date string to format
- * @returns {string} - The formatted date
+ * @returns {string} - The formatted date, or the original string if it can't be parsed
  */
 function formatDateForCsv(dateStr) {
   if (!dateStr || dateStr === 'Unknown date') {
     return '';
   }
-
-  try {
-    // If already in DD/MM/YYYY format, return as is
-    if (/^\d{2}\/\d{2}\/\d{4}$/.test(dateStr)) {
-      return dateStr;
-    }
-
-    // If in YYYY-MM-DD format, convert to DD/MM/YYYY
-    if (/^\d{4}-\d{2}-\d{2}$/.test(dateStr)) {
-      const [year, month, day] = dateStr.split('-');
-      return `${day}/${month}/${year}`;
-    }
-
-    // Try to parse various date formats
-    let date;
-    
-    // Try to parse MM/DD/YYYY or DD/MM/YYYY
-    if (dateStr.includes('/')) {
-      const parts = dateStr.split('/');
-      if (parts.length === 3) {
-        const firstNum = parseInt(parts[0]);
-        const secondNum = parseInt(parts[1]);
-        
-        // If first number is > 12, it's likely DD/MM/YYYY
-        if (firstNum > 12) {
-          // Already in DD/MM/YYYY format
-          return `${parts[0].padStart(2, '0')}/${parts[1].padStart(2, '0')}/${parts[2]}`;
-        }
-        // If second number is > 12, it's likely MM/DD/YYYY
-        else if (secondNum > 12) {
-          // Convert to DD/MM/YYYY
-          return `${parts[1].padStart(2, '0')}/${parts[0].padStart(2, '0')}/${parts[2]}`;
-        }
-        // If both are <= 12, assume it's already in DD/MM/YYYY format
-        else {
-          return `${parts[0].padStart(2, '0')}/${parts[1].padStart(2, '0')}/${parts[2]}`;
-        }
-      }
-    }
-    
-    // Try to create a date object
-    date = new Date(dateStr);
-    if (!isNaN(date.getTime())) {
-      const day = String(date.getDate()).padStart(2, '0');
-      const month = String(date.getMonth() + 1).padStart(2, '0');
-      const year = date.getFullYear();
-      return `${day}/${month}/${year}`;
-    }
-    
-    // If all else fails, return the original string
-    return dateStr;
-  } catch (e) {
-    console.log(`Error formatting date "${dateStr}": ${e.message}`);
-    return dateStr;
-  }
+  const isoDate = normalizeReviewDate(dateStr);
+  return isoDate ? formatIsoDate(isoDate) : dateStr;
 }
 
 /**
@@ -98,11 +47,13 @@ function generateCsvContent(reviews, options = {}) {
     successfulProducts = 0
   } = options;
   
-  // Create CSV content
+  // Collect the CSV in parts and join once at the end rather than growing one string
+  const csvParts = [];
+
   // First, add metadata as comments at the top of the CSV
-  let csvContent = `# Products Scraped: ${totalProductsScraped}\r\n`;
-  csvContent += `# Extraction Date: ${new Date().toLocaleDateString()}\r\n`;
-  csvContent += `# Total Reviews: ${reviews.length}\r\n`;
+  csvParts.push(`# Products Scraped: ${totalProductsScraped}\r\n`);
+  csvParts.push(`# Extraction Date: ${new Date().toLocaleDateString()}\r\n`);
+  csvParts.push(`# Total Reviews: ${reviews.length}\r\n`);
   
   // Add date filter information if provided
   if (dateFrom || dateTo) {
@@ -110,19 +61,19 @@ function generateCsvContent(reviews, options = {}) {
     const fromDateStr = dateFrom ? new Date(dateFrom).toLocaleDateString() : 'any';
     const toDateStr = dateTo ? new Date(dateTo).toLocaleDateString() : 'any';
     
-    csvContent += `# Date Filter: ${fromDateStr} to ${toDateStr}\r\n`;
+    csvParts.push(`# Date Filter: ${fromDateStr} to ${toDateStr}\r\n`);
     const inRangeCount = reviews.filter(review => review.inDateRange === true).length;
-    csvContent += `# Reviews in date range: ${inRangeCount} of ${reviews.length}\r\n`;
+    csvParts.push(`# Reviews in date range: ${inRangeCount} of ${reviews.length}\r\n`);
     
     // Add explanation of date filtering
-    csvContent += `# Note: All reviews are included, but only those within the date range are marked 'Yes' in the 'In Date Range' column.\r\n`;
+    csvParts.push(`# Note: All reviews are included, but only those within the date range are marked 'Yes' in the 'In Date Range' column.\r\n`);
   }
   
-  csvContent += `\r\n`; // Empty line after metadata
+  csvParts.push(`\r\n`); // Empty line after metadata
   
   // Define CSV headers
   const headers = ['Product Name', 'Rating', 'Date', 'In Date Range', 'Title', 'Text', 'Extracted On'];
-  csvContent += headers.join(',') + '\r\n';
+  csvParts.push(headers.join(',') + '\r\n');
   
   // Track the current product ID to add separators between products
   let currentProductId = null;
@@ -131,16 +82,16 @@ function generateCsvContent(reviews, options = {}) {
   for (const review of reviews) {
     // Add a blank line and product header between different products for better readability
     if (currentProductId !== null && currentProductId !== review.productId) {
-      csvContent += ',,,,,,\r\n'; // Empty row as separator
-      csvContent += `"Product: ${review.productName || 'Unknown Product'} (ID: ${review.productId || 'unknown'})",,,,,,\r\n`; // Product header
+      csvParts.push(',,,,,,\r\n'); // Empty row as separator
+      csvParts.push(`"Product: ${review.productName || 'Unknown Product'} (ID: ${review.productId || 'unknown'})",,,,,,\r\n`); // Product header
     } else if (currentProductId === null) {
       // Add product header for the first product
-      csvContent += `"Product: ${review.productName || 'Unknown Product'} (ID: ${review.productId || 'unknown'})",,,,,,\r\n`; // Product header
+      csvParts.push(`"Product: ${review.productName || 'Unknown Product'} (ID: ${review.productId || 'unknown'})",,,,,,\r\n`); // Product header
     }
     currentProductId = review.productId;
     
     // Format the date for display
-    const reviewDate = formatDateForCsv(review.date);
+    const reviewDate = formatReviewDateForExport(review);
     
     // Clean the title if it contains "Rated" text
     let cleanTitle = review.title || '';
@@ -169,10 +120,114 @@ function generateCsvContent(reviews, options = {}) {
       escapeCsvField(extractionDate)
     ];
     
-    csvContent += row.join(',') + '\r\n';
+    csvParts.push(row.join(',') + '\r\n');
   }
   
-  return csvContent;
+  return csvParts.join('');
+}
+
+// Column headers shared by the CSV and XLSX exports
+const EXPORT_HEADERS = ['Product Name', 'Rating', 'Date', 'In Date Range', 'Title', 'Text', 'Extracted On'];
+
+/**
+ * Format a review's date as DD/MM/YYYY for export, from the ISO parsedDate set
+ * at extraction (or by normalizing review.date for reviews that don't have one)
+ * @param {Object} review - The review to format the date for
+ * @returns {string} - The formatted date, or an empty string if it isn't usable
+ */
+function formatReviewDateForExport(review) {
+  const isoDate = review.parsedDate || normalizeReviewDate(review.date, review.siteType);
+  return formatIsoDate(isoDate);
+}
+
+/**
+ * Remove the "Rated X out of 5" suffix and escaped quotes some retailers include in titles
+ * @param {string} title - The review title
+ * @returns {string} - The cleaned title
+ */
+function cleanReviewTitle(title) {
+  let cleanTitle = title || '';
+
+  // First, handle any escaped characters (like \x22 for quotes)
+  cleanTitle = cleanTitle.replace(/\\x22/g, '"');
+  cleanTitle = cleanTitle.replace(/\\x27/g, "'");
+
+  // Then remove the "Rated X out of 5" part
+  if (cleanTitle.includes('Rated')) {
+    cleanTitle = cleanTitle.split('Rated')[0].trim();
+  }
+
+  return cleanTitle;
+}
+
+/**
+ * Build the export row for a review (unescaped values in EXPORT_HEADERS order)
+ * @param {Object} review - The review to export
+ * @returns {Array} - The row values
+ */
+function buildExportRow(review) {
+  // Extract just the date part from the timestamp
+  const extractionDate = review.extractedAt ? review.extractedAt.split('T')[0] : new Date().toISOString().split('T')[0];
+
+  return [
+    review.productName,
+    review.rating,
+    formatReviewDateForExport(review),
+    review.inDateRange === false ? 'No' : 'Yes',
+    cleanReviewTitle(review.title),
+    review.text,
+    extractionDate
+  ];
+}
+
+/**
+ * Format one product's reviews for the streaming export: newest first when
+ * sorting by date, and each run of reviews for the same product turned into
+ * CSV text and XLSX rows (ratings are defaulted by the caller beforehand). Runs on the export
+ * worker pool (export-worker.js), so it takes and returns plain data; the CSV
+ * comes back as one ArrayBuffer that can be transferred instead of copied.
+ * @param {Array} reviews - The product's (deduplicated) reviews
+ * @param {Object} options - { sortByDate }
+ * @returns {Object} - { csv: ArrayBuffer, groups: [{ productId, productName, csvStart, csvEnd, rows }],
+ *   inRangeCount }; csvStart/csvEnd are byte offsets into csv
+ */
+function formatProductBatch(reviews, options = {}) {
+  const ordered = options.sortByDate
+    ? [...reviews].sort((a, b) => {
+      // parsedDate is ISO YYYY-MM-DD, so it sorts as a string
+      if (a.parsedDate && b.parsedDate) {
+        return a.parsedDate < b.parsedDate ? 1 : a.parsedDate > b.parsedDate ? -1 : 0;
+      }
+      return 0;
+    })
+    : reviews;
+
+  const csvParts = [];
+  const groups = [];
+  let group = null;
+  let byteOffset = 0;
+  let inRangeCount = 0;
+
+  for (const review of ordered) {
+    if (!group || group.productId !== review.productId) {
+      group = { productId: review.productId, productName: review.productName, csvStart: byteOffset, csvEnd: byteOffset, rows: [] };
+      groups.push(group);
+    }
+
+    const row = buildExportRow(review);
+    const line = row.map(escapeCsvField).join(',') + '\r\n';
+    csvParts.push(line);
+    byteOffset += Buffer.byteLength(line);
+    group.csvEnd = byteOffset;
+    group.rows.push(row);
+
+    if (review.inDateRange === true) {
+      inRangeCount++;
+    }
+  }
+
+  const csv = new TextEncoder().encode(csvParts.join('')).buffer;
+  return { csv, groups, inRangeCount };
 }
 
 /**
@@ -280,8 +335,13 @@ function addProductInfoToReviews(reviews, url) {
 }
 
 module.exports = {
+  EXPORT_HEADERS,
   escapeCsvField,
   formatDateForCsv,
+  formatReviewDateForExport,
+  cleanReviewTitle,
+  buildExportRow,
+  formatProductBatch,
   generateCsvContent,
   addSiteTypeToReviews,
   addProductInfoToReviews
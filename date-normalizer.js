@@ -0,0 +1,245 @@
+/**
+ * Review date normalization
+ * Turns the raw date strings retailers show ("Submitted 12/03/2025, by Sam",
+ * "9th April 2025", "19/05/2024", API timestamps, "3 days ago") into ISO
+ * YYYY-MM-DD dates. Each retailer's known formats are tried first with regexes
+ * compiled once at load, results are kept in a bounded LRU cache since the
+ * same strings repeat across reviews, and chrono-node is only used as a last
+ * resort for formats we haven't seen.
+ *
+ * Reviews are normalized once at extraction (review.parsedDate); date-range
+ * checks and CSV formatting then work on that ISO string.
+ */
+
+const { readPositiveIntEnv } = require('./concurrency-utils');
+
+const MONTHS = {
+  jan: 1, january: 1, feb: 2, february: 2, mar: 3, march: 3, apr: 4, april: 4,
+  may: 5, jun: 6, june: 6, jul: 7, july: 7, aug: 8, august: 8,
+  sep: 9, sept: 9, september: 9, oct: 10, october: 10, nov: 11, november: 11, dec: 12, december: 12
+};
+const MONTH_NAMES = Object.keys(MONTHS).sort((a, b) => b.length - a.length).join('|');
+
+// Placeholders the handlers use when no date was found
+const MISSING_DATE_PATTERN = /^(unknown date|no_date_found|date_not_found|error|failed to parse)/i;
+
+// Slash dates are day-first on UK sites; only swap when the day-first reading is impossible
+function slashDate(first, second, year) {
+  const a = parseInt(first, 10);
+  const b = parseInt(second, 10);
+  return b > 12 && a <= 12 ? { year, month: a, day: b } : { year, month: b, day: a };
+}
+
+const matchers = {
+  iso: {
+    // 2025-04-09 or 2025-04-09T10:15:00Z from review APIs
+    pattern: /^(\d{4})-(\d{1,2})-(\d{1,2})(?:$|[T\s])/,
+    toParts: m => ({ year: m[1], month: m[2], day: m[3] })
+  },
+  slash: {
+    // 19/05/2024 (ASDA), also with - or . separators
+    pattern: /(?:^|\D)(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})(?!\d)/,
+    toParts: m => slashDate(m[1], m[2], m[3])
+  },
+  submitted: {
+    // Morrisons: "Submitted 12/03/2025, by Author"
+    pattern: /Submitted\s+(?:on\s+)?(\d{1,2})\/(\d{1,2})\/(\d{4})/i,
+    toParts: m => slashDate(m[1], m[2], m[3])
+  },
+  dayMonthYear: {
+    // Tesco/Sainsbury's: "9th April 2025", also "9 Apr 2025"
+    pattern: new RegExp(`(\\d{1,2})(?:st|nd|rd|th)?\\s+(${MONTH_NAMES})\\.?,?\\s+(\\d{4})`, 'i'),
+    toParts: m => ({ year: m[3], month: MONTHS[m[2].toLowerCase()], day: m[1] })
+  },
+  monthDayYear: {
+    // "April 9, 2025"
+    pattern: new RegExp(`(${MONTH_NAMES})\\.?\\s+(\\d{1,2})(?:st|nd|rd|th)?,?\\s+(\\d{4})`, 'i'),
+    toParts: m => ({ year: m[3], month: MONTHS[m[1].toLowerCase()], day: m[2] })
+  },
+  relative: {
+    // "3 days ago", "a month ago", "today", "yesterday" - depends on now, so never cached
+    pattern: /^(?:(today)|(yesterday)|(a|an|\d+)\s+(day|week|month|year)s?\s+ago)\b/i,
+    relative: true,
+    toParts: (m, now) => {
+      const date = new Date(now.getFullYear(), now.getMonth(), now.getDate());
+      if (m[2]) {
+        date.setDate(date.getDate() - 1);
+      } else if (m[3]) {
+        const amount = /^an?$/i.test(m[3]) ? 1 : parseInt(m[3], 10);
+        const unit = m[4].toLowerCase();
+        if (unit === 'day') date.setDate(date.getDate() - amount);
+        if (unit === 'week') date.setDate(date.getDate() - amount * 7);
+        if (unit === 'month') date.setMonth(date.getMonth() - amount);
+        if (unit === 'year') date.setFullYear(date.getFullYear() - amount);
+      }
+      return { year: date.getFullYear(), month: date.getMonth() + 1, day: date.getDate() };
+    }
+  }
+};
+
+// Formats to try per retailer, most likely first
+const RETAILER_MATCHERS = {
+  morrisons: [matchers.submitted, matchers.slash, matchers.iso, matchers.dayMonthYear, matchers.relative],
+  asda: [matchers.slash, matchers.iso, matchers.dayMonthYear, matchers.monthDayYear, matchers.relative],
+  tesco: [matchers.dayMonthYear, matchers.iso, matchers.slash, matchers.relative],
+  sainsburys: [matchers.dayMonthYear, matchers.iso, matchers.slash, matchers.relative],
+  default: [matchers.iso, matchers.slash, matchers.dayMonthYear, matchers.monthDayYear, matchers.submitted, matchers.relative]
+};
+
+// `${retailer}|${raw}` -> ISO date or null; Map keeps insertion order, so the first key is the least recently used
+const cache = new Map();
+const cacheStats = { hits: 0, misses: 0, chrono: 0 };
+let cacheSize = null;
+
+function getCacheSize() {
+  if (cacheSize === null) {
+    cacheSize = readPositiveIntEnv('DATE_CACHE_SIZE', 5000);
+  }
+  return cacheSize;
+}
+
+function remember(key, value) {
+  cache.set(key, value);
+  if (cache.size > getCacheSize()) {
+    cache.delete(cache.keys().next().value);
+  }
+}
+
+function pad(value) {
+  return String(value).padStart(2, '0');
+}
+
+// Validated YYYY-MM-DD, or null if the parts don't make a real date
+function toIso({ year, month, day }) {
+  const y = parseInt(year, 10);
+  const m = parseInt(month, 10);
+  const d = parseInt(day, 10);
+  if (!y || !m || !d || m > 12 || d > 31) return null;
+
+  const check = new Date(Date.UTC(y, m - 1, d));
+  if (check.getUTCMonth() !== m - 1 || check.getUTCDate() !== d) return null;
+  return `${y}-${pad(m)}-${pad(d)}`;
+}
+
+function parseWithChrono(raw, now) {
+  // Loaded on first use; most scrapes never get this far
+  const { parseDate } = require('chrono-node');
+  const date = parseDate(raw, now);
+  if (!date || isNaN(date.getTime())) return null;
+  return toIso({ year: date.getFullYear(), month: date.getMonth() + 1, day: date.getDate() });
+}
+
+/**
+ * Normalize a raw review date to ISO YYYY-MM-DD
+ * @param {string} raw - Date as shown on the retailer's site
+ * @param {string} retailer - Retailer name, picks the formats tried first
+ * @param {Date} now - Reference date for relative dates (defaults to now)
+ * @returns {string|null} - ISO date, or null if it couldn't be parsed
+ */
+function normalizeReviewDate(raw, retailer = 'default', now = new Date()) {
+  if (!raw || typeof raw !== 'string') return null;
+  const trimmed = raw.trim();
+  if (!trimmed || MISSING_DATE_PATTERN.test(trimmed)) return null;
+
+  const key = `${retailer}|${trimmed}`;
+  if (cache.has(key)) {
+    const cached = cache.get(key);
+    // Move to the most recently used end
+    cache.delete(key);
+    cache.set(key, cached);
+    cacheStats.hits++;
+    return cached;
+  }
+  cacheStats.misses++;
+
+  for (const matcher of RETAILER_MATCHERS[retailer] || RETAILER_MATCHERS.default) {
+    const match = trimmed.match(matcher.pattern);
+    if (!match) continue;
+
+    const iso = toIso(matcher.toParts(match, now));
+    if (iso) {
+      if (!matcher.relative) remember(key, iso);
+      return iso;
+    }
+  }
+
+  cacheStats.chrono++;
+  let iso = null;
+  try {
+    iso = parseWithChrono(trimmed, now);
+  } catch (e) {
+    iso = null;
+  }
+  // Only cache chrono results that can't depend on today's date
+  if (!iso || /\d{4}/.test(trimmed)) {
+    remember(key, iso);
+  }
+  return iso;
+}
+
+/**
+ * Whether a raw date is relative to today ("3 days ago", "yesterday", or any
+ * date without a year), so its ISO date would change from one day to the next
+ * @param {string} raw - Date as shown on the retailer's site
+ * @returns {boolean}
+ */
+function isRelativeReviewDate(raw) {
+  if (!raw || typeof raw !== 'string') return false;
+  const trimmed = raw.trim();
+  if (!trimmed || MISSING_DATE_PATTERN.test(trimmed)) return false;
+  // Every absolute format above includes a four-digit year
+  return matchers.relative.pattern.test(trimmed) || !/\d{4}/.test(trimmed);
+}
+
+/**
+ * Check an ISO date against a dateFrom/dateTo filter (both inclusive, either optional).
+ * ISO dates compare correctly as strings.
+ * @param {string} isoDate - YYYY-MM-DD
+ * @param {string} dateFrom - Start of the range, YYYY-MM-DD (or any ISO timestamp)
+ * @param {string} dateTo - End of the range, YYYY-MM-DD (or any ISO timestamp)
+ * @returns {boolean}
+ */
+function isIsoDateInRange(isoDate, dateFrom, dateTo) {
+  if (!isoDate) return false;
+  if (dateFrom && isoDate < String(dateFrom).slice(0, 10)) return false;
+  if (dateTo && isoDate > String(dateTo).slice(0, 10)) return false;
+  return true;
+}
+
+/**
+ * Format an ISO date as DD/MM/YYYY for the CSV/XLSX exports
+ * @param {string} isoDate - YYYY-MM-DD
+ * @returns {string} - DD/MM/YYYY, or '' if there's no date
+ */
+function formatIsoDate(isoDate) {
+  if (!isoDate) return '';
+  const [year, month, day] = isoDate.slice(0, 10).split('-');
+  return `${day}/${month}/${year}`;
+}
+
+/**
+ * Local-midnight Date for an ISO date
+ * @param {string} isoDate - YYYY-MM-DD
+ * @returns {Date}
+ */
+function isoToDate(isoDate) {
+  const [year, month, day] = isoDate.split('-').map(Number);
+  return new Date(year, month - 1, day);
+}
+
+/**
+ * Cache counters, for diagnostics
+ * @returns {Object} - { size, hits, misses, chrono }
+ */
+function getDateCacheStats() {
+  return { size: cache.size, ...cacheStats };
+}
+
+module.exports = {
+  normalizeReviewDate,
+  isRelativeReviewDate,
+  isIsoDateInRange,
+  formatIsoDate,
+  isoToDate,
+  getDateCacheStats
+};
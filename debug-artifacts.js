@@ -0,0 +1,239 @@
+/**
+ * Debug artifacts
+ * Replaces the screenshots the handlers used to write to the app directory at
+ * every step. DEBUG_ARTIFACTS picks the policy:
+ *
+ * - off: capture nothing
+ * - on-failure (default): keep the last DEBUG_ARTIFACTS_BUFFER page states
+ *   (URL + HTML, no image encoding) in memory, and only write them, plus one
+ *   screenshot of the page as it failed, when a scrape fails
+ * - always: also write a screenshot at every step
+ *
+ * Artifacts go to <DEBUG_ARTIFACTS_DIR>/<jobId>/. cleanupJobArtifacts removes a
+ * job's directory afterwards unless it holds failure artifacts (or the mode is
+ * always), and prunes kept directories older than DEBUG_ARTIFACTS_TTL_MS or
+ * beyond the newest DEBUG_ARTIFACTS_MAX_JOBS.
+ */
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const { readPositiveIntEnv } = require('./concurrency-utils');
+
+const MODES = ['off', 'on-failure', 'always'];
+const DEFAULT_ARTIFACTS_DIR = path.join(__dirname, 'storage', 'debug-artifacts');
+const FAILURE_PREFIX = 'failure-';
+
+function getArtifactMode() {
+  const mode = (process.env.DEBUG_ARTIFACTS || 'on-failure').toLowerCase();
+  return MODES.includes(mode) ? mode : 'on-failure';
+}
+
+function getArtifactsDir() {
+  return process.env.DEBUG_ARTIFACTS_DIR || DEFAULT_ARTIFACTS_DIR;
+}
+
+// File-system safe name for a job ID or step label
+function safeName(value) {
+  return String(value).replace(/[^\w.-]/g, '_');
+}
+
+class ArtifactRecorder {
+  /**
+   * @param {Object} options - Recorder options
+   * @param {string} options.jobId - Job the scrape belongs to (a random ID if not given)
+   * @param {string} options.retailer - Retailer name, used in file names
+   * @param {string} options.mode - off, on-failure or always (defaults to DEBUG_ARTIFACTS)
+   * @param {number} options.bufferSize - Page states kept in memory (DEBUG_ARTIFACTS_BUFFER, default 5)
+   * @param {Object} options.log - Logger
+   */
+  constructor(options = {}) {
+    this.jobId = options.jobId || crypto.randomUUID();
+    this.retailer = options.retailer || 'unknown';
+    this.mode = options.mode || getArtifactMode();
+    this.bufferSize = options.bufferSize || readPositiveIntEnv('DEBUG_ARTIFACTS_BUFFER', 5);
+    this.log = options.log || console;
+    this.dir = path.join(getArtifactsDir(), safeName(this.jobId));
+
+    // Ring buffer of { label, url, html, capturedAt }, oldest first
+    this.states = [];
+    this.page = null;
+    this.sequence = 0;
+    this.flushed = false;
+  }
+
+  get enabled() {
+    return this.mode !== 'off';
+  }
+
+  /**
+   * Set the page to screenshot if the scrape fails before any step is captured
+   * @param {Object} page - Playwright page
+   */
+  setPage(page) {
+    this.page = page;
+  }
+
+  /**
+   * Record the page's state after a step. Never throws.
+   * @param {Object} page - Playwright page
+   * @param {string} label - Step name, e.g. 'after-tab-click'
+   */
+  async capture(page, label) {
+    if (!this.enabled) return;
+    this.page = page;
+    const sequence = ++this.sequence;
+
+    try {
+      const state = { label, url: page.url(), html: await page.content(), capturedAt: new Date().toISOString() };
+      this.states.push(state);
+      if (this.states.length > this.bufferSize) {
+        this.states.shift();
+      }
+
+      if (this.mode === 'always') {
+        const screenshot = await page.screenshot({ type: 'jpeg', quality: 70 });
+        await this.writeFile(`${this.fileStem(sequence, label)}.jpg`, screenshot);
+      }
+    } catch (error) {
+      this.log.debug(`Could not capture debug artifact ${label}: ${error.message}`);
+    }
+  }
+
+  fileStem(sequence, label) {
+    return `${this.retailer}-${String(sequence).padStart(3, '0')}-${safeName(label)}`;
+  }
+
+  async writeFile(name, content) {
+    await fs.promises.mkdir(this.dir, { recursive: true });
+    await fs.promises.writeFile(path.join(this.dir, name), content);
+  }
+
+  /**
+   * Write the buffered page states and a screenshot of the failing page.
+   * Only the first call per recorder writes anything. Never throws.
+   * @param {Error} error - What went wrong
+   * @param {Object} page - Page to screenshot (defaults to the last captured page)
+   * @returns {Promise<string|null>} - Directory written to, or null
+   */
+  async flush(error, page = this.page) {
+    if (!this.enabled || this.flushed) return null;
+    this.flushed = true;
+
+    try {
+      const stem = `${FAILURE_PREFIX}${this.retailer}-${Date.now()}`;
+      const states = this.states.map((state, i) => ({ ...state, file: `${stem}-state-${i + 1}.html` }));
+      for (const state of states) {
+        await this.writeFile(state.file, state.html);
+      }
+
+      let screenshotFile = null;
+      if (page) {
+        const screenshot = await page.screenshot({ type: 'png' }).catch(() => null);
+        if (screenshot) {
+          screenshotFile = `${stem}.png`;
+          await this.writeFile(screenshotFile, screenshot);
+        }
+      }
+
+      await this.writeFile(`${stem}.json`, JSON.stringify({
+        jobId: this.jobId,
+        retailer: this.retailer,
+        error: error ? { message: error.message, stack: error.stack } : null,
+        url: page ? page.url() : null,
+        screenshot: screenshotFile,
+        states: states.map(({ html, ...state }) => state)
+      }, null, 2));
+
+      this.states = [];
+      this.log.info(`Saved debug artifacts for failed ${this.retailer} scrape to ${this.dir}`);
+      return this.dir;
+    } catch (writeError) {
+      this.log.error(`Error saving debug artifacts: ${writeError.message}`);
+      return null;
+    }
+  }
+}
+
+/**
+ * Create a recorder for one scrape
+ * @param {Object} options - See ArtifactRecorder
+ * @returns {ArtifactRecorder}
+ */
+function createArtifactRecorder(options = {}) {
+  return new ArtifactRecorder(options);
+}
+
+/**
+ * Remove a job's artifact directory once the job is done, unless a scrape in
+ * it failed or DEBUG_ARTIFACTS=always (those artifacts are kept for debugging).
+ * Kept directories are pruned by age and count at the same time.
+ * @param {string} jobId - Job ID
+ * @param {Object} log - Logger
+ * @returns {Promise<boolean>} - Whether the directory was removed
+ */
+async function cleanupJobArtifacts(jobId, log = console) {
+  const dir = path.join(getArtifactsDir(), safeName(jobId));
+  let files;
+  try {
+    files = await fs.promises.readdir(dir);
+  } catch (error) {
+    if (error.code === 'ENOENT') return false;
+    throw error;
+  }
+
+  let removed = false;
+  if (getArtifactMode() === 'always') {
+    log.info(`Keeping debug artifacts for job ${jobId} in ${dir} (DEBUG_ARTIFACTS=always)`);
+  } else if (files.some(file => file.startsWith(FAILURE_PREFIX))) {
+    log.info(`Keeping debug artifacts for job ${jobId} in ${dir} (a scrape failed)`);
+  } else {
+    await fs.promises.rm(dir, { recursive: true, force: true });
+    removed = true;
+  }
+
+  await pruneArtifacts(log);
+  return removed;
+}
+
+// Delete kept job directories older than DEBUG_ARTIFACTS_TTL_MS, and all but the newest DEBUG_ARTIFACTS_MAX_JOBS
+async function pruneArtifacts(log = console) {
+  const ttlMs = readPositiveIntEnv('DEBUG_ARTIFACTS_TTL_MS', 7 * 24 * 60 * 60 * 1000);
+  const maxJobs = readPositiveIntEnv('DEBUG_ARTIFACTS_MAX_JOBS', 50);
+  const root = getArtifactsDir();
+
+  let entries;
+  try {
+    entries = await fs.promises.readdir(root, { withFileTypes: true });
+  } catch (error) {
+    if (error.code === 'ENOENT') return 0;
+    throw error;
+  }
+
+  const dirs = [];
+  for (const entry of entries) {
+    if (!entry.isDirectory()) continue;
+    const dir = path.join(root, entry.name);
+    const stat = await fs.promises.stat(dir).catch(() => null);
+    if (stat) dirs.push({ dir, modifiedAt: stat.mtimeMs });
+  }
+
+  // Newest first
+  dirs.sort((a, b) => b.modifiedAt - a.modifiedAt);
+  const now = Date.now();
+  const expired = dirs.filter(({ modifiedAt }, index) => index >= maxJobs || now - modifiedAt > ttlMs);
+  for (const { dir } of expired) {
+    await fs.promises.rm(dir, { recursive: true, force: true });
+  }
+  if (expired.length > 0) {
+    log.info(`Removed ${expired.length} old debug artifact directories`);
+  }
+  return expired.length;
+}
+
+module.exports = {
+  ArtifactRecorder,
+  createArtifactRecorder,
+  cleanupJobArtifacts,
+  getArtifactMode
+};
@@ -0,0 +1,18 @@
+/**
+ * Export worker
+ * Worker thread for the export pool (see review-export.js): formats a
+ * product's reviews into CSV bytes and XLSX rows off the main thread.
+ */
+
+const { parentPort } = require('worker_threads');
+const { formatProductBatch } = require('./csv-exporter');
+
+parentPort.on('message', ({ id, task }) => {
+  try {
+    const result = formatProductBatch(task.reviews, task.options);
+    // Hand the CSV bytes back without copying them
+    parentPort.postMessage({ id, result }, [result.csv]);
+  } catch (error) {
+    parentPort.postMessage({ id, error: error.message });
+  }
+});
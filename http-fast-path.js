@@ -0,0 +1,386 @@
+/**
+ * HTTP fast path
+ * Fetches product pages with a keep-alive axios client and parses reviews out
+ * of the server-rendered HTML (or embedded JSON state) with Cheerio, so many
+ * products can be scraped without launching a browser at all.
+ *
+ * scrapeReviews tries this first and falls back to the browser when it finds
+ * no reviews, hits a bot challenge or can only see part of the reviews. The
+ * path that worked is remembered per retailer (per hostname for generic
+ * sites), so retailers that always need the browser stop paying for a wasted fetch.
+ */
+
+const http = require('http');
+const https = require('https');
+const axios = require('axios');
+const cheerio = require('cheerio');
+const { KeyValueStore, log: defaultLog } = require('crawlee');
+const urlUtils = require('./url-utils');
+const { readPositiveIntEnv } = require('./concurrency-utils');
+const { mapApiReview, findReviewArray } = require('./review-api-capture');
+const { cachedRequest } = require('./network-cache');
+
+const PATH_STORE_NAME = 'retailer-paths';
+
+// Header the mock retailer server reads the original URL from
+const MOCK_ORIGINAL_URL_HEADER = 'x-mock-original-url';
+
+const USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36';
+
+// Pages served instead of the product when the retailer's bot protection kicks in
+const BOT_CHALLENGE_MARKERS = [
+  /errors\.edgesuite\.net/i,
+  /<title>\s*Access Denied/i,
+  // Only challenge pages, not product pages that merely load a captcha script
+  /<title>[^<]*(?:captcha|are you a robot|human verification)[^<]*<\/title>/i,
+  /verify (?:that )?you are (?:a )?human/i,
+  /geo\.captcha-delivery\.com/i,
+  /cf-chl-|challenge-platform/i,
+  /px-captcha|_pxhd/i,
+  /Incapsula incident|_Incapsula_Resource/i,
+  /Pardon Our Interruption/i
+];
+
+// Same containers/fields the browser handlers read
+const RETAILER_SELECTORS = {
+  asda: {
+    container: 'div.pdp-description-reviews__content-cntr',
+    rating: 'div.rating-stars__stars--top[style*="width"]',
+    title: 'span.pdp-description-reviews__rating-title',
+    date: 'div.pdp-description-reviews__submitted-date',
+    text: 'p.pdp-description-reviews__content-text',
+    nextPage: 'a[data-auto-id="btnright"]'
+  },
+  tesco: {
+    container: 'div[class*="ReviewTileContainer"], div[data-auto="review-card"], div[class*="review-card"]',
+    rating: 'div[class*="ReviewRating-mfe-pdp"], [aria-label*="out of 5"]',
+    title: 'h3[class*="Title-mfe-pdp"], h3',
+    date: 'span[class*="ReviewDate-mfe-pdp"], div[data-auto="review-date"], div[class*="review-date"]',
+    text: 'span[class*="Content-mfe-pdp"], div[data-auto="review-text"], div[class*="review-text"]',
+    // "Showing 10 of 22 reviews" - the rest only load when "show more" is clicked
+    totalCount: 'span[class*="ReviewsCount-mfe-pdp"]'
+  },
+  sainsburys: {
+    container: '.pd-reviews__review-container',
+    rating: '.review__star-rating [title*="out of 5"], .review__star-rating [aria-label*="out of 5"]',
+    title: '.review__title',
+    date: '.review__date',
+    text: '.review__content'
+  }
+};
+
+let httpClient = null;
+
+// One axios instance with keep-alive agents, so repeat fetches reuse connections
+function getHttpClient() {
+  if (!httpClient) {
+    const maxSockets = readPositiveIntEnv('HTTP_FAST_PATH_MAX_SOCKETS', 16);
+    httpClient = axios.create({
+      timeout: readPositiveIntEnv('HTTP_FAST_PATH_TIMEOUT_MS', 15000),
+      maxRedirects: 5,
+      responseType: 'text',
+      // Challenge pages come back as 403/429/503; look at them instead of throwing
+      validateStatus: () => true,
+      httpAgent: new http.Agent({ keepAlive: true, maxSockets }),
+      httpsAgent: new https.Agent({ keepAlive: true, maxSockets }),
+      headers: {
+        'User-Agent': USER_AGENT,
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-GB,en-US;q=0.9,en;q=0.8',
+        'Cache-Control': 'no-cache'
+      }
+    });
+  }
+  return httpClient;
+}
+
+/**
+ * Check whether the fast path is turned on (HTTP_FAST_PATH, default true)
+ * @returns {boolean}
+ */
+function isHttpFastPathEnabled() {
+  return process.env.HTTP_FAST_PATH !== 'false';
+}
+
+async function fetchPage(url) {
+  return cachedRequest({ url, resourceType: 'document' }, () => {
+    const mockUrl = process.env.MOCK_RETAILER_URL;
+    if (mockUrl) {
+      // Offline runs: ask the mock retailer server, as the browser would
+      const original = new URL(url);
+      return getHttpClient().get(`${new URL(mockUrl).origin}${original.pathname}${original.search}`, {
+        headers: { [MOCK_ORIGINAL_URL_HEADER]: url }
+      });
+    }
+    return getHttpClient().get(url);
+  });
+}
+
+/**
+ * Check a response for a bot challenge instead of the product page
+ * @param {number} status - HTTP status
+ * @param {string} html - Response body
+ * @returns {string|null} - What gave the challenge away, or null
+ */
+function detectBotChallenge(status, html) {
+  if (status === 403 || status === 429 || status === 503) {
+    return `HTTP ${status}`;
+  }
+  const marker = BOT_CHALLENGE_MARKERS.find(pattern => pattern.test(html));
+  return marker ? `page matched ${marker}` : null;
+}
+
+function parseRating($, $el, selector) {
+  const ratingEl = $el.find(selector).first();
+  if (!ratingEl.length) return '5';
+
+  // ASDA: filled stars are a width percentage
+  const width = (ratingEl.attr('style') || '').match(/width:\s*([\d.]+)%/);
+  if (width) {
+    return String(Math.round(parseFloat(width[1]) / 20));
+  }
+
+  // Tesco/Sainsbury's: "rating of 4 stars out of 5" / "Rating 5 out of 5"
+  const labels = [ratingEl, ...ratingEl.find('[aria-label], [title]').toArray().map(el => $(el))]
+    .map(el => `${el.attr('aria-label') || ''} ${el.attr('title') || ''}`);
+  const match = labels.concat(ratingEl.text()).join(' ').match(/([\d.]+)\s*(?:stars?\s*)?out of 5/i);
+  return match ? String(Math.round(parseFloat(match[1]))) : '5';
+}
+
+function extractDomReviews($, selectors) {
+  const reviews = [];
+  $(selectors.container).each((i, container) => {
+    const $el = $(container);
+    const textOf = selector => $el.find(selector).first().text().replace(/\s+/g, ' ').trim();
+
+    const text = textOf(selectors.text);
+    if (!text || text.length <= 5) return;
+
+    reviews.push({
+      rating: parseRating($, $el, selectors.rating),
+      title: textOf(selectors.title) || 'Product Review',
+      date: textOf(selectors.date) || 'Unknown date',
+      text
+    });
+  });
+  return reviews;
+}
+
+// Reviews embedded as JSON-LD or framework state (__NEXT_DATA__, __APOLLO_STATE__, ...)
+function extractEmbeddedReviews($) {
+  for (const script of $('script[type="application/ld+json"], script[type="application/json"], script#__NEXT_DATA__').toArray()) {
+    let json;
+    try {
+      json = JSON.parse($(script).contents().text());
+    } catch (e) {
+      continue;
+    }
+
+    const reviewArray = findReviewArray(json);
+    if (reviewArray) {
+      const reviews = reviewArray.map(mapApiReview).filter(review => review.text);
+      if (reviews.length > 0) return reviews;
+    }
+  }
+  return [];
+}
+
+function reportedReviewTotal($, selectors) {
+  if (!selectors.totalCount) return null;
+  const match = $(selectors.totalCount).first().text().match(/of\s+([\d,]+)/i);
+  return match ? parseInt(match[1].replace(/,/g, ''), 10) : null;
+}
+
+function nextPageUrl($, selectors, currentUrl) {
+  if (!selectors.nextPage) return null;
+  const next = $(selectors.nextPage).first();
+  const href = next.attr('href');
+  if (!href || next.attr('aria-disabled') === 'true' || next.hasClass('disabled')) return null;
+  try {
+    return new URL(decodeURIComponent(href), currentUrl).href;
+  } catch (e) {
+    return null;
+  }
+}
+
+/**
+ * Try to scrape a product's reviews over plain HTTP
+ * @param {string} url - Product URL
+ * @param {Object} options - Fast path options
+ * @param {number} options.maxReviews - Stop after this many reviews (default 50)
+ * @param {number} options.maxPages - Most review pages to follow (HTTP_FAST_PATH_MAX_PAGES, default 10)
+ * @param {Function} options.shouldStopPagination - (pageReviews) => boolean, checked after each page
+ * @param {Function} options.onResponse - ({ status, latencyMs, challenge, error }) => void, called for
+ *   every fetch that reached the retailer (not network cache hits), e.g. to feed the rate limiter
+ * @param {Object} options.log - Logger
+ * @returns {Promise<Object>} - { reviews, escalate: reason or null, pages }
+ */
+async function scrapeReviewsOverHttp(url, options = {}) {
+  const log = options.log || defaultLog;
+  const maxReviews = options.maxReviews || 50;
+  const maxPages = options.maxPages || readPositiveIntEnv('HTTP_FAST_PATH_MAX_PAGES', 10);
+  const retailer = urlUtils.detectRetailerFromUrl(url);
+  const selectors = RETAILER_SELECTORS[retailer];
+
+  const reviews = [];
+  const seenIds = new Set();
+  let pageUrl = url;
+  let pages = 0;
+
+  while (pageUrl && pages < maxPages && reviews.length < maxReviews) {
+    const startedAt = Date.now();
+    let response;
+    try {
+      response = await fetchPage(pageUrl);
+    } catch (error) {
+      if (options.onResponse) options.onResponse({ error, latencyMs: Date.now() - startedAt });
+      throw error;
+    }
+    pages++;
+
+    const html = typeof response.data === 'string' ? response.data : JSON.stringify(response.data);
+    const challenge = detectBotChallenge(response.status, html);
+    if (options.onResponse && !response.fromCache) {
+      options.onResponse({ status: response.status, latencyMs: Date.now() - startedAt, challenge });
+    }
+    if (challenge) {
+      return { reviews, escalate: `bot challenge (${challenge})`, pages };
+    }
+    if (response.status >= 400) {
+      return { reviews, escalate: `HTTP ${response.status}`, pages };
+    }
+
+    const $ = cheerio.load(html);
+    let pageReviews = selectors ? extractDomReviews($, selectors) : [];
+    if (pageReviews.length === 0) {
+      pageReviews = extractEmbeddedReviews($);
+    }
+
+    let added = 0;
+    for (const review of pageReviews) {
+      const id = urlUtils.createReviewUniqueId(review);
+      if (seenIds.has(id) || reviews.length >= maxReviews) continue;
+      seenIds.add(id);
+      reviews.push(review);
+      added++;
+    }
+    log.info(`HTTP fast path: ${added} reviews on page ${pages} of ${url}`);
+
+    if (pages === 1 && reviews.length === 0) {
+      return { reviews, escalate: 'no reviews in the page HTML', pages };
+    }
+    if (added === 0 || (options.shouldStopPagination && options.shouldStopPagination(pageReviews))) {
+      break;
+    }
+
+    const next = nextPageUrl($, selectors || {}, pageUrl);
+    if (!next) {
+      // Reviews past the first batch are loaded by the page's own scripts
+      const total = selectors ? reportedReviewTotal($, selectors) : null;
+      if (total && total > reviews.length && reviews.length < maxReviews) {
+        return { reviews, escalate: `page reports ${total} reviews but only ${reviews.length} are in the HTML`, pages };
+      }
+    }
+    pageUrl = next;
+  }
+
+  return { reviews, escalate: null, pages };
+}
+
+// Which path (http or browser) works for each retailer, persisted between runs
+const pathMemory = new Map();
+let pathStorePromise = null;
+
+function getPathStore() {
+  if (!pathStorePromise) {
+    pathStorePromise = KeyValueStore.open(PATH_STORE_NAME);
+  }
+  return pathStorePromise;
+}
+
+// Generic sites have nothing in common with each other, so they're remembered per hostname
+function getPathKey(retailer, url) {
+  if (retailer !== 'unknown' || !url) {
+    return retailer;
+  }
+  try {
+    return `site-${new URL(url).hostname.replace(/^www\./, '').toLowerCase()}`;
+  } catch (e) {
+    return retailer;
+  }
+}
+
+/**
+ * Get the remembered scrape path for a retailer
+ * @param {string} retailer - Retailer name
+ * @param {string} url - Product URL (picks the entry for generic sites)
+ * @returns {Promise<Object|null>} - { preferred: 'http'|'browser', successes, failures, updatedAt } or null
+ */
+async function getRetailerPath(retailer, url) {
+  const key = getPathKey(retailer, url);
+  if (!pathMemory.has(key)) {
+    try {
+      pathMemory.set(key, await (await getPathStore()).getValue(key));
+    } catch (e) {
+      pathMemory.set(key, null);
+    }
+  }
+  return pathMemory.get(key);
+}
+
+/**
+ * Record which path worked for a retailer
+ * @param {string} retailer - Retailer name
+ * @param {string} url - Product URL (picks the entry for generic sites)
+ * @param {string} path - 'http' or 'browser'
+ * @param {Object} log - Logger
+ */
+async function recordRetailerPath(retailer, url, path, log = defaultLog) {
+  const key = getPathKey(retailer, url);
+  const previous = (await getRetailerPath(retailer, url)) || { successes: 0, failures: 0 };
+  const record = {
+    preferred: path,
+    successes: previous.successes + (path === 'http' ? 1 : 0),
+    failures: previous.failures + (path === 'browser' ? 1 : 0),
+    updatedAt: new Date().toISOString()
+  };
+  pathMemory.set(key, record);
+
+  if (previous.preferred !== path) {
+    log.info(`Scrape path for ${key} is now ${path}`);
+  }
+
+  try {
+    await (await getPathStore()).setValue(key, record);
+  } catch (error) {
+    log.warning(`Could not save scrape path for ${key}: ${error.message}`);
+  }
+}
+
+/**
+ * Decide whether to try the fast path for a retailer. Retailers remembered as
+ * needing the browser are retried over HTTP once HTTP_FAST_PATH_RETRY_MS
+ * (default 24h) has passed, in case the site has changed.
+ * @param {string} retailer - Retailer name
+ * @param {string} url - Product URL (picks the entry for generic sites)
+ * @returns {Promise<boolean>}
+ */
+async function shouldTryHttpFastPath(retailer, url) {
+  if (!isHttpFastPathEnabled()) return false;
+
+  const record = await getRetailerPath(retailer, url);
+  if (!record || record.preferred !== 'browser') return true;
+
+  const retryAfterMs = readPositiveIntEnv('HTTP_FAST_PATH_RETRY_MS', 24 * 60 * 60 * 1000);
+  return Date.now() - new Date(record.updatedAt).getTime() > retryAfterMs;
+}
+
+module.exports = {
+  RETAILER_SELECTORS,
+  isHttpFastPathEnabled,
+  detectBotChallenge,
+  scrapeReviewsOverHttp,
+  shouldTryHttpFastPath,
+  getRetailerPath,
+  recordRetailerPath
+};
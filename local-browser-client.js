@@ -0,0 +1,251 @@
+/**
+ * Local browser service client
+ * Sends Morrisons and Sainsbury's URLs to the visible-browser service
+ * (local-browser-service.js). Calls made within LOCAL_BROWSER_BATCH_WINDOW_MS
+ * of each other are sent as one /scrape-batch request over a keep-alive
+ * connection, and each caller gets its URL's result as soon as the service
+ * streams it back.
+ *
+ * A circuit breaker keeps a dead service from costing every URL a timeout:
+ * after LOCAL_BROWSER_FAILURE_THRESHOLD failed requests in a row the circuit
+ * opens and calls fail straight away, while the service's /health endpoint
+ * is probed in the background (backing off up to LOCAL_BROWSER_PROBE_MAX_MS).
+ * The first healthy probe closes the circuit again.
+ */
+
+const http = require('http');
+const https = require('https');
+const readline = require('readline');
+const axios = require('axios');
+const { log } = require('crawlee');
+const { readPositiveIntEnv } = require('./concurrency-utils');
+
+const DEFAULT_SERVICE_URL = 'http://localhost:3002';
+const UNAVAILABLE = 'LOCAL_SERVICE_UNAVAILABLE';
+
+// Calls waiting for the current batch window: { url, retailer, resolve, reject }
+let queue = [];
+let batchTimer = null;
+
+const breaker = { state: 'closed', failures: 0, openedAt: null, probeDelayMs: 0, probeTimer: null, lastError: null };
+const serviceStats = { batches: 0, urls: 0, succeeded: 0, failed: 0, skipped: 0, probes: 0 };
+
+let httpClient = null;
+
+/**
+ * Whether the local browser service is used at all (LOCAL_BROWSER_SERVICE, default true)
+ * @returns {boolean}
+ */
+function isLocalBrowserServiceEnabled() {
+  return process.env.LOCAL_BROWSER_SERVICE !== 'false';
+}
+
+/**
+ * Base URL of the service (LOCAL_BROWSER_SERVICE_URL)
+ * @returns {string}
+ */
+function getLocalBrowserServiceUrl() {
+  return (process.env.LOCAL_BROWSER_SERVICE_URL || DEFAULT_SERVICE_URL).replace(/\/+$/, '');
+}
+
+// One axios instance with keep-alive agents, so batches and probes reuse the connection
+function getHttpClient() {
+  if (!httpClient) {
+    httpClient = axios.create({
+      validateStatus: () => true,
+      httpAgent: new http.Agent({ keepAlive: true }),
+      httpsAgent: new https.Agent({ keepAlive: true })
+    });
+  }
+  return httpClient;
+}
+
+function unavailableError(message) {
+  const error = new Error(message);
+  error.code = UNAVAILABLE;
+  return error;
+}
+
+function recordSuccess() {
+  breaker.failures = 0;
+  breaker.lastError = null;
+  if (breaker.state === 'open') {
+    log.info(`Local browser service is healthy again after ${Math.round((Date.now() - breaker.openedAt) / 1000)}s, closing circuit`);
+  }
+  breaker.state = 'closed';
+  breaker.openedAt = null;
+  if (breaker.probeTimer) {
+    clearTimeout(breaker.probeTimer);
+    breaker.probeTimer = null;
+  }
+}
+
+function recordFailure(error) {
+  breaker.failures++;
+  breaker.lastError = error.message;
+  if (breaker.state === 'closed' && breaker.failures >= readPositiveIntEnv('LOCAL_BROWSER_FAILURE_THRESHOLD', 2)) {
+    breaker.state = 'open';
+    breaker.openedAt = Date.now();
+    breaker.probeDelayMs = readPositiveIntEnv('LOCAL_BROWSER_PROBE_INTERVAL_MS', 5000);
+    log.warning(`Local browser service unavailable (${error.message}), skipping it until its health check passes`);
+    scheduleProbe();
+  }
+}
+
+function scheduleProbe() {
+  breaker.probeTimer = setTimeout(probeHealth, breaker.probeDelayMs);
+  // Probing shouldn't keep a CLI run alive
+  breaker.probeTimer.unref();
+}
+
+async function probeHealth() {
+  breaker.probeTimer = null;
+  serviceStats.probes++;
+  try {
+    const response = await getHttpClient().get(`${getLocalBrowserServiceUrl()}/health`, {
+      timeout: readPositiveIntEnv('LOCAL_BROWSER_PROBE_TIMEOUT_MS', 2000)
+    });
+    if (response.status === 200) {
+      recordSuccess();
+      return;
+    }
+    breaker.lastError = `health check returned HTTP ${response.status}`;
+  } catch (error) {
+    breaker.lastError = error.message;
+  }
+
+  breaker.probeDelayMs = Math.min(readPositiveIntEnv('LOCAL_BROWSER_PROBE_MAX_MS', 60000), breaker.probeDelayMs * 2);
+  scheduleProbe();
+}
+
+function flushQueue() {
+  clearTimeout(batchTimer);
+  batchTimer = null;
+  const batch = queue;
+  queue = [];
+  if (batch.length > 0) {
+    sendBatch(batch);
+  }
+}
+
+// POST a batch and hand each streamed NDJSON result to the callers waiting on that URL
+async function sendBatch(batch) {
+  serviceStats.batches++;
+  serviceStats.urls += batch.length;
+
+  const waiting = new Map();
+  for (const entry of batch) {
+    if (!waiting.has(entry.url)) waiting.set(entry.url, []);
+    waiting.get(entry.url).push(entry);
+  }
+
+  // The stream is aborted if the service goes quiet for longer than the timeout
+  const controller = new AbortController();
+  const timeoutMs = readPositiveIntEnv('LOCAL_BROWSER_TIMEOUT_MS', 30000);
+  let idleTimer = null;
+  const resetIdleTimer = () => {
+    clearTimeout(idleTimer);
+    idleTimer = setTimeout(() => controller.abort(), timeoutMs);
+  };
+
+  let received = 0;
+  try {
+    resetIdleTimer();
+    const response = await getHttpClient().post(`${getLocalBrowserServiceUrl()}/scrape-batch`, {
+      items: [...waiting.keys()].map(url => ({ url, retailer: waiting.get(url)[0].retailer }))
+    }, { responseType: 'stream', signal: controller.signal });
+
+    if (response.status !== 200) {
+      response.data.destroy();
+      throw new Error(`batch request returned HTTP ${response.status}`);
+    }
+
+    const lines = readline.createInterface({ input: response.data, crlfDelay: Infinity });
+    for await (const line of lines) {
+      resetIdleTimer();
+      if (!line.trim()) continue;
+      const result = JSON.parse(line);
+      received++;
+      for (const entry of waiting.get(result.url) || []) {
+        if (result.success) {
+          serviceStats.succeeded++;
+          entry.resolve(result.reviews || []);
+        } else {
+          serviceStats.failed++;
+          entry.reject(new Error(result.error || 'Local browser service failed'));
+        }
+      }
+      waiting.delete(result.url);
+    }
+
+    recordSuccess();
+  } catch (error) {
+    const reason = controller.signal.aborted ? `no response for ${timeoutMs}ms` : error.message;
+    // Results already streamed show the service is up; the batch just broke off
+    if (received === 0) {
+      recordFailure(new Error(reason));
+    }
+    for (const entries of waiting.values()) {
+      serviceStats.failed += entries.length;
+      entries.forEach(entry => entry.reject(unavailableError(`Local browser service request failed: ${reason}`)));
+    }
+    waiting.clear();
+  } finally {
+    clearTimeout(idleTimer);
+  }
+
+  for (const entries of waiting.values()) {
+    serviceStats.failed += entries.length;
+    entries.forEach(entry => entry.reject(new Error('Local browser service returned no result for this URL')));
+  }
+}
+
+/**
+ * Scrape a URL through the local browser service. Rejects straight away with
+ * error.code LOCAL_SERVICE_UNAVAILABLE while the circuit is open.
+ * @param {string} url - Product URL
+ * @param {string} retailer - Retailer name (morrisons or sainsburys)
+ * @returns {Promise<Array>} - Reviews as extracted by the service's handler
+ */
+function scrapeWithLocalBrowserService(url, retailer) {
+  if (!isLocalBrowserServiceEnabled()) {
+    return Promise.reject(unavailableError('Local browser service is disabled (LOCAL_BROWSER_SERVICE=false)'));
+  }
+  if (breaker.state === 'open') {
+    serviceStats.skipped++;
+    return Promise.reject(unavailableError(`Local browser service circuit is open (${breaker.lastError})`));
+  }
+
+  return new Promise((resolve, reject) => {
+    queue.push({ url, retailer, resolve, reject });
+    if (queue.length >= readPositiveIntEnv('LOCAL_BROWSER_BATCH_SIZE', 10)) {
+      flushQueue();
+    } else if (!batchTimer) {
+      batchTimer = setTimeout(flushQueue, readPositiveIntEnv('LOCAL_BROWSER_BATCH_WINDOW_MS', 50));
+    }
+  });
+}
+
+/**
+ * Circuit state and counters since startup
+ * @returns {Object} - { enabled, url, circuit, consecutiveFailures, lastError, openForMs, batches, urls, succeeded, failed, skipped, probes }
+ */
+function getLocalBrowserServiceStats() {
+  return {
+    enabled: isLocalBrowserServiceEnabled(),
+    url: getLocalBrowserServiceUrl(),
+    circuit: breaker.state,
+    consecutiveFailures: breaker.failures,
+    lastError: breaker.lastError,
+    openForMs: breaker.openedAt ? Date.now() - breaker.openedAt : 0,
+    ...serviceStats
+  };
+}
+
+module.exports = {
+  UNAVAILABLE,
+  isLocalBrowserServiceEnabled,
+  getLocalBrowserServiceUrl,
+  scrapeWithLocalBrowserService,
+  getLocalBrowserServiceStats
+};
@@ -3,48 +3,64 @@ const puppeteer = require('puppeteer');
 const cors = require('cors');
 const { handleMorrisonsSite } = require('./checkpoint/morrisons-handler-new');
 const { handleSainsburysSite } = require('./checkpoint/sainsburys-handler-new');
+const { BrowserPool } = require('./browser-pool');
+const { readPositiveIntEnv, runWithConcurrency } = require('./concurrency-utils');
 
 const app = express();
 const port = 3002; // Different from the main server port
 
+// Pool of visible browsers reused across requests; each request gets its own incognito context
+const browserPool = new BrowserPool({
+  name: 'puppeteer',
+  launch: (launchOptions) => puppeteer.launch(launchOptions),
+  createContext: (browser) => browser.createIncognitoBrowserContext()
+});
+
+const visibleLaunchOptions = {
+  headless: false, // Use a visible browser
+  defaultViewport: null, // Use default viewport size
+  args: [
+    '--start-maximized', // Start with maximized window
+    '--disable-features=site-per-process', // Disable site isolation
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-accelerated-2d-canvas',
+    '--disable-gpu'
+  ]
+};
+
 // Enable CORS for all routes
 app.use(cors());
 app.use(express.json());
 
-// Health check endpoint
+// Health check endpoint (the scraper's circuit breaker probes this)
 app.get('/health', (req, res) => {
-  res.status(200).json({ status: 'ok', timestamp: new Date().toISOString() });
+  res.status(200).json({ status: 'ok', timestamp: new Date().toISOString(), browserPool: browserPool.stats() });
 });
 
-// Endpoint to scrape reviews using a visible browser
-app.post('/scrape-with-visible-browser', async (req, res) => {
-  const { url, retailer } = req.body;
+// Create a custom logger
+const log = {
+  info: (message) => console.log(`INFO: ${message}`),
+  warning: (message) => console.warn(`WARNING: ${message}`),
+  error: (message) => console.error(`ERROR: ${message}`)
+};
+
+// Scrape one URL in a visible browser and return its reviews
+async function scrapeWithVisibleBrowser(url, retailer) {
+  console.log(`Starting visible browser scraping for ${url} (${retailer})`);
   
-  if (!url) {
-    return res.status(400).json({ error: 'URL is required' });
+  if (retailer !== 'morrisons' && retailer !== 'sainsburys') {
+    throw new Error(`Unsupported retailer: ${retailer}`);
   }
   
-  console.log(`Starting visible browser scraping for ${url} (${retailer})`);
-  
-  let browser;
+  // Lease a visible browser from the pool and open a fresh context
+  const browserLease = await browserPool.acquire({ headless: false }, visibleLaunchOptions);
   try {
-    // Launch a visible browser
-    browser = await puppeteer.launch({
-      headless: false, // Use a visible browser
-      defaultViewport: null, // Use default viewport size
-      args: [
-        '--start-maximized', // Start with maximized window
-        '--disable-features=site-per-process', // Disable site isolation
-        '--no-sandbox',
-        '--disable-setuid-sandbox',
-        '--disable-dev-shm-usage',
-        '--disable-accelerated-2d-canvas',
-        '--disable-gpu'
-      ]
-    });
+    const context = await browserLease.newContext();
     
     // Create a new page
-    const page = await browser.newPage();
+    const page = await context.newPage();
     
     // Set a realistic user agent
     await page.setUserAgent('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36');
@@ -56,13 +72,6 @@ app.post('/scrape-with-visible-browser', async (req, res) => {
       'Accept-Encoding': 'gzip, deflate, br'
     });
     
-    // Create a custom logger
-    const log = {
-      info: (message) => console.log(`INFO: ${message}`),
-      warning: (message) => console.warn(`WARNING: ${message}`),
-      error: (message) => console.error(`ERROR: ${message}`)
-    };
-    
     // Navigate to the URL
     console.log(`Navigating to ${url}`);
     await page.goto(url, { waitUntil: 'domcontentloaded', timeout: 60000 });
@@ -73,23 +82,38 @@ app.post('/scrape-with-visible-browser', async (req, res) => {
     // Take a screenshot for debugging
     await page.screenshot({ path: `local-browser-${retailer}-${Date.now()}.png` });
     
-    let reviews = [];
-    
     // Use the appropriate handler based on the retailer
+    let reviews;
     if (retailer === 'morrisons') {
       console.log('Using Morrisons handler');
       reviews = await handleMorrisonsSite(page, { log });
-    } else if (retailer === 'sainsburys') {
+    } else {
       console.log('Using Sainsburys handler');
       reviews = await handleSainsburysSite(page, { log });
-    } else {
-      throw new Error(`Unsupported retailer: ${retailer}`);
     }
     
     console.log(`Extracted ${reviews.length} reviews from ${retailer} site`);
-    
-    // Close the browser
-    await browser.close();
+    return reviews;
+  } finally {
+    // Close the context and return the browser to the pool
+    try {
+      await browserLease.release();
+    } catch (closeError) {
+      console.error(`Error releasing browser: ${closeError.message}`);
+    }
+  }
+}
+
+// Endpoint to scrape reviews using a visible browser
+app.post('/scrape-with-visible-browser', async (req, res) => {
+  const { url, retailer } = req.body;
+  
+  if (!url) {
+    return res.status(400).json({ error: 'URL is required' });
+  }
+  
+  try {
+    const reviews = await scrapeWithVisibleBrowser(url, retailer);
     
     // Return the reviews
     res.status(200).json({ 
@@ -104,15 +128,6 @@ app.post('/scrape-with-visible-browser', async (req, res) => {
     console.error(`Error scraping with visible browser: ${error.message}`);
     console.error(error.stack);
     
-    // Make sure to close the browser if it's open
-    if (browser) {
-      try {
-        await browser.close();
-      } catch (closeError) {
-        console.error(`Error closing browser: ${closeError.message}`);
-      }
-    }
-    
     res.status(500).json({ 
       error: error.message,
       stack: error.stack,
@@ -122,9 +137,61 @@ app.post('/scrape-with-visible-browser', async (req, res) => {
   }
 });
 
+// Scrape a batch of URLs ({ items: [{ url, retailer }] }), streaming one NDJSON
+// line per URL as soon as it finishes, in completion order
+app.post('/scrape-batch', async (req, res) => {
+  const items = Array.isArray(req.body.items) ? req.body.items : [];
+  
+  if (items.length === 0 || items.some(item => !item || !item.url)) {
+    return res.status(400).json({ error: 'items must be a non-empty list of { url, retailer }' });
+  }
+  
+  console.log(`Starting visible browser batch of ${items.length} URLs`);
+  res.status(200).set('Content-Type', 'application/x-ndjson');
+  res.flushHeaders();
+  
+  // Don't start more browsers for a caller that has gone away
+  let clientGone = false;
+  res.on('close', () => {
+    clientGone = !res.writableEnded;
+  });
+  
+  await runWithConcurrency(items, (item) => {
+    if (clientGone) {
+      throw new Error('Client disconnected');
+    }
+    return scrapeWithVisibleBrowser(item.url, item.retailer);
+  }, {
+    concurrency: readPositiveIntEnv('LOCAL_BROWSER_CONCURRENCY', 2),
+    onSettled: (outcome, item) => {
+      if (clientGone) return;
+      const { url, retailer } = item;
+      if (outcome.status === 'fulfilled') {
+        res.write(JSON.stringify({ url, retailer, success: true, reviews: outcome.value, count: outcome.value.length }) + '\n');
+      } else {
+        console.error(`Error scraping ${url} with visible browser: ${outcome.reason.message}`);
+        res.write(JSON.stringify({ url, retailer, success: false, error: outcome.reason.message }) + '\n');
+      }
+    }
+  });
+  
+  res.end();
+});
+
 // Start the server
-app.listen(port, '0.0.0.0', () => {
+const server = app.listen(port, '0.0.0.0', () => {
   console.log(`Local browser service listening on port ${port}`);
   console.log(`Local URL: http://localhost:${port}`);
   console.log(`Environment: ${process.env.NODE_ENV || 'development'}`);
 });
+
+// Close pooled browsers before exiting
+async function shutdown(signal) {
+  console.log(`Received ${signal}, shutting down...`);
+  server.close();
+  await browserPool.closeAll().catch(error => console.error(`Error closing browser pool: ${error.message}`));
+  process.exit(0);
+}
+
+process.on('SIGTERM', () => shutdown('SIGTERM'));
+process.on('SIGINT', () => shutdown('SIGINT'));
@@ -0,0 +1,178 @@
+/**
+ * Scrape stage metrics
+ * Times each stage of a scrape (browser acquire, navigation attempts, cookie
+ * banner, reviews tab, pagination steps, extraction, date parsing, CSV
+ * generation) as a span tagged with the retailer, logs it, and aggregates it
+ * into Prometheus histograms served from /metrics. Event loop lag is tracked
+ * too, to show when synchronous work stalls other requests.
+ */
+
+const { monitorEventLoopDelay } = require('perf_hooks');
+const { log } = require('crawlee');
+
+// Stage durations range from a few ms (date parsing) to minutes (navigation retries)
+const DURATION_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300];
+
+const STAGE_METRIC = 'scraper_stage_duration_seconds';
+
+// serialized label set -> { labels, buckets[], sum, count }
+const stageSeries = new Map();
+
+// How late the event loop runs timers, sampled every 10ms from startup
+const eventLoopDelay = monitorEventLoopDelay({ resolution: 10 });
+eventLoopDelay.enable();
+
+function labelKey(labels) {
+  return Object.keys(labels).sort().map(name => `${name}=${labels[name]}`).join(',');
+}
+
+function escapeLabelValue(value) {
+  return String(value).replace(/\\/g, '\\\\').replace(/\n/g, '\\n').replace(/"/g, '\\"');
+}
+
+function formatLabels(labels) {
+  const pairs = Object.keys(labels).map(name => `${name}="${escapeLabelValue(labels[name])}"`);
+  return pairs.length ? `{${pairs.join(',')}}` : '';
+}
+
+/**
+ * Record one stage duration
+ * @param {string} stage - Stage name, e.g. 'navigation'
+ * @param {Object} labels - Extra labels (retailer, outcome, ...)
+ * @param {number} seconds - Duration in seconds
+ */
+function observeStage(stage, labels, seconds) {
+  const allLabels = { stage, retailer: 'unknown', outcome: 'ok', ...labels };
+  const key = labelKey(allLabels);
+  let series = stageSeries.get(key);
+  if (!series) {
+    series = { labels: allLabels, buckets: DURATION_BUCKETS.map(() => 0), sum: 0, count: 0 };
+    stageSeries.set(key, series);
+  }
+
+  DURATION_BUCKETS.forEach((bound, i) => {
+    if (seconds <= bound) series.buckets[i]++;
+  });
+  series.sum += seconds;
+  series.count++;
+}
+
+/**
+ * Start timing a stage
+ * @param {string} stage - Stage name
+ * @param {Object} labels - Labels, usually { retailer }
+ * @returns {Object} - Span with end(extraLabels) returning the duration in ms; ending twice is a no-op
+ */
+function startSpan(stage, labels = {}) {
+  const startedAt = process.hrtime.bigint();
+  let ended = false;
+
+  return {
+    end(extraLabels = {}) {
+      if (ended) return 0;
+      ended = true;
+
+      const durationMs = Number(process.hrtime.bigint() - startedAt) / 1e6;
+      const spanLabels = { ...labels, ...extraLabels };
+      observeStage(stage, spanLabels, durationMs / 1000);
+      log.debug(`span ${stage}`, { ...spanLabels, durationMs: Math.round(durationMs) });
+      return durationMs;
+    }
+  };
+}
+
+/**
+ * Time an async stage; failures are recorded with outcome="error" and rethrown
+ * @param {string} stage - Stage name
+ * @param {Object} labels - Labels, usually { retailer }
+ * @param {Function} fn - Async work to time
+ * @returns {Promise<*>} - fn's result
+ */
+async function timeStage(stage, labels, fn) {
+  const span = startSpan(stage, labels);
+  try {
+    const result = await fn();
+    span.end();
+    return result;
+  } catch (error) {
+    span.end({ outcome: 'error' });
+    throw error;
+  }
+}
+
+/**
+ * Event loop lag since startup (or the last reset): how long callbacks were
+ * held up by synchronous work on the main thread
+ * @param {boolean} reset - Start a new measurement window after reading
+ * @returns {Object} - { meanMs, p50Ms, p99Ms, maxMs }
+ */
+function getEventLoopLag(reset = false) {
+  const toMs = ns => (Number.isFinite(ns) ? Math.round(ns / 1e4) / 100 : 0);
+  const lag = {
+    meanMs: toMs(eventLoopDelay.mean),
+    p50Ms: toMs(eventLoopDelay.percentile(50)),
+    p99Ms: toMs(eventLoopDelay.percentile(99)),
+    maxMs: toMs(eventLoopDelay.max)
+  };
+  if (reset) {
+    eventLoopDelay.reset();
+  }
+  return lag;
+}
+
+/**
+ * Render all metrics in the Prometheus text exposition format
+ * @param {Object} gauges - Extra point-in-time values, name -> { help, value }, where value
+ *   can also be a list of { labels, value }
+ * @returns {string}
+ */
+function renderMetrics(gauges = {}) {
+  const lines = [
+    `# HELP ${STAGE_METRIC} Time spent in each scrape stage, by retailer`,
+    `# TYPE ${STAGE_METRIC} histogram`
+  ];
+
+  for (const series of stageSeries.values()) {
+    DURATION_BUCKETS.forEach((bound, i) => {
+      lines.push(`${STAGE_METRIC}_bucket${formatLabels({ ...series.labels, le: bound })} ${series.buckets[i]}`);
+    });
+    lines.push(`${STAGE_METRIC}_bucket${formatLabels({ ...series.labels, le: '+Inf' })} ${series.count}`);
+    lines.push(`${STAGE_METRIC}_sum${formatLabels(series.labels)} ${series.sum}`);
+    lines.push(`${STAGE_METRIC}_count${formatLabels(series.labels)} ${series.count}`);
+  }
+
+  const memory = process.memoryUsage();
+  const lag = getEventLoopLag();
+  const allGauges = {
+    process_resident_memory_bytes: { help: 'Resident memory size in bytes', value: memory.rss },
+    nodejs_heap_used_bytes: { help: 'V8 heap used in bytes', value: memory.heapUsed },
+    process_uptime_seconds: { help: 'Process uptime in seconds', value: process.uptime() },
+    nodejs_eventloop_lag_seconds: {
+      help: 'Event loop lag since startup, by quantile',
+      value: [
+        { labels: { quantile: '0.5' }, value: lag.p50Ms / 1000 },
+        { labels: { quantile: '0.99' }, value: lag.p99Ms / 1000 },
+        { labels: { quantile: '1' }, value: lag.maxMs / 1000 }
+      ]
+    },
+    ...gauges
+  };
+  for (const [name, { help, value }] of Object.entries(allGauges)) {
+    lines.push(`# HELP ${name} ${help}`, `# TYPE ${name} gauge`);
+    // A gauge is a single value, or a list of { labels, value } series
+    for (const series of Array.isArray(value) ? value : [{ labels: {}, value }]) {
+      lines.push(`${name}${formatLabels(series.labels)} ${series.value}`);
+    }
+  }
+
+  return lines.join('\n') + '\n';
+}
+
+module.exports = {
+  DURATION_BUCKETS,
+  startSpan,
+  timeStage,
+  observeStage,
+  getEventLoopLag,
+  renderMetrics
+};
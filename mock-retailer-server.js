@@ -0,0 +1,311 @@
+/**
+ * Mock retailer server
+ * Serves the saved retailer page captures so the scrapers can be run and
+ * benchmarked without touching the live sites. Each capture's reviews are
+ * repeated across several pages (ASDA next-page links, Tesco "show more"),
+ * and every response can be delayed to mimic real latency.
+ *
+ * Point the scraper at it with MOCK_RETAILER_URL=http://localhost:3010 and
+ * every browser request (any host) is answered by this server instead.
+ *
+ * Usage: node mock-retailer-server.js [port]
+ */
+
+const fs = require('fs');
+const path = require('path');
+const express = require('express');
+const cheerio = require('cheerio');
+const urlUtils = require('./url-utils');
+const { readPositiveIntEnv } = require('./concurrency-utils');
+
+// Header carrying the URL the browser originally asked for
+const ORIGINAL_URL_HEADER = 'x-mock-original-url';
+
+// Saved captures for each retailer and how their reviews are laid out
+const RETAILER_FIXTURES = {
+  asda: {
+    files: ['asda-page-html-*.html', 'backup-files/asda-page-html-*.html'],
+    productPath: /\/product\//,
+    itemSelector: 'div.pdp-description-reviews__content-cntr',
+    titleSelector: '.pdp-description-reviews__rating-title',
+    textSelector: '.pdp-description-reviews__content-text',
+    pagination: 'links',
+    nextSelector: 'a[data-auto-id="btnright"]'
+  },
+  tesco: {
+    files: ['backup-files/tesco-page-html-*.html'],
+    // The debug capture is the page Tesco serves outside a product (used for the homepage visit)
+    otherPage: 'debug-tesco-initial.html',
+    productPath: /\/products\//,
+    itemSelector: 'div[class*="ReviewTileContainer"]',
+    titleSelector: 'h3, [class*="Title-mfe-pdp"]',
+    textSelector: 'span[class*="Content-mfe-pdp"]',
+    pagination: 'show-more',
+    showMoreSelector: 'button[class*="ShowMoreButton"]'
+  },
+  sainsburys: {
+    files: ['backup-files/sainsburys-page-html-*.html'],
+    productPath: /\/product\//,
+    itemSelector: '.pd-reviews__review-container',
+    titleSelector: '.review__title',
+    textSelector: '.review__content',
+    pagination: 'none'
+  }
+};
+
+function expandFixturePattern(pattern) {
+  const dir = path.join(__dirname, path.dirname(pattern));
+  const [prefix, suffix] = path.basename(pattern).split('*');
+  if (!fs.existsSync(dir)) return [];
+  return fs.readdirSync(dir)
+    .filter(file => suffix === undefined ? file === prefix : file.startsWith(prefix) && file.endsWith(suffix))
+    .sort()
+    .map(file => path.join(dir, file));
+}
+
+// Parse a capture once: the page without scripts, with its review list emptied, plus the review items
+function loadFixture(filePath, config) {
+  const $ = cheerio.load(fs.readFileSync(filePath, 'utf8'));
+  $('script, noscript, link[rel="preload"], link[rel="prefetch"]').remove();
+
+  const items = $(config.itemSelector);
+  const itemHtml = items.map((i, el) => $.html(el)).get();
+  if (items.length > 0) {
+    $(items[0]).before('<div id="mock-review-slot"></div>');
+    items.remove();
+  }
+
+  return { filePath, shell: $.html(), itemHtml };
+}
+
+// Give reviews on later pages distinct titles/text so they don't deduplicate away
+function reviewItemForPage(itemHtml, config, pageNumber) {
+  if (pageNumber === 1) return itemHtml;
+
+  const $ = cheerio.load(itemHtml, null, false);
+  const prefix = `[Page ${pageNumber}] `;
+  const title = $(config.titleSelector).first();
+  if (title.length) title.text(prefix + title.text().trim());
+  const text = $(config.textSelector).first();
+  if (text.length) text.text(prefix + text.text().trim());
+  return $.html();
+}
+
+// Delays may be 0, which readPositiveIntEnv would treat as unset
+function readDelayEnv(name, defaultValue) {
+  const parsed = parseInt(process.env[name], 10);
+  return Number.isInteger(parsed) && parsed >= 0 ? parsed : defaultValue;
+}
+
+function hashString(value) {
+  let hash = 0;
+  for (const char of value) {
+    hash = ((hash << 5) - hash + char.charCodeAt(0)) | 0;
+  }
+  return Math.abs(hash);
+}
+
+/**
+ * Create the mock retailer app
+ * @param {Object} options - Mock options
+ * @param {number} options.latencyMs - Base delay added to every response (MOCK_LATENCY_MS, default 150)
+ * @param {number} options.jitterMs - Extra random delay up to this much (MOCK_JITTER_MS, default 100)
+ * @param {number} options.reviewPages - Pages of reviews per product (MOCK_REVIEW_PAGES, default 3)
+ * @returns {Object} - Express app, with app.locals.stats counting served requests
+ */
+function createMockRetailerApp(options = {}) {
+  const latencyMs = options.latencyMs !== undefined ? options.latencyMs : readDelayEnv('MOCK_LATENCY_MS', 150);
+  const jitterMs = options.jitterMs !== undefined ? options.jitterMs : readDelayEnv('MOCK_JITTER_MS', 100);
+  const reviewPages = options.reviewPages || readPositiveIntEnv('MOCK_REVIEW_PAGES', 3);
+
+  // Captures are parsed lazily and kept for the life of the server
+  const fixtureCache = new Map();
+  const getFixtures = (retailer) => {
+    if (!fixtureCache.has(retailer)) {
+      const config = RETAILER_FIXTURES[retailer];
+      const files = config.files.flatMap(expandFixturePattern);
+      fixtureCache.set(retailer, files.map(file => loadFixture(file, config)));
+    }
+    return fixtureCache.get(retailer);
+  };
+
+  const pageItems = (fixture, config, pageNumber) => fixture.itemHtml
+    .map(item => reviewItemForPage(item, config, pageNumber))
+    .join('\n');
+
+  const app = express();
+  app.locals.stats = { documents: 0, reviewPages: 0, other: 0 };
+
+  // Simulated network latency
+  app.use((req, res, next) => {
+    const delay = latencyMs + Math.round(Math.random() * jitterMs);
+    setTimeout(next, delay);
+  });
+
+  // Work out which URL the browser was really asking for
+  app.use((req, res, next) => {
+    const original = req.get(ORIGINAL_URL_HEADER);
+    req.originalTarget = new URL(original || req.originalUrl, `http://${req.get('host')}`);
+    req.retailer = urlUtils.detectRetailerFromUrl(req.originalTarget.href);
+    next();
+  });
+
+  // Next batch of Tesco-style "show more" reviews, as an HTML fragment
+  app.get('/__mock/reviews/:retailer/:fixture', (req, res) => {
+    const config = RETAILER_FIXTURES[req.params.retailer];
+    const fixture = config && getFixtures(req.params.retailer)[parseInt(req.params.fixture, 10)];
+    const pageNumber = parseInt(req.query.page, 10) || 1;
+    if (!fixture || pageNumber > reviewPages) {
+      return res.status(404).send('');
+    }
+
+    app.locals.stats.reviewPages++;
+    res.json({ html: pageItems(fixture, config, pageNumber), hasMore: pageNumber < reviewPages });
+  });
+
+  app.get('*', (req, res) => {
+    const config = RETAILER_FIXTURES[req.retailer];
+    const target = req.originalTarget;
+    const wantsDocument = (req.get('accept') || '').includes('text/html');
+
+    if (!config || !wantsDocument) {
+      app.locals.stats.other++;
+      return wantsDocument ? res.send('<!DOCTYPE html><html><head><title>Mock</title></head><body></body></html>') : res.status(404).send('');
+    }
+
+    if (!config.productPath.test(target.pathname)) {
+      app.locals.stats.documents++;
+      return config.otherPage
+        ? res.sendFile(path.join(__dirname, config.otherPage))
+        : res.send(`<!DOCTYPE html><html><head><title>${req.retailer}</title></head><body></body></html>`);
+    }
+
+    const fixtures = getFixtures(req.retailer);
+    if (fixtures.length === 0) {
+      return res.status(404).send(`No ${req.retailer} captures found`);
+    }
+
+    // The same product always gets the same capture
+    const { productId } = urlUtils.extractProductInfoFromUrl(target.href);
+    const fixtureIndex = hashString(productId) % fixtures.length;
+    const fixture = fixtures[fixtureIndex];
+    const pageNumber = config.pagination === 'links' ? Math.min(parseInt(target.searchParams.get('page'), 10) || 1, reviewPages) : 1;
+
+    const $ = cheerio.load(fixture.shell);
+    $('#mock-review-slot').replaceWith(pageItems(fixture, config, pageNumber));
+
+    if (config.pagination === 'links') {
+      const next = $(config.nextSelector);
+      if (pageNumber < reviewPages) {
+        next.attr('href', `${target.pathname}?page=${pageNumber + 1}`).attr('aria-disabled', 'false');
+      } else {
+        next.attr('aria-disabled', 'true').addClass('disabled').removeAttr('href');
+      }
+    } else if (config.pagination === 'show-more') {
+      // Small stand-in for the retailer's script: fetch and append the next batch on click
+      $('body').append(`<script>
+        (function () {
+          var nextPage = 2;
+          document.addEventListener('click', function (event) {
+            var button = event.target.closest(${JSON.stringify(config.showMoreSelector)});
+            if (!button) return;
+            fetch('/__mock/reviews/${req.retailer}/${fixtureIndex}?page=' + nextPage)
+              .then(function (response) { return response.json(); })
+              .then(function (data) {
+                var tiles = document.querySelectorAll(${JSON.stringify(config.itemSelector)});
+                tiles[tiles.length - 1].insertAdjacentHTML('afterend', data.html);
+                nextPage++;
+                if (!data.hasMore) button.remove();
+              });
+          });
+        })();
+      </script>`);
+      if (reviewPages === 1) {
+        $(config.showMoreSelector).remove();
+      }
+    }
+
+    app.locals.stats.documents++;
+    res.type('html').send($.html());
+  });
+
+  return app;
+}
+
+/**
+ * route.fetch options that send a request to the mock server instead, keeping
+ * the original URL in a header
+ * @param {Object} request - Playwright request
+ * @param {string} mockUrl - Base URL of the mock server
+ * @returns {Object|undefined} - undefined for requests already going to the mock server
+ */
+function mockFetchOptions(request, mockUrl) {
+  const mockOrigin = new URL(mockUrl).origin;
+  const original = new URL(request.url());
+  if (original.origin === mockOrigin) {
+    return undefined;
+  }
+  return {
+    url: `${mockOrigin}${original.pathname}${original.search}`,
+    headers: { ...request.headers(), [ORIGINAL_URL_HEADER]: request.url() }
+  };
+}
+
+/**
+ * Send every request from a Playwright context to the mock server, keeping
+ * the original URL in a header. Register this before other routes (such as
+ * the resource policy) so they still see the request first.
+ * @param {Object} context - Playwright browser context
+ * @param {string} mockUrl - Base URL of the mock server
+ */
+async function routeContextToMockRetailer(context, mockUrl) {
+  await context.route('**/*', async (route) => {
+    const fetchOptions = mockFetchOptions(route.request(), mockUrl);
+    if (!fetchOptions) {
+      await route.fallback().catch(() => {});
+      return;
+    }
+
+    try {
+      const response = await route.fetch(fetchOptions);
+      await route.fulfill({ response });
+    } catch (e) {
+      await route.abort().catch(() => {});
+    }
+  });
+}
+
+/**
+ * Start the mock server
+ * @param {Object} options - createMockRetailerApp options plus port (0 picks a free port)
+ * @returns {Promise<Object>} - { url, app, close() }
+ */
+function startMockRetailerServer(options = {}) {
+  const app = createMockRetailerApp(options);
+  return new Promise((resolve, reject) => {
+    const server = app.listen(options.port || 0, '127.0.0.1', () => {
+      resolve({
+        url: `http://127.0.0.1:${server.address().port}`,
+        app,
+        close: () => new Promise(done => server.close(done))
+      });
+    });
+    server.on('error', reject);
+  });
+}
+
+module.exports = {
+  RETAILER_FIXTURES,
+  createMockRetailerApp,
+  startMockRetailerServer,
+  mockFetchOptions,
+  routeContextToMockRetailer
+};
+
+if (require.main === module) {
+  const port = parseInt(process.argv[2], 10) || readPositiveIntEnv('MOCK_RETAILER_PORT', 3010);
+  startMockRetailerServer({ port }).then(({ url }) => {
+    console.log(`Mock retailer server listening on ${url}`);
+    console.log(`Run the scraper with MOCK_RETAILER_URL=${url} to use it`);
+  });
+}
@@ -0,0 +1,387 @@
+/**
+ * Network cache
+ * Opt-in record/replay cache for the retailer pages and review responses the
+ * scraper fetches: the Playwright context (as a route handler), the HTTP fast
+ * path and the local browser service client all go through it.
+ *
+ * NETWORK_CACHE picks the mode:
+ * - off (default): no caching
+ * - on: serve fresh entries from the cache, fetch and store misses
+ * - record: always fetch, and store the responses (refreshes the cache)
+ * - replay: serve only from the cache, whatever the entries' age; misses fail
+ *   instead of going to the network, for deterministic offline runs
+ *
+ * Bodies are stored content-addressed (blobs/<sha256>), so identical responses
+ * from different URLs are stored once; entries/<key>.json maps a request to
+ * its status, headers and body hash. Each resource type has its own TTL, and
+ * the least recently used entries are evicted once the blobs pass
+ * NETWORK_CACHE_MAX_MB.
+ */
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const { readPositiveIntEnv } = require('./concurrency-utils');
+
+const MODES = ['off', 'on', 'record', 'replay'];
+const DEFAULT_CACHE_DIR = path.join(__dirname, 'storage', 'network-cache');
+
+// Playwright resource types -> TTL group; other types (images, fonts, media...) aren't cached
+const RESOURCE_TTL_GROUPS = {
+  document: 'document',
+  xhr: 'api',
+  fetch: 'api',
+  script: 'static',
+  stylesheet: 'static'
+};
+
+const DEFAULT_TTLS_MS = {
+  document: 6 * 60 * 60 * 1000,
+  api: 60 * 60 * 1000,
+  static: 24 * 60 * 60 * 1000
+};
+
+// Headers that describe the stored bytes rather than the response
+const DROPPED_HEADERS = ['content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie'];
+
+/**
+ * The cache mode (NETWORK_CACHE)
+ * @returns {string} - off, on, record or replay
+ */
+function getNetworkCacheMode() {
+  const mode = (process.env.NETWORK_CACHE || 'off').toLowerCase();
+  return MODES.includes(mode) ? mode : 'off';
+}
+
+function getTtlMs(group) {
+  return readPositiveIntEnv(`NETWORK_CACHE_TTL_${group.toUpperCase()}_MS`, DEFAULT_TTLS_MS[group]);
+}
+
+function sha256(value) {
+  return crypto.createHash('sha256').update(value).digest('hex');
+}
+
+/**
+ * Cache key for a request
+ * @param {string} method - HTTP method
+ * @param {string} url - Request URL
+ * @param {string} body - Request body, for POSTs
+ * @returns {string}
+ */
+function cacheKey(method, url, body = '') {
+  return sha256(`${method.toUpperCase()} ${url}\n${body || ''}`);
+}
+
+function cleanHeaders(headers) {
+  const cleaned = {};
+  for (const [name, value] of Object.entries(headers || {})) {
+    if (!DROPPED_HEADERS.includes(name.toLowerCase())) {
+      cleaned[name] = Array.isArray(value) ? value.join(', ') : String(value);
+    }
+  }
+  return cleaned;
+}
+
+class NetworkCache {
+  /**
+   * @param {Object} options - Cache options
+   * @param {string} options.dir - Cache directory (NETWORK_CACHE_DIR)
+   * @param {number} options.maxBytes - Size limit for stored bodies (NETWORK_CACHE_MAX_MB, default 500)
+   * @param {string} options.mode - Cache mode (defaults to NETWORK_CACHE)
+   * @param {Object} options.log - Logger
+   */
+  constructor(options = {}) {
+    this.dir = options.dir || process.env.NETWORK_CACHE_DIR || DEFAULT_CACHE_DIR;
+    this.entriesDir = path.join(this.dir, 'entries');
+    this.blobsDir = path.join(this.dir, 'blobs');
+    this.maxBytes = options.maxBytes || readPositiveIntEnv('NETWORK_CACHE_MAX_MB', 500) * 1024 * 1024;
+    this.mode = options.mode || getNetworkCacheMode();
+    this.log = options.log || console;
+
+    // key -> { bodyHash, size, lastAccessAt }; bodyHash -> { size, refs }
+    this.entries = new Map();
+    this.blobs = new Map();
+    this.totalBytes = 0;
+    this.loading = null;
+    this.stats = { hits: 0, misses: 0, stored: 0, evicted: 0 };
+  }
+
+  /**
+   * Index the entries on disk (once)
+   * @returns {Promise<NetworkCache>}
+   */
+  load() {
+    if (!this.loading) {
+      this.loading = this.readIndex().then(() => this);
+    }
+    return this.loading;
+  }
+
+  async readIndex() {
+    let files = [];
+    try {
+      files = await fs.promises.readdir(this.entriesDir);
+    } catch (error) {
+      if (error.code !== 'ENOENT') throw error;
+    }
+
+    for (const file of files) {
+      if (!file.endsWith('.json')) continue;
+      const filePath = path.join(this.entriesDir, file);
+      try {
+        const [content, stat] = await Promise.all([fs.promises.readFile(filePath, 'utf8'), fs.promises.stat(filePath)]);
+        const entry = JSON.parse(content);
+        this.track(file.slice(0, -'.json'.length), entry.bodyHash, entry.size, stat.mtimeMs);
+      } catch (e) {
+        // Half-written entry; the next store for that request replaces it
+      }
+    }
+  }
+
+  track(key, bodyHash, size, lastAccessAt) {
+    this.entries.set(key, { bodyHash, size, lastAccessAt });
+    const blob = this.blobs.get(bodyHash);
+    if (blob) {
+      blob.refs++;
+    } else {
+      this.blobs.set(bodyHash, { size, refs: 1 });
+      this.totalBytes += size;
+    }
+  }
+
+  entryPath(key) {
+    return path.join(this.entriesDir, `${key}.json`);
+  }
+
+  blobPath(bodyHash) {
+    return path.join(this.blobsDir, bodyHash.slice(0, 2), bodyHash);
+  }
+
+  /**
+   * Look a request up. In replay mode entries never expire.
+   * @param {string} key - From cacheKey
+   * @param {string} resourceType - Playwright resource type, or 'document'/'api'
+   * @returns {Promise<Object|null>} - { status, headers, body (Buffer), storedAt } or null
+   */
+  async get(key, resourceType) {
+    await this.load();
+    if (this.mode === 'record' || !this.entries.has(key)) {
+      this.stats.misses++;
+      return null;
+    }
+
+    try {
+      const entry = JSON.parse(await fs.promises.readFile(this.entryPath(key), 'utf8'));
+      const group = RESOURCE_TTL_GROUPS[resourceType] || resourceType;
+      const ageMs = Date.now() - new Date(entry.storedAt).getTime();
+      if (this.mode !== 'replay' && ageMs > getTtlMs(group)) {
+        this.stats.misses++;
+        return null;
+      }
+
+      const body = await fs.promises.readFile(this.blobPath(entry.bodyHash));
+      this.stats.hits++;
+      this.entries.get(key).lastAccessAt = Date.now();
+      const now = new Date();
+      fs.promises.utimes(this.entryPath(key), now, now).catch(() => {});
+      return { status: entry.status, headers: entry.headers, body, storedAt: entry.storedAt };
+    } catch (e) {
+      this.stats.misses++;
+      return null;
+    }
+  }
+
+  /**
+   * Store a response
+   * @param {string} key - From cacheKey
+   * @param {Object} response - { url, status, headers, body (Buffer or string) }
+   */
+  async put(key, response) {
+    await this.load();
+    const body = Buffer.isBuffer(response.body) ? response.body : Buffer.from(String(response.body));
+    const bodyHash = sha256(body);
+
+    if (!this.blobs.has(bodyHash)) {
+      const blobPath = this.blobPath(bodyHash);
+      await fs.promises.mkdir(path.dirname(blobPath), { recursive: true });
+      await fs.promises.writeFile(blobPath, body);
+    }
+
+    await fs.promises.mkdir(this.entriesDir, { recursive: true });
+    const tempPath = `${this.entryPath(key)}.${process.pid}.tmp`;
+    await fs.promises.writeFile(tempPath, JSON.stringify({
+      url: response.url,
+      status: response.status,
+      headers: cleanHeaders(response.headers),
+      bodyHash,
+      size: body.length,
+      storedAt: new Date().toISOString()
+    }));
+    await fs.promises.rename(tempPath, this.entryPath(key));
+
+    // Reference the new body before dropping the old one, which may be the same blob
+    const previous = this.entries.get(key);
+    this.track(key, bodyHash, body.length, Date.now());
+    if (previous) {
+      await this.dropBlobRef(previous.bodyHash);
+    }
+    this.stats.stored++;
+    await this.evict();
+  }
+
+  // Delete a blob once no entry points at it
+  async dropBlobRef(bodyHash) {
+    const blob = this.blobs.get(bodyHash);
+    if (blob && --blob.refs === 0) {
+      this.blobs.delete(bodyHash);
+      this.totalBytes -= blob.size;
+      await fs.promises.rm(this.blobPath(bodyHash), { force: true });
+    }
+  }
+
+  async evict() {
+    if (this.totalBytes <= this.maxBytes) return;
+
+    const oldestFirst = [...this.entries.entries()].sort((a, b) => a[1].lastAccessAt - b[1].lastAccessAt);
+    for (const [key, entry] of oldestFirst) {
+      if (this.totalBytes <= this.maxBytes) break;
+      this.entries.delete(key);
+      await fs.promises.rm(this.entryPath(key), { force: true });
+      await this.dropBlobRef(entry.bodyHash);
+      this.stats.evicted++;
+    }
+  }
+
+  /**
+   * @returns {Object} - { mode, entries, bytes, hits, misses, stored, evicted }
+   */
+  getStats() {
+    return { mode: this.mode, entries: this.entries.size, bytes: this.totalBytes, ...this.stats };
+  }
+}
+
+let networkCache = null;
+
+/**
+ * Get the shared cache, or null if NETWORK_CACHE is off
+ * @returns {NetworkCache|null}
+ */
+function getNetworkCache() {
+  if (getNetworkCacheMode() === 'off') {
+    return null;
+  }
+  if (!networkCache) {
+    const { log } = require('crawlee');
+    networkCache = new NetworkCache({ log });
+  }
+  return networkCache;
+}
+
+// Cached bot challenge pages would keep failing after the retailer lets us back in
+function isCacheableResponse(status, body, resourceType) {
+  if (status < 200 || status >= 300) return false;
+  if (resourceType !== 'document') return true;
+  const { detectBotChallenge } = require('./http-fast-path');
+  return !detectBotChallenge(status, body.toString('utf8'));
+}
+
+/**
+ * Route a Playwright context's cacheable requests (documents, XHR/fetch,
+ * scripts, stylesheets) through the cache. Register it before routes that
+ * should see requests first (e.g. the resource policy).
+ * @param {Object} context - Playwright browser context
+ * @param {Object} options - Options
+ * @param {Function} options.fetchOptions - (request) => route.fetch options for misses (e.g. to the mock retailer server)
+ * @param {Object} options.log - Logger
+ * @returns {Promise<NetworkCache|null>} - The cache, or null if it is off
+ */
+async function applyNetworkCache(context, options = {}) {
+  const cache = getNetworkCache();
+  if (!cache) {
+    return null;
+  }
+  await cache.load();
+
+  await context.route('**/*', async (route) => {
+    const request = route.request();
+    const resourceType = request.resourceType();
+    if (request.method() !== 'GET' || !RESOURCE_TTL_GROUPS[resourceType]) {
+      await route.fallback().catch(() => {});
+      return;
+    }
+
+    const key = cacheKey('GET', request.url());
+    const cached = await cache.get(key, resourceType);
+    if (cached) {
+      await route.fulfill({ status: cached.status, headers: cached.headers, body: cached.body }).catch(() => {});
+      return;
+    }
+    if (cache.mode === 'replay') {
+      await route.abort('internetdisconnected').catch(() => {});
+      return;
+    }
+
+    try {
+      const response = await route.fetch(options.fetchOptions ? options.fetchOptions(request) : undefined);
+      const body = await response.body();
+      if (isCacheableResponse(response.status(), body, resourceType)) {
+        await cache.put(key, { url: request.url(), status: response.status(), headers: response.headers(), body });
+      }
+      await route.fulfill({ response, body });
+    } catch (e) {
+      await route.abort().catch(() => {});
+    }
+  });
+
+  return cache;
+}
+
+/**
+ * Run an HTTP request through the cache (for axios callers)
+ * @param {Object} request - { method, url, body, resourceType ('document' or 'api') }
+ * @param {Function} send - async () => axios-style response ({ status, headers, data })
+ * @returns {Promise<Object>} - { status, headers, data, fromCache }; cached JSON responses are parsed again
+ */
+async function cachedRequest(request, send) {
+  const cache = getNetworkCache();
+  if (!cache) {
+    return send();
+  }
+
+  const key = cacheKey(request.method || 'GET', request.url, request.body);
+  const cached = await cache.get(key, request.resourceType);
+  if (cached) {
+    const text = cached.body.toString('utf8');
+    const isJson = /json/i.test(cached.headers['content-type'] || '');
+    return { status: cached.status, headers: cached.headers, data: isJson ? JSON.parse(text) : text, fromCache: true };
+  }
+  if (cache.mode === 'replay') {
+    throw new Error(`${request.url} is not in the network cache (NETWORK_CACHE=replay)`);
+  }
+
+  const response = await send();
+  const body = typeof response.data === 'string' ? response.data : JSON.stringify(response.data);
+  if (isCacheableResponse(response.status, Buffer.from(body), request.resourceType)) {
+    await cache.put(key, { url: request.url, status: response.status, headers: response.headers, body });
+  }
+  return response;
+}
+
+/**
+ * Cache counters, or null if the cache is off
+ * @returns {Object|null}
+ */
+function getNetworkCacheStats() {
+  const cache = getNetworkCache();
+  return cache ? cache.getStats() : null;
+}
+
+module.exports = {
+  NetworkCache,
+  cacheKey,
+  getNetworkCacheMode,
+  getNetworkCache,
+  applyNetworkCache,
+  cachedRequest,
+  getNetworkCacheStats
+};
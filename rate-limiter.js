@@ -0,0 +1,195 @@
+/**
+ * Adaptive per-retailer rate limiting
+ * Tracks each retailer's navigation latency, HTTP status codes, bot-challenge
+ * pages and timeouts, and tunes how hard we hit it with an
+ * additive-increase/multiplicative-decrease policy (like TCP congestion control):
+ *
+ * - every clean navigation nudges the allowed concurrency up (by 1/limit) and
+ *   the spacing between scrape starts down by RATE_LIMIT_STEP_MS
+ * - a block (403/429/503, challenge page) or timeout halves the concurrency,
+ *   doubles the spacing and pauses new scrapes for that long; at most once per
+ *   spacing interval, so a burst of in-flight failures only counts once
+ *
+ * Navigation timeouts follow the retailer's observed latency instead of a
+ * fixed 60/90/120s, and navigateWithRetry stops retrying a retailer that is
+ * currently blocking us. Set ADAPTIVE_RATE_LIMIT=false to use the fixed
+ * SCRAPE_CONCURRENCY_PER_RETAILER with no spacing.
+ */
+
+const { readPositiveIntEnv } = require('./concurrency-utils');
+const { sleep } = require('./cancellation');
+
+const BLOCKED_STATUSES = [403, 429, 503];
+// Outcomes kept per retailer for the recent block rate
+const RECENT_OUTCOMES = 20;
+// Weight of the newest sample in the latency moving average
+const LATENCY_ALPHA = 0.2;
+
+// retailer -> limiter state
+const retailers = new Map();
+
+function isAdaptive() {
+  return process.env.ADAPTIVE_RATE_LIMIT !== 'false';
+}
+
+function getConfig() {
+  return {
+    initialConcurrency: readPositiveIntEnv('SCRAPE_CONCURRENCY_PER_RETAILER', 1),
+    maxConcurrency: readPositiveIntEnv('RATE_LIMIT_MAX_PER_RETAILER', 4),
+    minIntervalMs: readPositiveIntEnv('RATE_LIMIT_MIN_INTERVAL_MS', 500),
+    maxIntervalMs: readPositiveIntEnv('RATE_LIMIT_MAX_INTERVAL_MS', 60000),
+    stepMs: readPositiveIntEnv('RATE_LIMIT_STEP_MS', 250),
+    minTimeoutMs: readPositiveIntEnv('NAVIGATION_MIN_TIMEOUT_MS', 15000),
+    maxTimeoutMs: readPositiveIntEnv('NAVIGATION_MAX_TIMEOUT_MS', 60000)
+  };
+}
+
+function getState(retailer) {
+  if (!retailers.has(retailer)) {
+    const config = getConfig();
+    retailers.set(retailer, {
+      limit: Math.min(config.initialConcurrency, config.maxConcurrency),
+      intervalMs: config.minIntervalMs,
+      nextStartAt: 0,
+      lastDecreaseAt: 0,
+      latencyMs: null,
+      recent: [],
+      totals: { ok: 0, blocked: 0, timeout: 0, error: 0 }
+    });
+  }
+  return retailers.get(retailer);
+}
+
+function classify({ status, error }) {
+  if (status && BLOCKED_STATUSES.includes(status)) return 'blocked';
+  if (error) {
+    return error.name === 'TimeoutError' || /timeout/i.test(error.message) ? 'timeout' : 'error';
+  }
+  return 'ok';
+}
+
+/**
+ * Record the outcome of a request to a retailer and adjust its limits
+ * @param {string} retailer - Retailer name
+ * @param {Object} result - { status, latencyMs, error, challenge }; challenge is
+ *   set when the page was a bot challenge despite a 200
+ * @returns {string} - The outcome: ok, blocked, timeout or error
+ */
+function recordOutcome(retailer, result = {}) {
+  const state = getState(retailer);
+  const outcome = result.challenge ? 'blocked' : classify(result);
+  const config = getConfig();
+  const now = Date.now();
+
+  state.totals[outcome]++;
+  state.recent.push(outcome);
+  if (state.recent.length > RECENT_OUTCOMES) {
+    state.recent.shift();
+  }
+
+  if (outcome === 'ok') {
+    if (result.latencyMs !== undefined) {
+      state.latencyMs = state.latencyMs === null
+        ? result.latencyMs
+        : Math.round(LATENCY_ALPHA * result.latencyMs + (1 - LATENCY_ALPHA) * state.latencyMs);
+    }
+    state.limit = Math.min(config.maxConcurrency, state.limit + 1 / state.limit);
+    state.intervalMs = Math.max(config.minIntervalMs, state.intervalMs - config.stepMs);
+  } else if (outcome !== 'error' && now - state.lastDecreaseAt >= state.intervalMs) {
+    state.lastDecreaseAt = now;
+    state.limit = Math.max(1, state.limit / 2);
+    state.intervalMs = Math.min(config.maxIntervalMs, state.intervalMs * 2);
+    state.nextStartAt = Math.max(state.nextStartAt, now + state.intervalMs);
+  }
+  return outcome;
+}
+
+/**
+ * Current number of concurrent scrapes allowed for a retailer (for runWithConcurrency's perKeyLimit)
+ * @param {string} retailer - Retailer name
+ * @returns {number}
+ */
+function getConcurrency(retailer) {
+  if (!isAdaptive()) {
+    return getConfig().initialConcurrency;
+  }
+  return Math.max(1, Math.floor(getState(retailer).limit));
+}
+
+/**
+ * Wait until the retailer's spacing allows another scrape to start
+ * @param {string} retailer - Retailer name
+ * @param {AbortSignal} signal - Rejects the wait with an AbortError when it fires
+ * @returns {Promise<number>} - How long we waited, in ms
+ */
+async function waitForTurn(retailer, signal) {
+  if (!isAdaptive()) return 0;
+
+  const state = getState(retailer);
+  const now = Date.now();
+  const startAt = Math.max(now, state.nextStartAt);
+  state.nextStartAt = startAt + state.intervalMs;
+
+  const delay = startAt - now;
+  if (delay > 0) {
+    await sleep(delay, signal);
+  }
+  return delay;
+}
+
+/**
+ * Navigation timeout for a retailer: a few times its usual page load, within
+ * NAVIGATION_MIN_TIMEOUT_MS..NAVIGATION_MAX_TIMEOUT_MS
+ * @param {string} retailer - Retailer name
+ * @returns {number} - Timeout in ms
+ */
+function getNavigationTimeout(retailer) {
+  const config = getConfig();
+  const latencyMs = isAdaptive() ? getState(retailer).latencyMs : null;
+  if (latencyMs === null) {
+    return config.maxTimeoutMs;
+  }
+  return Math.min(config.maxTimeoutMs, Math.max(config.minTimeoutMs, latencyMs * 4));
+}
+
+/**
+ * Whether a retailer is currently blocking or timing out on us, so failed
+ * navigations shouldn't be retried
+ * @param {string} retailer - Retailer name
+ * @returns {boolean}
+ */
+function isBackingOff(retailer) {
+  if (!isAdaptive()) return false;
+  const state = getState(retailer);
+  const last = state.recent[state.recent.length - 1];
+  return last === 'blocked' || Date.now() - state.lastDecreaseAt < state.intervalMs;
+}
+
+/**
+ * Limits and recent block rates per retailer
+ * @returns {Object} - retailer -> { concurrency, intervalMs, latencyMs, navigationTimeoutMs, recentBlockRate, totals }
+ */
+function getRateLimitStats() {
+  const stats = {};
+  for (const [retailer, state] of retailers) {
+    const failures = state.recent.filter(outcome => outcome === 'blocked' || outcome === 'timeout').length;
+    stats[retailer] = {
+      concurrency: getConcurrency(retailer),
+      intervalMs: state.intervalMs,
+      latencyMs: state.latencyMs,
+      navigationTimeoutMs: getNavigationTimeout(retailer),
+      recentBlockRate: state.recent.length ? failures / state.recent.length : 0,
+      totals: { ...state.totals }
+    };
+  }
+  return stats;
+}
+
+module.exports = {
+  recordOutcome,
+  getConcurrency,
+  waitForTurn,
+  getNavigationTimeout,
+  isBackingOff,
+  getRateLimitStats
+};
@@ -0,0 +1,175 @@
+/**
+ * Resource policy
+ * Blocks resources the review scrapers never need (product imagery, fonts,
+ * video, ads and analytics) through Playwright routing, while letting review
+ * widgets and anything the retailer's bot checks depend on through. Keeps
+ * per-URL counts so we can see what each policy saves on metered proxies.
+ */
+
+// Third-party hosts that only serve ads, analytics or session recording
+const TRACKER_HOSTS = [
+  'google-analytics.com',
+  'googletagmanager.com',
+  'googleadservices.com',
+  'googlesyndication.com',
+  'doubleclick.net',
+  'adservice.google.com',
+  'facebook.net',
+  'facebook.com',
+  'connect.facebook.net',
+  'bat.bing.com',
+  'clarity.ms',
+  'hotjar.com',
+  'hotjar.io',
+  'criteo.com',
+  'criteo.net',
+  'taboola.com',
+  'outbrain.com',
+  'adnxs.com',
+  'scorecardresearch.com',
+  'quantserve.com',
+  'tiktok.com',
+  'snapchat.com',
+  'pinterest.com',
+  'twitter.com',
+  'demdex.net',
+  'omtrdc.net',
+  'everesttech.net',
+  'contentsquare.net',
+  'quantummetric.com',
+  'newrelic.com',
+  'nr-data.net',
+  'branch.io',
+  'cquotient.com',
+  'mxpnl.com',
+  'segment.io'
+];
+
+// Rough transfer sizes used to estimate what a blocked request would have cost
+const ESTIMATED_BYTES_BY_TYPE = {
+  image: 45 * 1024,
+  media: 250 * 1024,
+  font: 35 * 1024,
+  script: 30 * 1024,
+  stylesheet: 20 * 1024,
+  xhr: 2 * 1024,
+  fetch: 2 * 1024,
+  other: 5 * 1024
+};
+
+const DEFAULT_POLICY = {
+  blockTypes: ['image', 'media', 'font'],
+  blockHosts: TRACKER_HOSTS,
+  // Review widgets (Bazaarvoice) are always allowed through
+  allowHosts: ['bazaarvoice.com']
+};
+
+// Per-retailer adjustments on top of the default policy
+const RETAILER_POLICIES = {
+  sainsburys: {
+    // Sainsbury's sits behind Akamai bot protection, never block its hosts
+    allowHosts: ['bazaarvoice.com', 'akamaihd.net', 'akamaized.net']
+  }
+};
+
+/**
+ * Get the resource policy for a retailer
+ * @param {string} retailer - The retailer name from detectRetailerFromUrl
+ * @returns {Object} - { blockTypes, blockHosts, allowHosts }
+ */
+function getResourcePolicy(retailer) {
+  return { ...DEFAULT_POLICY, ...(RETAILER_POLICIES[retailer] || {}) };
+}
+
+function hostMatches(hostname, hosts) {
+  return hosts.some(host => hostname === host || hostname.endsWith(`.${host}`));
+}
+
+/**
+ * Decide whether a request should be blocked
+ * @param {Object} policy - Policy from getResourcePolicy
+ * @param {string} url - Request URL
+ * @param {string} resourceType - Playwright resource type
+ * @returns {boolean} - True if the request should be aborted
+ */
+function shouldBlockRequest(policy, url, resourceType) {
+  let hostname;
+  try {
+    hostname = new URL(url).hostname;
+  } catch (e) {
+    return false;
+  }
+
+  if (hostMatches(hostname, policy.allowHosts)) {
+    return false;
+  }
+  if (hostMatches(hostname, policy.blockHosts)) {
+    return true;
+  }
+  return policy.blockTypes.includes(resourceType);
+}
+
+/**
+ * Apply a retailer's resource policy to a browser context
+ * @param {Object} context - Playwright browser context
+ * @param {string} retailer - The retailer name
+ * @param {Object} options - Options
+ * @param {Object} options.log - Logger
+ * @returns {Promise<Object>} - Handle with stats() and logSummary(url)
+ */
+async function applyResourcePolicy(context, retailer, options = {}) {
+  const log = options.log || console;
+  const policy = getResourcePolicy(retailer);
+  const stats = {
+    allowedRequests: 0,
+    allowedBytes: 0,
+    blockedRequests: 0,
+    estimatedBytesSaved: 0,
+    blockedByType: {}
+  };
+
+  await context.route('**/*', async (route) => {
+    const request = route.request();
+    const resourceType = request.resourceType();
+
+    if (shouldBlockRequest(policy, request.url(), resourceType)) {
+      stats.blockedRequests++;
+      stats.blockedByType[resourceType] = (stats.blockedByType[resourceType] || 0) + 1;
+      stats.estimatedBytesSaved += ESTIMATED_BYTES_BY_TYPE[resourceType] || ESTIMATED_BYTES_BY_TYPE.other;
+      await route.abort('blockedbyclient').catch(() => {});
+      return;
+    }
+
+    stats.allowedRequests++;
+    // fallback() rather than continue() so later routes (e.g. caches) still see the request
+    await route.fallback().catch(() => {});
+  });
+
+  context.on('response', (response) => {
+    const contentLength = parseInt(response.headers()['content-length'], 10);
+    if (!isNaN(contentLength)) {
+      stats.allowedBytes += contentLength;
+    }
+  });
+
+  return {
+    policy,
+    stats: () => ({ ...stats, blockedByType: { ...stats.blockedByType } }),
+    logSummary: (url) => {
+      const byType = Object.entries(stats.blockedByType)
+        .map(([type, count]) => `${type}=${count}`)
+        .join(', ');
+      log.info(
+        `Resource policy (${retailer || 'default'}) for ${url}: blocked ${stats.blockedRequests} requests ` +
+        `(~${Math.round(stats.estimatedBytesSaved / 1024)} KB estimated saved${byType ? `; ${byType}` : ''}), ` +
+        `allowed ${stats.allowedRequests} requests (${Math.round(stats.allowedBytes / 1024)} KB by content-length)`
+      );
+    }
+  };
+}
+
+module.exports = {
+  applyResourcePolicy,
+  getResourcePolicy,
+  shouldBlockRequest
+};
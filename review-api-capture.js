@@ -0,0 +1,404 @@
+/**
+ * Review API capture
+ * Most retailers load their reviews from a JSON endpoint (Bazaarvoice or an
+ * in-house API). Instead of clicking through review pages and re-scraping the
+ * DOM, this listens to the page's network responses, picks up the first review
+ * API call and then pages through that endpoint with fetch() inside the page,
+ * so cookies, origin and API keys stay the same as the site's own requests.
+ */
+
+const urlUtils = require('./url-utils');
+
+// Query string / body keys used for paging, compared case-insensitively
+const OFFSET_KEYS = ['offset', 'start', 'from', 'skip'];
+const PAGE_KEYS = ['page', 'pagenumber', 'pageno', 'pageindex', 'currentpage'];
+const LIMIT_KEYS = ['limit', 'pagesize', 'size', 'count', 'perpage', 'per_page', 'rows'];
+const TOTAL_KEYS = ['totalresults', 'totalcount', 'total', 'totalreviews', 'totalelements', 'numberofreviews'];
+
+// Review fields in the order we prefer them
+const RATING_KEYS = ['rating', 'ratingvalue', 'overallrating', 'stars', 'score'];
+const TITLE_KEYS = ['title', 'headline', 'summary', 'reviewtitle'];
+const TEXT_KEYS = ['reviewtext', 'text', 'body', 'comment', 'comments', 'content', 'reviewbody', 'description'];
+const DATE_KEYS = ['submissiontime', 'submittedat', 'submissiondate', 'reviewdate', 'date', 'createdat', 'created', 'publisheddate'];
+
+// Request headers the page's fetch() isn't allowed to set or that it sets itself
+const SKIPPED_HEADERS = /^(host|cookie|content-length|origin|referer|user-agent|connection|accept-encoding|sec-|:)/i;
+
+// Stop paging after this many API pages even if the endpoint keeps answering
+const MAX_API_PAGES = 50;
+
+/**
+ * Look up a value by key, ignoring case
+ * @param {Object} obj - The object to search
+ * @param {Array<string>} keys - Lower-case candidate keys, in order of preference
+ * @returns {*} - The first non-empty value found
+ */
+function pickField(obj, keys) {
+  if (!obj || typeof obj !== 'object') return undefined;
+
+  const lowerKeyMap = {};
+  for (const key of Object.keys(obj)) {
+    lowerKeyMap[key.toLowerCase()] = key;
+  }
+
+  for (const key of keys) {
+    const actualKey = lowerKeyMap[key];
+    if (actualKey !== undefined && obj[actualKey] !== null && obj[actualKey] !== undefined && obj[actualKey] !== '') {
+      return obj[actualKey];
+    }
+  }
+  return undefined;
+}
+
+function isReviewLike(item) {
+  return !!item && typeof item === 'object' && !Array.isArray(item) &&
+    pickField(item, RATING_KEYS) !== undefined &&
+    pickField(item, TEXT_KEYS) !== undefined;
+}
+
+/**
+ * Find the array of reviews inside an API payload
+ * @param {*} json - Parsed JSON payload
+ * @param {number} depth - Current recursion depth
+ * @returns {Array|null} - The review array, or null if none was found
+ */
+function findReviewArray(json, depth = 0) {
+  if (!json || typeof json !== 'object' || depth > 6) return null;
+
+  if (Array.isArray(json)) {
+    if (json.length > 0 && isReviewLike(json[0])) {
+      return json;
+    }
+    for (const item of json) {
+      const found = findReviewArray(item, depth + 1);
+      if (found) return found;
+    }
+    return null;
+  }
+
+  for (const value of Object.values(json)) {
+    const found = findReviewArray(value, depth + 1);
+    if (found) return found;
+  }
+  return null;
+}
+
+/**
+ * Find the total number of reviews reported by an API payload
+ * @param {*} json - Parsed JSON payload
+ * @param {number} depth - Current recursion depth
+ * @returns {number|null} - The total, or null if not reported
+ */
+function findTotal(json, depth = 0) {
+  if (!json || typeof json !== 'object' || Array.isArray(json) || depth > 4) return null;
+
+  const total = pickField(json, TOTAL_KEYS);
+  if (total !== undefined && !isNaN(parseInt(total, 10))) {
+    return parseInt(total, 10);
+  }
+
+  for (const value of Object.values(json)) {
+    const found = findTotal(value, depth + 1);
+    if (found !== null) return found;
+  }
+  return null;
+}
+
+function toText(value) {
+  if (value === undefined || value === null) return '';
+  if (typeof value === 'object') {
+    return toText(pickField(value, ['value', 'text', 'name', 'displayname']));
+  }
+  return String(value).trim();
+}
+
+function formatApiDate(value) {
+  const raw = toText(value);
+  if (!raw) return 'Unknown date';
+
+  // Epoch timestamps (seconds or milliseconds) and ISO strings
+  const numeric = /^\d{10,13}$/.test(raw) ? parseInt(raw, 10) * (raw.length === 10 ? 1000 : 1) : null;
+  const parsed = new Date(numeric !== null ? numeric : raw);
+  if (isNaN(parsed.getTime()) || (numeric === null && !/\d{4}/.test(raw))) {
+    return raw;
+  }
+
+  // Same DD/MM/YYYY format the DOM handlers produce
+  const day = String(parsed.getUTCDate()).padStart(2, '0');
+  const month = String(parsed.getUTCMonth() + 1).padStart(2, '0');
+  return `${day}/${month}/${parsed.getUTCFullYear()}`;
+}
+
+/**
+ * Convert a review from an API payload into the scraper's review object
+ * @param {Object} apiReview - A single review from the API
+ * @returns {Object} - Review with rating, title, date and text
+ */
+function mapApiReview(apiReview) {
+  let rating = toText(pickField(apiReview, RATING_KEYS));
+  const ratingNumber = parseFloat(rating);
+  rating = isNaN(ratingNumber) ? '5' : String(Math.round(ratingNumber > 5 ? ratingNumber / 20 : ratingNumber));
+
+  return {
+    rating,
+    title: toText(pickField(apiReview, TITLE_KEYS)),
+    date: formatApiDate(pickField(apiReview, DATE_KEYS)),
+    text: toText(pickField(apiReview, TEXT_KEYS))
+  };
+}
+
+/**
+ * Work out how to request further pages from a captured API call
+ * @param {Object} captured - The captured request (url, postData)
+ * @returns {Object|null} - Paging description, or null if the endpoint can't be paged
+ */
+function detectPaging(captured) {
+  const findKey = (keys, obj) => Object.keys(obj).find(key => keys.includes(key.toLowerCase()));
+
+  const url = new URL(captured.url);
+  const query = Object.fromEntries(url.searchParams.entries());
+  let location = 'query';
+  let params = query;
+
+  // In-house APIs often POST a JSON body (or GraphQL variables) instead
+  if (captured.postData) {
+    try {
+      const body = JSON.parse(captured.postData);
+      const variables = body && typeof body.variables === 'object' ? body.variables : body;
+      if (variables && (findKey(OFFSET_KEYS, variables) || findKey(PAGE_KEYS, variables) || findKey(LIMIT_KEYS, variables))) {
+        location = body.variables ? 'variables' : 'body';
+        params = variables;
+      }
+    } catch (e) {
+      // Not JSON, only the query string can be paged
+    }
+  }
+
+  const offsetKey = findKey(OFFSET_KEYS, params);
+  const pageKey = findKey(PAGE_KEYS, params);
+  const limitKey = findKey(LIMIT_KEYS, params);
+
+  if (offsetKey) {
+    return { location, mode: 'offset', key: offsetKey, start: parseInt(params[offsetKey], 10) || 0, limitKey };
+  }
+  if (pageKey) {
+    return { location, mode: 'page', key: pageKey, start: parseInt(params[pageKey], 10) || 0, limitKey };
+  }
+  if (limitKey) {
+    // Bazaarvoice style: Limit without Offset means Offset=0
+    const offsetName = limitKey[0] === limitKey[0].toUpperCase() ? 'Offset' : 'offset';
+    return { location, mode: 'offset', key: offsetName, start: 0, limitKey };
+  }
+  return null;
+}
+
+/**
+ * Build the request for a given paging value
+ * @param {Object} captured - The captured request
+ * @param {Object} paging - Paging description from detectPaging
+ * @param {number} value - Offset or page number to request
+ * @returns {Object} - { url, postData }
+ */
+function buildPagedRequest(captured, paging, value) {
+  if (paging.location === 'query') {
+    const url = new URL(captured.url);
+    url.searchParams.set(paging.key, String(value));
+    return { url: url.toString(), postData: captured.postData };
+  }
+
+  const body = JSON.parse(captured.postData);
+  const target = paging.location === 'variables' ? body.variables : body;
+  target[paging.key] = typeof target[paging.key] === 'string' ? String(value) : value;
+  return { url: captured.url, postData: JSON.stringify(body) };
+}
+
+/**
+ * Start listening for review API responses on a page
+ * @param {Object} page - Playwright page
+ * @param {Object} options - Capture options
+ * @param {Object} options.log - Logger
+ * @returns {Object} - Capture handle with waitForCapture(timeoutMs), getCaptured() and stop()
+ */
+function startReviewApiCapture(page, options = {}) {
+  const log = options.log || console;
+  let captured = null;
+  let notify = null;
+
+  const onResponse = async (response) => {
+    if (captured) return;
+
+    try {
+      const request = response.request();
+      const resourceType = request.resourceType();
+      if (resourceType !== 'xhr' && resourceType !== 'fetch') return;
+      if (response.status() !== 200) return;
+
+      const contentType = response.headers()['content-type'] || '';
+      if (!contentType.includes('json')) return;
+
+      const json = await response.json();
+      const reviewArray = findReviewArray(json);
+      if (!reviewArray || captured) return;
+
+      captured = {
+        url: response.url(),
+        method: request.method(),
+        headers: request.headers(),
+        postData: request.postData(),
+        json
+      };
+      log.info(`Captured review API call: ${request.method()} ${response.url()} (${reviewArray.length} reviews)`);
+      if (notify) notify(captured);
+    } catch (e) {
+      // Bodies of redirected or aborted responses can't be read, ignore them
+    }
+  };
+
+  page.on('response', onResponse);
+
+  return {
+    getCaptured: () => captured,
+    waitForCapture: (timeoutMs) => {
+      if (captured) return Promise.resolve(captured);
+      return new Promise((resolve) => {
+        const timer = setTimeout(() => {
+          notify = null;
+          resolve(null);
+        }, timeoutMs);
+        notify = (result) => {
+          clearTimeout(timer);
+          notify = null;
+          resolve(result);
+        };
+      });
+    },
+    stop: () => {
+      page.off('response', onResponse);
+      if (notify) notify(captured);
+    }
+  };
+}
+
+/**
+ * Fetch a review API page from inside the page so it shares cookies and origin
+ * @param {Object} page - Playwright page
+ * @param {Object} captured - The captured request (method, headers)
+ * @param {Object} pagedRequest - { url, postData } for this page
+ * @returns {Promise<Object|null>} - Parsed JSON, or null on failure
+ */
+async function fetchApiPage(page, captured, pagedRequest) {
+  const headers = {};
+  for (const [name, value] of Object.entries(captured.headers || {})) {
+    if (!SKIPPED_HEADERS.test(name)) {
+      headers[name] = value;
+    }
+  }
+
+  const response = await page.evaluate(async ({ url, method, headers, body }) => {
+    try {
+      const res = await fetch(url, { method, headers, body: body || undefined, credentials: 'include' });
+      return { status: res.status, text: await res.text() };
+    } catch (e) {
+      return { status: 0, text: '', error: e.message };
+    }
+  }, { url: pagedRequest.url, method: captured.method, headers, body: pagedRequest.postData });
+
+  if (response.status !== 200) {
+    throw new Error(`Review API returned status ${response.status}${response.error ? ` (${response.error})` : ''}`);
+  }
+  return JSON.parse(response.text);
+}
+
+/**
+ * Collect reviews by paging through a captured review API
+ * @param {Object} page - Playwright page
+ * @param {Object} capture - Handle returned by startReviewApiCapture
+ * @param {Object} options - Paging options
+ * @param {number} options.maxReviews - Maximum number of reviews to return
+ * @param {number} options.waitMs - How long to wait for the review API call to happen
+ * @param {Function} options.trigger - async () => void, called if nothing was captured yet (e.g. scroll to reviews)
+ * @param {Function} options.shouldStopPagination - (pageReviews) => boolean, stops fetching further pages
+ * @param {Object} options.log - Logger
+ * @returns {Promise<Array>} - Reviews in the same shape as the DOM handlers (empty if the API couldn't be used)
+ */
+async function scrapeReviewsFromApi(page, capture, options = {}) {
+  const { maxReviews = 50, waitMs = 5000, trigger = null, shouldStopPagination = null } = options;
+  const log = options.log || console;
+
+  let captured = capture.getCaptured();
+  if (!captured && trigger) {
+    try {
+      await trigger();
+    } catch (e) {
+      log.warning(`Error triggering review API call: ${e.message}`);
+    }
+  }
+  captured = captured || await capture.waitForCapture(waitMs);
+  capture.stop();
+
+  if (!captured) {
+    log.info('No review API call captured, falling back to DOM extraction');
+    return [];
+  }
+
+  const reviews = [];
+  const seenIds = new Set();
+  const addPage = (json) => {
+    const pageReviews = (findReviewArray(json) || []).map(mapApiReview).filter(review => review.text);
+    let added = 0;
+    for (const review of pageReviews) {
+      const id = urlUtils.createReviewUniqueId(review);
+      if (!seenIds.has(id) && reviews.length < maxReviews) {
+        seenIds.add(id);
+        reviews.push(review);
+        added++;
+      }
+    }
+    return { count: pageReviews.length, added, pageReviews };
+  };
+
+  const firstPage = addPage(captured.json);
+  const total = findTotal(captured.json);
+  const paging = detectPaging(captured);
+  log.info(`Review API page 1: ${firstPage.count} reviews (total reported: ${total === null ? 'unknown' : total}, paging: ${paging ? paging.mode : 'none'})`);
+
+  if (!paging) {
+    return reviews;
+  }
+  if (shouldStopPagination && shouldStopPagination(firstPage.pageReviews)) {
+    return reviews;
+  }
+
+  let position = paging.start;
+  let pageSize = firstPage.count;
+
+  for (let pageIndex = 2; pageIndex <= MAX_API_PAGES; pageIndex++) {
+    if (reviews.length >= maxReviews || pageSize === 0) break;
+    if (total !== null && reviews.length >= total) break;
+
+    position = paging.mode === 'offset' ? position + pageSize : position + 1;
+
+    let result;
+    try {
+      const json = await fetchApiPage(page, captured, buildPagedRequest(captured, paging, position));
+      result = addPage(json);
+    } catch (e) {
+      log.warning(`Error fetching review API page ${pageIndex}: ${e.message}`);
+      break;
+    }
+
+    log.info(`Review API page ${pageIndex}: ${result.count} reviews (${result.added} new, ${reviews.length} total)`);
+    if (result.added === 0) break;
+    if (shouldStopPagination && shouldStopPagination(result.pageReviews)) break;
+    pageSize = result.count;
+  }
+
+  return reviews;
+}
+
+module.exports = {
+  startReviewApiCapture,
+  scrapeReviewsFromApi,
+  mapApiReview,
+  findReviewArray
+};
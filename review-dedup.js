@@ -0,0 +1,358 @@
+/**
+ * Persistent review deduplication
+ * Remembers every review (retailer + product + content hash) we've ever kept,
+ * without holding them all in memory:
+ *
+ * - A Bloom filter answers "definitely new" for most reviews with no disk access.
+ *   It is sized for REVIEW_DEDUP_CAPACITY items and persisted as bloom.bin.
+ * - An on-disk index holds one small file of content hashes per product
+ *   (index/<retailer>/<productId>.idx). It confirms Bloom "maybe" answers, and
+ *   the most recently used products stay cached in memory.
+ *
+ * If bloom.bin is missing, or was built for a different capacity, it is
+ * rebuilt from the index files.
+ */
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const { readPositiveIntEnv } = require('./concurrency-utils');
+
+const BLOOM_MAGIC = 'RBF1';
+const BLOOM_HEADER_BYTES = 16;
+
+class BloomFilter {
+  /**
+   * @param {number} bitCount - Size of the bit array
+   * @param {number} hashCount - Bit positions set per item
+   * @param {Buffer} bits - Existing bit array (optional)
+   * @param {number} count - Items already added (optional)
+   */
+  constructor(bitCount, hashCount, bits = null, count = 0) {
+    this.bitCount = bitCount;
+    this.hashCount = hashCount;
+    this.bits = bits || Buffer.alloc(Math.ceil(bitCount / 8));
+    this.count = count;
+  }
+
+  /**
+   * Size a filter for an expected number of items and false positive rate
+   * @param {number} capacity - Expected number of items
+   * @param {number} falsePositiveRate - e.g. 0.001
+   * @returns {BloomFilter}
+   */
+  static forCapacity(capacity, falsePositiveRate) {
+    const bitCount = Math.ceil(-capacity * Math.log(falsePositiveRate) / (Math.LN2 * Math.LN2));
+    const hashCount = Math.max(1, Math.round(bitCount / capacity * Math.LN2));
+    return new BloomFilter(bitCount, hashCount);
+  }
+
+  static fromBuffer(buffer) {
+    if (buffer.length < BLOOM_HEADER_BYTES || buffer.toString('ascii', 0, 4) !== BLOOM_MAGIC) {
+      return null;
+    }
+    const bitCount = buffer.readUInt32LE(4);
+    const hashCount = buffer.readUInt32LE(8);
+    const count = buffer.readUInt32LE(12);
+    const bits = buffer.subarray(BLOOM_HEADER_BYTES);
+    return bits.length === Math.ceil(bitCount / 8) ? new BloomFilter(bitCount, hashCount, Buffer.from(bits), count) : null;
+  }
+
+  toBuffer() {
+    const header = Buffer.alloc(BLOOM_HEADER_BYTES);
+    header.write(BLOOM_MAGIC, 0, 'ascii');
+    header.writeUInt32LE(this.bitCount, 4);
+    header.writeUInt32LE(this.hashCount, 8);
+    header.writeUInt32LE(Math.min(this.count, 0xffffffff), 12);
+    return Buffer.concat([header, this.bits]);
+  }
+
+  // Double hashing: position i is h1 + i * h2, from a hex digest of the key
+  positions(keyHash) {
+    const h1 = parseInt(keyHash.slice(0, 8), 16);
+    const h2 = (parseInt(keyHash.slice(8, 16), 16) | 1) >>> 0;
+    const positions = [];
+    for (let i = 0; i < this.hashCount; i++) {
+      positions.push((h1 + i * h2) % this.bitCount);
+    }
+    return positions;
+  }
+
+  add(keyHash) {
+    for (const position of this.positions(keyHash)) {
+      this.bits[position >> 3] |= 1 << (position & 7);
+    }
+    this.count++;
+  }
+
+  has(keyHash) {
+    return this.positions(keyHash).every(position => (this.bits[position >> 3] & (1 << (position & 7))) !== 0);
+  }
+
+  /**
+   * Expected false positive rate at the current fill
+   * @returns {number}
+   */
+  estimatedFalsePositiveRate() {
+    return Math.pow(1 - Math.exp(-this.hashCount * this.count / this.bitCount), this.hashCount);
+  }
+}
+
+// File-system safe name for a retailer or product ID
+function safeName(value) {
+  return String(value).replace(/[^\w.-]/g, '_');
+}
+
+function dedupKeyHash(retailer, productId, contentHash) {
+  return crypto.createHash('sha1').update(`${retailer}|${productId}|${contentHash}`).digest('hex');
+}
+
+class ReviewDeduplicator {
+  /**
+   * @param {Object} options - Deduplicator options
+   * @param {string} options.dir - Directory for bloom.bin and the index files
+   * @param {number} options.capacity - Reviews the Bloom filter is sized for (REVIEW_DEDUP_CAPACITY, default 2,000,000)
+   * @param {number} options.falsePositiveRate - Bloom filter false positive rate (default 0.001)
+   * @param {number} options.cachedProducts - Product indexes kept in memory (REVIEW_DEDUP_CACHED_PRODUCTS, default 200)
+   * @param {Object} options.log - Logger
+   */
+  constructor(options = {}) {
+    this.dir = options.dir;
+    this.indexDir = path.join(this.dir, 'index');
+    this.bloomPath = path.join(this.dir, 'bloom.bin');
+    this.capacity = options.capacity || readPositiveIntEnv('REVIEW_DEDUP_CAPACITY', 2000000);
+    this.falsePositiveRate = options.falsePositiveRate || 0.001;
+    this.cachedProducts = options.cachedProducts || readPositiveIntEnv('REVIEW_DEDUP_CACHED_PRODUCTS', 200);
+    this.log = options.log || console;
+
+    this.bloom = null;
+    this.loading = null;
+    // productKey -> Set of content hashes, least recently used first
+    this.products = new Map();
+    this.productLoads = new Map();
+    this.flushTimer = null;
+    this.dirty = false;
+    this.exitHook = null;
+    this.warnedFull = false;
+  }
+
+  /**
+   * Load (or rebuild) the Bloom filter, once
+   * @returns {Promise<ReviewDeduplicator>}
+   */
+  load() {
+    if (!this.loading) {
+      this.loading = this.loadBloom().then(() => this);
+    }
+    return this.loading;
+  }
+
+  async loadBloom() {
+    const expected = BloomFilter.forCapacity(this.capacity, this.falsePositiveRate);
+    try {
+      const saved = BloomFilter.fromBuffer(await fs.promises.readFile(this.bloomPath));
+      if (saved && saved.bitCount === expected.bitCount && saved.hashCount === expected.hashCount) {
+        this.bloom = saved;
+        this.log.info(`Loaded review dedup filter (${saved.count} reviews)`);
+        return;
+      }
+    } catch (error) {
+      if (error.code !== 'ENOENT') throw error;
+    }
+
+    // No usable filter on disk: rebuild it from the per-product index files
+    this.bloom = expected;
+    for (const retailer of await this.listDir(this.indexDir)) {
+      for (const file of await this.listDir(path.join(this.indexDir, retailer))) {
+        if (!file.endsWith('.idx')) continue;
+        const productId = file.slice(0, -'.idx'.length);
+        for (const contentHash of await this.readIndexFile(path.join(this.indexDir, retailer, file))) {
+          this.bloom.add(dedupKeyHash(retailer, productId, contentHash));
+        }
+      }
+    }
+    if (this.bloom.count > 0) {
+      this.log.info(`Rebuilt review dedup filter from the index (${this.bloom.count} reviews)`);
+      await this.flush();
+    }
+  }
+
+  async listDir(dir) {
+    try {
+      return await fs.promises.readdir(dir);
+    } catch (error) {
+      if (error.code === 'ENOENT') return [];
+      throw error;
+    }
+  }
+
+  async readIndexFile(filePath) {
+    try {
+      const content = await fs.promises.readFile(filePath, 'utf8');
+      return content.split('\n').filter(line => /^[0-9a-f]+$/.test(line));
+    } catch (error) {
+      if (error.code === 'ENOENT') return [];
+      throw error;
+    }
+  }
+
+  indexPath(retailer, productId) {
+    return path.join(this.indexDir, safeName(retailer), `${safeName(productId)}.idx`);
+  }
+
+  /**
+   * Load a product's index into the in-memory cache (evicting the least recently used)
+   * @param {string} retailer - Retailer name
+   * @param {string} productId - Product ID
+   * @returns {Promise<Set>} - The product's content hashes
+   */
+  async loadProduct(retailer, productId) {
+    const key = `${safeName(retailer)}|${safeName(productId)}`;
+    if (this.products.has(key)) {
+      const hashes = this.products.get(key);
+      this.products.delete(key);
+      this.products.set(key, hashes);
+      return hashes;
+    }
+
+    if (!this.productLoads.has(key)) {
+      this.productLoads.set(key, this.readIndexFile(this.indexPath(retailer, productId)).then((hashes) => {
+        this.productLoads.delete(key);
+        const set = new Set(hashes);
+        this.products.set(key, set);
+        while (this.products.size > this.cachedProducts) {
+          this.products.delete(this.products.keys().next().value);
+        }
+        return set;
+      }));
+    }
+    return this.productLoads.get(key);
+  }
+
+  /**
+   * Check a review without touching disk. Call loadProduct first; for products
+   * that aren't loaded a Bloom "maybe" is treated as seen.
+   * @param {string} retailer - Retailer name
+   * @param {string} productId - Product ID
+   * @param {string} contentHash - The review's createReviewUniqueId
+   * @returns {boolean}
+   */
+  hasLoaded(retailer, productId, contentHash) {
+    if (!this.bloom || !this.bloom.has(dedupKeyHash(safeName(retailer), safeName(productId), contentHash))) {
+      return false;
+    }
+    const hashes = this.products.get(`${safeName(retailer)}|${safeName(productId)}`);
+    return hashes ? hashes.has(contentHash) : true;
+  }
+
+  /**
+   * Filter a product's content hashes down to the ones never seen before
+   * @param {string} retailer - Retailer name
+   * @param {string} productId - Product ID
+   * @param {Array<string>} contentHashes - Hashes to check
+   * @returns {Promise<Array<string>>} - Unseen hashes (each once)
+   */
+  async filterNew(retailer, productId, contentHashes) {
+    await this.load();
+    const keyRetailer = safeName(retailer);
+    const keyProduct = safeName(productId);
+    const fresh = new Set();
+    let hashes = null;
+
+    for (const contentHash of contentHashes) {
+      if (fresh.has(contentHash)) continue;
+      if (this.bloom.has(dedupKeyHash(keyRetailer, keyProduct, contentHash))) {
+        // Only read the product's index when the filter says "maybe"
+        hashes = hashes || await this.loadProduct(retailer, productId);
+        if (hashes.has(contentHash)) continue;
+      }
+      fresh.add(contentHash);
+    }
+    return [...fresh];
+  }
+
+  /**
+   * Record content hashes as seen (callers pass hashes from filterNew)
+   * @param {string} retailer - Retailer name
+   * @param {string} productId - Product ID
+   * @param {Array<string>} contentHashes - New hashes
+   */
+  async add(retailer, productId, contentHashes) {
+    if (contentHashes.length === 0) return;
+    await this.load();
+
+    const indexPath = this.indexPath(retailer, productId);
+    await fs.promises.mkdir(path.dirname(indexPath), { recursive: true });
+    await fs.promises.appendFile(indexPath, contentHashes.join('\n') + '\n', 'utf8');
+
+    const cached = this.products.get(`${safeName(retailer)}|${safeName(productId)}`);
+    for (const contentHash of contentHashes) {
+      this.bloom.add(dedupKeyHash(safeName(retailer), safeName(productId), contentHash));
+      if (cached) cached.add(contentHash);
+    }
+
+    if (this.bloom.count > this.capacity && !this.warnedFull) {
+      this.warnedFull = true;
+      this.log.info(`Warning: review dedup filter holds ${this.bloom.count} reviews, more than REVIEW_DEDUP_CAPACITY (${this.capacity}); raise it to keep index lookups rare`);
+    }
+    this.scheduleFlush();
+  }
+
+  scheduleFlush() {
+    this.dirty = true;
+    if (!this.exitHook) {
+      // A filter older than the index would call stored reviews new, so save it on the way out too
+      this.exitHook = () => this.flushSync();
+      process.once('exit', this.exitHook);
+    }
+    if (this.flushTimer) return;
+    this.flushTimer = setTimeout(() => {
+      this.flushTimer = null;
+      this.flush().catch(error => this.log.error(`Error saving review dedup filter: ${error.message}`));
+    }, 1000);
+    this.flushTimer.unref();
+  }
+
+  /**
+   * Write the Bloom filter to disk (atomically, via a temp file)
+   */
+  async flush() {
+    if (!this.bloom) return;
+    this.dirty = false;
+    await fs.promises.mkdir(this.dir, { recursive: true });
+    const tempPath = `${this.bloomPath}.${process.pid}.tmp`;
+    await fs.promises.writeFile(tempPath, this.bloom.toBuffer());
+    await fs.promises.rename(tempPath, this.bloomPath);
+  }
+
+  flushSync() {
+    if (!this.bloom || !this.dirty) return;
+    this.dirty = false;
+    try {
+      fs.mkdirSync(this.dir, { recursive: true });
+      const tempPath = `${this.bloomPath}.${process.pid}.tmp`;
+      fs.writeFileSync(tempPath, this.bloom.toBuffer());
+      fs.renameSync(tempPath, this.bloomPath);
+    } catch (error) {
+      this.log.error(`Error saving review dedup filter: ${error.message}`);
+    }
+  }
+
+  /**
+   * @returns {Object} - { reviews, bitCount, hashCount, estimatedFalsePositiveRate, cachedProducts }
+   */
+  stats() {
+    return {
+      reviews: this.bloom ? this.bloom.count : 0,
+      bitCount: this.bloom ? this.bloom.bitCount : 0,
+      hashCount: this.bloom ? this.bloom.hashCount : 0,
+      estimatedFalsePositiveRate: this.bloom ? this.bloom.estimatedFalsePositiveRate() : 0,
+      cachedProducts: this.products.size
+    };
+  }
+}
+
+module.exports = {
+  BloomFilter,
+  ReviewDeduplicator
+};
@@ -0,0 +1,314 @@
+/**
+ * Streaming review export
+ * Writes reviews to CSV and XLSX files as each product finishes, instead of
+ * building the whole file in memory at the end of a scrape. Finished exports
+ * are kept on disk for a while so they can be downloaded by job ID.
+ */
+
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const crypto = require('crypto');
+const { once } = require('events');
+const { readPositiveIntEnv } = require('./concurrency-utils');
+const { EXPORT_HEADERS, formatProductBatch } = require('./csv-exporter');
+const { startSpan } = require('./metrics');
+const { WorkerPool } = require('./worker-pool');
+
+const EXPORT_DIR = process.env.EXPORT_DIR || path.join(os.tmpdir(), 'review-exports');
+const EXPORT_FORMATS = {
+  csv: { fileName: 'reviews.csv', contentType: 'text/csv; charset=utf-8' },
+  xlsx: { fileName: 'reviews.xlsx', contentType: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' }
+};
+
+// jobId -> ReviewExport
+const exportJobs = new Map();
+let cleanupTimer = null;
+let exportPool = null;
+
+// Worker threads for formatting rows: EXPORT_WORKERS, default one per spare CPU up to 2; 0 formats inline
+function getExportPool() {
+  if (exportPool === null) {
+    const configured = parseInt(process.env.EXPORT_WORKERS, 10);
+    const size = Number.isInteger(configured) && configured >= 0
+      ? configured
+      : Math.max(1, Math.min(2, os.cpus().length - 1));
+    const { log } = require('crawlee');
+    exportPool = size > 0
+      ? new WorkerPool({ script: path.join(__dirname, 'export-worker.js'), size, name: 'Export', log })
+      : false;
+  }
+  return exportPool;
+}
+
+// Format a product's rows on the pool, or inline if the pool is off or a worker fails
+async function formatReviews(reviews, options) {
+  const pool = getExportPool();
+  if (pool) {
+    try {
+      return await pool.run({ reviews, options });
+    } catch (error) {
+      console.warn(`Export worker failed (${error.message}), formatting on the main thread`);
+    }
+  }
+  return formatProductBatch(reviews, options);
+}
+
+/**
+ * Export worker pool counters, or null if EXPORT_WORKERS=0
+ * @returns {Object|null}
+ */
+function getExportPoolStats() {
+  const pool = getExportPool();
+  return pool ? pool.stats() : null;
+}
+
+class ReviewExport {
+  /**
+   * @param {Object} options - Export options
+   * @param {string} options.jobId - Job ID used in the download URL
+   * @param {number} options.totalUrls - Number of product URLs in the job
+   * @param {string} options.dateFrom - Start of the date filter, if any
+   * @param {string} options.dateTo - End of the date filter, if any
+   * @param {string} options.baseName - Download file name without extension
+   */
+  constructor(options) {
+    this.jobId = options.jobId;
+    this.totalUrls = options.totalUrls || 0;
+    this.dateFrom = options.dateFrom || null;
+    this.dateTo = options.dateTo || null;
+    this.baseName = options.baseName || 'reviews';
+    this.dir = path.join(EXPORT_DIR, this.jobId);
+    this.files = {
+      csv: path.join(this.dir, EXPORT_FORMATS.csv.fileName),
+      xlsx: path.join(this.dir, EXPORT_FORMATS.xlsx.fileName)
+    };
+
+    this.status = 'writing';
+    this.createdAt = Date.now();
+    this.finishedAt = null;
+    this.reviewCount = 0;
+    this.inRangeCount = 0;
+    this.productCount = 0;
+    this.currentProductId = null;
+
+    // Writes are chained so rows from concurrently finishing products never interleave
+    this.queue = Promise.resolve();
+    this.writeError = null;
+  }
+
+  async open() {
+    await fs.promises.mkdir(this.dir, { recursive: true });
+
+    this.csvStream = fs.createWriteStream(this.files.csv, { encoding: 'utf8' });
+    this.csvStream.on('error', (error) => { this.writeError = this.writeError || error; });
+
+    // Metadata we know up front goes at the top, totals are appended when the job finishes
+    let header = `# Products Scraped: ${this.totalUrls}\r\n`;
+    header += `# Extraction Date: ${new Date().toLocaleDateString()}\r\n`;
+    if (this.dateFrom || this.dateTo) {
+      const fromDateStr = this.dateFrom ? new Date(this.dateFrom).toLocaleDateString() : 'any';
+      const toDateStr = this.dateTo ? new Date(this.dateTo).toLocaleDateString() : 'any';
+      header += `# Date Filter: ${fromDateStr} to ${toDateStr}\r\n`;
+      header += `# Note: All reviews are included, but only those within the date range are marked 'Yes' in the 'In Date Range' column.\r\n`;
+    }
+    header += `\r\n`;
+    header += EXPORT_HEADERS.join(',') + '\r\n';
+    await this.writeCsv(header);
+
+    const ExcelJS = require('exceljs');
+    this.workbook = new ExcelJS.stream.xlsx.WorkbookWriter({
+      filename: this.files.xlsx,
+      useStyles: false,
+      useSharedStrings: false
+    });
+    this.worksheet = this.workbook.addWorksheet('Reviews');
+    this.worksheet.addRow(EXPORT_HEADERS).commit();
+
+    exportJobs.set(this.jobId, this);
+    scheduleCleanup();
+    return this;
+  }
+
+  async writeCsv(chunk) {
+    if (!this.csvStream.write(chunk)) {
+      await once(this.csvStream, 'drain');
+    }
+  }
+
+  /**
+   * Queue one product's reviews to be written to both files. The rows are
+   * formatted on the export worker pool straight away, so formatting overlaps
+   * with earlier products still being written; only the writes are in order.
+   * @param {Array} reviews - The product's (deduplicated) reviews
+   * @returns {Promise<void>} - Resolves once the rows have been written
+   */
+  writeProduct(reviews) {
+    if (!reviews || reviews.length === 0) {
+      return this.queue;
+    }
+
+    // With a date filter, reviews within each product are ordered newest first
+    const formatted = formatReviews(reviews, { sortByDate: Boolean(this.dateFrom || this.dateTo) });
+    // Failures are picked up in order below
+    formatted.catch(() => {});
+
+    this.queue = this.queue.then(async () => {
+      if (this.writeError) return;
+
+      const span = startSpan('csv_generation', { retailer: reviews[0].siteType });
+      try {
+        const { csv, groups, inRangeCount } = await formatted;
+
+        for (const group of groups) {
+          // Add a blank line and product header between different products for better readability
+          if (this.currentProductId === null || this.currentProductId !== group.productId) {
+            const productHeader = `Product: ${group.productName} (ID: ${group.productId})`;
+            if (this.currentProductId !== null) {
+              await this.writeCsv(',,,,,,\r\n'); // Empty row as separator
+              this.worksheet.addRow([]).commit();
+            }
+            await this.writeCsv(`"${productHeader.replace(/"/g, '""')}",,,,,,\r\n`);
+            this.worksheet.addRow([productHeader]).commit();
+            this.productCount++;
+          }
+          this.currentProductId = group.productId;
+
+          await this.writeCsv(Buffer.from(csv, group.csvStart, group.csvEnd - group.csvStart));
+          for (const row of group.rows) {
+            this.worksheet.addRow(row).commit();
+          }
+          this.reviewCount += group.rows.length;
+        }
+        this.inRangeCount += inRangeCount;
+        span.end();
+      } catch (error) {
+        span.end({ outcome: 'error' });
+        this.writeError = error;
+      }
+    });
+
+    return this.queue;
+  }
+
+  /**
+   * Wait for every queued product to be written, so reviewCount is final
+   * @returns {Promise<void>}
+   */
+  drain() {
+    return this.queue;
+  }
+
+  /**
+   * Write the summary, close both files and make the export downloadable
+   * @returns {Promise<Object>} - Download references for the finished export
+   */
+  async finish() {
+    await this.drain();
+    if (this.writeError) {
+      throw this.writeError;
+    }
+
+    const span = startSpan('csv_finalize', { retailer: 'all' });
+    let footer = `\r\n# Total Reviews: ${this.reviewCount}\r\n`;
+    if (this.dateFrom || this.dateTo) {
+      footer += `# Reviews in date range: ${this.inRangeCount} of ${this.reviewCount}\r\n`;
+    }
+    await this.writeCsv(footer);
+    this.csvStream.end();
+    await once(this.csvStream, 'finish');
+
+    this.worksheet.commit();
+    const summarySheet = this.workbook.addWorksheet('Summary');
+    summarySheet.addRow(['Products Scraped', this.totalUrls]).commit();
+    summarySheet.addRow(['Extraction Date', new Date().toLocaleDateString()]).commit();
+    summarySheet.addRow(['Total Reviews', this.reviewCount]).commit();
+    if (this.dateFrom || this.dateTo) {
+      summarySheet.addRow(['Date Filter', `${this.dateFrom || 'any'} to ${this.dateTo || 'any'}`]).commit();
+      summarySheet.addRow(['Reviews in date range', this.inRangeCount]).commit();
+    }
+    summarySheet.commit();
+    await this.workbook.commit();
+    span.end();
+
+    this.status = 'complete';
+    this.finishedAt = Date.now();
+    return this.downloads();
+  }
+
+  /**
+   * Stop writing and delete the files (e.g. when no reviews were found)
+   */
+  async abort() {
+    this.status = 'aborted';
+    await this.drain().catch(() => {});
+    if (this.csvStream) {
+      this.csvStream.destroy();
+    }
+    exportJobs.delete(this.jobId);
+    await fs.promises.rm(this.dir, { recursive: true, force: true }).catch(() => {});
+  }
+
+  downloads() {
+    return {
+      csv: `/exports/${this.jobId}/csv`,
+      xlsx: `/exports/${this.jobId}/xlsx`
+    };
+  }
+}
+
+/**
+ * Create and open a streaming export for a scrape job
+ * @param {Object} options - See ReviewExport constructor (jobId is generated if not given)
+ * @returns {Promise<ReviewExport>} - The open export
+ */
+async function createReviewExport(options = {}) {
+  const reviewExport = new ReviewExport({ ...options, jobId: options.jobId || crypto.randomUUID() });
+  return reviewExport.open();
+}
+
+/**
+ * Look up a finished export and the file for a format
+ * @param {string} jobId - The export job ID
+ * @param {string} format - 'csv' or 'xlsx'
+ * @returns {Object|null} - { reviewExport, filePath, contentType, fileName } or null if unknown
+ */
+function getExportDownload(jobId, format) {
+  const reviewExport = exportJobs.get(jobId);
+  const formatInfo = EXPORT_FORMATS[format];
+  if (!reviewExport || !formatInfo) {
+    return null;
+  }
+
+  return {
+    reviewExport,
+    filePath: reviewExport.files[format],
+    contentType: formatInfo.contentType,
+    fileName: `${reviewExport.baseName}.${format}`
+  };
+}
+
+// Delete finished exports once they've been around for EXPORT_TTL_MS
+function scheduleCleanup() {
+  if (cleanupTimer) return;
+
+  const ttlMs = readPositiveIntEnv('EXPORT_TTL_MS', 60 * 60 * 1000);
+  cleanupTimer = setInterval(() => {
+    const now = Date.now();
+    for (const reviewExport of [...exportJobs.values()]) {
+      if (reviewExport.status === 'complete' && now - reviewExport.finishedAt > ttlMs) {
+        console.log(`Removing expired export ${reviewExport.jobId}`);
+        exportJobs.delete(reviewExport.jobId);
+        fs.promises.rm(reviewExport.dir, { recursive: true, force: true }).catch(() => {});
+      }
+    }
+  }, Math.min(ttlMs, 5 * 60 * 1000));
+  cleanupTimer.unref();
+}
+
+module.exports = {
+  createReviewExport,
+  getExportDownload,
+  getExportPoolStats,
+  EXPORT_DIR
+};
@@ -2,13 +2,6 @@ const { PlaywrightCrawler, log } = require('crawlee');
 const { parseDate } = require('chrono-node');
 const urlUtils = require('./url-utils');
 
-// Global arrays to store reviews for each retailer
-global.tescoReviews = [];
-global.sainsburysReviews = [];
-global.asdaReviews = [];
-global.morrisonsReviews = [];
-global.icelandReviews = [];
-
 // Main function to extract reviews
 async function extractReviews(page, url, maxReviews = 50) {
   log.info(`Starting review extraction for URL: ${url}`);
@@ -113,8 +106,8 @@ async function handleTescoSite(page, siteConfig, maxReviews) {
   log.info('Using Tesco specific handler');
   console.log('DEBUGGING: Using improved Tesco handler with robust button clicking');
 
-  // Initialize global array for Tesco reviews
-  global.tescoReviews = [];
+  // Collect reviews for this invocation only, so concurrent scrapes don't share state
+  let tescoReviews = [];
 
   try {
     // Implementation for Tesco site
@@ -376,17 +369,17 @@ async function handleTescoSite(page, siteConfig, maxReviews) {
       return results;
     });
 
-    // Add the reviews to the global array
+    // Add the reviews to this invocation's results
     if (reviews && reviews.length > 0) {
-      global.tescoReviews = reviews;
-      log.info(`Added ${reviews.length} reviews to global Tesco reviews array`);
+      tescoReviews = reviews;
+      log.info(`Added ${reviews.length} reviews to Tesco reviews array`);
     }
 
     // Take a final screenshot
     await page.screenshot({ path: `tesco-final-${Date.now()}.png` });
 
     // No fallbacks - only use actual reviews
-    if (global.tescoReviews.length === 0) {
+    if (tescoReviews.length === 0) {
       log.warning('No Tesco reviews found. NOT adding fallback reviews.');
     }
   } catch (error) {
@@ -394,12 +387,12 @@ async function handleTescoSite(page, siteConfig, maxReviews) {
     console.log('DEBUGGING: Error in Tesco handler:', error);
 
     // No fallbacks - only use actual reviews
-    if (global.tescoReviews.length === 0) {
+    if (tescoReviews.length === 0) {
       log.warning('Error occurred and no reviews were found. NOT adding fallback reviews.');
     }
   }
 
-  return global.tescoReviews;
+  return tescoReviews;
 }
 
 // Generic handler for unknown sites
@@ -1,7 +1,21 @@
 const { PlaywrightCrawler, log } = require('crawlee');
-const { parseDate } = require('chrono-node');
 const urlUtils = require('./url-utils');
 const axios = require('axios');
+const { BrowserPool } = require('./browser-pool');
+const { startReviewApiCapture, scrapeReviewsFromApi } = require('./review-api-capture');
+const { applyResourcePolicy } = require('./resource-policy');
+const { getReviewStore, createPaginationStop } = require('./review-store');
+const httpFastPath = require('./http-fast-path');
+const metrics = require('./metrics');
+const { createArtifactRecorder } = require('./debug-artifacts');
+const sessionManager = require('./session-manager');
+const rateLimiter = require('./rate-limiter');
+const { applyNetworkCache, cachedRequest } = require('./network-cache');
+const localBrowserService = require('./local-browser-client');
+const { throwIfAborted, isAbortError, onAbort } = require('./cancellation');
+const { SingleFlight } = require('./single-flight');
+const { getSelectorCache, getDomain } = require('./selector-cache');
+const { normalizeReviewDate, isIsoDateInRange, isoToDate } = require('./date-normalizer');
 
 // Import retailer-specific handlers from checkpoint directory
 const { handleTescoSite } = require('./checkpoint/tesco-handler-new');
@@ -9,15 +23,40 @@ const { handleSainsburysSite } = require('./checkpoint/sainsburys-handler-new');
 const { handleAsdaSite } = require('./checkpoint/asda-handler-new');
 const { handleMorrisonsSite } = require('./checkpoint/morrisons-handler-new');
 
-// Global arrays to store reviews for each retailer
-global.tescoReviews = [];
-global.sainsburysReviews = [];
-global.asdaReviews = [];
-global.morrisonsReviews = [];
-global.icelandReviews = [];
+// Shared pool of warm Playwright browsers, created on first use
+let browserPool = null;
+
+function getBrowserPool() {
+  if (!browserPool) {
+    const { chromium } = require('playwright');
+    browserPool = new BrowserPool({
+      name: 'playwright',
+      launch: (launchOptions) => chromium.launch(launchOptions),
+      createContext: (browser, contextOptions) => browser.newContext(contextOptions),
+      log: log
+    });
+  }
+  return browserPool;
+}
+
+// Browser pool counters (browsers, activeLeases, profiles, launches)
+function getBrowserPoolStats() {
+  return browserPool ? browserPool.stats() : { browsers: 0, activeLeases: 0, profiles: 0, launches: 0 };
+}
+
+// Close all pooled browsers (called on server shutdown)
+async function closeBrowserPool() {
+  if (browserPool) {
+    await browserPool.closeAll();
+    browserPool = null;
+  }
+}
 
 // Main function to extract reviews
-async function extractReviews(page, url, maxReviews = 50) {
+// options.shouldStopPagination: (pageReviews) => boolean, checked by handlers after each page
+// options.artifacts: debug artifact recorder from createArtifactRecorder
+// options.signal: AbortSignal; handlers stop between steps once it fires
+async function extractReviews(page, url, maxReviews = 50, options = {}) {
   log.info(`Starting review extraction for URL: ${url}`);
 
   // Determine which retailer's site we're on using the urlUtils module
@@ -27,11 +66,15 @@ async function extractReviews(page, url, maxReviews = 50) {
   // Configure site-specific settings
   const siteConfig = {
     log: log,
-    retailer: retailer
+    retailer: retailer,
+    shouldStopPagination: options.shouldStopPagination || null,
+    artifacts: options.artifacts || createArtifactRecorder({ retailer, log }),
+    signal: options.signal || null
   };
 
   // Handle the site based on the retailer
   let reviews = [];
+  const extractionSpan = metrics.startSpan('extraction', { retailer });
 
   try {
     switch (retailer) {
@@ -61,10 +104,17 @@ async function extractReviews(page, url, maxReviews = 50) {
         reviews = await handleGenericSite(page, siteConfig, maxReviews);
     }
 
+    extractionSpan.end();
     log.info(`Extracted ${reviews.length} reviews from ${retailer} site`);
     return reviews;
   } catch (error) {
+    if (isAbortError(error) || (options.signal && options.signal.aborted)) {
+      extractionSpan.end({ outcome: 'cancelled' });
+      throw error;
+    }
+    extractionSpan.end({ outcome: 'error' });
     log.error(`Error extracting reviews: ${error.message}\n${error.stack}`);
+    await siteConfig.artifacts.flush(error, page);
     return [];
   }
 }
@@ -89,48 +139,65 @@ async function autoScroll(page) {
   });
 }
 
-// Helper function to parse dates
-function parseReviewDate(dateStr) {
-  if (!dateStr || dateStr === 'Unknown date') {
-    return new Date();
-  }
-
-  try {
-    // Check if the date is already in DD/MM/YYYY format
-    const ddmmyyyyRegex = /^(\d{1,2})\/(\d{1,2})\/(\d{4})$/;
-    const ddmmyyyyMatch = dateStr.match(ddmmyyyyRegex);
-    if (ddmmyyyyMatch) {
-      const day = parseInt(ddmmyyyyMatch[1]);
-      const month = parseInt(ddmmyyyyMatch[2]) - 1; // JS months are 0-indexed
-      const year = parseInt(ddmmyyyyMatch[3]);
-      return new Date(year, month, day);
-    }
-
-    // Try to parse the date using chrono
-    const parsedDate = parseDate(dateStr);
-    if (parsedDate) {
-      return parsedDate;
-    }
-  } catch (e) {
-    log.warning(`Error parsing date "${dateStr}": ${e.message}`);
-  }
-
-  // If we can't parse the date at all, return current date
-  return new Date();
+// Parse a review date to a Date (local midnight); unparseable dates fall back to now.
+// Prefer review.parsedDate (ISO, set at extraction) over calling this.
+function parseReviewDate(dateStr, retailer) {
+  const isoDate = normalizeReviewDate(dateStr, retailer);
+  return isoDate ? isoToDate(isoDate) : new Date();
 }
 
+// Selectors the generic handler tries for each field, in order
+const GENERIC_SELECTORS = {
+  container: ['.review', '.product-review', '[class*="review"]', '[id*="review"]', '[data-testid*="review"]'],
+  rating: ['.rating', '.stars', '[class*="rating"]', '[class*="stars"]'],
+  title: ['.title', '.review-title', 'h3', 'h4', '[class*="title"]'],
+  date: ['.date', '.review-date', 'time', '[class*="date"]'],
+  text: ['.text', '.review-text', '.content', 'p', '[class*="text"]', '[class*="content"]']
+};
+
 // Generic handler for unknown sites
 async function handleGenericSite(page, siteConfig, maxReviews) {
   const log = siteConfig.log;
   log.info('Using generic handler');
   
   try {
+    // Put the selectors that matched on this site last time first
+    const selectorCache = await getSelectorCache();
+    const domain = getDomain(page.url());
+    const candidates = {};
+    for (const [field, selectors] of Object.entries(GENERIC_SELECTORS)) {
+      candidates[field] = selectorCache ? selectorCache.order(domain, field, selectors) : selectors;
+    }
+
     // Look for common review containers
-    const reviews = await page.evaluate(() => {
+    const { reviews, matched } = await page.evaluate((candidates) => {
       const results = [];
+      // field -> selector -> number of containers it matched in
+      const matchCounts = { rating: {}, title: {}, date: {}, text: {} };
+      
+      // Find the first selector (in order) that matches inside a root
+      const findFirst = (root, field) => {
+        for (const selector of candidates[field]) {
+          const element = root.querySelector(selector);
+          if (element) {
+            matchCounts[field][selector] = (matchCounts[field][selector] || 0) + 1;
+            return element;
+          }
+        }
+        return null;
+      };
       
       // Try to find review containers using common selectors
-      const reviewContainers = document.querySelectorAll('.review, .product-review, [class*="review"], [id*="review"], [data-testid*="review"]');
+      let reviewContainers = [];
+      let containerSelector = null;
+      for (const selector of candidates.container) {
+        const elements = document.querySelectorAll(selector);
+        if (elements.length > 0) {
+          reviewContainers = Array.from(elements);
+          containerSelector = selector;
+          break;
+        }
+      }
       console.log(`Found ${reviewContainers.length} review containers`);
       
       // Process each review container
@@ -138,7 +205,7 @@ async function handleGenericSite(page, siteConfig, maxReviews) {
         try {
           // Extract rating
           let rating = '5'; // Default to 5 stars
-          const ratingElement = container.querySelector('.rating, .stars, [class*="rating"], [class*="stars"]');
+          const ratingElement = findFirst(container, 'rating');
           if (ratingElement) {
             const ratingText = ratingElement.textContent.trim();
             const ratingMatch = ratingText.match(/\d+/);
@@ -149,21 +216,21 @@ async function handleGenericSite(page, siteConfig, maxReviews) {
           
           // Extract title
           let title = '';
-          const titleElement = container.querySelector('.title, .review-title, h3, h4, [class*="title"]');
+          const titleElement = findFirst(container, 'title');
           if (titleElement) {
             title = titleElement.textContent.trim();
           }
           
           // Extract date
           let date = '';
-          const dateElement = container.querySelector('.date, .review-date, time, [class*="date"]');
+          const dateElement = findFirst(container, 'date');
           if (dateElement) {
             date = dateElement.textContent.trim();
           }
           
           // Extract review text
           let text = '';
-          const textElement = container.querySelector('.text, .review-text, .content, p, [class*="text"], [class*="content"]');
+          const textElement = findFirst(container, 'text');
           if (textElement) {
             text = textElement.textContent.trim();
           }
@@ -177,8 +244,21 @@ async function handleGenericSite(page, siteConfig, maxReviews) {
         }
       }
       
-      return results;
-    });
+      // Report the selector that matched most containers for each field
+      const matched = { container: containerSelector };
+      for (const [field, counts] of Object.entries(matchCounts)) {
+        const best = Object.entries(counts).sort((a, b) => b[1] - a[1])[0];
+        matched[field] = best ? best[0] : null;
+      }
+      
+      return { reviews: results, matched };
+    }, candidates);
+    
+    if (selectorCache) {
+      for (const [field, selector] of Object.entries(matched)) {
+        selectorCache.record(domain, field, selector);
+      }
+    }
     
     log.info(`Extracted ${reviews.length} reviews using generic method`);
     return reviews;
@@ -188,6 +268,143 @@ async function handleGenericSite(page, siteConfig, maxReviews) {
   }
 }
 
+// page.goto timed as one 'navigation' span per attempt
+async function timedGoto(page, url, gotoOptions, labels) {
+  const startedAt = Date.now();
+  try {
+    const response = await metrics.timeStage('navigation', labels, () => page.goto(url, gotoOptions));
+    // Warm-up visits go to other sites, so they don't say anything about the retailer
+    if (labels.attempt !== 'warmup') {
+      rateLimiter.recordOutcome(labels.retailer, { status: response ? response.status() : null, latencyMs: Date.now() - startedAt });
+    }
+    return response;
+  } catch (error) {
+    // A page closed under us (cancelled scrape) says nothing about the retailer either
+    if (labels.attempt !== 'warmup' && !page.isClosed()) {
+      rateLimiter.recordOutcome(labels.retailer, { error, latencyMs: Date.now() - startedAt });
+    }
+    throw error;
+  }
+}
+
+// Set a review's ISO parsedDate (once, at extraction) and flag it against the request's date filter
+function setReviewDate(review, retailer, options) {
+  review.parsedDate = normalizeReviewDate(review.date, review.siteType || retailer);
+  if (!review.parsedDate && review.date && review.date !== 'Unknown date') {
+    log.warning(`Could not parse review date "${review.date}"`);
+  }
+  review.inDateRange = isIsoDateInRange(review.parsedDate, options.dateFrom, options.dateTo);
+}
+
+// Save freshly scraped reviews to the review store and, in incremental mode,
+// add back the product's stored reviews that weren't re-scraped this time
+async function mergeWithReviewStore(reviews, retailer, productId, options) {
+  const reviewStore = getReviewStore();
+  if (!reviewStore) {
+    return reviews;
+  }
+
+  try {
+    const added = await reviewStore.addReviews(reviews);
+    log.info(`Review store: ${added} new of ${reviews.length} scraped reviews for ${retailer} product ${productId}`);
+
+    if (!options.incremental) {
+      return reviews;
+    }
+
+    const scrapedIds = new Set(reviews.map(review => review.uniqueId));
+    const storedReviews = (await reviewStore.getProductReviews(retailer, productId))
+      .filter(review => !scrapedIds.has(review.uniqueId) && !review.isFallback);
+    storedReviews.forEach(review => {
+      review.inDateRange = isIsoDateInRange(review.parsedDate, options.dateFrom, options.dateTo);
+    });
+
+    log.info(`Incremental scrape: added ${storedReviews.length} previously stored reviews for ${retailer} product ${productId}`);
+    // Placeholder reviews from a failed scrape aren't mixed in with real stored ones
+    const scraped = storedReviews.length > 0 ? reviews.filter(review => !review.isFallback) : reviews;
+    return scraped.concat(storedReviews);
+  } catch (error) {
+    log.error(`Error using review store: ${error.message}`);
+    return reviews;
+  }
+}
+
+// Add extraction/product metadata, uniqueId and the parsed date to scraped reviews
+function addReviewMetadata(reviews, url, retailer, options) {
+  const { productId, productName } = urlUtils.extractProductInfoFromUrl(url);
+  const span = metrics.startSpan('date_parsing', { retailer });
+  const now = new Date();
+  reviews.forEach(review => {
+    // Add extraction timestamp and source URL
+    review.extractedAt = now.toISOString();
+    review.sourceUrl = url;
+
+    // Add product information
+    review.productId = productId;
+    review.productName = productName;
+
+    // Add site type if not already set
+    if (!review.siteType) {
+      review.siteType = retailer;
+    }
+
+    // Normalize the date to ISO and check it against the date filter
+    setReviewDate(review, retailer, options);
+
+    // Add a content hash for deduplication (uses the normalized date)
+    review.uniqueId = urlUtils.createReviewUniqueId(review);
+  });
+  span.end();
+  return reviews;
+}
+
+// Build the per-page pagination stop for a product (see createPaginationStop)
+async function buildPaginationStop(retailer, productId, options) {
+  const reviewStore = options.incremental ? getReviewStore() : null;
+  if (reviewStore) {
+    // has() answers from memory during pagination, so read the product's index now
+    await reviewStore.loadProduct(retailer, productId);
+  }
+  return createPaginationStop({
+    store: reviewStore,
+    retailer,
+    productId,
+    dateFrom: options.dateFrom,
+    log
+  });
+}
+
+// Try the browserless HTTP + Cheerio fast path; null means fall back to the browser
+async function tryHttpFastPath(url, retailer, options) {
+  const { productId } = urlUtils.extractProductInfoFromUrl(url);
+  const span = metrics.startSpan('http_fast_path', { retailer });
+
+  try {
+    const shouldStopPagination = await buildPaginationStop(retailer, productId, options);
+    const { reviews, escalate, pages } = await httpFastPath.scrapeReviewsOverHttp(url, {
+      maxReviews: 50,
+      shouldStopPagination,
+      // Blocks and challenges on the fast path back the retailer off before the browser goes in
+      onResponse: result => rateLimiter.recordOutcome(retailer, result),
+      log
+    });
+    const durationMs = span.end({ outcome: escalate ? 'escalated' : 'ok' });
+
+    if (escalate) {
+      log.info(`HTTP fast path for ${url} needs the browser: ${escalate}`);
+      return null;
+    }
+
+    log.info(`HTTP fast path got ${reviews.length} reviews from ${pages} pages of ${url} in ${Math.round(durationMs)}ms`);
+    await httpFastPath.recordRetailerPath(retailer, url, 'http', log);
+    return reviews;
+  } catch (error) {
+    span.end({ outcome: 'error' });
+    log.warning(`HTTP fast path failed for ${url}: ${error.message}, falling back to the browser`);
+    return null;
+  }
+}
+
 // Function to try using the local browser service
 async function tryLocalBrowserService(url, options = {}) {
   const retailer = urlUtils.detectRetailerFromUrl(url);
@@ -200,14 +417,18 @@ async function tryLocalBrowserService(url, options = {}) {
   log.info(`Attempting to use local browser service for ${retailer} URL: ${url}`);
   
   try {
-    // Try to connect to the local browser service
-    const response = await axios.post('http://localhost:3002/scrape-with-visible-browser', {
-      url,
-      retailer,
-      options
-    }, {
-      timeout: 30000 // 30 second timeout
-    });
+    // Batched with other URLs sent around the same time; fails fast while the service is down
+    const response = await cachedRequest({
+      method: 'POST',
+      url: `${localBrowserService.getLocalBrowserServiceUrl()}/scrape-batch`,
+      // Only the inputs that change the result; jobId differs on every run
+      body: JSON.stringify({ url, retailer, dateFrom: options.dateFrom, dateTo: options.dateTo }),
+      resourceType: 'api'
+    }, async () => ({
+      status: 200,
+      headers: { 'content-type': 'application/json' },
+      data: { reviews: await localBrowserService.scrapeWithLocalBrowserService(url, retailer) }
+    }));
     
     if (response.status === 200 && response.data && response.data.reviews) {
       log.info(`Successfully retrieved ${response.data.reviews.length} reviews from local browser service`);
@@ -232,35 +453,7 @@ async function tryLocalBrowserService(url, options = {}) {
       }));
       
       // Add date parsing and filtering
-      reviews.forEach(review => {
-        if (review.date && review.date !== 'Unknown date') {
-          try {
-            // Parse the date using our helper function
-            const parsedDate = parseReviewDate(review.date);
-            review.parsedDate = parsedDate.toISOString().split('T')[0]; // YYYY-MM-DD format
-
-            // Check if the review is within the specified date range
-            let inRange = true;
-            if (options.dateFrom) {
-              const fromDate = new Date(options.dateFrom);
-              inRange = inRange && parsedDate >= fromDate;
-            }
-            if (options.dateTo) {
-              const toDate = new Date(options.dateTo);
-              toDate.setHours(23, 59, 59, 999); // End of the day
-              inRange = inRange && parsedDate <= toDate;
-            }
-            review.inDateRange = inRange;
-          } catch (e) {
-            log.warning(`Error parsing date "${review.date}": ${e.message}`);
-            review.parsedDate = null;
-            review.inDateRange = false;
-          }
-        } else {
-          review.parsedDate = null;
-          review.inDateRange = false;
-        }
-      });
+      reviews.forEach(review => setReviewDate(review, retailer, options));
       
       return reviews;
     }
@@ -268,27 +461,98 @@ async function tryLocalBrowserService(url, options = {}) {
     log.info('Local browser service returned invalid response');
     return null;
   } catch (error) {
-    log.error(`Error using local browser service: ${error.message}`);
-    log.info('Falling back to regular scraper');
+    if (error.code === localBrowserService.UNAVAILABLE) {
+      log.info(`${error.message}, using the regular scraper`);
+    } else {
+      log.error(`Error using local browser service: ${error.message}`);
+      log.info('Falling back to regular scraper');
+    }
     return null;
   }
 }
 
+// Identical scrapes (same retailer, product, date range and mode) that overlap
+// share one run, and a result is reused for SCRAPE_MEMO_TTL_MS after it finishes.
+// Empty or placeholder-only results aren't reused so a failed scrape is retried on the next request.
+const scrapeFlights = new SingleFlight({
+  memoTtlMs: process.env.SCRAPE_MEMO_TTL_MS === undefined ? 60000 : Math.max(0, parseInt(process.env.SCRAPE_MEMO_TTL_MS, 10) || 0),
+  shouldMemoize: reviews => urlUtils.hasRealReviews(reviews)
+});
+
+function isScrapeCoalescingEnabled() {
+  return process.env.SCRAPE_COALESCING !== 'false';
+}
+
 // Main scraper function that will be called from server.js
+// options.signal: AbortSignal that cancels this caller's wait; the shared run is
+// cancelled (its browser context closed) once every caller waiting on it has cancelled
 async function scrapeReviews(url, options = {}) {
+  if (!isScrapeCoalescingEnabled()) {
+    return runScrape(url, options);
+  }
+
+  const key = urlUtils.createScrapeKey(url, options);
+  const reviews = await scrapeFlights.run(key, signal => runScrape(url, { ...options, signal }), {
+    signal: options.signal,
+    onJoin: source => log.info(`Reusing ${source === 'memo' ? 'recent' : 'in-flight'} scrape of ${key} for ${url}`)
+  });
+
+  // Callers add their own fields (productUrl, job metadata) to the reviews, so each gets copies
+  return reviews.map(review => ({ ...review, sourceUrl: url }));
+}
+
+/**
+ * Coalescing counters since startup
+ * @returns {Object} - { enabled, memoTtlMs, inFlight, memoEntries, runs, joined, memoHits, cancelled }
+ */
+function getScrapeCoalescingStats() {
+  return {
+    enabled: isScrapeCoalescingEnabled(),
+    memoTtlMs: scrapeFlights.memoTtlMs,
+    ...scrapeFlights.stats()
+  };
+}
+
+// Scrape one URL: HTTP fast path, local browser service, then a pooled browser
+// options.signal: AbortSignal that cancels the scrape; it then rejects with an
+// AbortError once its browser context has been closed
+async function runScrape(url, options = {}) {
+  const { signal, ...loggedOptions } = options;
   log.info(`Starting scrapeReviews for URL: ${url}`);
-  log.info(`Options: ${JSON.stringify(options)}`);
+  log.info(`Options: ${JSON.stringify(loggedOptions)}`);
+  throwIfAborted(signal);
 
   // Determine which retailer's site we're on
   const retailer = urlUtils.detectRetailerFromUrl(url);
+
+  // Space out scrapes of the same retailer (wider after blocks, see rate-limiter.js)
+  const waitedMs = await rateLimiter.waitForTurn(retailer, signal);
+  if (waitedMs > 0) {
+    log.info(`Waited ${waitedMs}ms for ${retailer} rate limit`);
+  }
+  const scrapeSpan = metrics.startSpan('scrape', { retailer });
   
-  // For Morrisons and Sainsburys, try the local browser service first
-  if (retailer === 'morrisons' || retailer === 'sainsburys') {
+  // Plain HTTP first, unless this retailer is remembered as needing the browser
+  const httpFastPathTried = await httpFastPath.shouldTryHttpFastPath(retailer, url);
+  if (httpFastPathTried) {
+    const httpReviews = await tryHttpFastPath(url, retailer, options);
+    if (httpReviews) {
+      const { productId } = urlUtils.extractProductInfoFromUrl(url);
+      addReviewMetadata(httpReviews, url, retailer, options);
+      scrapeSpan.end({ path: 'http' });
+      return mergeWithReviewStore(httpReviews, retailer, productId, options);
+    }
+  }
+
+  // For Morrisons and Sainsburys, try the local browser service next (not against the mock retailer server)
+  if ((retailer === 'morrisons' || retailer === 'sainsburys') && !process.env.MOCK_RETAILER_URL) {
     try {
       const localBrowserReviews = await tryLocalBrowserService(url, options);
       if (localBrowserReviews && localBrowserReviews.length > 0) {
         log.info(`Using ${localBrowserReviews.length} reviews from local browser service for ${retailer}`);
-        return localBrowserReviews;
+        const { productId } = urlUtils.extractProductInfoFromUrl(url);
+        scrapeSpan.end({ path: 'local_service' });
+        return mergeWithReviewStore(localBrowserReviews, retailer, productId, options);
       }
       log.info(`Local browser service didn't return reviews for ${retailer}, falling back to headless browser`);
     } catch (localBrowserError) {
@@ -297,11 +561,22 @@ async function scrapeReviews(url, options = {}) {
     }
   }
 
-  try {
-    // Directly use the extractReviews function without the crawler
-    // This simplifies the process and ensures we get the reviews
-    const { chromium } = require('playwright');
+  // Don't take a browser for a scrape that was cancelled while the faster paths ran
+  if (signal && signal.aborted) {
+    scrapeSpan.end({ outcome: 'cancelled' });
+    throwIfAborted(signal);
+  }
+
+  // Browser lease from the shared pool, released in the finally block below
+  let browserLease = null;
+  let resourcePolicy = null;
+  // Set when a cancellation closes the context early; the finally block waits for it
+  let cancelRelease = null;
+  let removeAbortListener = () => {};
+  // Page states kept for debugging, written out only if the scrape fails (see DEBUG_ARTIFACTS)
+  const artifacts = createArtifactRecorder({ jobId: options.jobId, retailer, log });
 
+  try {
     // Determine if we should run in headless mode
     const isProduction = process.env.NODE_ENV === 'production';
     
@@ -396,9 +671,26 @@ async function scrapeReviews(url, options = {}) {
       launchOptions.args.push('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36');
     }
     
-    const browser = await chromium.launch(launchOptions);
+    // Lease a warm browser for this launch profile instead of launching a new one
+    const browserProfile = {
+      headless: headlessMode,
+      proxy: launchOptions.args.filter(arg => arg.startsWith('--proxy-server=')).join(','),
+      userAgent: launchOptions.args.find(arg => arg.startsWith('--user-agent='))
+    };
+    browserLease = await metrics.timeStage('browser_acquire', { retailer: detectedRetailer },
+      () => getBrowserPool().acquire(browserProfile, launchOptions));
     
-    console.log('DEBUGGING: Browser launched successfully');
+    console.log('DEBUGGING: Browser acquired from pool');
+
+    // On cancellation close the context right away, so pending navigations, waits
+    // and pagination fail instead of running to completion for nobody
+    removeAbortListener = onAbort(signal, () => {
+      const cancelSpan = metrics.startSpan('cancel_to_free', { retailer: detectedRetailer });
+      log.info(`Scrape of ${url} cancelled, closing its browser context`);
+      cancelRelease = browserLease.release().then(() => {
+        log.info(`Browser context for ${url} released ${Math.round(cancelSpan.end())}ms after cancellation`);
+      });
+    });
     
     // Enhanced browser context with additional configurations
     // Use different context options based on the retailer
@@ -436,7 +728,39 @@ if (detectedRetailer === 'sainsburys') {
       contextOptions.userAgent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36';
     }
     
-    const context = await browser.newContext(contextOptions);
+    // Start from the retailer's saved cookies/localStorage when we have a healthy session
+    const session = await sessionManager.acquireSession(detectedRetailer, browserProfile.proxy, log);
+    if (session.storageState) {
+      contextOptions.storageState = session.storageState;
+    }
+
+    throwIfAborted(signal);
+    const context = await browserLease.newContext(contextOptions);
+    if (signal && signal.aborted) {
+      // Cancelled while the context was opening, after the lease was already released
+      await context.close().catch(() => {});
+      throwIfAborted(signal);
+    }
+
+    // Offline runs and benchmarks answer every request from the mock retailer server
+    // (registered first so the resource policy below still sees requests before it)
+    if (process.env.MOCK_RETAILER_URL) {
+      const { routeContextToMockRetailer } = require('./mock-retailer-server');
+      await routeContextToMockRetailer(context, process.env.MOCK_RETAILER_URL);
+    }
+
+    // Record/replay cache (NETWORK_CACHE); misses are fetched the way the mock route would
+    await applyNetworkCache(context, {
+      log,
+      fetchOptions: process.env.MOCK_RETAILER_URL
+        ? request => require('./mock-retailer-server').mockFetchOptions(request, process.env.MOCK_RETAILER_URL)
+        : null
+    });
+
+    // Drop images, fonts, media and trackers the review extraction doesn't need
+    if (process.env.RESOURCE_BLOCKING !== 'false') {
+      resourcePolicy = await applyResourcePolicy(context, detectedRetailer, { log });
+    }
     
     // Add advanced anti-detection scripts
     await context.addInitScript(() => {
@@ -606,6 +930,14 @@ if (detectedRetailer === 'sainsburys') {
     
     const page = await context.newPage();
     console.log('DEBUGGING: New page created');
+    artifacts.setPage(page);
+
+    // Optionally listen for the retailer's review API so we can page through it
+    // directly instead of clicking through review pages in the DOM
+    const useReviewApi = options.captureReviewApi !== undefined
+      ? !!options.captureReviewApi
+      : process.env.REVIEW_API_CAPTURE === 'true';
+    const reviewApiCapture = useReviewApi ? startReviewApiCapture(page, { log }) : null;
 
     // Add page-specific anti-detection measures
     await page.addInitScript(() => {
@@ -650,14 +982,14 @@ if (detectedRetailer === 'sainsburys') {
     // Enhanced navigation with retry logic and cookies handling
     console.log(`DEBUGGING: Navigating to URL: ${url}`);
     
-    // For Tesco, try a special approach
-    if (detectedRetailer === 'tesco') {
+    // For Tesco, try a special approach (a warm session already has the homepage cookies)
+    if (detectedRetailer === 'tesco' && !session.warm) {
       try {
         // First, visit the Tesco homepage to get cookies
-        await page.goto('https://www.tesco.com/', { 
+        await timedGoto(page, 'https://www.tesco.com/', { 
           waitUntil: 'domcontentloaded', 
           timeout: 60000 
-        });
+        }, { retailer: detectedRetailer, attempt: 'warmup' });
         console.log('DEBUGGING: Visited Tesco homepage to get cookies');
         
         // Accept cookies if the banner appears
@@ -673,10 +1005,10 @@ if (detectedRetailer === 'sainsburys') {
         }
         
         // Now navigate to the actual product page
-        await page.goto(url, { 
+        await timedGoto(page, url, { 
           waitUntil: 'domcontentloaded', 
           timeout: 60000 
-        });
+        }, { retailer: detectedRetailer, attempt: '1' });
         console.log('DEBUGGING: Navigated to Tesco product page after homepage visit');
         
         // Wait for network to be idle
@@ -708,14 +1040,16 @@ if (detectedRetailer === 'sainsburys') {
       'Upgrade-Insecure-Requests': '1'
     });
     
-    // First visit a reference site, then Sainsbury's
-    await page.goto('https://www.bbc.co.uk/food', { 
-      waitUntil: 'domcontentloaded',
-      timeout: 60000
-    });
-    
-    log.info('DEBUGGING: Visited reference site');
-    await page.waitForTimeout(3000);
+    // First visit a reference site, then Sainsbury's (not needed with a warm session)
+    if (!session.warm) {
+      await timedGoto(page, 'https://www.bbc.co.uk/food', { 
+        waitUntil: 'domcontentloaded',
+        timeout: 60000
+      }, { retailer: detectedRetailer, attempt: 'warmup' });
+      
+      log.info('DEBUGGING: Visited reference site');
+      await page.waitForTimeout(3000);
+    }
     
     // Execute stealth script to mask automation
     await page.addInitScript(() => {
@@ -744,10 +1078,10 @@ if (detectedRetailer === 'sainsburys') {
     });
     
     // Directly navigate to Sainsbury's product page with a realistic referrer
-    await page.goto(url, { 
+    await timedGoto(page, url, { 
       waitUntil: 'domcontentloaded',
       timeout: 90000 // Use a longer timeout
-    });
+    }, { retailer: detectedRetailer, attempt: '1' });
     
     log.info('DEBUGGING: Navigated to Sainsbury\'s product page');
     
@@ -785,7 +1119,7 @@ if (detectedRetailer === 'sainsburys') {
   } catch (sainsburysError) {
     log.warning(`DEBUGGING: Sainsbury's approach failed: ${sainsburysError.message}, trying direct navigation`);
     try {
-      await page.goto(url, { timeout: 120000, waitUntil: 'networkidle0' });
+      await timedGoto(page, url, { timeout: 120000, waitUntil: 'networkidle0' }, { retailer: detectedRetailer, attempt: '2' });
     } catch (e) {
       log.error(`DEBUGGING: Final navigation attempt failed: ${e.message}`);
     }
@@ -796,120 +1130,140 @@ if (detectedRetailer === 'sainsburys') {
       await navigateWithRetry(page, url);
     }
 
-  // Helper function for navigation with retry
+  // Helper function for navigation with retry. Timeouts follow the retailer's
+  // usual load time, and a blocked response or a retailer that is currently
+  // blocking/timing out on us fails fast instead of retrying with longer timeouts.
   async function navigateWithRetry(page, url) {
-    try {
-      await page.goto(url, { 
-        waitUntil: 'domcontentloaded', 
-        timeout: 60000
-      });
-      log.info('DEBUGGING: Initial navigation successful with domcontentloaded');
-        
+    const attempts = [
+      { waitUntil: 'domcontentloaded' },
+      { waitUntil: 'load' },
+      {}
+    ];
+
+    for (let i = 0; i < attempts.length; i++) {
+      throwIfAborted(signal);
+      const timeout = rateLimiter.getNavigationTimeout(detectedRetailer);
+      let response;
+      try {
+        response = await timedGoto(page, url, { ...attempts[i], timeout }, { retailer: detectedRetailer, attempt: String(i + 1) });
+      } catch (navigationError) {
+        console.log(`DEBUGGING: Navigation attempt ${i + 1} failed: ${navigationError.message}`);
+        if (i === attempts.length - 1 || rateLimiter.isBackingOff(detectedRetailer)) {
+          console.log(`DEBUGGING: Giving up on ${url} after ${i + 1} navigation attempts`);
+          throw navigationError;
+        }
+        continue;
+      }
+
+      const status = response ? response.status() : null;
+      if (status === 403 || status === 429 || status === 503) {
+        throw new Error(`Blocked by ${detectedRetailer} (HTTP ${status}), not retrying`);
+      }
+
+      log.info(`DEBUGGING: Navigation successful on attempt ${i + 1}${attempts[i].waitUntil ? ` with ${attempts[i].waitUntil}` : ''}`);
+      if (i === 0) {
         // Wait for network to be idle
         await page.waitForLoadState('networkidle', { timeout: 30000 }).catch(e => {
           console.log(`DEBUGGING: Network idle wait timed out: ${e.message}`);
         });
-      } catch (navigationError) {
-        console.log(`DEBUGGING: Initial navigation failed: ${navigationError.message}, trying with different options`);
-        // Try again with different options
-        try {
-          await page.goto(url, { 
-            waitUntil: 'load', 
-            timeout: 90000
-          });
-          console.log('DEBUGGING: Retry navigation successful with load');
-        } catch (retryError) {
-          console.log(`DEBUGGING: Navigation retry failed: ${retryError.message}, trying with minimal options`);
-          
-          // Last attempt with minimal options
-          try {
-            await page.goto(url, { timeout: 120000 });
-            console.log('DEBUGGING: Last attempt navigation successful with minimal options');
-          } catch (lastError) {
-            console.log(`DEBUGGING: All navigation attempts failed: ${lastError.message}`);
-            throw lastError;
-          }
-        }
       }
+      return;
     }
+  }
+
+    // The retailer-specific navigation above swallows its errors, including a closed context
+    throwIfAborted(signal);
 
     // Log the detected retailer
     log.info(`Detected retailer: ${detectedRetailer} for URL: ${url}`);
 
-    // Extract reviews
-    const reviews = await extractReviews(page, url, 50);
-    log.info(`Directly extracted ${reviews.length} reviews from ${url}`);
-
     // Extract product information from URL
     const { productId, productName } = urlUtils.extractProductInfoFromUrl(url);
     log.info(`Extracted product info - ID: ${productId}, Name: ${productName}`);
 
-    // Add metadata to each review
-    const now = new Date();
-    reviews.forEach(review => {
-      // Add extraction timestamp and source URL
-      review.extractedAt = now.toISOString();
-      review.sourceUrl = url;
+    // A bot challenge instead of the product page counts against the session
+    const challenge = httpFastPath.detectBotChallenge(null, await page.content().catch(() => ''));
+    if (challenge) {
+      rateLimiter.recordOutcome(detectedRetailer, { challenge });
+      await sessionManager.markSessionBlocked(session, challenge, log);
+    }
+
+    // Stop paginating early at already-stored reviews (incremental mode) or ones before dateFrom
+    const shouldStopPagination = await buildPaginationStop(detectedRetailer, productId, options);
 
-      // Add product information
-      review.productId = productId;
-      review.productName = productName;
+    // Extract reviews, from the review API if one was captured, otherwise from the DOM
+    let reviews = [];
+    if (reviewApiCapture) {
+      reviews = await metrics.timeStage('api_extraction', { retailer: detectedRetailer }, () => scrapeReviewsFromApi(page, reviewApiCapture, {
+        maxReviews: 50,
+        shouldStopPagination,
+        log,
+        // Review widgets are usually lazy-loaded, so scroll to trigger the API call
+        trigger: () => autoScroll(page)
+      }));
+      log.info(`Extracted ${reviews.length} reviews from review API for ${url}`);
+    }
+    if (reviews.length === 0) {
+      reviews = await extractReviews(page, url, 50, { shouldStopPagination, artifacts, signal });
+      log.info(`Directly extracted ${reviews.length} reviews from ${url}`);
+    }
 
-      // Add site type if not already set
-      if (!review.siteType) {
-        review.siteType = detectedRetailer;
-      }
+    addReviewMetadata(reviews, url, detectedRetailer, options);
 
-      // Add a unique identifier for deduplication
-      review.uniqueId = urlUtils.createReviewUniqueId(review);
+    // Placeholder reviews from a failed extraction don't count as a successful scrape
+    const foundReviews = urlUtils.hasRealReviews(reviews);
 
-      // Format the date for display
-      if (review.date && review.date !== 'Unknown date') {
-        try {
-          // Parse the date using our helper function
-          const parsedDate = parseReviewDate(review.date);
-          review.parsedDate = parsedDate.toISOString().split('T')[0]; // YYYY-MM-DD format
-
-          // Check if the review is within the specified date range
-          let inRange = true;
-          if (options.dateFrom) {
-            const fromDate = new Date(options.dateFrom);
-            inRange = inRange && parsedDate >= fromDate;
-          }
-          if (options.dateTo) {
-            const toDate = new Date(options.dateTo);
-            toDate.setHours(23, 59, 59, 999); // End of the day
-            inRange = inRange && parsedDate <= toDate;
-          }
-          review.inDateRange = inRange;
-        } catch (e) {
-          log.warning(`Error parsing date "${review.date}": ${e.message}`);
-          review.parsedDate = null;
-          review.inDateRange = false;
-        }
-      } else {
-        review.parsedDate = null;
-        review.inDateRange = false;
-      }
-    });
+    // Keep the cookies/localStorage for the next scrape of this retailer (skipped if it was blocked)
+    if (foundReviews) {
+      await sessionManager.saveSession(session, context, log);
+    }
 
-    // Close the browser
-    await browser.close();
+    // Remember that this retailer needed the browser when the fast path couldn't do it
+    if (httpFastPathTried && foundReviews) {
+      await httpFastPath.recordRetailerPath(detectedRetailer, url, 'browser', log);
+    }
 
-    // Return the reviews
-    return reviews;
+    // Return the reviews (plus stored ones in incremental mode)
+    return await mergeWithReviewStore(reviews, detectedRetailer, productId, options);
   } catch (error) {
+    // A cancelled scrape's errors are just the closed context; don't save artifacts for them
+    if (signal && signal.aborted) {
+      scrapeSpan.end({ path: 'browser', outcome: 'cancelled' });
+      throwIfAborted(signal);
+    }
+
     log.error(`Error in scrapeReviews: ${error.message}\n${error.stack}`);
     console.log('DEBUGGING: Error in scrapeReviews:', error);
+    await artifacts.flush(error);
+
+    scrapeSpan.end({ path: 'browser', outcome: 'error' });
 
     // Return empty array
     return [];
+  } finally {
+    scrapeSpan.end({ path: 'browser' });
+
+    if (resourcePolicy) {
+      resourcePolicy.logSummary(url);
+    }
+
+    // Close the context and hand the browser back to the pool
+    // (the pool drops the browser instead if it crashed)
+    removeAbortListener();
+    if (cancelRelease) {
+      await cancelRelease;
+    } else if (browserLease) {
+      await browserLease.release();
+    }
   }
 }
 
 // Export the functions
 module.exports = {
   scrapeReviews,
+  getScrapeCoalescingStats,
+  closeBrowserPool,
+  getBrowserPoolStats,
   extractReviews,
   handleGenericSite,
   autoScroll,
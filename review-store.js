@@ -0,0 +1,288 @@
+/**
+ * Persistent review store
+ * Every review we've scraped, as one append-only JSONL file per product
+ * (<dir>/<retailer>/<productId>.jsonl), deduplicated across runs by the
+ * review's content hash (createReviewUniqueId) through a ReviewDeduplicator.
+ * Lets incremental scrapes stop paginating once they reach reviews we
+ * already have, and fill the rest of the product's reviews in from disk.
+ * Only the products being scraped are read, so memory doesn't grow with the
+ * size of the store.
+ */
+
+const fs = require('fs');
+const path = require('path');
+const readline = require('readline');
+const urlUtils = require('./url-utils');
+const { normalizeReviewDate } = require('./date-normalizer');
+const { ReviewDeduplicator } = require('./review-dedup');
+
+const DEFAULT_STORE_DIR = path.join(__dirname, 'storage', 'review-store');
+
+// File-system safe name for a retailer or product ID
+function safeName(value) {
+  return String(value).replace(/[^\w.-]/g, '_');
+}
+
+function contentHash(retailer, review) {
+  return review.uniqueId || urlUtils.createReviewUniqueId({ siteType: retailer, ...review });
+}
+
+class ReviewStore {
+  /**
+   * @param {Object} options - Store options
+   * @param {string} options.dir - Directory holding the per-product files and the dedup index
+   * @param {string} options.legacyFilePath - Single-file store from older versions, migrated on load
+   * @param {Object} options.log - Logger
+   */
+  constructor(options = {}) {
+    this.dir = options.dir || DEFAULT_STORE_DIR;
+    this.legacyFilePath = options.legacyFilePath || path.join(this.dir, 'reviews.jsonl');
+    this.log = options.log || console;
+    this.dedup = options.dedup || new ReviewDeduplicator({ dir: path.join(this.dir, 'dedup'), log: this.log });
+
+    this.loading = null;
+    // Appends are chained so lines from concurrent scrapes never interleave
+    this.writeQueue = Promise.resolve();
+  }
+
+  /**
+   * Load the dedup index (once), migrating a legacy single-file store first;
+   * later calls reuse the same load
+   * @returns {Promise<ReviewStore>}
+   */
+  load() {
+    if (!this.loading) {
+      this.loading = this.dedup.load()
+        .then(() => this.migrateLegacyFile())
+        .then(() => this);
+    }
+    return this.loading;
+  }
+
+  async migrateLegacyFile() {
+    if (!fs.existsSync(this.legacyFilePath)) return;
+
+    this.log.info(`Migrating review store ${this.legacyFilePath} to per-product files...`);
+    const byProduct = new Map();
+    let skipped = 0;
+
+    const lines = readline.createInterface({ input: fs.createReadStream(this.legacyFilePath, 'utf8'), crlfDelay: Infinity });
+    for await (const line of lines) {
+      if (!line.trim()) continue;
+      try {
+        const review = JSON.parse(line);
+        if (!review.siteType || !review.productId) continue;
+        const key = `${review.siteType}|${review.productId}`;
+        if (!byProduct.has(key)) byProduct.set(key, []);
+        byProduct.get(key).push(review);
+      } catch (e) {
+        // A crash mid-append can leave a partial last line
+        skipped++;
+      }
+
+      // Write out in batches so a large store never sits in memory whole
+      if (byProduct.size >= 100) {
+        await this.writeProductBatches(byProduct);
+      }
+    }
+    await this.writeProductBatches(byProduct);
+
+    await fs.promises.rename(this.legacyFilePath, `${this.legacyFilePath}.migrated`);
+    this.log.info(`Review store migrated (${this.dedup.stats().reviews} reviews${skipped ? `, skipped ${skipped} unreadable lines` : ''})`);
+  }
+
+  async writeProductBatches(byProduct) {
+    for (const reviews of byProduct.values()) {
+      // Old IDs were prefixes of the title and text; re-hash with the current scheme
+      await this.appendProductReviews(reviews[0].siteType, reviews[0].productId, reviews.map(review => ({
+        ...review,
+        uniqueId: urlUtils.createReviewUniqueId(review)
+      })));
+    }
+    byProduct.clear();
+  }
+
+  productPath(retailer, productId) {
+    return path.join(this.dir, safeName(retailer), `${safeName(productId)}.jsonl`);
+  }
+
+  /**
+   * Load a product's dedup index so has() can answer from memory. Call before
+   * paginating a product in incremental mode.
+   * @param {string} retailer - Retailer name
+   * @param {string} productId - Product ID
+   */
+  async loadProduct(retailer, productId) {
+    await this.load();
+    await this.dedup.loadProduct(retailer, productId);
+  }
+
+  /**
+   * Check whether a review is already stored (loadProduct first)
+   * @param {string} retailer - Retailer name
+   * @param {string} productId - Product ID from extractProductInfoFromUrl
+   * @param {Object} review - Review (uniqueId is derived if missing)
+   * @returns {boolean}
+   */
+  has(retailer, productId, review) {
+    return this.dedup.hasLoaded(retailer, productId, contentHash(retailer, review));
+  }
+
+  /**
+   * Get all stored reviews for a product
+   * @param {string} retailer - Retailer name
+   * @param {string} productId - Product ID
+   * @returns {Promise<Array>} - Stored reviews
+   */
+  async getProductReviews(retailer, productId) {
+    await this.load();
+    // Let pending appends land first
+    await this.writeQueue;
+
+    let content;
+    try {
+      content = await fs.promises.readFile(this.productPath(retailer, productId), 'utf8');
+    } catch (error) {
+      if (error.code === 'ENOENT') return [];
+      throw error;
+    }
+
+    const reviews = [];
+    for (const line of content.split('\n')) {
+      if (!line.trim()) continue;
+      try {
+        reviews.push(JSON.parse(line));
+      } catch (e) {
+        // Partial last line from a crash mid-append
+      }
+    }
+    return reviews;
+  }
+
+  /**
+   * Append reviews that aren't stored yet. Reviews need siteType, productId and uniqueId;
+   * placeholder reviews (isFallback) are never stored.
+   * @param {Array} reviews - Reviews with metadata from scrapeReviews
+   * @returns {Promise<number>} - Number of reviews added
+   */
+  async addReviews(reviews) {
+    await this.load();
+
+    const byProduct = new Map();
+    for (const review of reviews) {
+      if (!review.siteType || !review.productId || !review.uniqueId || review.isFallback) continue;
+      const key = `${review.siteType}|${review.productId}`;
+      if (!byProduct.has(key)) byProduct.set(key, []);
+      byProduct.get(key).push(review);
+    }
+
+    let added = 0;
+    this.writeQueue = this.writeQueue.then(async () => {
+      for (const productReviews of byProduct.values()) {
+        const { siteType, productId } = productReviews[0];
+        added += await this.appendProductReviews(siteType, productId, productReviews.map(review => {
+          const stored = { ...review, firstSeenAt: review.extractedAt || new Date().toISOString() };
+          delete stored.inDateRange; // Depends on the request's date filter, recalculated on read
+          return stored;
+        }));
+      }
+    }).catch((error) => {
+      this.log.error(`Error writing to review store: ${error.message}`);
+    });
+    await this.writeQueue;
+
+    return added;
+  }
+
+  // Append a product's unseen reviews to its file and record them in the dedup index
+  async appendProductReviews(retailer, productId, reviews) {
+    const fresh = new Set(await this.dedup.filterNew(retailer, productId, reviews.map(review => review.uniqueId)));
+    const lines = [];
+    const added = [];
+    for (const review of reviews) {
+      if (!fresh.delete(review.uniqueId)) continue;
+      lines.push(JSON.stringify(review));
+      added.push(review.uniqueId);
+    }
+    if (lines.length === 0) return 0;
+
+    const filePath = this.productPath(retailer, productId);
+    await fs.promises.mkdir(path.dirname(filePath), { recursive: true });
+    await fs.promises.appendFile(filePath, lines.join('\n') + '\n', 'utf8');
+    await this.dedup.add(retailer, productId, added);
+    return lines.length;
+  }
+}
+
+let reviewStore = null;
+
+/**
+ * Get the shared review store, or null if REVIEW_STORE=false
+ * @returns {ReviewStore|null}
+ */
+function getReviewStore() {
+  if (process.env.REVIEW_STORE === 'false') {
+    return null;
+  }
+  if (!reviewStore) {
+    const { log } = require('crawlee');
+    reviewStore = new ReviewStore({
+      dir: process.env.REVIEW_STORE_DIR || DEFAULT_STORE_DIR,
+      legacyFilePath: process.env.REVIEW_STORE_PATH,
+      log
+    });
+  }
+  return reviewStore;
+}
+
+/**
+ * Build the per-page stop check handlers call while paginating (newest-first
+ * sort assumed). Stops once a page holds only reviews we already have
+ * (incremental mode), or only reviews older than dateFrom.
+ * @param {Object} options - Stop options
+ * @param {ReviewStore} options.store - Review store with the product loaded (incremental mode only)
+ * @param {string} options.retailer - Retailer name
+ * @param {string} options.productId - Product ID
+ * @param {string} options.dateFrom - Start of the date filter, if any (YYYY-MM-DD)
+ * @param {Object} options.log - Logger
+ * @returns {Function|null} - (pageReviews) => boolean, or null if nothing can stop pagination early
+ */
+function createPaginationStop(options) {
+  const { store, retailer, productId, dateFrom } = options;
+  const log = options.log || console;
+  const fromDate = dateFrom ? String(dateFrom).slice(0, 10) : null;
+
+  if (!store && !fromDate) {
+    return null;
+  }
+
+  return (pageReviews) => {
+    if (!pageReviews || pageReviews.length === 0) {
+      return false;
+    }
+
+    if (store && pageReviews.every(review => store.has(retailer, productId, review))) {
+      log.info(`All ${pageReviews.length} reviews on this page are already stored, stopping pagination`);
+      return true;
+    }
+
+    if (fromDate) {
+      const dates = pageReviews
+        .map(review => review.parsedDate || normalizeReviewDate(review.date, retailer))
+        .filter(Boolean);
+
+      if (dates.length > 0 && dates.every(date => date < fromDate)) {
+        log.info(`All dated reviews on this page are before ${dateFrom}, stopping pagination`);
+        return true;
+      }
+    }
+
+    return false;
+  };
+}
+
+module.exports = {
+  ReviewStore,
+  getReviewStore,
+  createPaginationStop
+};
@@ -0,0 +1,461 @@
+/**
+ * Scrape jobs
+ * Background scrape jobs that outlive the HTTP request that started them.
+ * A job's URLs go into a Crawlee request queue and each finished URL's
+ * reviews are checkpointed to a key-value store (both under ./storage), so
+ * after a restart the job carries on from the next unfinished URL.
+ */
+
+const crypto = require('crypto');
+const { EventEmitter } = require('events');
+const { RequestQueue, KeyValueStore, log } = require('crawlee');
+const urlUtils = require('./url-utils');
+const { readPositiveIntEnv, runWithConcurrency } = require('./concurrency-utils');
+const { createReviewExport, getExportDownload } = require('./review-export');
+const { scrapeReviews } = require('./review-scraper-integrated');
+const { cleanupJobArtifacts } = require('./debug-artifacts');
+const rateLimiter = require('./rate-limiter');
+
+// Named key-value store holding job records (job-<id>) and per-URL checkpoints (job-<id>-url-<n>)
+const JOB_STORE_NAME = 'scrape-jobs';
+const ACTIVE_STATUSES = ['queued', 'running'];
+
+// jobId -> job record
+const jobs = new Map();
+// jobId -> promise for the job's current run
+const runningJobs = new Map();
+// jobId -> chain of pending writes of the job record
+const saveChains = new Map();
+// jobId -> in-progress rebuild of the job's export
+const exportRebuilds = new Map();
+let expiryTimer = null;
+
+// Emits (jobId, event, data) for subscribers
+const jobEvents = new EventEmitter();
+jobEvents.setMaxListeners(0);
+
+let jobStorePromise = null;
+
+function getJobStore() {
+  if (!jobStorePromise) {
+    jobStorePromise = KeyValueStore.open(JOB_STORE_NAME);
+  }
+  return jobStorePromise;
+}
+
+const jobKey = jobId => `job-${jobId}`;
+const resultKey = (jobId, index) => `job-${jobId}-url-${index}`;
+
+function emitJobEvent(job, event, data) {
+  jobEvents.emit(job.id, event, { jobId: job.id, ...data });
+}
+
+// Persist the job record; writes for one job are chained so an older snapshot never wins
+function saveJob(job) {
+  job.updatedAt = new Date().toISOString();
+  const snapshot = { ...job };
+  const previous = saveChains.get(job.id) || Promise.resolve();
+  const next = previous
+    .then(async () => (await getJobStore()).setValue(jobKey(job.id), snapshot))
+    .catch(error => log.error(`Error saving scrape job ${job.id}: ${error.message}`));
+  saveChains.set(job.id, next);
+  return next;
+}
+
+/**
+ * Public view of a job, as returned by the job API
+ * @param {Object} job - Job record
+ * @returns {Object} - Status, progress, links and (once complete) download URLs
+ */
+function describeJob(job) {
+  return {
+    jobId: job.id,
+    status: job.status,
+    total: job.urls.length,
+    completed: job.completedUrls,
+    failed: job.failedUrls,
+    reviewsFound: job.reviewsFound,
+    totalReviews: job.totalReviews,
+    createdAt: job.createdAt,
+    updatedAt: job.updatedAt,
+    finishedAt: job.finishedAt,
+    error: job.error,
+    links: {
+      self: `/jobs/${job.id}`,
+      events: `/jobs/${job.id}/events`,
+      results: `/jobs/${job.id}/results`
+    },
+    downloads: job.downloads
+  };
+}
+
+/**
+ * Create a scrape job and start it in the background
+ * @param {Array<string>} urls - Product URLs
+ * @param {Object} options - scrapeReviews options (dateFrom, dateTo, incremental)
+ * @returns {Promise<Object>} - The job record
+ */
+async function createScrapeJob(urls, options = {}) {
+  const now = new Date().toISOString();
+  const job = {
+    id: crypto.randomUUID(),
+    status: 'queued',
+    urls: urls,
+    options: {
+      dateFrom: options.dateFrom || null,
+      dateTo: options.dateTo || null,
+      incremental: options.incremental === true
+    },
+    requestIds: [],
+    completedUrls: 0,
+    failedUrls: 0,
+    reviewsFound: 0,
+    totalReviews: null,
+    downloads: null,
+    error: null,
+    createdAt: now,
+    updatedAt: now,
+    finishedAt: null
+  };
+
+  // The index is part of the unique key so the same URL can appear twice in a job
+  const queue = await RequestQueue.open(jobKey(job.id));
+  const { processedRequests } = await queue.addRequests(
+    urls.map((url, index) => ({ url, uniqueKey: `${index}:${url}`, userData: { index } }))
+  );
+  processedRequests.forEach(processed => {
+    job.requestIds[parseInt(processed.uniqueKey, 10)] = processed.requestId;
+  });
+
+  jobs.set(job.id, job);
+  await saveJob(job);
+  log.info(`Created scrape job ${job.id} for ${urls.length} URLs`);
+
+  startJob(job);
+  return job;
+}
+
+function startJob(job) {
+  if (runningJobs.has(job.id)) {
+    return runningJobs.get(job.id);
+  }
+
+  const run = runJob(job)
+    .catch(async (error) => {
+      log.error(`Scrape job ${job.id} failed: ${error.message}`);
+      job.status = 'failed';
+      job.error = error.message;
+      job.finishedAt = new Date().toISOString();
+      await saveJob(job);
+      emitJobEvent(job, 'error', { message: error.message });
+    })
+    .finally(() => {
+      runningJobs.delete(job.id);
+      // Debug artifacts are only kept for jobs where a scrape failed
+      cleanupJobArtifacts(job.id, log).catch(error => log.error(`Error cleaning up debug artifacts: ${error.message}`));
+    });
+
+  runningJobs.set(job.id, run);
+  return run;
+}
+
+async function runJob(job) {
+  const store = await getJobStore();
+  const queue = await RequestQueue.open(jobKey(job.id));
+
+  // Requests the queue still considers unfinished
+  const fetched = new Map();
+  let request;
+  while ((request = await queue.fetchNextRequest())) {
+    fetched.set(request.userData.index, request);
+  }
+
+  // The checkpoints decide what's done; recount progress from them on every (re)start
+  job.completedUrls = 0;
+  job.failedUrls = 0;
+  job.reviewsFound = 0;
+  const pending = [];
+  for (let index = 0; index < job.urls.length; index++) {
+    const checkpoint = await store.getValue(resultKey(job.id, index));
+    const queued = fetched.get(index);
+
+    // A URL that only got placeholder reviews is scraped again on resume
+    if (checkpoint && !checkpoint.fallback) {
+      job.completedUrls++;
+      job.reviewsFound += checkpoint.reviews.length;
+      if (checkpoint.error) job.failedUrls++;
+      // Checkpointed just before a restart, before the request was marked handled
+      if (queued) await queue.markRequestHandled(queued);
+      continue;
+    }
+
+    // Requests the previous run was in the middle of can still be locked, so look them up directly
+    pending.push({
+      index,
+      url: job.urls[index],
+      request: queued || (job.requestIds[index] ? await queue.getRequest(job.requestIds[index]) : null)
+    });
+  }
+
+  if (job.completedUrls > 0) {
+    log.info(`Resuming scrape job ${job.id}: ${job.completedUrls} of ${job.urls.length} URLs already done`);
+  }
+
+  job.status = 'running';
+  await saveJob(job);
+  emitJobEvent(job, 'start', { totalUrls: job.urls.length, completed: job.completedUrls });
+
+  const concurrency = readPositiveIntEnv('SCRAPE_CONCURRENCY', 3);
+
+  const scrapeJobUrl = async (item) => {
+    let checkpoint;
+    try {
+      const reviews = await scrapeReviews(item.url, { ...job.options, jobId: job.id });
+      checkpoint = { url: item.url, index: item.index, reviews, finishedAt: new Date().toISOString() };
+      if (reviews.length > 0 && !urlUtils.hasRealReviews(reviews)) {
+        checkpoint.fallback = true;
+      }
+    } catch (error) {
+      log.error(`Error scraping ${item.url} for job ${job.id}: ${error.message}`);
+      checkpoint = { url: item.url, index: item.index, reviews: [], error: error.message, finishedAt: new Date().toISOString() };
+    }
+
+    await store.setValue(resultKey(job.id, item.index), checkpoint);
+    if (item.request) {
+      await queue.markRequestHandled(item.request);
+    }
+    return checkpoint;
+  };
+
+  await runWithConcurrency(pending, scrapeJobUrl, {
+    concurrency,
+    keyFn: item => urlUtils.detectRetailerFromUrl(item.url),
+    perKeyLimit: retailer => rateLimiter.getConcurrency(retailer),
+    onSettled: (outcome, item) => {
+      job.completedUrls++;
+      const checkpoint = outcome.status === 'fulfilled' ? outcome.value : null;
+      const error = checkpoint ? checkpoint.error : (outcome.reason && outcome.reason.message) || 'Unknown error';
+
+      if (error) {
+        job.failedUrls++;
+        emitJobEvent(job, 'url_error', { url: item.url, message: error });
+      }
+      if (checkpoint) {
+        job.reviewsFound += checkpoint.reviews.length;
+      }
+
+      emitJobEvent(job, 'progress', {
+        current: job.completedUrls,
+        total: job.urls.length,
+        url: item.url,
+        reviewsFound: checkpoint ? checkpoint.reviews.length : 0
+      });
+      saveJob(job);
+    }
+  });
+
+  await buildJobExport(job);
+  await queue.drop().catch(() => {});
+
+  job.finishedAt = new Date().toISOString();
+  await saveJob(job);
+
+  if (job.status === 'complete') {
+    log.info(`Scrape job ${job.id} complete: ${job.totalReviews} reviews from ${job.urls.length} URLs`);
+    emitJobEvent(job, 'complete', {
+      downloads: job.downloads,
+      totalReviews: job.totalReviews,
+      totalProducts: job.urls.length,
+      failed: job.failedUrls
+    });
+  } else {
+    emitJobEvent(job, 'error', { message: job.error });
+  }
+}
+
+// Walk the job's checkpoints in URL order, passing each product's deduplicated reviews
+async function forEachJobProduct(job, callback) {
+  const store = await getJobStore();
+  const uniqueReviewIds = new Set();
+
+  for (let index = 0; index < job.urls.length; index++) {
+    const checkpoint = await store.getValue(resultKey(job.id, index));
+    if (!checkpoint) continue;
+
+    const uniqueReviews = urlUtils.filterUniqueReviews(checkpoint.reviews, uniqueReviewIds);
+    uniqueReviews.forEach(review => {
+      // Make sure we have a valid rating
+      if (!review.rating || review.rating === 'N/A' || review.rating === '') {
+        review.rating = '5'; // Default to 5 if no rating found
+      }
+    });
+    await callback(uniqueReviews, checkpoint);
+  }
+}
+
+// Write the job's CSV/XLSX export from its checkpoints (also used to rebuild it after a restart)
+async function buildJobExport(job) {
+  const date = new Date(job.createdAt).toISOString().split('T')[0]; // YYYY-MM-DD format
+  const reviewExport = await createReviewExport({
+    jobId: job.id,
+    totalUrls: job.urls.length,
+    dateFrom: job.options.dateFrom,
+    dateTo: job.options.dateTo,
+    baseName: `reviews_multiple_products_${date}`
+  });
+
+  try {
+    await forEachJobProduct(job, reviews => reviewExport.writeProduct(reviews));
+
+    if (reviewExport.reviewCount === 0) {
+      await reviewExport.abort();
+      job.status = 'failed';
+      job.error = 'No reviews found for any of the given URLs.';
+      return;
+    }
+
+    job.downloads = await reviewExport.finish();
+    job.totalReviews = reviewExport.reviewCount;
+    job.status = 'complete';
+  } catch (error) {
+    await reviewExport.abort();
+    throw error;
+  }
+}
+
+/**
+ * Look up a job
+ * @param {string} jobId - Job ID
+ * @returns {Object|null} - The job record
+ */
+function getScrapeJob(jobId) {
+  return jobs.get(jobId) || null;
+}
+
+/**
+ * Get a finished job's reviews, rebuilding its export if it was lost in a restart
+ * @param {Object} job - Job record (status 'complete')
+ * @returns {Promise<Array>} - Deduplicated reviews in URL order
+ */
+async function getScrapeJobResults(job) {
+  if (!getExportDownload(job.id, 'csv')) {
+    await rebuildJobExport(job);
+  }
+
+  const reviews = [];
+  await forEachJobProduct(job, productReviews => {
+    reviews.push(...productReviews);
+  });
+  return reviews;
+}
+
+// Concurrent requests share one rebuild, since they'd all write to the same export directory
+function rebuildJobExport(job) {
+  if (!exportRebuilds.has(job.id)) {
+    log.info(`Rebuilding export for scrape job ${job.id}`);
+    const rebuild = buildJobExport(job)
+      .then(() => saveJob(job))
+      .finally(() => exportRebuilds.delete(job.id));
+    exportRebuilds.set(job.id, rebuild);
+  }
+  return exportRebuilds.get(job.id);
+}
+
+// Delete the records and checkpoints of jobs that finished more than JOB_TTL_MS ago
+async function expireScrapeJobs() {
+  const ttlMs = readPositiveIntEnv('JOB_TTL_MS', 7 * 24 * 60 * 60 * 1000);
+  const now = Date.now();
+  const expired = new Set();
+  for (const job of jobs.values()) {
+    if (ACTIVE_STATUSES.includes(job.status) || runningJobs.has(job.id) || exportRebuilds.has(job.id)) continue;
+    const finishedAt = Date.parse(job.finishedAt || job.updatedAt);
+    if (now - finishedAt > ttlMs) {
+      expired.add(job.id);
+    }
+  }
+  if (expired.size === 0) return 0;
+
+  const store = await getJobStore();
+  const keys = [];
+  await store.forEachKey(async (key) => {
+    // job-<id> or job-<id>-url-<n>; job IDs contain dashes themselves
+    const match = /^job-(.+?)(?:-url-\d+)?$/.exec(key);
+    if (match && expired.has(match[1])) {
+      keys.push(key);
+    }
+  });
+
+  for (const jobId of expired) {
+    // Let a pending write land first so it can't recreate the record
+    await saveChains.get(jobId);
+    jobs.delete(jobId);
+    saveChains.delete(jobId);
+  }
+  for (const key of keys) {
+    await store.setValue(key, null);
+  }
+  log.info(`Removed ${expired.size} expired scrape jobs`);
+  return expired.size;
+}
+
+function scheduleJobExpiry() {
+  if (expiryTimer) return;
+
+  const ttlMs = readPositiveIntEnv('JOB_TTL_MS', 7 * 24 * 60 * 60 * 1000);
+  expiryTimer = setInterval(() => {
+    expireScrapeJobs().catch(error => log.error(`Error removing expired scrape jobs: ${error.message}`));
+  }, Math.min(ttlMs, 60 * 60 * 1000));
+  expiryTimer.unref();
+}
+
+/**
+ * Subscribe to a job's events ('start', 'progress', 'url_error', 'complete', 'error')
+ * @param {string} jobId - Job ID
+ * @param {Function} listener - (event, data) => void
+ * @returns {Function} - Call to unsubscribe
+ */
+function subscribeToJob(jobId, listener) {
+  jobEvents.on(jobId, listener);
+  return () => jobEvents.off(jobId, listener);
+}
+
+/**
+ * Load saved jobs and restart any that hadn't finished (called on server start).
+ * Finished jobs are deleted JOB_TTL_MS after they finish.
+ * @returns {Promise<number>} - Number of jobs resumed
+ */
+async function resumeScrapeJobs() {
+  const store = await getJobStore();
+  const jobKeys = [];
+  await store.forEachKey(async (key) => {
+    if (key.startsWith('job-') && !key.includes('-url-')) {
+      jobKeys.push(key);
+    }
+  });
+
+  let resumed = 0;
+  for (const key of jobKeys) {
+    const job = await store.getValue(key);
+    if (!job || jobs.has(job.id)) continue;
+
+    jobs.set(job.id, job);
+    if (ACTIVE_STATUSES.includes(job.status)) {
+      log.info(`Resuming unfinished scrape job ${job.id}`);
+      startJob(job);
+      resumed++;
+    }
+  }
+
+  await expireScrapeJobs().catch(error => log.error(`Error removing expired scrape jobs: ${error.message}`));
+  scheduleJobExpiry();
+  return resumed;
+}
+
+module.exports = {
+  createScrapeJob,
+  getScrapeJob,
+  getScrapeJobResults,
+  describeJob,
+  subscribeToJob,
+  resumeScrapeJobs
+};
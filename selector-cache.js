@@ -0,0 +1,282 @@
+/**
+ * Selector cache
+ * The generic extraction paths probe long selector lists in order, one
+ * round trip per selector. This remembers, per domain and field (container,
+ * rating, date, text, tab, next page...), which selector last matched, and
+ * puts it at the front of the list on later visits, so a known site usually
+ * needs one probe.
+ *
+ * A learned selector is replaced as soon as a different one matches instead,
+ * and dropped after SELECTOR_CACHE_MAX_FAILURES visits in a row where nothing
+ * matched (a missing next-page link on the last page isn't a failure on its own).
+ * The cache is kept in memory and written to SELECTOR_CACHE_PATH (JSON) shortly
+ * after it changes. Set SELECTOR_CACHE=false to always probe in the listed order.
+ */
+
+const fs = require('fs');
+const path = require('path');
+const { readPositiveIntEnv } = require('./concurrency-utils');
+
+const DEFAULT_CACHE_PATH = path.join(__dirname, 'storage', 'selector-cache.json');
+// Changes are written at most this often
+const SAVE_DELAY_MS = 1000;
+
+/**
+ * Domain a page or URL belongs to, without a leading www.
+ * @param {string} url - Page URL
+ * @returns {string}
+ */
+function getDomain(url) {
+  try {
+    return new URL(url).hostname.replace(/^www\./, '').toLowerCase();
+  } catch (e) {
+    return 'unknown';
+  }
+}
+
+class SelectorCache {
+  /**
+   * @param {Object} options - Cache options
+   * @param {string} options.filePath - JSON file the cache is kept in
+   * @param {number} options.maxFailures - Visits in a row with no match before a learned selector is dropped
+   * @param {Object} options.log - Logger
+   */
+  constructor(options = {}) {
+    this.filePath = options.filePath || DEFAULT_CACHE_PATH;
+    this.maxFailures = options.maxFailures || 3;
+    this.log = options.log || console;
+
+    // domain -> field -> { selector, hits, failures, learnedAt, lastHitAt }
+    this.domains = {};
+    this.counters = { hits: 0, misses: 0, learned: 0, invalidations: 0 };
+    this.loading = null;
+    this.saveTimer = null;
+    this.saving = Promise.resolve();
+  }
+
+  /**
+   * Read the cache file (once); later calls reuse the same load
+   * @returns {Promise<SelectorCache>}
+   */
+  load() {
+    if (!this.loading) {
+      this.loading = fs.promises.readFile(this.filePath, 'utf8')
+        .then(content => {
+          this.domains = JSON.parse(content).domains || {};
+        })
+        .catch(error => {
+          if (error.code !== 'ENOENT') {
+            this.log.warning(`Could not read selector cache ${this.filePath}: ${error.message}`);
+          }
+        })
+        .then(() => this);
+    }
+    return this.loading;
+  }
+
+  /**
+   * The learned selector for a domain and field
+   * @param {string} domain - Domain (see getDomain)
+   * @param {string} field - Field name, e.g. container or nextPage
+   * @returns {string|null}
+   */
+  get(domain, field) {
+    const entry = this.domains[domain] && this.domains[domain][field];
+    return entry ? entry.selector : null;
+  }
+
+  /**
+   * Candidates with the learned selector moved to the front. A learned
+   * selector that is no longer in the list is ignored.
+   * @param {string} domain - Domain
+   * @param {string} field - Field name
+   * @param {Array<string>} candidates - Selectors in their default order
+   * @returns {Array<string>}
+   */
+  order(domain, field, candidates) {
+    const learned = this.get(domain, field);
+    if (!learned || !candidates.includes(learned)) {
+      return candidates;
+    }
+    return [learned, ...candidates.filter(selector => selector !== learned)];
+  }
+
+  /**
+   * Record which selector matched on a visit
+   * @param {string} domain - Domain
+   * @param {string} field - Field name
+   * @param {string|null} selector - The selector that matched, or null if none did
+   */
+  record(domain, field, selector) {
+    const fields = this.domains[domain] || {};
+    const entry = fields[field];
+    const now = new Date().toISOString();
+
+    if (entry && selector === entry.selector) {
+      this.counters.hits++;
+      entry.hits++;
+      entry.failures = 0;
+      entry.lastHitAt = now;
+      this.scheduleSave();
+      return;
+    }
+
+    this.counters.misses++;
+    if (!selector) {
+      if (entry && ++entry.failures >= this.maxFailures) {
+        this.counters.invalidations++;
+        this.log.info(`Selector cache: dropping ${field} selector "${entry.selector}" for ${domain} after ${entry.failures} visits without a match`);
+        delete fields[field];
+        if (Object.keys(fields).length === 0) {
+          delete this.domains[domain];
+        }
+      }
+      if (entry) this.scheduleSave();
+      return;
+    }
+
+    if (entry) {
+      this.counters.invalidations++;
+      this.log.info(`Selector cache: ${field} selector for ${domain} changed from "${entry.selector}" to "${selector}"`);
+    }
+    this.counters.learned++;
+    fields[field] = { selector, hits: 0, failures: 0, learnedAt: now, lastHitAt: null };
+    this.domains[domain] = fields;
+    this.scheduleSave();
+  }
+
+  scheduleSave() {
+    if (!this.saveTimer) {
+      this.saveTimer = setTimeout(() => {
+        this.saveTimer = null;
+        this.saving = this.saving.then(() => this.save());
+      }, SAVE_DELAY_MS);
+      // A pending save shouldn't keep a finished CLI run alive
+      this.saveTimer.unref();
+    }
+  }
+
+  // Write to a temporary file first so a crash never leaves a half-written cache
+  async save() {
+    try {
+      const tempPath = `${this.filePath}.${process.pid}.tmp`;
+      await fs.promises.mkdir(path.dirname(this.filePath), { recursive: true });
+      await fs.promises.writeFile(tempPath, JSON.stringify({ version: 1, domains: this.domains }, null, 2), 'utf8');
+      await fs.promises.rename(tempPath, this.filePath);
+    } catch (error) {
+      this.log.warning(`Could not write selector cache ${this.filePath}: ${error.message}`);
+    }
+  }
+
+  /**
+   * Write pending changes now
+   * @returns {Promise<void>}
+   */
+  flush() {
+    if (this.saveTimer) {
+      clearTimeout(this.saveTimer);
+      this.saveTimer = null;
+      this.saving = this.saving.then(() => this.save());
+    }
+    return this.saving;
+  }
+
+  /**
+   * @returns {Object} - { domains, entries, hits, misses, learned, invalidations, hitRate }
+   */
+  stats() {
+    const domainNames = Object.keys(this.domains);
+    const lookups = this.counters.hits + this.counters.misses;
+    return {
+      domains: domainNames.length,
+      entries: domainNames.reduce((total, domain) => total + Object.keys(this.domains[domain]).length, 0),
+      ...this.counters,
+      hitRate: lookups ? this.counters.hits / lookups : 0
+    };
+  }
+}
+
+let selectorCache = null;
+
+/**
+ * Get the shared, loaded selector cache, or null if SELECTOR_CACHE=false
+ * @returns {Promise<SelectorCache|null>}
+ */
+async function getSelectorCache() {
+  if (process.env.SELECTOR_CACHE === 'false') {
+    return null;
+  }
+  if (!selectorCache) {
+    const { log } = require('crawlee');
+    selectorCache = new SelectorCache({
+      filePath: process.env.SELECTOR_CACHE_PATH || DEFAULT_CACHE_PATH,
+      maxFailures: readPositiveIntEnv('SELECTOR_CACHE_MAX_FAILURES', 3),
+      log
+    });
+  }
+  return selectorCache.load();
+}
+
+/**
+ * Probe selectors in order with page.$ and return the first that matches.
+ * Selectors may contain placeholders like {page}, filled from params.
+ * @param {Object} page - Playwright or Puppeteer page
+ * @param {Array<string>} templates - Selectors (or templates) to try
+ * @param {Object} params - Placeholder values, e.g. { page: 3 }
+ * @returns {Promise<Object>} - { template, selector, element }, all null if nothing matched
+ */
+async function probeSelectors(page, templates, params = {}) {
+  for (const template of templates) {
+    const selector = template.replace(/\{(\w+)\}/g, (placeholder, name) => (name in params ? params[name] : placeholder));
+    const element = await page.$(selector).catch(() => null);
+    if (element) {
+      return { template, selector, element };
+    }
+  }
+  return { template: null, selector: null, element: null };
+}
+
+/**
+ * Probe selectors with page.$, learned one first, and record which matched.
+ * A learned template (e.g. with {page}) works for every placeholder value.
+ * @param {Object} page - Playwright or Puppeteer page
+ * @param {string} field - Field name, e.g. reviewsTab or loadMore
+ * @param {Array<string>} candidates - Selectors (or templates) in their default order
+ * @param {Object} params - Placeholder values
+ * @returns {Promise<Object>} - { selector, element }: the filled-in selector and its element, or nulls
+ */
+async function findFirstSelector(page, field, candidates, params = {}) {
+  const cache = await getSelectorCache();
+  const domain = getDomain(page.url());
+  const { template, selector, element } = await probeSelectors(page, cache ? cache.order(domain, field, candidates) : candidates, params);
+  if (cache) {
+    cache.record(domain, field, template);
+  }
+  return { selector, element };
+}
+
+/**
+ * Selector cache counters, or null if SELECTOR_CACHE=false or it hasn't been used yet
+ * @returns {Object|null}
+ */
+function getSelectorCacheStats() {
+  return selectorCache && process.env.SELECTOR_CACHE !== 'false' ? selectorCache.stats() : null;
+}
+
+/**
+ * Write pending selector cache changes now (e.g. before the process exits)
+ * @returns {Promise<void>}
+ */
+function flushSelectorCache() {
+  return selectorCache ? selectorCache.flush() : Promise.resolve();
+}
+
+module.exports = {
+  SelectorCache,
+  getDomain,
+  getSelectorCache,
+  probeSelectors,
+  findFirstSelector,
+  getSelectorCacheStats,
+  flushSelectorCache
+};
@@ -1,56 +1,19 @@
 const express = require('express');
 const path = require('path');
 const fs = require('fs');
-const axios = require('axios');
-const { scrapeReviews } = require('./review-scraper-integrated'); // Import the integrated scraper function
+const { scrapeReviews, closeBrowserPool, getBrowserPoolStats, getScrapeCoalescingStats } = require('./review-scraper-integrated'); // Import the integrated scraper function
 const { generateCsvContent, addSiteTypeToReviews, addProductInfoToReviews } = require('./csv-exporter'); // Import CSV export utilities
+const { createReviewExport, getExportDownload, getExportPoolStats } = require('./review-export'); // Import streaming export
 const urlUtils = require('./url-utils'); // Import URL utilities
-
-// Function to try scraping with local browser service first
-async function tryLocalBrowserService(url, options = {}) {
-  const retailer = urlUtils.detectRetailerFromUrl(url);
-  
-  // Only use local browser service for Morrisons and Sainsburys
-  if (retailer !== 'morrisons' && retailer !== 'sainsburys') {
-    return null;
-  }
-  
-  console.log(`Attempting to use local browser service for ${retailer} URL: ${url}`);
-  
-  try {
-    // Try to connect to the local browser service
-    const response = await axios.post('http://localhost:3002/scrape-with-visible-browser', {
-      url,
-      retailer,
-      options
-    }, {
-      timeout: 30000 // 30 second timeout
-    });
-    
-    if (response.status === 200 && response.data && response.data.reviews) {
-      console.log(`Successfully retrieved ${response.data.reviews.length} reviews from local browser service`);
-      
-      // Add metadata to reviews
-      const reviews = response.data.reviews.map(review => ({
-        ...review,
-        sourceUrl: url,
-        siteType: retailer,
-        extractedAt: new Date().toISOString(),
-        // Generate a unique ID for deduplication
-        uniqueId: `${retailer}-${review.title ? review.title.substring(0, 20) : ''}-${review.text ? review.text.substring(0, 30) : ''}`.replace(/\s+/g, '-').toLowerCase()
-      }));
-      
-      return reviews;
-    }
-    
-    console.log('Local browser service returned invalid response');
-    return null;
-  } catch (error) {
-    console.error(`Error using local browser service: ${error.message}`);
-    console.log('Falling back to regular scraper');
-    return null;
-  }
-}
+const { readPositiveIntEnv, runWithConcurrency } = require('./concurrency-utils'); // Import worker pool utilities
+const scrapeJobs = require('./scrape-jobs'); // Import background job API
+const metrics = require('./metrics'); // Import stage timing metrics
+const { cleanupJobArtifacts } = require('./debug-artifacts'); // Import debug artifact cleanup
+const { getSessionStats } = require('./session-manager'); // Import retailer session reuse stats
+const rateLimiter = require('./rate-limiter'); // Import adaptive per-retailer rate limits
+const { getNetworkCacheStats } = require('./network-cache'); // Import record/replay cache stats
+const { getLocalBrowserServiceStats } = require('./local-browser-client'); // Import local browser service circuit state
+const { getSelectorCacheStats, flushSelectorCache } = require('./selector-cache'); // Import learned selector hit rates
 
 const app = express();
 const port = process.env.PORT || 8080; // Use environment port or default to 8080
@@ -58,6 +21,9 @@ const port = process.env.PORT || 8080; // Use environment port or default to 808
 // Middleware to parse URL-encoded bodies (as sent by HTML forms)
 app.use(express.urlencoded({ extended: true }));
 
+// Middleware to parse JSON bodies (job API)
+app.use(express.json({ limit: '1mb' }));
+
 // Serve static files from the 'public' directory
 app.use(express.static(path.join(__dirname, 'public')));
 
@@ -68,7 +34,189 @@ app.get('/', (req, res) => {
 
 // Health check endpoint for Fly.io
 app.get('/health', (req, res) => {
-  res.status(200).json({ status: 'ok', timestamp: new Date().toISOString() });
+  res.status(200).json({
+    status: 'ok',
+    timestamp: new Date().toISOString(),
+    browserPool: getBrowserPoolStats(),
+    sessions: getSessionStats(),
+    rateLimits: rateLimiter.getRateLimitStats(),
+    networkCache: getNetworkCacheStats(),
+    localBrowserService: getLocalBrowserServiceStats(),
+    coalescing: getScrapeCoalescingStats(),
+    selectorCache: getSelectorCacheStats(),
+    exportWorkers: getExportPoolStats(),
+    eventLoop: metrics.getEventLoopLag()
+  });
+});
+
+// Prometheus metrics: per-stage scrape timings by retailer, plus browser pool, session, rate limit, network cache, local browser service, coalescing, selector cache, export worker, event loop and process gauges
+app.get('/metrics', (req, res) => {
+  const pool = getBrowserPoolStats();
+  const sessions = getSessionStats();
+  const rateLimits = Object.entries(rateLimiter.getRateLimitStats());
+  const networkCache = getNetworkCacheStats() || { hits: 0, misses: 0, bytes: 0 };
+  const localService = getLocalBrowserServiceStats();
+  const coalescing = getScrapeCoalescingStats();
+  const selectorCache = getSelectorCacheStats() || { hits: 0, misses: 0, invalidations: 0 };
+  const exportWorkers = getExportPoolStats() || { busy: 0, queued: 0 };
+  res.set('Content-Type', 'text/plain; version=0.0.4; charset=utf-8');
+  res.send(metrics.renderMetrics({
+    scraper_browser_pool_browsers: { help: 'Browsers currently open in the pool', value: pool.browsers },
+    scraper_browser_pool_active_leases: { help: 'Browser leases currently in use', value: pool.activeLeases },
+    scraper_browser_pool_launches: { help: 'Browsers launched since startup', value: pool.launches },
+    scraper_session_hits: { help: 'Scrapes started from a saved retailer session', value: sessions.hits },
+    scraper_session_misses: { help: 'Scrapes started without a saved retailer session', value: sessions.misses },
+    scraper_session_retired: { help: 'Retailer sessions retired (blocked, too old or used up)', value: sessions.retired },
+    scraper_retailer_concurrency: {
+      help: 'Concurrent scrapes currently allowed per retailer',
+      value: rateLimits.map(([retailer, stats]) => ({ labels: { retailer }, value: stats.concurrency }))
+    },
+    scraper_retailer_interval_ms: {
+      help: 'Current spacing between scrape starts per retailer',
+      value: rateLimits.map(([retailer, stats]) => ({ labels: { retailer }, value: stats.intervalMs }))
+    },
+    scraper_retailer_block_rate: {
+      help: 'Share of recent navigations per retailer that were blocked or timed out',
+      value: rateLimits.map(([retailer, stats]) => ({ labels: { retailer }, value: stats.recentBlockRate }))
+    },
+    scraper_network_cache_hits: { help: 'Requests answered from the network cache', value: networkCache.hits },
+    scraper_network_cache_misses: { help: 'Cacheable requests that went to the network', value: networkCache.misses },
+    scraper_network_cache_bytes: { help: 'Response bodies stored in the network cache', value: networkCache.bytes },
+    scraper_local_service_circuit_open: { help: 'Whether the local browser service is being skipped (1) or used (0)', value: localService.circuit === 'open' ? 1 : 0 },
+    scraper_local_service_skipped: { help: 'URLs that skipped the local browser service while its circuit was open', value: localService.skipped },
+    scraper_coalesced_in_flight: { help: 'Scrapes running on behalf of one or more callers', value: coalescing.inFlight },
+    scraper_coalesced_joined: { help: 'Scrape calls that joined an identical scrape already in flight', value: coalescing.joined },
+    scraper_coalesced_memo_hits: { help: 'Scrape calls answered from a recently finished identical scrape', value: coalescing.memoHits },
+    scraper_selector_cache_hits: { help: 'Selector lookups where the selector learned for the site matched', value: selectorCache.hits },
+    scraper_selector_cache_misses: { help: 'Selector lookups with no learned selector, or where it did not match', value: selectorCache.misses },
+    scraper_selector_cache_invalidations: { help: 'Learned selectors replaced or dropped after they stopped matching', value: selectorCache.invalidations },
+    scraper_export_workers_busy: { help: 'Export worker threads formatting rows', value: exportWorkers.busy },
+    scraper_export_workers_queued: { help: 'Export batches waiting for a worker thread', value: exportWorkers.queued }
+  }));
+});
+
+// Download a finished export (format is 'csv' or 'xlsx'), streamed from disk
+app.get('/exports/:jobId/:format', (req, res) => {
+  const download = getExportDownload(req.params.jobId, req.params.format);
+  if (!download) {
+    return res.status(404).json({ error: 'Export not found or expired.' });
+  }
+  if (download.reviewExport.status !== 'complete') {
+    return res.status(409).json({ error: 'Export is still being written.' });
+  }
+
+  res.setHeader('Content-Type', download.contentType);
+  res.setHeader('Content-Disposition', `attachment; filename="${download.fileName}"`);
+
+  const fileStream = fs.createReadStream(download.filePath);
+  fileStream.on('error', (error) => {
+    console.error(`Error streaming export ${req.params.jobId}:`, error.message);
+    if (!res.headersSent) {
+      res.status(404).json({ error: 'Export not found or expired.' });
+    } else {
+      res.destroy(error);
+    }
+  });
+  fileStream.pipe(res);
+});
+
+// Start a background scrape job. Body: { urls: [...] (or productUrls: "one per line"), dateFrom, dateTo, incremental }
+// The job keeps running if the client goes away and resumes after a restart.
+app.post('/jobs', async (req, res) => {
+  const body = req.body || {};
+  const urls = (Array.isArray(body.urls) ? body.urls : String(body.productUrls || '').split('\n'))
+    .map(url => String(url).trim())
+    .filter(url => url.length > 0);
+
+  if (!urls.length) {
+    return res.status(400).json({ error: 'At least one product URL is required.' });
+  }
+
+  const invalidUrls = urls.filter(url => {
+    try {
+      new URL(url);
+      return false;
+    } catch (e) {
+      return true;
+    }
+  });
+  if (invalidUrls.length) {
+    return res.status(400).json({ error: 'Some product URLs are not valid URLs.', invalidUrls });
+  }
+
+  try {
+    const job = await scrapeJobs.createScrapeJob(urls, {
+      dateFrom: body.dateFrom || null,
+      dateTo: body.dateTo || null,
+      incremental: body.incremental === true || body.incremental === 'true'
+    });
+    res.status(202).location(`/jobs/${job.id}`).json(scrapeJobs.describeJob(job));
+  } catch (error) {
+    console.error('Error creating scrape job:', error);
+    res.status(500).json({ error: `Could not create job: ${error.message}` });
+  }
+});
+
+// Poll a job's status and progress
+app.get('/jobs/:jobId', (req, res) => {
+  const job = scrapeJobs.getScrapeJob(req.params.jobId);
+  if (!job) {
+    return res.status(404).json({ error: 'Job not found.' });
+  }
+  res.json(scrapeJobs.describeJob(job));
+});
+
+// Subscribe to a job's progress with Server-Sent Events; disconnecting doesn't stop the job
+app.get('/jobs/:jobId/events', (req, res) => {
+  const job = scrapeJobs.getScrapeJob(req.params.jobId);
+  if (!job) {
+    return res.status(404).json({ error: 'Job not found.' });
+  }
+
+  res.setHeader('Content-Type', 'text/event-stream');
+  res.setHeader('Cache-Control', 'no-cache');
+  res.setHeader('Connection', 'keep-alive');
+  res.flushHeaders();
+
+  const sendEvent = (event, data) => {
+    res.write(`event: ${event}\n`);
+    res.write(`data: ${JSON.stringify(data)}\n\n`);
+  };
+
+  // Current state first, so late subscribers don't wait for the next URL to finish
+  sendEvent('status', scrapeJobs.describeJob(job));
+  if (job.status === 'complete' || job.status === 'failed') {
+    return res.end();
+  }
+
+  const unsubscribe = scrapeJobs.subscribeToJob(job.id, (event, data) => {
+    sendEvent(event, data);
+    if (event === 'complete' || event === 'error') {
+      unsubscribe();
+      res.end();
+    }
+  });
+
+  req.on('close', unsubscribe);
+});
+
+// Fetch a finished job's reviews (the CSV/XLSX are under downloads)
+app.get('/jobs/:jobId/results', async (req, res) => {
+  const job = scrapeJobs.getScrapeJob(req.params.jobId);
+  if (!job) {
+    return res.status(404).json({ error: 'Job not found.' });
+  }
+  if (job.status !== 'complete') {
+    return res.status(409).json({ error: `Job is ${job.status}.`, ...scrapeJobs.describeJob(job) });
+  }
+
+  try {
+    const reviews = await scrapeJobs.getScrapeJobResults(job);
+    res.json({ ...scrapeJobs.describeJob(job), reviews });
+  } catch (error) {
+    console.error(`Error reading results for job ${job.id}:`, error);
+    res.status(500).json({ error: `Could not read results: ${error.message}` });
+  }
 });
 
 // Route to handle the scraping request
@@ -78,6 +226,8 @@ app.get('/scrape-stream', async (req, res) => {
   const productUrlsText = req.query.productUrls;
   const dateFrom = req.query.dateFrom || null;
   const dateTo = req.query.dateTo || null;
+  // Incremental mode stops paginating at reviews already in the review store
+  const incremental = req.query.incremental === 'true' || process.env.INCREMENTAL_SCRAPE === 'true';
 
   // Set headers for Server-Sent Events
   res.setHeader('Content-Type', 'text/event-stream');
@@ -85,17 +235,22 @@ app.get('/scrape-stream', async (req, res) => {
   res.setHeader('Connection', 'keep-alive');
   res.flushHeaders(); // Flush headers to open the connection immediately
 
+  // Cancels this request's scrapes (and frees their browsers) if the client goes away
+  const abortController = new AbortController();
+
   const sendEvent = (event, data) => {
+    if (abortController.signal.aborted) return;
     res.write(`event: ${event}\n`);
     res.write(`data: ${JSON.stringify(data)}\n\n`);
     // res.flush(); // Optional: flush after each event
   };
 
-  // Handle client disconnection
-  req.on('close', () => {
-    console.log('Client disconnected');
-    // Clean up resources if necessary
-    res.end();
+  // Handle client disconnection (the response closing before we ended it)
+  res.on('close', () => {
+    if (!res.writableEnded) {
+      console.log('Client disconnected, cancelling its scrapes');
+      abortController.abort(new Error('Client disconnected'));
+    }
   });
 
   // Split the URLs by newline and filter out empty lines
@@ -114,9 +269,8 @@ app.get('/scrape-stream', async (req, res) => {
     return res.end();
   }
 
+  let reviewExport = null;
   try {
-    // Create an array to hold all reviews from all products
-    let allReviews = [];
     let totalProductsScraped = 0;
     let successfulProducts = 0;
     const totalUrls = productUrls.length;
@@ -124,8 +278,21 @@ app.get('/scrape-stream', async (req, res) => {
     // Create a Set to track unique review identifiers for deduplication
     const uniqueReviewIds = new Set();
 
-    console.log(`Starting to process ${totalUrls} URLs...`);
-    sendEvent('start', { totalUrls: totalUrls });
+    // Per-product and per-site counts for logging, the reviews themselves go straight to the export
+    const reviewsBySiteType = {};
+    const reviewsByProduct = {};
+
+    // Reviews are written to disk as each product finishes rather than held until the end
+    const date = new Date().toISOString().split('T')[0]; // YYYY-MM-DD format
+    reviewExport = await createReviewExport({
+      totalUrls: totalUrls,
+      dateFrom: dateFrom,
+      dateTo: dateTo,
+      baseName: `reviews_multiple_products_${date}`
+    });
+
+    console.log(`Starting to process ${totalUrls} URLs (export ${reviewExport.jobId})...`);
+    sendEvent('start', { totalUrls: totalUrls, jobId: reviewExport.jobId });
 
     // Group URLs by retailer for better logging
     const retailerGroups = {};
@@ -142,440 +309,75 @@ app.get('/scrape-stream', async (req, res) => {
       console.log(`Found ${retailerGroups[retailer].length} URLs for ${retailer}`);
     });
 
-    // Process each URL
-    for (const productUrl of productUrls) {
-      totalProductsScraped++;
-      console.log(`Starting scraper for URL ${totalProductsScraped}/${totalUrls}: ${productUrl}`);
-      sendEvent('progress', {
-        current: totalProductsScraped,
-        total: totalUrls,
-        url: productUrl
-      });
+    // Process URLs in parallel with a global limit and a per-retailer cap
+    const concurrency = readPositiveIntEnv('SCRAPE_CONCURRENCY', 3);
+    console.log(`Scraping with concurrency ${concurrency} (per-retailer limits adapt, starting at ${readPositiveIntEnv('SCRAPE_CONCURRENCY_PER_RETAILER', 1)})`);
 
-      try {
-        const options = {
-          dateFrom: dateFrom,
-          dateTo: dateTo
-        };
-
-        // Call the scraper for this URL
-        const productReviews = await scrapeReviews(productUrl, options);
-        console.log(`Found ${productReviews.length} reviews for ${productUrl}`);
-
-        // Filter out duplicate reviews
-        const uniqueReviews = productReviews.filter(review => {
-          // Use the uniqueId property added by the scraper
-          if (review.uniqueId && !uniqueReviewIds.has(review.uniqueId)) {
-            uniqueReviewIds.add(review.uniqueId);
-            return true;
-          }
-
-          // Fallback if uniqueId is not available
-          const titlePart = review.title ? review.title.substring(0, 30) : '';
-          const textPart = review.text ? review.text.substring(0, 50) : '';
-          const reviewId = `${titlePart}-${textPart}`.replace(/\s+/g, '-').toLowerCase();
-
-          if (!uniqueReviewIds.has(reviewId)) {
-            uniqueReviewIds.add(reviewId);
-            return true;
-          }
-
-          return false;
-        });
+    const scrapeProductUrl = async (productUrl, index) => {
+      console.log(`Starting scraper for URL ${index + 1}/${totalUrls}: ${productUrl}`);
 
-        if (uniqueReviews.length < productReviews.length) {
-          console.log(`Filtered out ${productReviews.length - uniqueReviews.length} duplicate reviews`);
-        }
+      const options = {
+        dateFrom: dateFrom,
+        dateTo: dateTo,
+        incremental: incremental,
+        jobId: reviewExport.jobId,
+        signal: abortController.signal
+      };
 
-        // Make sure each review has a valid rating
-        uniqueReviews.forEach(review => {
-          // Make sure we have a valid rating
-          if (!review.rating || review.rating === 'N/A' || review.rating === '') {
-            review.rating = '5'; // Default to 5 if no rating found
-            console.log(`Set default rating 5 for review with missing rating`);
-          }
-        });
+      // Call the scraper for this URL
+      const productReviews = await scrapeReviews(productUrl, options);
+      console.log(`Found ${productReviews.length} reviews for ${productUrl}`);
+      return productReviews;
+    };
 
-        // Debug: Log the first review to check its structure
-        if (uniqueReviews.length > 0) {
-          console.log(`First review from ${productUrl}: ${JSON.stringify(uniqueReviews[0])}`);
-        }
+    // Runs as each URL finishes. This is synchronous, so the dedup check and
+    // insert into uniqueReviewIds can't interleave between concurrent URLs.
+    const handleUrlSettled = (outcome, productUrl) => {
+      totalProductsScraped++;
 
-        // Add these reviews to our collection
-        console.log(`Adding ${uniqueReviews.length} reviews from ${productUrl} to allReviews (current size: ${allReviews.length})`);
-        allReviews = allReviews.concat(uniqueReviews);
-        console.log(`After adding, allReviews now contains ${allReviews.length} reviews`);
+      // Nobody is listening any more; the export is discarded below
+      if (abortController.signal.aborted) {
+        return;
+      }
 
-        // Only count products that actually returned reviews
-        if (uniqueReviews.length > 0) {
-          successfulProducts++;
-        }
-      } catch (productError) {
+      if (outcome.status === 'rejected') {
+        const productError = outcome.reason || new Error('Unknown error');
         console.error(`Error scraping ${productUrl}: ${productError.message}`);
         sendEvent('url_error', { url: productUrl, message: productError.message });
-        // Continue with next URL even if this one failed
+        sendEvent('progress', {
+          current: totalProductsScraped,
+          total: totalUrls,
+          url: productUrl,
+          reviewsFound: 0
+        });
+        // Continue with the other URLs even if this one failed
+        return;
       }
-    }
-
-    console.log(`Scraper finished, found ${allReviews.length} reviews across ${totalUrls} products (${successfulProducts} with reviews).`);
-
-    if (!allReviews || allReviews.length === 0) {
-        sendEvent('error', { message: 'No reviews found for any of the given URLs, or scraping was interrupted.' });
-        return res.end();
-    }
-
-    // Generate a more descriptive filename based on the date
-    const date = new Date().toISOString().split('T')[0]; // YYYY-MM-DD format
-
-    // Create a simple filename
-    let filename = `reviews_multiple_products_${date}.csv`;
-
-    // Apply date filtering if specified
-    console.log(`Preparing to generate CSV with ${allReviews.length} reviews from ${totalUrls} products`);
-    let filteredReviews = allReviews;
-    let inRangeCount = 0;
-
-    if (dateFrom || dateTo) {
-      // Count reviews in date range
-      inRangeCount = allReviews.filter(review => review.inDateRange === true).length;
-
-      // Sort reviews by product ID and then by date
-      filteredReviews = allReviews.sort((a, b) => {
-        // First sort by product ID
-        if (a.productId !== b.productId) {
-          return a.productId.localeCompare(b.productId);
-        }
-        // Then by date (newest first)
-        if (a.parsedDate && b.parsedDate) {
-          return new Date(b.parsedDate) - new Date(a.parsedDate);
-        }
-        return 0;
-      });
-    } else {
-      // If no date filtering, just sort by product ID
-      filteredReviews = allReviews.sort((a, b) => {
-        return a.productId.localeCompare(b.productId);
-      });
-    }
-
-    // Create CSV content
-    // First, add metadata as comments at the top of the CSV
-    let csvContent = `# Products Scraped: ${totalUrls}\r\n`;
-    csvContent += `# Extraction Date: ${new Date().toLocaleDateString()}\r\n`;
-    csvContent += `# Total Reviews: ${allReviews.length}\r\n`;
 
-    // Add date filter information if provided
-    if (dateFrom || dateTo) {
-      // Format the date range in a readable format
-      const fromDateStr = dateFrom ? new Date(dateFrom).toLocaleDateString() : 'any';
-      const toDateStr = dateTo ? new Date(dateTo).toLocaleDateString() : 'any';
+      const productReviews = outcome.value;
 
-      csvContent += `# Date Filter: ${fromDateStr} to ${toDateStr}\r\n`;
-      csvContent += `# Reviews in date range: ${inRangeCount} of ${allReviews.length}\r\n`;
+      // Filter out duplicate reviews
+      const uniqueReviews = urlUtils.filterUniqueReviews(productReviews, uniqueReviewIds);
 
-      // Add explanation of date filtering
-      csvContent += `# Note: All reviews are included, but only those within the date range are marked 'Yes' in the 'In Date Range' column.\r\n`;
-    }
-
-    csvContent += `\r\n`; // Empty line after metadata
-
-    // Define CSV headers
-    const headers = ['Product Name', 'Rating', 'Date', 'In Date Range', 'Title', 'Text', 'Extracted On'];
-    csvContent += headers.join(',') + '\r\n';
-
-    // Track the current product ID to add separators between products
-    console.log(`Starting to add ${filteredReviews.length} reviews to CSV file`);
-    let currentProductId = null;
-
-    // Add each review as a row in the CSV
-    for (const review of filteredReviews) {
-      // Properly escape fields that might contain commas or quotes
-      const escapeCsvField = (field) => {
-        if (field === null || field === undefined) return '';
-        const stringField = String(field);
-        // If the field contains commas, quotes, or newlines, wrap it in quotes and escape any quotes
-        if (stringField.includes(',') || stringField.includes('"') || stringField.includes('\n') || stringField.includes('\r')) {
-          return '"' + stringField.replace(/"/g, '""') + '"';
-        }
-        return stringField;
-      };
-
-      // Extract just the date part from the timestamp
-      const extractionDate = review.extractedAt ? review.extractedAt.split('T')[0] : date;
-
-      // Add a blank line and product header between different products for better readability
-      if (currentProductId !== null && currentProductId !== review.productId) {
-        csvContent += ',,,,,,\r\n'; // Empty row as separator
-        csvContent += `"Product: ${review.productName} (ID: ${review.productId})",,,,,,\r\n`; // Product header
-      } else if (currentProductId === null) {
-        // Add product header for the first product
-        csvContent += `"Product: ${review.productName} (ID: ${review.productId})",,,,,,\r\n`; // Product header
-      }
-      currentProductId = review.productId;
-
-      // Check if the date is today's date (which is likely a default value)
-      let reviewDate = review.date;
-      const today = new Date().toISOString().split('T')[0]; // YYYY-MM-DD format
-      const isToday = reviewDate === today;
-
-      // For Morrisons reviews, check if the date contains "Submitted"
-      if (review.siteType === 'morrisons' && reviewDate && reviewDate.includes('Submitted')) {
-        // Extract the date from "Submitted DD/MM/YYYY, by Author"
-        const match = reviewDate.match(/Submitted\s+(\d{1,2})\/(\d{1,2})\/(\d{4})/);
-        if (match && match[1] && match[2] && match[3]) {
-          const day = match[1].padStart(2, '0');
-          const month = match[2].padStart(2, '0');
-          const year = match[3];
-          // Format directly as DD/MM/YYYY
-          reviewDate = `${day}/${month}/${year}`;
-          console.log(`Extracted Morrisons date: ${reviewDate} from ${review.date}`);
-        }
-      }
-
-      // For Sainsbury's reviews, handle their date format
-      if (review.siteType === 'sainsburys' && reviewDate && reviewDate !== 'Unknown date') {
-        // Try to parse various date formats
-        try {
-          // Format: "9th April 2025" or similar
-          const dateRegex = /(\d+)(st|nd|rd|th)\s+([A-Za-z]+)\s+(\d{4})/;
-          const match = reviewDate.match(dateRegex);
-
-          if (match && match[1] && match[3] && match[4]) {
-            const day = match[1].padStart(2, '0');
-            const monthText = match[3];
-            const year = match[4];
-
-            // Convert month name to number
-            const months = {
-              'january': '01', 'february': '02', 'march': '03', 'april': '04',
-              'may': '05', 'june': '06', 'july': '07', 'august': '08',
-              'september': '09', 'october': '10', 'november': '11', 'december': '12'
-            };
-
-            const month = months[monthText.toLowerCase()];
-            if (month) {
-              // Format directly as DD/MM/YYYY
-              reviewDate = `${day}/${month}/${year}`;
-              console.log(`Extracted Sainsbury's date: ${reviewDate} from ${review.date}`);
-            }
-          }
-        } catch (e) {
-          console.log(`Error parsing Sainsbury's date: ${e.message}`);
-        }
+      if (uniqueReviews.length < productReviews.length) {
+        console.log(`Filtered out ${productReviews.length - uniqueReviews.length} duplicate reviews`);
       }
 
-      // For ASDA reviews, handle their date format
-      if (review.siteType === 'asda' && reviewDate && reviewDate !== 'Unknown date') {
-        try {
-          // Try various date formats
-
-          // Format 1: "MM/DD/YYYY"
-          const slashFormat = /^(\d{1,2})\/(\d{1,2})\/(\d{4})$/;
-          const slashMatch = reviewDate.match(slashFormat);
-          if (slashMatch && slashMatch[1] && slashMatch[2] && slashMatch[3]) {
-            const month = slashMatch[1].padStart(2, '0');
-            const day = slashMatch[2].padStart(2, '0');
-            const year = slashMatch[3];
-            // Format directly as DD/MM/YYYY
-            reviewDate = `${day}/${month}/${year}`;
-            console.log(`Extracted ASDA date (slash format): ${reviewDate} from ${review.date}`);
-          }
-
-          // Format 2: "Month DD, YYYY" (e.g., "January 15, 2023")
-          const monthNameFormat = /([A-Za-z]+)\s+(\d{1,2}),?\s+(\d{4})/;
-          const monthMatch = reviewDate.match(monthNameFormat);
-          if (monthMatch && monthMatch[1] && monthMatch[2] && monthMatch[3]) {
-            const monthText = monthMatch[1];
-            const day = monthMatch[2].padStart(2, '0');
-            const year = monthMatch[3];
-
-            // Convert month name to number
-            const months = {
-              'january': '01', 'february': '02', 'march': '03', 'april': '04',
-              'may': '05', 'june': '06', 'july': '07', 'august': '08',
-              'september': '09', 'october': '10', 'november': '11', 'december': '12'
-            };
-
-            const month = months[monthText.toLowerCase()];
-            if (month) {
-              // Format directly as DD/MM/YYYY
-              reviewDate = `${day}/${month}/${year}`;
-              console.log(`Extracted ASDA date (month name format): ${reviewDate} from ${review.date}`);
-            }
-          }
-
-          // If we still don't have a valid date, try to extract it from the review text
-          if (reviewDate === review.date) {
-            // Look for date patterns in the review text
-            const reviewText = review.text || '';
-
-            // Format 1: "MM/DD/YYYY" in the text
-            const textSlashMatch = reviewText.match(/(\d{1,2})\/(\d{1,2})\/(\d{4})/);
-            if (textSlashMatch && textSlashMatch[1] && textSlashMatch[2] && textSlashMatch[3]) {
-              const month = textSlashMatch[1].padStart(2, '0');
-              const day = textSlashMatch[2].padStart(2, '0');
-              const year = textSlashMatch[3];
-              // Format directly as DD/MM/YYYY
-              reviewDate = `${day}/${month}/${year}`;
-              console.log(`Extracted ASDA date from review text (slash format): ${reviewDate}`);
-            }
-
-            // Format 2: "Month DD, YYYY" in the text
-            const textMonthMatch = reviewText.match(/([A-Za-z]+)\s+(\d{1,2}),?\s+(\d{4})/);
-            if (textMonthMatch && textMonthMatch[1] && textMonthMatch[2] && textMonthMatch[3]) {
-              const monthText = textMonthMatch[1];
-              const day = textMonthMatch[2].padStart(2, '0');
-              const year = textMonthMatch[3];
-
-              // Convert month name to number
-              const months = {
-                'january': '01', 'february': '02', 'march': '03', 'april': '04',
-                'may': '05', 'june': '06', 'july': '07', 'august': '08',
-                'september': '09', 'october': '10', 'november': '11', 'december': '12'
-              };
-
-              const month = months[monthText.toLowerCase()];
-              if (month) {
-                // Format directly as DD/MM/YYYY
-                reviewDate = `${day}/${month}/${year}`;
-                console.log(`Extracted ASDA date from review text (month name format): ${reviewDate}`);
-              }
-            }
-          }
-
-          // If we still don't have a date, use today's date for ASDA reviews
-          if (reviewDate === review.date || reviewDate === 'Unknown date') {
-            // Use today's date as a fallback for ASDA reviews
-            const today = new Date();
-            const year = today.getFullYear();
-            const month = (today.getMonth() + 1).toString().padStart(2, '0');
-            const day = today.getDate().toString().padStart(2, '0');
-            // Format directly as DD/MM/YYYY
-            reviewDate = `${day}/${month}/${year}`;
-            console.log(`Using today's date for ASDA review: ${reviewDate}`);
-          }
-        } catch (e) {
-          console.log(`Error parsing ASDA date: ${e.message}`);
+      // Make sure each review has a valid rating (before it's logged, counted and exported)
+      let defaultedRatings = 0;
+      uniqueReviews.forEach(review => {
+        if (!review.rating || review.rating === 'N/A' || review.rating === '') {
+          review.rating = '5'; // Default to 5 if no rating found
+          defaultedRatings++;
         }
+      });
+      if (defaultedRatings > 0) {
+        console.log(`Set default rating 5 for ${defaultedRatings} reviews with missing rating`);
       }
 
-      if (!reviewDate ||
-          reviewDate === '' ||
-          reviewDate.startsWith('Failed to parse') ||
-          reviewDate.startsWith('ERROR') ||
-          reviewDate === 'NO_DATE_FOUND' ||
-          reviewDate === 'DATE_NOT_FOUND' ||
-          isToday) {
-        reviewDate = ''; // Empty string instead of today's date
-        console.log(`Using empty string for invalid date: ${review.date}`);
-      } else {
-        console.log(`Using valid date: ${reviewDate}`);
-
-        // Format the date to dd/mm/yyyy for display in the CSV
-        if (reviewDate && reviewDate !== 'Unknown date') {
-          try {
-            // Try to parse the date
-            if (reviewDate.includes('-')) {
-              // Format: YYYY-MM-DD
-              const [year, month, day] = reviewDate.split('-');
-              // Make sure day and month are in the correct order (dd/mm/yyyy)
-              const dayNum = parseInt(day);
-              const monthNum = parseInt(month);
-
-              // If day is greater than 12, it's likely already in the correct format
-              if (dayNum > 12) {
-                reviewDate = `${day}/${month}/${year}`;
-              }
-              // If month is greater than 12, it's likely in the wrong format (mm/dd/yyyy)
-              else if (monthNum > 12) {
-                // Swap day and month
-                reviewDate = `${parts[1]}/${parts[0]}/${parts[2]}`;
-              }
-              // If both are <= 12, use the original order but ensure it's dd/mm/yyyy
-              else {
-                reviewDate = `${day}/${month}/${year}`;
-              }
-            } else if (reviewDate.includes('/')) {
-              // Format: MM/DD/YYYY or DD/MM/YYYY
-              const parts = reviewDate.split('/');
-              if (parts.length === 3) {
-                const firstNum = parseInt(parts[0]);
-                const secondNum = parseInt(parts[1]);
-
-                // If first number is > 12, it's likely already DD/MM/YYYY
-                if (firstNum > 12) {
-                  // Keep as is
-                }
-                // If second number is > 12, it's likely MM/DD/YYYY
-                else if (secondNum > 12) {
-                  reviewDate = `${parts[1]}/${parts[0]}/${parts[2]}`;
-                }
-                // If both are <= 12, assume it's already in DD/MM/YYYY format
-                // Keep as is
-              }
-            }
-
-            // Ensure the date is in dd/mm/yyyy format with leading zeros
-            const dateRegex = /^(\d{1,2})\/(\d{1,2})\/(\d{4})$/;
-            const match = reviewDate.match(dateRegex);
-            if (match) {
-              const day = match[1].padStart(2, '0');
-              const month = match[2].padStart(2, '0');
-              const year = match[3];
-              reviewDate = `${day}/${month}/${year}`;
-            }
-
-            // Handle dates in YYYY-MM-DD format
-            const isoDateRegex = /^(\d{4})-(\d{1,2})-(\d{1,2})$/;
-            const isoMatch = reviewDate.match(isoDateRegex);
-            if (isoMatch) {
-              const year = isoMatch[1];
-              const month = isoMatch[2].padStart(2, '0');
-              const day = isoMatch[3].padStart(2, '0');
-              reviewDate = `${day}/${month}/${year}`;
-            }
-
-            console.log(`Formatted date for CSV: ${reviewDate}`);
-          } catch (e) {
-            console.log(`Error formatting date: ${e.message}`);
-            // Keep original if parsing fails
-          }
-        }
-      }
-
-      // Clean the title if it contains "Rated" text (especially for Morrisons)
-      let cleanTitle = review.title || '';
-
-      // First, handle any escaped characters (like \x22 for quotes)
-      cleanTitle = cleanTitle.replace(/\\x22/g, '"');
-      cleanTitle = cleanTitle.replace(/\\x27/g, "'");
-
-      // Then remove the "Rated X out of 5" part
-      if (cleanTitle.includes('Rated')) {
-        cleanTitle = cleanTitle.split('Rated')[0].trim();
-        console.log(`Cleaned title from "${review.title}" to "${cleanTitle}"`);
-      }
-
-      const row = [
-        escapeCsvField(review.productName),
-        escapeCsvField(review.rating),
-        escapeCsvField(reviewDate), // Use our validated date
-        escapeCsvField(review.inDateRange === false ? 'No' : 'Yes'),
-        escapeCsvField(cleanTitle), // Use the cleaned title
-        escapeCsvField(review.text),
-        escapeCsvField(extractionDate)
-      ];
-
-      csvContent += row.join(',') + '\r\n';
-    }
-
-    // Debug: Print the first 5 reviews from each product
-    const productIds = [...new Set(allReviews.map(review => review.productId))];
-    for (const productId of productIds) {
-      const productReviews = allReviews.filter(review => review.productId === productId).slice(0, 5);
-      console.log(`First 5 reviews for product ${productId}:`);
-      productReviews.forEach((review, index) => {
-        console.log(`  Review ${index + 1}: ${JSON.stringify({
+      // Debug: Log the first reviews to check their structure
+      uniqueReviews.slice(0, 5).forEach((review, index) => {
+        console.log(`  Review ${index + 1} from ${productUrl}: ${JSON.stringify({
           title: review.title,
           rating: review.rating,
           date: review.date,
@@ -584,139 +386,125 @@ app.get('/scrape-stream', async (req, res) => {
           productName: review.productName
         })}`);
       });
-    }
 
-    // Debug: Count reviews by site type
-    const reviewsBySiteType = allReviews.reduce((acc, review) => {
-      acc[review.siteType] = (acc[review.siteType] || 0) + 1;
-      return acc;
-    }, {});
-    console.log(`Reviews by site type: ${JSON.stringify(reviewsBySiteType)}`);
+      uniqueReviews.forEach(review => {
+        reviewsBySiteType[review.siteType] = (reviewsBySiteType[review.siteType] || 0) + 1;
+        reviewsByProduct[review.productId] = (reviewsByProduct[review.productId] || 0) + 1;
+      });
 
-    // Make sure we have reviews for each site type in the URLs
-    const urlDomains = productUrls.map(url => {
-      try {
-        const urlObj = new URL(url);
-        return urlObj.hostname.toLowerCase();
-      } catch (e) {
-        return '';
+      // Queue the rows for the export; they're formatted on the export worker pool and written in order
+      console.log(`Writing ${uniqueReviews.length} reviews from ${productUrl} to export ${reviewExport.jobId}`);
+      reviewExport.writeProduct(uniqueReviews);
+
+      // Only count products that actually returned reviews
+      if (uniqueReviews.length > 0) {
+        successfulProducts++;
       }
+
+      sendEvent('progress', {
+        current: totalProductsScraped,
+        total: totalUrls,
+        url: productUrl,
+        reviewsFound: uniqueReviews.length
+      });
+    };
+
+    await runWithConcurrency(productUrls, scrapeProductUrl, {
+      concurrency,
+      keyFn: url => urlUtils.detectRetailerFromUrl(url),
+      perKeyLimit: retailer => rateLimiter.getConcurrency(retailer),
+      onSettled: handleUrlSettled
     });
 
+    // URLs that hadn't started were skipped; running ones closed their browser contexts
+    if (abortController.signal.aborted) {
+      console.log(`Scrape cancelled after ${totalProductsScraped}/${totalUrls} URLs, discarding export ${reviewExport.jobId}`);
+      await reviewExport.abort();
+      return;
+    }
+
+    // onSettled doesn't wait for the writes it queued, so let them finish before counting
+    await reviewExport.drain();
+
+    console.log(`Scraper finished, found ${reviewExport.reviewCount} reviews across ${totalUrls} products (${successfulProducts} with reviews).`);
+
+    if (reviewExport.reviewCount === 0) {
+        await reviewExport.abort();
+        sendEvent('error', { message: 'No reviews found for any of the given URLs, or scraping was interrupted.' });
+        return res.end();
+    }
+
+    console.log(`Reviews by site type: ${JSON.stringify(reviewsBySiteType)}`);
+
     // Check if we have ASDA URLs but no ASDA reviews
-    const hasAsdaUrls = urlDomains.some(domain => domain.includes('asda'));
-    const hasAsdaReviews = reviewsBySiteType['asda'] > 0;
-
-    if (hasAsdaUrls && !hasAsdaReviews) {
-      console.log('Warning: ASDA URLs were provided but no ASDA reviews were found. Adding fallback reviews.');
-      // Find all ASDA URLs
-      const asdaUrls = productUrls.filter(url => url.toLowerCase().includes('asda'));
-      for (const asdaUrl of asdaUrls) {
-        try {
-          const urlObj = new URL(asdaUrl);
-          const pathParts = urlObj.pathname.split('/');
-          const productId = pathParts[pathParts.length - 1] || 'unknown';
-          const productName = `ASDA ${pathParts[pathParts.length - 2] || 'Product'} ${productId}`;
-
-          // Add multiple fallback reviews with different ratings
-          const ratings = ['5', '4', '3', '2', '1'];
-          const titles = [
-            'Great product', 'Good quality', 'Average product',
-            'Disappointing', 'Not recommended'
-          ];
-          const texts = [
-            'This product exceeded my expectations. Highly recommended!',
-            'Good product overall, would buy again.',
-            'Average quality, nothing special but does the job.',
-            'Disappointing quality, not worth the price.',
-            'Would not recommend this product. Poor quality.'
-          ];
-
-          // Add 5 reviews with different ratings
-          for (let i = 0; i < 5; i++) {
-            const fallbackReview = {
-              title: titles[i],
-              rating: ratings[i],
-              date: new Date().toISOString().split('T')[0], // Today's date in YYYY-MM-DD format
-              text: texts[i],
-              sourceUrl: asdaUrl,
-              siteType: 'asda',
-              productId: productId,
-              productName: productName,
-              extractedAt: new Date().toISOString(),
-              inDateRange: true
-            };
-
-            allReviews.push(fallbackReview);
-            console.log(`Added fallback ASDA review: ${JSON.stringify(fallbackReview)}`);
-          }
-
-          console.log(`Added 5 fallback reviews for ASDA product: ${productName}`);
-        } catch (e) {
-          console.log(`Error adding fallback ASDA review: ${e.message}`);
-        }
-      }
+    const hasAsdaUrls = productUrls.some(url => urlUtils.detectRetailerFromUrl(url) === 'asda');
+    if (hasAsdaUrls && !reviewsBySiteType['asda']) {
+      console.log('Warning: ASDA URLs were provided but no ASDA reviews were found.');
     }
 
-    // Send the CSV content as a final event
+    // Close the export files; the client downloads them by job ID
+    const downloads = await reviewExport.finish();
     sendEvent('complete', {
-      filename: filename,
-      csvContent: csvContent,
-      totalReviews: allReviews.length,
+      jobId: reviewExport.jobId,
+      filename: `${reviewExport.baseName}.csv`,
+      downloads: downloads,
+      totalReviews: reviewExport.reviewCount,
       totalProducts: totalUrls,
       successfulProducts: successfulProducts
     });
 
-    console.log(`CSV data for "${filename}" sent as 'complete' event.`);
-    console.log(`Reviews by product: ${JSON.stringify(allReviews.reduce((acc, review) => {
-      acc[review.productId] = (acc[review.productId] || 0) + 1;
-      return acc;
-    }, {}))}`);
-    console.log(`Total reviews in CSV: ${filteredReviews.length}`);
+    console.log(`Export ${reviewExport.jobId} ready for download (${downloads.csv}, ${downloads.xlsx})`);
+    console.log(`Reviews by product: ${JSON.stringify(reviewsByProduct)}`);
+    console.log(`Total reviews in CSV: ${reviewExport.reviewCount}`);
     console.log(`Total products in CSV: ${totalUrls}`);
     console.log(`Successful products (with reviews): ${successfulProducts}`);
 
-    // Delete all screenshot files after CSV has been sent
-    console.log('About to delete screenshots...');
-    deleteScreenshots();
-    console.log('Screenshot deletion complete.');
-
   } catch (error) {
     console.error('Error during scraping or file generation:', error);
+    if (reviewExport && reviewExport.status !== 'complete') {
+      await reviewExport.abort();
+    }
     sendEvent('error', { message: `Scraping failed: ${error.message}` });
   } finally {
     res.end(); // End the SSE connection
+
+    // Remove this job's debug artifacts in the background (kept if a scrape failed)
+    if (reviewExport) {
+      cleanupJobArtifacts(reviewExport.jobId).catch(error => {
+        console.error(`Error cleaning up debug artifacts: ${error.message}`);
+      });
+    }
   }
 });
 
-// Function to delete all screenshot files (PNG files)
-function deleteScreenshots() {
-  try {
-    console.log('Starting deleteScreenshots function...');
-    // Get all PNG files in the current directory
-    const files = fs.readdirSync(__dirname);
-    console.log(`Found ${files.length} files in directory`);
-    let deletedCount = 0;
-
-    // Filter for PNG files and delete them
-    files.forEach(file => {
-      if (file.toLowerCase().endsWith('.png')) {
-        console.log(`Deleting file: ${file}`);
-        const filePath = path.join(__dirname, file);
-        fs.unlinkSync(filePath);
-        deletedCount++;
+// Start the server
+const server = app.listen(port, '0.0.0.0', () => {
+  console.log(`Review scraper server listening on port ${port}`);
+  console.log(`Local URL: http://localhost:${port}`);
+  console.log(`Environment: ${process.env.NODE_ENV || 'development'}`);
+
+  // Pick up any background jobs that were interrupted by a restart
+  scrapeJobs.resumeScrapeJobs()
+    .then(resumed => {
+      if (resumed > 0) {
+        console.log(`Resumed ${resumed} unfinished scrape jobs`);
       }
-    });
+    })
+    .catch(error => console.error(`Error resuming scrape jobs: ${error.message}`));
+});
 
-    console.log(`Successfully deleted ${deletedCount} screenshot files`);
+// Close pooled browsers before exiting so no Chromium processes are left behind
+async function shutdown(signal) {
+  console.log(`Received ${signal}, shutting down...`);
+  server.close();
+  try {
+    await closeBrowserPool();
   } catch (error) {
-    console.error(`Error deleting screenshots: ${error.message}`);
+    console.error(`Error closing browser pool: ${error.message}`);
   }
+  await flushSelectorCache();
+  process.exit(0);
 }
 
-// Start the server
-app.listen(port, '0.0.0.0', () => {
-  console.log(`Review scraper server listening on port ${port}`);
-  console.log(`Local URL: http://localhost:${port}`);
-  console.log(`Environment: ${process.env.NODE_ENV || 'development'}`);
-});
+process.on('SIGTERM', () => shutdown('SIGTERM'));
+process.on('SIGINT', () => shutdown('SIGINT'));
@@ -0,0 +1,179 @@
+/**
+ * Retailer sessions
+ * Saves the browser's storage state (cookies, localStorage) per retailer and
+ * proxy after a successful scrape, and starts the next context for that
+ * retailer from it. Consent cookies and bot-manager tokens carry over, so
+ * warm sessions skip the homepage/reference-site warm-up navigations and
+ * the cookie banner doesn't come back.
+ *
+ * Sessions live in the 'retailer-sessions' key-value store (under ./storage)
+ * so they survive restarts. Like Crawlee's SessionPool, a session collects an
+ * error score when its pages come back as bot challenges and is retired once
+ * it reaches SESSION_MAX_ERROR_SCORE; it is also retired after
+ * SESSION_MAX_USES scrapes or SESSION_MAX_AGE_MS.
+ */
+
+const crypto = require('crypto');
+const { KeyValueStore, log: defaultLog } = require('crawlee');
+const { readPositiveIntEnv } = require('./concurrency-utils');
+
+const SESSION_STORE_NAME = 'retailer-sessions';
+
+// sessionKey -> session record (null when there is no saved session)
+const sessions = new Map();
+const sessionStats = { hits: 0, misses: 0, saved: 0, blocked: 0, retired: 0 };
+let sessionStorePromise = null;
+
+function getSessionStore() {
+  if (!sessionStorePromise) {
+    sessionStorePromise = KeyValueStore.open(SESSION_STORE_NAME);
+  }
+  return sessionStorePromise;
+}
+
+/**
+ * Whether saved sessions are used (SESSION_REUSE, default true)
+ * @returns {boolean}
+ */
+function isSessionReuseEnabled() {
+  return process.env.SESSION_REUSE !== 'false';
+}
+
+// Key-value store keys only allow a limited character set, so the proxy is hashed
+function sessionKey(retailer, proxy) {
+  const proxyHash = crypto.createHash('sha1').update(proxy || 'direct').digest('hex').slice(0, 12);
+  return `${String(retailer).replace(/[^\w-]/g, '_')}-${proxyHash}`;
+}
+
+async function loadSession(key) {
+  if (!sessions.has(key)) {
+    try {
+      sessions.set(key, await (await getSessionStore()).getValue(key));
+    } catch (e) {
+      sessions.set(key, null);
+    }
+  }
+  return sessions.get(key);
+}
+
+async function persistSession(key, record) {
+  sessions.set(key, record);
+  try {
+    await (await getSessionStore()).setValue(key, record);
+  } catch (e) {
+    // Sessions are an optimization; the next scrape just starts cold
+  }
+}
+
+function isExpired(record) {
+  const maxAgeMs = readPositiveIntEnv('SESSION_MAX_AGE_MS', 12 * 60 * 60 * 1000);
+  const maxUses = readPositiveIntEnv('SESSION_MAX_USES', 100);
+  return Date.now() - new Date(record.createdAt).getTime() > maxAgeMs || record.usageCount >= maxUses;
+}
+
+async function retireSession(key, reason, log) {
+  sessionStats.retired++;
+  log.info(`Retiring ${key} session: ${reason}`);
+  await persistSession(key, null);
+}
+
+/**
+ * Get the session to start a retailer's browser context from
+ * @param {string} retailer - Retailer name
+ * @param {string} proxy - Proxy the browser uses ('' for none)
+ * @param {Object} log - Logger
+ * @returns {Promise<Object>} - { key, retailer, warm, storageState }; storageState is
+ *   undefined for a cold session, otherwise pass it as the context's storageState
+ */
+async function acquireSession(retailer, proxy, log = defaultLog) {
+  const key = sessionKey(retailer, proxy);
+  const session = { key, retailer, warm: false, storageState: undefined };
+  if (!isSessionReuseEnabled()) {
+    return session;
+  }
+
+  let record = await loadSession(key);
+  if (record && isExpired(record)) {
+    await retireSession(key, `used ${record.usageCount} times since ${record.createdAt}`, log);
+    record = null;
+  }
+
+  if (!record) {
+    sessionStats.misses++;
+    return session;
+  }
+
+  sessionStats.hits++;
+  record.usageCount++;
+  record.lastUsedAt = new Date().toISOString();
+  log.info(`Reusing saved ${retailer} session (use ${record.usageCount}, error score ${record.errorScore})`);
+  return { ...session, warm: true, storageState: record.storageState };
+}
+
+/**
+ * Save the context's storage state after a successful scrape; a good result
+ * also works off some of the session's error score
+ * @param {Object} session - From acquireSession
+ * @param {Object} context - Playwright browser context
+ * @param {Object} log - Logger
+ */
+async function saveSession(session, context, log = defaultLog) {
+  if (!isSessionReuseEnabled() || session.blocked) return;
+
+  try {
+    const storageState = await context.storageState();
+    const previous = await loadSession(session.key);
+    const now = new Date().toISOString();
+    await persistSession(session.key, {
+      retailer: session.retailer,
+      storageState,
+      createdAt: previous ? previous.createdAt : now,
+      lastUsedAt: now,
+      usageCount: previous ? previous.usageCount : 1,
+      errorScore: previous ? Math.max(0, previous.errorScore - 0.5) : 0
+    });
+    sessionStats.saved++;
+  } catch (error) {
+    log.warning(`Could not save ${session.retailer} session: ${error.message}`);
+  }
+}
+
+/**
+ * Record that the session's page came back as a bot challenge; the session is
+ * retired once its error score reaches SESSION_MAX_ERROR_SCORE (default 3)
+ * @param {Object} session - From acquireSession
+ * @param {string} reason - What gave the block away
+ * @param {Object} log - Logger
+ */
+async function markSessionBlocked(session, reason, log = defaultLog) {
+  session.blocked = true;
+  sessionStats.blocked++;
+  if (!isSessionReuseEnabled()) return;
+
+  const record = await loadSession(session.key);
+  if (!record) return;
+
+  record.errorScore++;
+  log.warning(`${session.retailer} session looks blocked (${reason}), error score ${record.errorScore}`);
+  if (record.errorScore >= readPositiveIntEnv('SESSION_MAX_ERROR_SCORE', 3)) {
+    await retireSession(session.key, `error score ${record.errorScore}`, log);
+  } else {
+    await persistSession(session.key, record);
+  }
+}
+
+/**
+ * Session reuse counters since startup
+ * @returns {Object} - { hits, misses, saved, blocked, retired }
+ */
+function getSessionStats() {
+  return { ...sessionStats };
+}
+
+module.exports = {
+  isSessionReuseEnabled,
+  acquireSession,
+  saveSession,
+  markSessionBlocked,
+  getSessionStats
+};
@@ -0,0 +1,129 @@
+/**
+ * Single-flight
+ * Coalesces concurrent calls with the same key onto one in-flight run, and
+ * keeps the result for a short while afterwards so calls that arrive just
+ * after it finished are served from memory instead of starting another run.
+ *
+ * Each caller can pass its own AbortSignal. A caller that cancels stops
+ * waiting straight away, but the shared run is only cancelled once every
+ * caller attached to it has cancelled.
+ */
+
+const { createAbortError, onAbort } = require('./cancellation');
+
+class SingleFlight {
+  /**
+   * @param {Object} options - Options
+   * @param {number} options.memoTtlMs - How long a finished result is served to later calls (0 disables the memo)
+   * @param {number} options.maxMemoEntries - Finished results kept at most, oldest dropped first
+   * @param {Function} options.shouldMemoize - (value) => boolean, e.g. to skip empty results
+   */
+  constructor(options = {}) {
+    this.memoTtlMs = options.memoTtlMs || 0;
+    this.maxMemoEntries = options.maxMemoEntries || 500;
+    this.shouldMemoize = options.shouldMemoize || (() => true);
+
+    // key -> { promise, controller, subscribers, settled }
+    this.flights = new Map();
+    // key -> { value, expiresAt }, oldest first
+    this.memo = new Map();
+    this.counters = { runs: 0, joined: 0, memoHits: 0, cancelled: 0 };
+  }
+
+  /**
+   * Run fn for a key, or attach to the run already in flight for it
+   * @param {string} key - Calls with the same key share a run
+   * @param {Function} fn - async (signal) => value; signal fires when every caller has cancelled
+   * @param {Object} options - Call options
+   * @param {AbortSignal} options.signal - This caller's signal
+   * @param {Function} options.onJoin - (source) => void, called with 'in-flight' or 'memo' when the
+   *   call is served by another caller's run
+   * @returns {Promise<*>} - The run's value, shared between callers
+   */
+  run(key, fn, options = {}) {
+    const { signal, onJoin } = options;
+
+    const memoized = this.memo.get(key);
+    if (memoized) {
+      if (memoized.expiresAt > Date.now()) {
+        this.counters.memoHits++;
+        if (onJoin) onJoin('memo');
+        return Promise.resolve(memoized.value);
+      }
+      this.memo.delete(key);
+    }
+
+    // A run whose callers have all cancelled is still winding down; don't join it
+    let flight = this.flights.get(key);
+    if (flight && !flight.controller.signal.aborted) {
+      this.counters.joined++;
+      if (onJoin) onJoin('in-flight');
+    } else {
+      flight = this.startFlight(key, fn);
+    }
+    return this.subscribe(flight, signal);
+  }
+
+  startFlight(key, fn) {
+    this.counters.runs++;
+    const controller = new AbortController();
+    const flight = { controller, subscribers: 0, settled: false, promise: null };
+
+    flight.promise = Promise.resolve().then(() => fn(controller.signal));
+    flight.promise.then((value) => {
+      if (this.memoTtlMs > 0 && !controller.signal.aborted && this.shouldMemoize(value)) {
+        this.remember(key, value);
+      }
+    }, () => {}).finally(() => {
+      flight.settled = true;
+      // A newer run may have replaced an aborted one under the same key
+      if (this.flights.get(key) === flight) {
+        this.flights.delete(key);
+      }
+    });
+
+    this.flights.set(key, flight);
+    return flight;
+  }
+
+  subscribe(flight, signal) {
+    flight.subscribers++;
+    if (!signal) {
+      return flight.promise;
+    }
+
+    return new Promise((resolve, reject) => {
+      const removeListener = onAbort(signal, () => {
+        reject(createAbortError(signal));
+        // Only cancel the shared run when nobody is waiting for it any more
+        if (--flight.subscribers === 0 && !flight.settled) {
+          this.counters.cancelled++;
+          flight.controller.abort(signal.reason);
+        }
+      });
+      flight.promise.then(
+        (value) => { removeListener(); resolve(value); },
+        (error) => { removeListener(); reject(error); }
+      );
+    });
+  }
+
+  remember(key, value) {
+    this.memo.delete(key);
+    this.memo.set(key, { value, expiresAt: Date.now() + this.memoTtlMs });
+    while (this.memo.size > this.maxMemoEntries) {
+      this.memo.delete(this.memo.keys().next().value);
+    }
+  }
+
+  /**
+   * @returns {Object} - { inFlight, memoEntries, runs, joined, memoHits, cancelled }
+   */
+  stats() {
+    return { inFlight: this.flights.size, memoEntries: this.memo.size, ...this.counters };
+  }
+}
+
+module.exports = {
+  SingleFlight
+};
@@ -3,6 +3,13 @@
  * Shared functionality for Sainsbury's, ASDA, Morrisons, and Tesco
  */
 
+const { jitter, waitForSelectorStable, watchReviewsUpdate, waitForReviewsUpdate } = require('./wait-utils');
+const { throwIfAborted } = require('./cancellation');
+const { getSelectorCache, getDomain, probeSelectors, findFirstSelector } = require('./selector-cache');
+
+// Review API calls usually have "review" somewhere in the URL
+const REVIEW_RESPONSE_PATTERN = /review/i;
+
 // Helper function to find and click the reviews tab/section
 async function findAndClickReviewsTab(page, selectors) {
   const log = console; // Use the same logging interface as the main script
@@ -17,9 +24,14 @@ async function findAndClickReviewsTab(page, selectors) {
     if (reviewsTab) {
       log.info('Found reviews tab, clicking...');
       await reviewsTab.scrollIntoViewIfNeeded();
-      await page.waitForTimeout(Math.random() * 500 + 300);
-      await reviewsTab.click();
-      await page.waitForTimeout(Math.random() * 2000 + 1000);
+      await jitter(page);
+      await waitForReviewsUpdate(page, {
+        containerSelector: selectors.reviewsSection,
+        itemSelector: selectors.reviewContainerSelector,
+        responsePattern: REVIEW_RESPONSE_PATTERN,
+        timeout: 3000,
+        action: () => reviewsTab.click()
+      });
       reviewsTabClicked = true;
     } else {
       log.info('No reviews tab found with standard selectors');
@@ -43,17 +55,20 @@ async function findAndClickReviewsTab(page, selectors) {
         'button:has-text("review" i)'
       ];
       
-      for (const selector of possibleTabs) {
-        const element = await page.$(selector).catch(() => null);
-        if (element) {
-          log.info(`Found possible reviews element with selector: ${selector}`);
-          await element.scrollIntoViewIfNeeded();
-          await page.waitForTimeout(Math.random() * 500 + 300);
-          await element.click();
-          await page.waitForTimeout(Math.random() * 2000 + 1000);
-          reviewsTabClicked = true;
-          break;
-        }
+      // The selector that worked on this site last time is tried first
+      const { selector, element } = await findFirstSelector(page, 'reviewsTab', possibleTabs);
+      if (element) {
+        log.info(`Found possible reviews element with selector: ${selector}`);
+        await element.scrollIntoViewIfNeeded();
+        await jitter(page);
+        await waitForReviewsUpdate(page, {
+          containerSelector: selectors.reviewsSection,
+          itemSelector: selectors.reviewContainerSelector,
+          responsePattern: REVIEW_RESPONSE_PATTERN,
+          timeout: 3000,
+          action: () => element.click()
+        });
+        reviewsTabClicked = true;
       }
     } catch (e) {
       log.warning(`Error with alternative review tab approach: ${e.message}`);
@@ -67,7 +82,11 @@ async function findAndClickReviewsTab(page, selectors) {
     if (reviewsSection) {
       log.info('Found reviews section, scrolling to it');
       await reviewsSection.scrollIntoViewIfNeeded();
-      await page.waitForTimeout(Math.random() * 1000 + 500);
+      if (selectors.reviewContainerSelector) {
+        await waitForSelectorStable(page, selectors.reviewContainerSelector, { timeout: 1500 });
+      } else {
+        await jitter(page);
+      }
     }
   } catch (e) {
     log.warning(`Error scrolling to reviews section: ${e.message}`);
@@ -79,17 +98,37 @@ async function findAndClickReviewsTab(page, selectors) {
 // Helper function to handle pagination for supermarket sites
 async function handleSupermarketPagination(page, siteConfig, currentPage, extractReviewsFn) {
   const log = console; // Use the same logging interface as the main script
+  // Stop before looking for another page once the scrape is cancelled
+  throwIfAborted(siteConfig.signal);
   let nextPageLink = null;
   const nextPageNumber = currentPage + 1;
   
-  // Strategy 1: Look for specific next page button
-  try {
-    nextPageLink = await page.$(siteConfig.nextPageSelector).catch(() => null);
+  // Selectors below may use {page} for the next page number, so what is
+  // learned for one page works for the rest
+  const selectorCache = await getSelectorCache();
+  const domain = getDomain(page.url());
+  const pageParams = { page: nextPageNumber };
+  let matchedTemplate = null;
+  
+  // Strategy 0: The selector that found the next page on this site last time
+  const learnedSelector = selectorCache && selectorCache.get(domain, 'nextPage');
+  if (learnedSelector) {
+    ({ template: matchedTemplate, element: nextPageLink } = await probeSelectors(page, [learnedSelector], pageParams));
     if (nextPageLink) {
-      log.info('Found next page button using nextPageSelector');
+      log.info(`Found next page link using learned selector: ${learnedSelector}`);
+    }
+  }
+  
+  // Strategy 1: Look for specific next page button
+  if (!nextPageLink && siteConfig.nextPageSelector) {
+    try {
+      ({ template: matchedTemplate, element: nextPageLink } = await probeSelectors(page, [siteConfig.nextPageSelector]));
+      if (nextPageLink) {
+        log.info('Found next page button using nextPageSelector');
+      }
+    } catch (e) {
+      log.warning(`Error finding next page button: ${e.message}`);
     }
-  } catch (e) {
-    log.warning(`Error finding next page button: ${e.message}`);
   }
   
   // Strategy 2: Look for page number
@@ -97,19 +136,17 @@ async function handleSupermarketPagination(page, siteConfig, currentPage, extrac
     try {
       // Try multiple selector variations for page numbers
       const pageNumberSelectors = [
-        `${siteConfig.pageNumberSelector}:has-text("${nextPageNumber}")`,
-        `a:has-text("${nextPageNumber}")`,
-        `[aria-label="Page ${nextPageNumber}"]`,
-        `[data-page="${nextPageNumber}"]`,
-        `li:has-text("${nextPageNumber}") a`
+        `${siteConfig.pageNumberSelector}:has-text("{page}")`,
+        'a:has-text("{page}")',
+        '[aria-label="Page {page}"]',
+        '[data-page="{page}"]',
+        'li:has-text("{page}") a'
       ];
       
-      for (const selector of pageNumberSelectors) {
-        nextPageLink = await page.$(selector).catch(() => null);
-        if (nextPageLink) {
-          log.info(`Found page ${nextPageNumber} link using selector: ${selector}`);
-          break;
-        }
+      let selector;
+      ({ template: matchedTemplate, selector, element: nextPageLink } = await probeSelectors(page, pageNumberSelectors, pageParams));
+      if (nextPageLink) {
+        log.info(`Found page ${nextPageNumber} link using selector: ${selector}`);
       }
     } catch (e) {
       log.warning(`Error finding page number link: ${e.message}`);
@@ -120,35 +157,33 @@ async function handleSupermarketPagination(page, siteConfig, currentPage, extrac
   if (!nextPageLink) {
     try {
       log.info('Trying to find any unselected page link...');
-      const pageLinks = await page.$$(siteConfig.pageNumberSelector);
-      log.info(`Found ${pageLinks.length} potential page links`);
-      
-      for (const link of pageLinks) {
-        try {
-          // Get the text of the link to see if it's a higher page number
-          const linkText = await link.textContent();
-          const linkNumber = parseInt(linkText.trim());
-          
+      // Inspect every page link in one evaluate and hand back the chosen element
+      const candidateHandle = await page.evaluateHandle(({ selector, current }) => {
+        const pageLinks = Array.from(document.querySelectorAll(selector));
+        console.log(`Found ${pageLinks.length} potential page links`);
+        
+        for (const link of pageLinks) {
           // Check if this is a higher page number than our current page
-          if (!isNaN(linkNumber) && linkNumber > currentPage) {
-            // Check if it's not selected
-            const isSelected = await link.evaluate(el => {
-              return el.classList.contains('active') ||
-                     el.classList.contains('selected') ||
-                     el.getAttribute('aria-current') === 'true' ||
-                     el.getAttribute('aria-selected') === 'true';
-            }).catch(() => false);
-            
-            if (!isSelected) {
-              nextPageLink = link;
-              log.info(`Found unselected page link to page ${linkNumber}`);
-              break;
-            }
+          const linkNumber = parseInt((link.textContent || '').trim());
+          if (isNaN(linkNumber) || linkNumber <= current) continue;
+          
+          // Check if it's not selected
+          const isSelected = link.classList.contains('active') ||
+                             link.classList.contains('selected') ||
+                             link.getAttribute('aria-current') === 'true' ||
+                             link.getAttribute('aria-selected') === 'true';
+          if (!isSelected) {
+            return link;
           }
-        } catch (e) {
-          log.warning(`Error checking page link: ${e.message}`);
-          continue;
         }
+        return null;
+      }, { selector: siteConfig.pageNumberSelector, current: currentPage });
+      
+      nextPageLink = candidateHandle.asElement();
+      if (nextPageLink) {
+        log.info(`Found unselected page link after page ${currentPage}`);
+      } else {
+        await candidateHandle.dispose();
       }
     } catch (e) {
       log.warning(`Error in strategy 3: ${e.message}`);
@@ -172,18 +207,21 @@ async function handleSupermarketPagination(page, siteConfig, currentPage, extrac
         '[class*="next"]'
       ];
       
-      for (const selector of possibleNextLinks) {
-        nextPageLink = await page.$(selector).catch(() => null);
-        if (nextPageLink) {
-          log.info(`Found next page link using selector: ${selector}`);
-          break;
-        }
+      ({ template: matchedTemplate, element: nextPageLink } = await probeSelectors(page, possibleNextLinks));
+      if (nextPageLink) {
+        log.info(`Found next page link using selector: ${matchedTemplate}`);
       }
     } catch (e) {
       log.warning(`Error in strategy 4: ${e.message}`);
     }
   }
   
+  // No link at all is just the last page, which says nothing about the learned selector.
+  // A link only Strategy 3 found (not by a selector) counts as a miss for it.
+  if (selectorCache && nextPageLink) {
+    selectorCache.record(domain, 'nextPage', matchedTemplate);
+  }
+  
   if (!nextPageLink) {
     log.info(`No more page links found after page ${currentPage}`);
     return { success: false, nextPageNumber: currentPage };
@@ -192,7 +230,15 @@ async function handleSupermarketPagination(page, siteConfig, currentPage, extrac
   // Click the next page link
   log.info(`Navigating to page ${nextPageNumber}...`);
   await nextPageLink.scrollIntoViewIfNeeded();
-  await page.waitForTimeout(Math.random() * 500 + 300);
+  await jitter(page);
+  
+  // Start watching before the click so a fast update isn't missed
+  const pageUpdate = await watchReviewsUpdate(page, {
+    containerSelector: siteConfig.reviewsSection,
+    itemSelector: siteConfig.reviewContainerSelector,
+    responsePattern: REVIEW_RESPONSE_PATTERN,
+    timeout: 3000
+  });
   
   try {
     // Try JavaScript click first (more reliable for some sites)
@@ -205,8 +251,8 @@ async function handleSupermarketPagination(page, siteConfig, currentPage, extrac
       await nextPageLink.click();
     }
     
-    // Wait for navigation to complete
-    await page.waitForTimeout(Math.random() * 2000 + 1000);
+    // Wait for the next page of reviews to load
+    await pageUpdate.wait();
     
     // Extract reviews from the new page
     const pageReviews = await extractReviewsFn();
@@ -217,6 +263,8 @@ async function handleSupermarketPagination(page, siteConfig, currentPage, extrac
       reviews: pageReviews
     };
   } catch (e) {
+    await pageUpdate.cancel();
+    throwIfAborted(siteConfig.signal);
     log.warning(`Error navigating to page ${nextPageNumber}: ${e.message}`);
     return { success: false, nextPageNumber: currentPage };
   }
@@ -1,5 +1,8 @@
 // Utility functions for URL handling and retailer detection
 
+const crypto = require('crypto');
+const { normalizeReviewDate, isRelativeReviewDate } = require('./date-normalizer');
+
 /**
  * Detects the retailer from a URL
  * @param {string} url - The URL to analyze
@@ -139,20 +142,103 @@ function extractProductInfoFromUrl(url) {
   }
 }
 
+// Lowercased, whitespace-collapsed text, so formatting differences don't change a review's hash
+function normalizeReviewContent(value) {
+  return String(value || '').normalize('NFKC').toLowerCase().replace(/\s+/g, ' ').trim();
+}
+
 /**
- * Creates a unique identifier for a review to help with deduplication
+ * Creates a stable identifier for a review: a hash of its full normalized
+ * title and text, rating and ISO date. Relative dates ("3 days ago") are left
+ * out, since both the text and the date they resolve to change every day.
+ * Retailer and product are not part of it, so use reviewDedupKey when
+ * comparing reviews across products.
  * @param {Object} review - The review object
- * @returns {string} - A unique identifier for the review
+ * @returns {string} - A unique identifier for the review (24 hex characters)
  */
 function createReviewUniqueId(review) {
-  // Create a unique ID based on title and text content
-  const titlePart = review.title ? review.title.substring(0, 30) : '';
-  const textPart = review.text ? review.text.substring(0, 50) : '';
-  return `${titlePart}-${textPart}`.replace(/\s+/g, '-').toLowerCase();
+  const date = isRelativeReviewDate(review.date)
+    ? ''
+    : review.parsedDate || normalizeReviewDate(review.date, review.siteType) || '';
+  const content = [
+    normalizeReviewContent(review.title),
+    normalizeReviewContent(review.text),
+    String(review.rating || '').trim(),
+    date
+  ].join('\u0000');
+  return crypto.createHash('sha1').update(content).digest('hex').slice(0, 24);
+}
+
+/**
+ * Key identifying a review across retailers and products
+ * @param {Object} review - Review with siteType and productId
+ * @returns {string}
+ */
+function reviewDedupKey(review) {
+  return `${review.siteType || 'unknown'}|${review.productId || 'unknown'}|${review.uniqueId || createReviewUniqueId(review)}`;
+}
+
+/**
+ * Key identifying a scrape: the retailer and product the URL points at plus
+ * the options that change the result, so URL variants of the same product
+ * (tracking parameters, fragments) share one key
+ * @param {string} url - Product URL
+ * @param {Object} options - scrapeReviews options (dateFrom, dateTo, incremental)
+ * @returns {string}
+ */
+function createScrapeKey(url, options = {}) {
+  let { productId } = extractProductInfoFromUrl(url);
+  if (!productId || productId === 'unknown') {
+    try {
+      const urlObj = new URL(url);
+      productId = `${urlObj.hostname}${urlObj.pathname}`.toLowerCase();
+    } catch (e) {
+      productId = String(url).trim();
+    }
+  }
+  return [
+    detectRetailerFromUrl(url),
+    productId,
+    options.dateFrom || '',
+    options.dateTo || '',
+    options.incremental ? 'incremental' : 'full'
+  ].join('|');
+}
+
+/**
+ * Filters out reviews already seen in this job, recording the new ones
+ * @param {Array} reviews - Reviews for one product
+ * @param {Set} seenIds - Dedup keys seen so far (updated in place)
+ * @returns {Array} - The reviews that hadn't been seen yet
+ */
+function filterUniqueReviews(reviews, seenIds) {
+  return reviews.filter(review => {
+    // Identical short reviews ("Great product") on different products are different reviews
+    const reviewKey = reviewDedupKey(review);
+    if (seenIds.has(reviewKey)) {
+      return false;
+    }
+    seenIds.add(reviewKey);
+    return true;
+  });
+}
+
+/**
+ * Whether a scrape found any real reviews. Handlers that find nothing (or fail)
+ * return placeholder reviews marked isFallback, which don't count.
+ * @param {Array} reviews - Scraped reviews
+ * @returns {boolean}
+ */
+function hasRealReviews(reviews) {
+  return Array.isArray(reviews) && reviews.some(review => !review.isFallback);
 }
 
 module.exports = {
   detectRetailerFromUrl,
   extractProductInfoFromUrl,
-  createReviewUniqueId
+  createReviewUniqueId,
+  reviewDedupKey,
+  createScrapeKey,
+  filterUniqueReviews,
+  hasRealReviews
 };
@@ -0,0 +1,262 @@
+/**
+ * Wait utilities
+ * Event-driven replacements for fixed waitForTimeout() sleeps. Each helper
+ * resolves as soon as its condition is met (or gives up at the timeout and
+ * lets the caller carry on), so a fast page no longer pays for the slowest
+ * one. A small randomized jitter floor keeps the request pacing polite.
+ */
+
+const { readPositiveIntEnv } = require('./concurrency-utils');
+
+const DEFAULT_TIMEOUT_MS = 10000;
+
+/**
+ * Sleep for a random interval between the jitter floor and ceiling.
+ * Set WAIT_JITTER=false to turn it off.
+ * @param {Object} page - Playwright page
+ * @param {Object} options - Jitter options
+ * @param {number} options.minMs - Minimum delay (WAIT_JITTER_MIN_MS, default 150)
+ * @param {number} options.maxMs - Maximum delay (WAIT_JITTER_MAX_MS, default 500)
+ * @returns {Promise<number>} - The delay that was used
+ */
+async function jitter(page, options = {}) {
+  if (process.env.WAIT_JITTER === 'false') return 0;
+
+  const minMs = options.minMs !== undefined ? options.minMs : readPositiveIntEnv('WAIT_JITTER_MIN_MS', 150);
+  const maxMs = Math.max(minMs, options.maxMs !== undefined ? options.maxMs : readPositiveIntEnv('WAIT_JITTER_MAX_MS', 500));
+  const delay = Math.round(minMs + Math.random() * (maxMs - minMs));
+  if (delay > 0) {
+    await page.waitForTimeout(delay);
+  }
+  return delay;
+}
+
+/**
+ * Count the elements matching a selector
+ * @param {Object} page - Playwright page
+ * @param {string} selector - CSS selector for review items
+ * @returns {Promise<number>} - Number of matching elements
+ */
+async function countElements(page, selector) {
+  return page.evaluate(sel => document.querySelectorAll(sel).length, selector).catch(() => 0);
+}
+
+/**
+ * Wait until the number of review items differs from a previous count
+ * @param {Object} page - Playwright page
+ * @param {string} selector - CSS selector for review items
+ * @param {number} previousCount - Count before the action (e.g. clicking "show more")
+ * @param {Object} options - { timeout }
+ * @returns {Promise<number|null>} - The new count, or null if it didn't change in time
+ */
+async function waitForReviewCountChange(page, selector, previousCount, options = {}) {
+  const timeout = options.timeout || DEFAULT_TIMEOUT_MS;
+  try {
+    const handle = await page.waitForFunction(
+      ({ sel, count }) => {
+        const current = document.querySelectorAll(sel).length;
+        return current !== count ? current : false;
+      },
+      { sel: selector, count: previousCount },
+      { timeout, polling: 100 }
+    );
+    return await handle.jsonValue();
+  } catch (e) {
+    return null;
+  }
+}
+
+/**
+ * Wait for the first DOM mutation inside a container, then for it to go quiet
+ * @param {Object} page - Playwright page
+ * @param {string} selector - CSS selector for the review container (falls back to body)
+ * @param {Object} options - { timeout, quietMs }
+ * @returns {Promise<boolean>} - True if a mutation was seen before the timeout
+ */
+async function waitForMutation(page, selector, options = {}) {
+  const timeout = options.timeout || DEFAULT_TIMEOUT_MS;
+  const quietMs = options.quietMs || 250;
+
+  return page.evaluate(({ sel, timeout, quietMs }) => new Promise((resolve) => {
+    const target = (sel && document.querySelector(sel)) || document.body;
+    let mutated = false;
+    let quietTimer = null;
+
+    const finish = (result) => {
+      observer.disconnect();
+      clearTimeout(timeoutTimer);
+      clearTimeout(quietTimer);
+      resolve(result);
+    };
+
+    const observer = new MutationObserver(() => {
+      mutated = true;
+      clearTimeout(quietTimer);
+      quietTimer = setTimeout(() => finish(true), quietMs);
+    });
+    observer.observe(target, { childList: true, subtree: true, characterData: true });
+
+    const timeoutTimer = setTimeout(() => finish(mutated), timeout);
+  }), { sel: selector, timeout, quietMs }).catch(() => false);
+}
+
+/**
+ * Wait for a network response whose URL matches a pattern
+ * @param {Object} page - Playwright page
+ * @param {RegExp|string|Function} pattern - URL regex, substring, or (response) => boolean
+ * @param {Object} options - { timeout }
+ * @returns {Promise<Object|null>} - The response, or null if none arrived in time
+ */
+async function waitForMatchingResponse(page, pattern, options = {}) {
+  const timeout = options.timeout || DEFAULT_TIMEOUT_MS;
+  const matches = typeof pattern === 'function'
+    ? pattern
+    : (response) => (pattern instanceof RegExp ? pattern.test(response.url()) : response.url().includes(pattern));
+
+  return page.waitForResponse(matches, { timeout }).catch(() => null);
+}
+
+/**
+ * Wait until the elements matching a selector stop changing (count and text length)
+ * @param {Object} page - Playwright page
+ * @param {string} selector - CSS selector for review items
+ * @param {Object} options - { timeout, stableMs }
+ * @returns {Promise<boolean>} - True if the selector was present and stable before the timeout
+ */
+async function waitForSelectorStable(page, selector, options = {}) {
+  const timeout = options.timeout || DEFAULT_TIMEOUT_MS;
+  const stableMs = options.stableMs || 500;
+
+  return page.evaluate(({ sel, timeout, stableMs }) => new Promise((resolve) => {
+    const startedAt = Date.now();
+    let lastSignature = null;
+    let stableSince = Date.now();
+
+    const check = () => {
+      const elements = document.querySelectorAll(sel);
+      let textLength = 0;
+      elements.forEach(el => { textLength += el.textContent.length; });
+      const signature = `${elements.length}:${textLength}`;
+
+      if (signature !== lastSignature) {
+        lastSignature = signature;
+        stableSince = Date.now();
+      } else if (elements.length > 0 && Date.now() - stableSince >= stableMs) {
+        resolve(true);
+        return;
+      }
+
+      if (Date.now() - startedAt >= timeout) {
+        resolve(false);
+        return;
+      }
+      setTimeout(check, 100);
+    };
+
+    check();
+  }), { sel: selector, timeout, stableMs }).catch(() => false);
+}
+
+/**
+ * Start watching for the reviews on the page to update. Call this before the
+ * action that triggers the update (tab click, next page, show more) so a fast
+ * update can't be missed, then await wait() afterwards.
+ * wait() resolves on whichever comes first: a review-container mutation, a
+ * matching network response or a full navigation, then waits for the review
+ * items to settle.
+ * @param {Object} page - Playwright page
+ * @param {Object} options - Wait options
+ * @param {string} options.containerSelector - Review container to watch for mutations (falls back to body)
+ * @param {string} options.itemSelector - Review items that should settle afterwards
+ * @param {RegExp|string|Function} options.responsePattern - Review API response to watch for
+ * @param {number} options.timeout - Maximum time to wait for the update
+ * @returns {Promise<Object>} - Watcher with wait() => 'mutation' | 'response' | 'navigation' | 'timeout', and cancel()
+ */
+async function watchReviewsUpdate(page, options = {}) {
+  const timeout = options.timeout || DEFAULT_TIMEOUT_MS;
+  const quietMs = options.quietMs || 250;
+
+  // Record the time of the latest mutation in the page
+  await page.evaluate((sel) => {
+    if (window.__reviewsObserver) window.__reviewsObserver.disconnect();
+    window.__reviewsMutatedAt = 0;
+    const target = (sel && document.querySelector(sel)) || document.body;
+    window.__reviewsObserver = new MutationObserver(() => { window.__reviewsMutatedAt = Date.now(); });
+    window.__reviewsObserver.observe(target, { childList: true, subtree: true, characterData: true });
+  }, options.containerSelector || null).catch(() => {});
+
+  const waiters = [
+    page.waitForFunction(
+      (quiet) => window.__reviewsMutatedAt > 0 && Date.now() - window.__reviewsMutatedAt >= quiet,
+      quietMs,
+      { timeout, polling: 100 }
+    ).then(() => 'mutation', () => null),
+    page.waitForEvent('framenavigated', { predicate: frame => frame === page.mainFrame(), timeout })
+      .then(() => 'navigation', () => null)
+  ];
+  if (options.responsePattern) {
+    waiters.push(waitForMatchingResponse(page, options.responsePattern, { timeout }).then(response => (response ? 'response' : null)));
+  }
+
+  const disconnect = () => page.evaluate(() => {
+    if (window.__reviewsObserver) window.__reviewsObserver.disconnect();
+    window.__reviewsObserver = null;
+  }).catch(() => {});
+
+  return {
+    wait: async () => {
+      // First waiter to see something wins; if none do, they all give up at the timeout
+      const trigger = await new Promise((resolve) => {
+        let pending = waiters.length;
+        for (const waiter of waiters) {
+          waiter.then((result) => {
+            pending--;
+            if (result) resolve(result);
+            else if (pending === 0) resolve('timeout');
+          });
+        }
+      });
+
+      // Next-page links sometimes do a full navigation rather than an in-page update
+      await page.waitForLoadState('domcontentloaded').catch(() => {});
+      await disconnect();
+
+      if (options.itemSelector) {
+        await waitForSelectorStable(page, options.itemSelector, { timeout: Math.min(timeout, 5000), stableMs: 300 });
+      }
+      await jitter(page);
+      return trigger;
+    },
+    cancel: disconnect
+  };
+}
+
+/**
+ * Perform an action and wait for the reviews to update (see watchReviewsUpdate)
+ * @param {Object} page - Playwright page
+ * @param {Object} options - watchReviewsUpdate options plus action: async () => void
+ * @returns {Promise<string>} - What triggered: 'mutation', 'response', 'navigation' or 'timeout'
+ */
+async function waitForReviewsUpdate(page, options = {}) {
+  const watcher = await watchReviewsUpdate(page, options);
+  try {
+    if (options.action) {
+      await options.action();
+    }
+  } catch (actionError) {
+    await watcher.cancel();
+    throw actionError;
+  }
+  return watcher.wait();
+}
+
+module.exports = {
+  jitter,
+  countElements,
+  waitForReviewCountChange,
+  waitForMutation,
+  waitForMatchingResponse,
+  waitForSelectorStable,
+  watchReviewsUpdate,
+  waitForReviewsUpdate
+};
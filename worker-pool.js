@@ -0,0 +1,135 @@
+/**
+ * Worker thread pool
+ * Runs CPU-bound tasks (like formatting export rows) on worker_threads so
+ * they don't block the main event loop, where they would stall /health,
+ * SSE writes and every other request. Workers are started on first use and
+ * replaced if one crashes; tasks wait in a queue while all workers are busy.
+ *
+ * The worker script answers each { id, task } message with { id, result }
+ * or { id, error }, and may transfer ArrayBuffers in the result.
+ */
+
+const { Worker } = require('worker_threads');
+
+class WorkerPool {
+  /**
+   * @param {Object} options - Pool options
+   * @param {string} options.script - Path of the worker script
+   * @param {number} options.size - Maximum number of workers
+   * @param {string} options.name - Name used in log messages
+   * @param {Object} options.log - Logger
+   */
+  constructor(options) {
+    this.script = options.script;
+    this.size = Math.max(1, options.size || 1);
+    this.name = options.name || 'worker';
+    this.log = options.log || console;
+
+    // Workers that are free, and every worker with the task it is running
+    this.idle = [];
+    this.workers = new Map();
+    // Tasks waiting for a worker: { task, transferList, resolve, reject }
+    this.queue = [];
+    this.nextId = 1;
+    this.closed = false;
+    this.counters = { completed: 0, failed: 0, crashed: 0 };
+  }
+
+  /**
+   * Run a task on a worker
+   * @param {*} task - Message for the worker (structured-cloned)
+   * @param {Array} transferList - ArrayBuffers to transfer instead of copying
+   * @returns {Promise<*>} - The worker's result
+   */
+  run(task, transferList = []) {
+    if (this.closed) {
+      return Promise.reject(new Error(`${this.name} pool is closed`));
+    }
+    return new Promise((resolve, reject) => {
+      this.queue.push({ task, transferList, resolve, reject });
+      this.dispatch();
+    });
+  }
+
+  dispatch() {
+    while (this.queue.length > 0) {
+      let worker = this.idle.pop();
+      if (!worker) {
+        if (this.workers.size >= this.size) return;
+        worker = this.startWorker();
+      }
+
+      const job = { ...this.queue.shift(), id: this.nextId++ };
+      this.workers.set(worker, job);
+      // Busy workers keep the process alive until their task finishes
+      worker.ref();
+      worker.postMessage({ id: job.id, task: job.task }, job.transferList);
+    }
+  }
+
+  startWorker() {
+    const worker = new Worker(this.script);
+
+    worker.on('message', ({ id, result, error }) => {
+      const job = this.workers.get(worker);
+      if (!job || job.id !== id) return;
+      this.workers.set(worker, null);
+      this.idle.push(worker);
+      worker.unref();
+
+      if (error) {
+        this.counters.failed++;
+        job.reject(new Error(error));
+      } else {
+        this.counters.completed++;
+        job.resolve(result);
+      }
+      this.dispatch();
+    });
+
+    const onExit = (reason) => {
+      const job = this.workers.get(worker);
+      if (!this.workers.delete(worker)) return;
+      this.idle = this.idle.filter(idleWorker => idleWorker !== worker);
+      if (!this.closed) {
+        this.counters.crashed++;
+        this.log.warning(`${this.name} pool worker stopped (${reason}), replacing it`);
+      }
+      if (job) {
+        this.counters.failed++;
+        job.reject(new Error(`${this.name} worker stopped: ${reason}`));
+      }
+      this.dispatch();
+    };
+    worker.on('error', error => onExit(error.message));
+    worker.on('exit', code => onExit(`exit code ${code}`));
+    // An idle pool shouldn't keep the process alive (unref after the listeners, which ref the worker)
+    worker.unref();
+
+    this.workers.set(worker, null);
+    return worker;
+  }
+
+  /**
+   * @returns {Object} - { size, workers, busy, queued, completed, failed, crashed }
+   */
+  stats() {
+    const busy = [...this.workers.values()].filter(Boolean).length;
+    return { size: this.size, workers: this.workers.size, busy, queued: this.queue.length, ...this.counters };
+  }
+
+  /**
+   * Stop all workers; queued and running tasks are rejected
+   */
+  async close() {
+    this.closed = true;
+    for (const job of this.queue.splice(0)) {
+      job.reject(new Error(`${this.name} pool is closed`));
+    }
+    await Promise.all([...this.workers.keys()].map(worker => worker.terminate()));
+  }
+}
+
+module.exports = {
+  WorkerPool
+};